@@ -48,7 +48,7 @@ print("="*60 + "\n")
 # Ahora importar Django después de configurar DJANGO_SETTINGS_MODULE
 from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
+from channels.sessions import SessionMiddlewareStack
 from taxis.middleware import TokenAuthMiddlewareStack  # ✅ Middleware personalizado para tokens
 import taxis.routing
 
@@ -84,8 +84,8 @@ except Exception as e:
 
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
-    "websocket": AuthMiddlewareStack(  # ✅ Primero AuthMiddleware para sesiones
-        TokenAuthMiddlewareStack(  # ✅ Luego TokenAuth para tokens
+    "websocket": SessionMiddlewareStack(  # ✅ Primero cookies y sesión (sin consultar al usuario)
+        TokenAuthMiddlewareStack(  # ✅ Luego TokenAuth: token o sesión, con caché entre handshakes
             URLRouter(
                 taxis.routing.websocket_urlpatterns  # Aquí enlazamos las rutas de WebSocket
             )
@@ -285,7 +285,7 @@ GOOGLE_MAPS_API_KEY = GOOGLE_API_KEY
 # REST Framework - Configuración de autenticación
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'taxis.authentication.CachedTokenAuthentication',  # Token con caché token → usuario
         'rest_framework.authentication.SessionAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
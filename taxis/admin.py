@@ -3,7 +3,7 @@ from django.contrib.auth.admin import UserAdmin
 from .models import (
     AppUser, Taxi, TaxiRoute, Ride, RideDestination,
     WhatsAppConversation, WhatsAppMessage, WhatsAppStats, WebPushSubscription,
-    FCMToken, Organization, PriceNegotiation, DriverApp
+    FCMToken, Organization, PriceNegotiation, DriverApp, Invoice
 )
 
 
@@ -339,41 +339,40 @@ class OrganizationAdmin(admin.ModelAdmin):
 # ============================================
 # ADMIN DE INVOICE (FASE 3)
 # ============================================
-# COMENTADO: El modelo Invoice aún no está implementado
-
-# @admin.register(Invoice)
-# class InvoiceAdmin(admin.ModelAdmin):
-#     list_display = (
-#         'invoice_number',
-#         'organization',
-#         'amount',
-#         'status',
-#         'issue_date',
-#         'due_date',
-#         'paid_date'
-#     )
-#     list_filter = ('status', 'issue_date', 'due_date')
-#     search_fields = ('invoice_number', 'organization__name')
-#     readonly_fields = ('invoice_number', 'created_at', 'updated_at')
-#     
-#     fieldsets = (
-#         ('Información de la Factura', {
-#             'fields': ('invoice_number', 'organization', 'period_start', 'period_end')
-#         }),
-#         ('Montos', {
-#             'fields': ('amount', 'tax_amount', 'total_amount')
-#         }),
-#         ('Fechas', {
-#             'fields': ('issue_date', 'due_date', 'paid_date')
-#         }),
-#         ('Estado', {
-#             'fields': ('status', 'notes', 'created_at', 'updated_at')
-#         }),
-#     )
-#     
-#     def has_add_permission(self, request):
-#         # Las facturas se crean desde el panel personalizado
-#         return False
+
+@admin.register(Invoice)
+class InvoiceAdmin(admin.ModelAdmin):
+    list_display = (
+        'invoice_number',
+        'organization',
+        'total_amount',
+        'status',
+        'issued_at',
+        'due_date',
+        'paid_at'
+    )
+    list_filter = ('status', 'issued_at', 'due_date')
+    search_fields = ('invoice_number', 'organization__name')
+    readonly_fields = ('invoice_number', 'issued_at')
+    
+    fieldsets = (
+        ('Información de la Factura', {
+            'fields': ('invoice_number', 'organization', 'period_start', 'period_end')
+        }),
+        ('Montos', {
+            'fields': ('subscription_fee', 'commission_amount', 'total_amount')
+        }),
+        ('Fechas', {
+            'fields': ('issued_at', 'due_date', 'paid_at')
+        }),
+        ('Estado', {
+            'fields': ('status', 'pdf_file', 'notes')
+        }),
+    )
+    
+    def has_add_permission(self, request):
+        # Las facturas se emiten con generate_invoices o desde el panel personalizado
+        return False
 
 
 # ============================================
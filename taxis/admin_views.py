@@ -5,17 +5,25 @@ Panel completo para gestionar cooperativas, conductores, reportes y facturación
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView, DetailView, TemplateView
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.urls import reverse_lazy
+from django.db import transaction
 from django.db.models import Sum, Count, Q, Avg
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.contrib import messages
 from django.shortcuts import redirect, get_object_or_404
-from django.http import JsonResponse, HttpResponse
-from datetime import timedelta, datetime
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from datetime import date, timedelta, datetime
 from decimal import Decimal
 
-from .models import Organization, AppUser, Ride, InvitationCode  # Invoice no existe aún
-from .forms import OrganizationForm, DriverApprovalForm  # InvoiceForm no existe aún
+from .models import Organization, AppUser, Ride, InvitationCode, Invoice
+from .forms import OrganizationForm, DriverApprovalForm, InvoiceForm
 from .decorators import superadmin_required, organization_admin_required
+from .ride_stats import period_range, period_totals
+from .analytics import AnalyticsReport, ReportError
+from .exports import async_chunks, csv_stream, ride_export_queryset, ride_rows, xlsx_stream
+from .billing import next_invoice_number
+from .task_queue import task_queue
 from django.utils.decorators import method_decorator
 from django.views import View
 
@@ -67,29 +75,11 @@ class SuperAdminDashboardView(TemplateView):
             except:
                 context['pending_drivers'] = 0
             
-            # Carreras del mes actual
-            now = timezone.now()
-            current_month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            
-            rides_this_month = Ride.objects.filter(
-                created_at__gte=current_month_start,
-                status='completed'
-            )
-            
-            context['rides_this_month'] = rides_this_month.count()
-            
-            # Ingresos del mes
-            try:
-                revenue_data = rides_this_month.aggregate(
-                    total=Sum('price'),
-                    commission=Sum('commission_amount')
-                )
-                context['revenue_this_month'] = revenue_data['total'] or Decimal('0.00')
-                context['commission_this_month'] = revenue_data['commission'] or Decimal('0.00')
-            except:
-                revenue_data = rides_this_month.aggregate(total=Sum('price'))
-                context['revenue_this_month'] = revenue_data['total'] or Decimal('0.00')
-                context['commission_this_month'] = Decimal('0.00')
+            # Carreras e ingresos del mes actual (acumulados por mes, ver taxis.ride_stats)
+            month = period_totals(*period_range('month'))
+            context['rides_this_month'] = month['total_rides']
+            context['revenue_this_month'] = month['total_revenue']
+            context['commission_this_month'] = month['total_commission']
             
             # Cooperativas recientes
             context['recent_organizations'] = Organization.objects.all().order_by('-created_at')[:5]
@@ -103,13 +93,10 @@ class SuperAdminDashboardView(TemplateView):
             except:
                 context['pending_drivers_list'] = []
             
-            # Facturas pendientes (Invoice no existe aún)
-            # try:
-            #     context['pending_invoices'] = Invoice.objects.filter(
-            #         status='pending'
-            #     ).select_related('organization')[:5]
-            # except:
-            context['pending_invoices'] = []
+            # Facturas pendientes
+            context['pending_invoices'] = Invoice.objects.filter(
+                status='pending'
+            ).select_related('organization').order_by('due_date')[:5]
             
             # Estadísticas por plan
             try:
@@ -222,16 +209,12 @@ class OrganizationDetailView(DetailView):
         
         # Carreras
         context['total_rides'] = org.rides.count()
-        context['completed_rides'] = org.rides.filter(status='completed').count()
+        context['completed_rides'] = org.total_rides
         context['active_rides'] = org.rides.filter(status__in=['requested', 'accepted', 'in_progress']).count()
         
-        # Ingresos
-        revenue_data = org.rides.filter(status='completed').aggregate(
-            total=Sum('price'),
-            commission=Sum('commission_amount')
-        )
-        context['total_revenue'] = revenue_data['total'] or Decimal('0.00')
-        context['total_commission'] = revenue_data['commission'] or Decimal('0.00')
+        # Ingresos (contadores de la organización)
+        context['total_revenue'] = org.total_revenue
+        context['total_commission'] = org.total_commission
         
         # Facturas
         context['invoices'] = org.invoices.all().order_by('-issued_at')[:10]
@@ -621,108 +604,195 @@ class FinancialReportsView(TemplateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
-        # Período seleccionado
+        # Período seleccionado: week (últimos 7 días, por día), month o year (por mes),
+        # o un rango libre (?start=&end=&granularity=) desde el motor de reportes
         period = self.request.GET.get('period', 'month')
-        now = timezone.now()
-        
-        if period == 'month':
-            start_date = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        elif period == 'year':
-            start_date = now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
-        else:  # week
-            start_date = now - timedelta(days=7)
-        
-        # Carreras completadas en el período
-        rides = Ride.objects.filter(
-            created_at__gte=start_date,
-            status='completed'
-        )
-        
-        # Totales
-        totals = rides.aggregate(
-            total_rides=Count('id'),
-            total_revenue=Sum('price'),
-            total_commission=Sum('commission_amount')
-        )
-        
-        context['total_rides'] = totals['total_rides'] or 0
-        context['total_revenue'] = totals['total_revenue'] or Decimal('0.00')
-        context['total_commission'] = totals['total_commission'] or Decimal('0.00')
-        
-        # Por cooperativa
-        context['by_organization'] = Organization.objects.filter(
-            is_active=True
-        ).annotate(
-            rides_count=Count('rides', filter=Q(rides__created_at__gte=start_date, rides__status='completed')),
-            revenue=Sum('rides__price', filter=Q(rides__created_at__gte=start_date, rides__status='completed')),
-            commission=Sum('rides__commission_amount', filter=Q(rides__created_at__gte=start_date, rides__status='completed'))
+        report = None
+        if self.request.GET.get('start') or self.request.GET.get('end'):
+            try:
+                report = AnalyticsReport.from_params(self.request.GET)
+                period = 'custom'
+            except ReportError as e:
+                messages.error(self.request, str(e))
+                period = 'month'
+        
+        # (Organization.is_active es un método que tapa el campo: se filtra por status)
+        organizations = Organization.objects.exclude(status__in=['suspended', 'canceled'])
+        
+        if report is not None:
+            totals = report.totals()
+            context['total_rides'] = totals['completed_rides']
+            context['total_revenue'] = totals['revenue'] or Decimal('0.00')
+            context['total_commission'] = totals['commission'] or Decimal('0.00')
+            start_date, end_date = report.start, report.end
+            in_period = report.bucket_filter('stats_buckets__')
+            prefix = 'stats_buckets'
+        else:
+            granularity, start_date = period_range(period)
+            end_date = timezone.localdate()
+            # Totales desde los acumulados por período (taxis.ride_stats)
+            context.update(period_totals(granularity, start_date))
+            in_period = Q(period_stats__period=granularity, period_stats__period_start__gte=start_date)
+            prefix = 'period_stats'
+            report = AnalyticsReport(start_date, end_date, granularity='month' if period == 'year' else 'day')
+        
+        # Por cooperativa (join con los acumulados, no con las carreras)
+        context['by_organization'] = organizations.annotate(
+            rides_count=Coalesce(Sum(f'{prefix}__completed_rides', filter=in_period), 0),
+            revenue=Sum(f'{prefix}__revenue', filter=in_period),
+            commission=Sum(f'{prefix}__commission', filter=in_period)
         ).order_by('-revenue')
         
+        # Serie para el gráfico de tendencia
+        context['trend'] = [
+            {
+                'label': point['start'].strftime('%d/%m %H:%M' if report.granularity == 'hour' else '%d/%m/%Y'),
+                'revenue': float(point['revenue']),
+                'commission': float(point['commission']),
+                'rides': point['completed_rides'],
+                'canceled': point['canceled_rides'],
+            }
+            for point in report.series()
+        ]
+        
         context['period'] = period
+        context['granularity'] = report.granularity
         context['start_date'] = start_date
+        context['end_date'] = end_date
         
         return context
 
 
+@method_decorator(organization_admin_required, name='dispatch')
+class AnalyticsReportView(View):
+    """
+    Series del motor de reportes en JSON o CSV
+
+    GET /manage/reports/analytics/?start=2025-01-01&end=2025-03-31&granularity=week
+        &organization=&driver=&group_by=organization|driver&format=json|csv
+
+    Los admins de cooperativa solo ven su organización.
+    """
+    
+    def get(self, request):
+        organization = None
+        if not request.user.is_superuser:
+            organization = request.user.organization_id
+            if organization is None:
+                return JsonResponse({'error': 'No tienes una organización asignada'}, status=403)
+        
+        try:
+            report = AnalyticsReport.from_params(request.GET, organization=organization)
+        except ReportError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        
+        if request.GET.get('format') == 'csv':
+            response = HttpResponse(content_type='text/csv; charset=utf-8')
+            response['Content-Disposition'] = (
+                f'attachment; filename="reporte_{report.start:%Y%m%d}_{report.end:%Y%m%d}_{report.granularity}.csv"'
+            )
+            report.write_csv(response)
+            return response
+        
+        return JsonResponse(report.to_dict())
+
+
+@method_decorator(organization_admin_required, name='dispatch')
+class RideExportView(View):
+    """
+    Exportación de carreras con precio y comisión, en streaming
+
+    GET /manage/exports/rides/?format=csv|xlsx&start=2025-01-01&end=2025-01-31
+        &organization=&driver=
+
+    Los admins de cooperativa solo exportan su organización.
+    """
+    FORMATS = {
+        'csv': ('text/csv; charset=utf-8', csv_stream),
+        'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', xlsx_stream),
+    }
+    
+    def get(self, request):
+        export_format = request.GET.get('format', 'csv')
+        if export_format not in self.FORMATS:
+            return JsonResponse({'error': f'Formato no soportado: {export_format}'}, status=400)
+        
+        if request.user.is_superuser:
+            organization = request.GET.get('organization') or None
+        else:
+            organization = request.user.organization_id
+            if organization is None:
+                return JsonResponse({'error': 'No tienes una organización asignada'}, status=403)
+        
+        try:
+            start = date.fromisoformat(request.GET['start']) if request.GET.get('start') else None
+            end = date.fromisoformat(request.GET['end']) if request.GET.get('end') else None
+            organization = int(organization) if organization is not None else None
+            driver = int(request.GET['driver']) if request.GET.get('driver') else None
+        except ValueError as e:
+            return JsonResponse({'error': f'Parámetro inválido: {e}'}, status=400)
+        
+        rides = ride_export_queryset(organization=organization, driver=driver, start=start, end=end)
+        content_type, stream = self.FORMATS[export_format]
+        chunks = stream(ride_rows(rides))
+        if isinstance(request, ASGIRequest):
+            # Daphne: sin iterador asíncrono Django armaría el archivo entero en memoria
+            chunks = async_chunks(chunks)
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        stamp = timezone.localtime().strftime('%Y%m%d_%H%M')
+        response['Content-Disposition'] = f'attachment; filename="carreras_{stamp}.{export_format}"'
+        return response
+
+
 # ============================================
-# GESTIÓN DE FACTURAS (DESHABILITADO - Invoice no existe)
+# GESTIÓN DE FACTURAS
 # ============================================
 
-# @method_decorator(organization_admin_required, name='dispatch')
-# class InvoiceListView(ListView):
-#     """Lista de facturas"""
-#     model = Invoice
-#     template_name = 'admin/invoices/list.html'
-#     context_object_name = 'invoices'
-#     paginate_by = 20
-#     
-#     def get_queryset(self):
-#         queryset = Invoice.objects.all().select_related('organization')
-#         
-#         status = self.request.GET.get('status')
-#         if status:
-#             queryset = queryset.filter(status=status)
-#         
-#         return queryset.order_by('-issued_at')
-
-
-# @method_decorator(organization_admin_required, name='dispatch')
-# class InvoiceCreateView(CreateView):
-#     """Crear nueva factura"""
-#     model = Invoice
-#     form_class = InvoiceForm
-#     template_name = 'admin/invoices/create.html'
-#     success_url = reverse_lazy('admin_invoices')
-#     
-#     def form_valid(self, form):
-#         # Generar número de factura automático
-#         year = timezone.now().year
-#         last_invoice = Invoice.objects.filter(
-#             invoice_number__startswith=f'INV-{year}'
-#         ).order_by('-invoice_number').first()
-#         
-#         if last_invoice:
-#             last_num = int(last_invoice.invoice_number.split('-')[-1])
-#             new_num = last_num + 1
-#         else:
-#             new_num = 1
-#         
-#         form.instance.invoice_number = f'INV-{year}-{new_num:04d}'
-#         
-#         # Calcular total
-#         form.instance.total_amount = form.instance.subscription_fee + form.instance.commission_amount
-#         
-#         messages.success(self.request, f'Factura {form.instance.invoice_number} creada exitosamente.')
-#         return super().form_valid(form)
-
-
-# @method_decorator(organization_admin_required, name='dispatch')
-# class InvoiceMarkPaidView(TemplateView):
-#     """Marcar factura como pagada"""
-#     
-#     def post(self, request, pk):
-#         invoice = get_object_or_404(Invoice, pk=pk)
-#         invoice.mark_as_paid()
-#         
-#         messages.success(request, f'Factura {invoice.invoice_number} marcada como pagada.')
-#         return redirect('admin_invoices')
+@method_decorator(superadmin_required, name='dispatch')
+class InvoiceListView(ListView):
+    """Lista de facturas"""
+    model = Invoice
+    template_name = 'admin/invoices/list.html'
+    context_object_name = 'invoices'
+    paginate_by = 20
+    
+    def get_queryset(self):
+        queryset = Invoice.objects.all().select_related('organization')
+        
+        status = self.request.GET.get('status')
+        if status:
+            queryset = queryset.filter(status=status)
+        
+        return queryset.order_by('-issued_at')
+
+
+@method_decorator(superadmin_required, name='dispatch')
+class InvoiceCreateView(CreateView):
+    """Crear nueva factura (las mensuales las emite generate_invoices)"""
+    model = Invoice
+    form_class = InvoiceForm
+    template_name = 'admin/invoices/create.html'
+    success_url = reverse_lazy('admin_invoices')
+    
+    def form_valid(self, form):
+        # El número se reserva en la misma transacción que guarda la factura (ver taxis.billing)
+        with transaction.atomic():
+            form.instance.invoice_number = next_invoice_number()
+            form.instance.total_amount = form.instance.subscription_fee + form.instance.commission_amount
+            response = super().form_valid(form)
+            task_queue.enqueue_on_commit('render_invoice_pdf', invoice_id=self.object.id)
+        
+        messages.success(self.request, f'Factura {self.object.invoice_number} creada exitosamente.')
+        return response
+
+
+@method_decorator(superadmin_required, name='dispatch')
+class InvoiceMarkPaidView(View):
+    """Marcar factura como pagada"""
+    
+    def post(self, request, pk):
+        invoice = get_object_or_404(Invoice, pk=pk)
+        invoice.mark_as_paid()
+        
+        messages.success(request, f'Factura {invoice.invoice_number} marcada como pagada.')
+        return redirect('admin_invoices')
@@ -0,0 +1,229 @@
+"""
+Motor de reportes sobre buckets pre-agregados (RideStatsBucket)
+
+FinancialReportsView solo ofrecía semana / mes / año y agregaba siempre
+desde las carreras con joins a Organization. Los reportes ahora leen los
+buckets por hora y por día que taxis.ride_stats mantiene al terminar cada
+carrera:
+
+- Rango arbitrario de fechas y granularidad hour / day / week / month
+  (hour lee los buckets por hora; el resto, los diarios agrupados en la base).
+- Filtros por organización y conductor, y desglose por cualquiera de los dos.
+- Series con los huecos en cero, listas para Chart.js, y exportación CSV.
+
+El costo depende del número de buckets del rango (días × conductores
+activos), no del número de carreras, y nunca se consulta la tabla de carreras.
+"""
+import csv
+from datetime import date, datetime, time, timedelta
+
+from django.db.models import Q, Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+from django.utils import timezone
+
+from .models import RideStatsBucket
+
+GRANULARITIES = ('hour', 'day', 'week', 'month')
+GROUP_BY = {'organization': 'organization_id', 'driver': 'driver_id'}
+METRICS = ('completed_rides', 'canceled_rides', 'revenue', 'commission')
+
+# Tope de puntos por serie (p. ej. granularidad hour para años de datos)
+MAX_POINTS = 5000
+
+
+class ReportError(ValueError):
+    """Parámetros de reporte inválidos"""
+
+
+def _local_midnight(day):
+    return timezone.make_aware(datetime.combine(day, time()))
+
+
+def _key(moment):
+    """Llave comparable de un inicio de bucket (hora local, sin zona)"""
+    return timezone.localtime(moment).replace(tzinfo=None)
+
+
+def _empty():
+    return dict.fromkeys(METRICS, 0)
+
+
+class AnalyticsReport:
+    """
+    Reporte de carreras, ingresos, comisiones y cancelaciones
+
+    Args:
+        start, end: date, ambos incluidos
+        granularity: 'hour', 'day', 'week' o 'month'
+        organization, driver: id o instancia para filtrar (None = todos)
+        group_by: None, 'organization' o 'driver'
+    """
+
+    def __init__(self, start, end, granularity='day', organization=None, driver=None, group_by=None):
+        if granularity not in GRANULARITIES:
+            raise ReportError(f'Granularidad inválida: {granularity}')
+        if group_by is not None and group_by not in GROUP_BY:
+            raise ReportError(f'Agrupación inválida: {group_by}')
+        if end < start:
+            raise ReportError('La fecha final es anterior a la inicial')
+
+        self.start = start
+        self.end = end
+        self.granularity = granularity
+        self.organization = getattr(organization, 'pk', organization)
+        self.driver = getattr(driver, 'pk', driver)
+        self.group_by = group_by
+
+        if len(self.bucket_starts()) > MAX_POINTS:
+            raise ReportError(f'El rango tiene más de {MAX_POINTS} puntos; use una granularidad mayor')
+
+    @classmethod
+    def from_params(cls, params, organization=None):
+        """
+        Crea el reporte desde parámetros GET (start, end, granularity,
+        organization, driver, group_by). `organization` fuerza el filtro
+        (admins de cooperativa).
+        """
+        today = timezone.localdate()
+        try:
+            end = date.fromisoformat(params['end']) if params.get('end') else today
+            start = date.fromisoformat(params['start']) if params.get('start') else end - timedelta(days=29)
+            organization = organization or (int(params['organization']) if params.get('organization') else None)
+            driver = int(params['driver']) if params.get('driver') else None
+        except ValueError as e:
+            raise ReportError(f'Parámetro inválido: {e}') from e
+        return cls(
+            start, end,
+            granularity=params.get('granularity') or 'day',
+            organization=organization,
+            driver=driver,
+            group_by=params.get('group_by') or None,
+        )
+
+    # ============================================
+    # CONSULTAS
+    # ============================================
+
+    def bucket_filter(self, prefix=''):
+        """
+        Q de los buckets del rango (por hora o por día según la granularidad);
+        con `prefix` sirve para filtrar un join (p. ej. 'stats_buckets__')
+        """
+        lookups = {
+            'granularity': 'hour' if self.granularity == 'hour' else 'day',
+            'bucket_start__gte': _local_midnight(self.start),
+            'bucket_start__lt': _local_midnight(self.end + timedelta(days=1)),
+        }
+        if self.organization is not None:
+            lookups['organization_id'] = self.organization
+        if self.driver is not None:
+            lookups['driver_id'] = self.driver
+        return Q(**{prefix + key: value for key, value in lookups.items()})
+
+    def buckets(self):
+        """RideStatsBucket del rango"""
+        return RideStatsBucket.objects.filter(self.bucket_filter())
+
+    def _sums(self):
+        return {metric: Sum(metric) for metric in METRICS}
+
+    def totals(self):
+        """Totales del rango: completed_rides, canceled_rides, revenue, commission"""
+        totals = self.buckets().aggregate(**self._sums())
+        return {metric: totals[metric] or 0 for metric in METRICS}
+
+    def bucket_starts(self):
+        """Inicios de todos los puntos del rango, en orden"""
+        if self.granularity == 'hour':
+            first = _local_midnight(self.start)
+            count = ((self.end - self.start).days + 1) * 24
+            return [first + timedelta(hours=i) for i in range(count)]
+        if self.granularity == 'day':
+            days = (self.end - self.start).days + 1
+            return [_local_midnight(self.start + timedelta(days=i)) for i in range(days)]
+        if self.granularity == 'week':
+            monday = self.start - timedelta(days=self.start.weekday())
+            weeks = (self.end - monday).days // 7 + 1
+            return [_local_midnight(monday + timedelta(weeks=i)) for i in range(weeks)]
+        starts = []
+        month = self.start.replace(day=1)
+        while month <= self.end:
+            starts.append(_local_midnight(month))
+            month = (month + timedelta(days=32)).replace(day=1)
+        return starts
+
+    def _rows(self):
+        """Filas agrupadas por (punto[, grupo]) calculadas en la base"""
+        buckets = self.buckets()
+        point = 'bucket_start'
+        if self.granularity in ('week', 'month'):
+            trunc = TruncWeek if self.granularity == 'week' else TruncMonth
+            buckets = buckets.annotate(point=trunc('bucket_start'))
+            point = 'point'
+        group = GROUP_BY.get(self.group_by)
+        fields = [point] + ([group] if group else [])
+        for row in buckets.values(*fields).annotate(**self._sums()).order_by():
+            yield row[point], (row[group] if group else None), row
+
+    def series(self):
+        """
+        Serie con un punto por bucket del rango (los vacíos en cero)
+
+        Returns:
+            list[dict] si no hay group_by, o {id del grupo: list[dict]}; cada
+            punto tiene 'start' (datetime local) y las métricas
+        """
+        starts = self.bucket_starts()
+        points = {}
+        for start, group, row in self._rows():
+            points.setdefault(group, {})[_key(start)] = {metric: row[metric] or 0 for metric in METRICS}
+
+        def build(values):
+            return [dict(start=timezone.localtime(s), **values.get(_key(s), _empty())) for s in starts]
+
+        if not self.group_by:
+            return build(points.get(None, {}))
+        return {group: build(values) for group, values in points.items()}
+
+    # ============================================
+    # EXPORTACIÓN
+    # ============================================
+
+    def write_csv(self, out):
+        """Escribe la serie en CSV (una fila por punto y grupo)"""
+        writer = csv.writer(out)
+        group_column = [self.group_by] if self.group_by else []
+        writer.writerow(['inicio'] + group_column + list(METRICS))
+
+        series = self.series()
+        groups = series.items() if self.group_by else [(None, series)]
+        fmt = '%Y-%m-%d %H:%M' if self.granularity == 'hour' else '%Y-%m-%d'
+        for group, points in groups:
+            for point in points:
+                writer.writerow(
+                    [point['start'].strftime(fmt)]
+                    + ([group if group is not None else ''] if self.group_by else [])
+                    + [point[metric] for metric in METRICS]
+                )
+
+    def to_dict(self):
+        """Serie y totales serializables a JSON"""
+        def serialize(points):
+            return [
+                {'start': p['start'].isoformat(), **{m: (str(p[m]) if m in ('revenue', 'commission') else p[m]) for m in METRICS}}
+                for p in points
+            ]
+
+        series = self.series()
+        totals = self.totals()
+        return {
+            'start': self.start.isoformat(),
+            'end': self.end.isoformat(),
+            'granularity': self.granularity,
+            'group_by': self.group_by,
+            'totals': {m: (str(v) if m in ('revenue', 'commission') else v) for m, v in totals.items()},
+            'series': (
+                {('' if group is None else str(group)): serialize(points) for group, points in series.items()}
+                if self.group_by else serialize(series)
+            ),
+        }
@@ -9,13 +9,12 @@ from rest_framework import status
 from rest_framework.authtoken.models import Token
 from django.db.models import Q
 from decimal import Decimal
-import googlemaps
-from django.conf import settings
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
 import json
 
 from .models import Ride, RideDestination, AppUser
+from .maps_client import maps_client
 
 
 def broadcast_ride_update(ride):
@@ -47,7 +46,8 @@ def broadcast_ride_update(ride):
 def calculate_route_distance_and_price(ride):
     """
     Calcula la distancia total y precio de una carrera con múltiples destinos
-    usando Google Maps Distance Matrix API
+    usando Google Maps Directions API (todos los tramos en una sola consulta
+    con paradas intermedias; los tramos sin cambios salen de la caché)
     
     Args:
         ride: Objeto Ride
@@ -62,9 +62,6 @@ def calculate_route_distance_and_price(ride):
         if not destinations.exists():
             return {'distance_km': 0.0, 'price': Decimal('0.00')}
         
-        # Inicializar cliente de Google Maps
-        gmaps = googlemaps.Client(key=settings.GOOGLE_API_KEY)
-        
         # Crear lista de waypoints: [Origen, Destino1, Destino2, ...]
         waypoints = [
             (ride.origin_latitude, ride.origin_longitude)
@@ -74,24 +71,9 @@ def calculate_route_distance_and_price(ride):
             waypoints.append((dest.destination_latitude, dest.destination_longitude))
         
         # Calcular distancia total sumando segmentos consecutivos
-        total_distance_meters = 0
-        
-        for i in range(len(waypoints) - 1):
-            origin = waypoints[i]
-            destination = waypoints[i + 1]
-            
-            # Llamar a Distance Matrix API
-            result = gmaps.distance_matrix(
-                origins=[origin],
-                destinations=[destination],
-                mode='driving'
-            )
-            
-            if result['rows'][0]['elements'][0]['status'] == 'OK':
-                distance = result['rows'][0]['elements'][0]['distance']['value']
-                total_distance_meters += distance
-            else:
-                print(f"No se pudo calcular distancia del segmento {i+1}")
+        total_distance_meters, failed_segments = maps_client.route_distance_m(waypoints)
+        if failed_segments:
+            print(f"No se pudo calcular distancia de {failed_segments} segmento(s)")
         
         # Convertir a kilómetros
         distance_km = total_distance_meters / 1000.0
@@ -5,7 +5,7 @@ Incluye endpoints para Flutter y otras apps móviles
 
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .api_views import LoginAPIView, save_webpush_subscription, UpdateLocationAPIView, test_push_notification, driver_info
+from .api_views import LoginAPIView, LogoutAPIView, save_webpush_subscription, UpdateLocationAPIView, test_push_notification, notification_metrics, driver_info, driver_track_view, talk_groups_view, talk_group_members_view, audio_clips_view, audio_clip_stream_view
 from .badge_api import get_badge_count, clear_badge, mark_messages_read
 from .api_viewsets import (
     ProfileViewSet, RegisterViewSet, DriverViewSet,
@@ -28,6 +28,7 @@ urlpatterns = [
     # AUTENTICACIÓN
     # =====================================================
     path('login/', LoginAPIView.as_view(), name='api_login'),
+    path('logout/', LogoutAPIView.as_view(), name='api_logout'),
     
     # =====================================================
     # REGISTRO
@@ -46,12 +47,21 @@ urlpatterns = [
     # UBICACIÓN
     # =====================================================
     path('update-location/', UpdateLocationAPIView.as_view(), name='api_update_location'),
+    path('drivers/<int:driver_id>/track/', driver_track_view, name='api_driver_track'),
     
     # =====================================================
     # INFORMACIÓN DE CONDUCTORES
     # =====================================================
     path('driver-info/<str:driver_id>/', driver_info, name='api_driver_info'),
     
+    # =====================================================
+    # WALKIE-TALKIE: GRUPOS DE CONVERSACIÓN
+    # =====================================================
+    path('talk-groups/', talk_groups_view, name='api_talk_groups'),
+    path('talk-groups/<int:talk_group_id>/members/', talk_group_members_view, name='api_talk_group_members'),
+    path('audio/clips/', audio_clips_view, name='api_audio_clips'),
+    path('audio/clips/<int:clip_id>/', audio_clip_stream_view, name='api_audio_clip_stream'),
+    
     # =====================================================
     # BADGES Y NOTIFICACIONES
     # =====================================================
@@ -60,6 +70,7 @@ urlpatterns = [
     path('mark-messages-read/', mark_messages_read, name='api_mark_messages_read'),
     path('save-subscription/', save_webpush_subscription, name='api_save_subscription'),
     path('test-push-notification/', test_push_notification, name='api_test_push_notification'),
+    path('notifications/metrics/', notification_metrics, name='api_notification_metrics'),
     
     # =====================================================
     # FIREBASE CLOUD MESSAGING (FCM)
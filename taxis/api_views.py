@@ -1,13 +1,14 @@
 from rest_framework.views import APIView
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.authtoken.models import Token
 from django.contrib.auth import authenticate, get_user_model
 from django.utils import timezone
 from django.db.models import Q, Avg, Count, Sum
-from .models import Taxi, Ride, RideDestination, PriceNegotiation, AppUser
+from .models import Taxi, Ride, RideDestination, PriceNegotiation, AppUser, Organization, TalkGroup
+from .location_pipeline import location_ingestor
 from datetime import datetime, timedelta
 
 User = get_user_model()
@@ -85,6 +86,15 @@ class LoginAPIView(APIView):
         )
 
 
+# 🚪 Logout de la app: borra el token (y con él su entrada en la caché de autenticación)
+class LogoutAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+    
+    def post(self, request):
+        Token.objects.filter(user=request.user).delete()
+        return Response({"message": "Sesión cerrada."}, status=status.HTTP_200_OK)
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def save_webpush_subscription(request):
@@ -198,18 +208,17 @@ class UpdateLocationAPIView(APIView):
             )
 
         try:
-            # Actualizar Taxi
-            taxi = user.taxi
-            taxi.latitude = lat
-            taxi.longitude = lng
-            taxi.save()
-            logger.info(f"✅ [UPDATE_LOCATION] Taxi actualizado: {taxi.id} → ({lat}, {lng})")
-            
-            # También actualizar AppUser para tener ubicación en ambos modelos
-            user.last_latitude = lat
-            user.last_longitude = lng
-            user.save(update_fields=['last_latitude', 'last_longitude'])
-            logger.info(f"✅ [UPDATE_LOCATION] Usuario actualizado: {user.username} → ({lat}, {lng})")
+            # Encolar la ubicación: Taxi y AppUser se actualizan en lote (escritura diferida)
+            driver = location_ingestor.resolve_driver(user.id, create_taxi=False)
+            if driver is None:
+                raise Taxi.DoesNotExist
+            if not location_ingestor.record(driver, lat, lng):
+                logger.error(f"❌ [UPDATE_LOCATION] Ubicación descartada para {user.username}: ({lat}, {lng})")
+                return Response(
+                    {'error': 'Coordenadas inválidas', 'latitude': latitude, 'longitude': longitude},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            logger.info(f"✅ [UPDATE_LOCATION] Ubicación encolada: taxi {driver.taxi_id} → ({lat}, {lng})")
             
             return Response(
                 {
@@ -218,7 +227,7 @@ class UpdateLocationAPIView(APIView):
                     'data': {
                         'latitude': lat,
                         'longitude': lng,
-                        'taxi_id': taxi.id,
+                        'taxi_id': driver.taxi_id,
                         'driver_id': user.id,
                         'driver_name': user.get_full_name() or user.username
                     }
@@ -281,6 +290,28 @@ def test_push_notification(request):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+# 📊 Métricas del envío unificado de notificaciones
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def notification_metrics(request):
+    """
+    GET /api/notifications/metrics/
+    
+    Contadores de notification_fanout (por canal), de la cola de tareas y de la
+    caché de identidades de los handshakes WebSocket (una tormenta de
+    reconexiones se ve en ws_auth)
+    """
+    from .middleware import ws_auth_cache
+    from .notification_fanout import notification_fanout
+    from .task_queue import task_queue
+    
+    return Response({
+        'fanout': notification_fanout.stats,
+        'task_queue': task_queue.stats,
+        'ws_auth': {**ws_auth_cache.stats, 'hit_rate': ws_auth_cache.hit_rate()},
+    })
+
+
 # 📱 Registrar token FCM
 @api_view(['POST'])
 def register_fcm_token_view(request):
@@ -356,6 +387,7 @@ def register_fcm_token_view(request):
 
 # 📊 Obtener estadísticas del conductor
 @api_view(['GET'])
+@permission_classes([IsAuthenticated])
 def driver_stats_view(request):
     """
     Obtener estadísticas del conductor autenticado
@@ -369,36 +401,16 @@ def driver_stats_view(request):
     }
     """
     try:
-        # Validar token manualmente
-        auth_header = request.headers.get('Authorization', '')
-        if not auth_header.startswith('Token '):
-            return Response({
-                'error': 'Token de autenticación no proporcionado'
-            }, status=status.HTTP_401_UNAUTHORIZED)
-        
-        token_key = auth_header.replace('Token ', '')
-        
-        try:
-            token = Token.objects.get(key=token_key)
-            user = token.user
-        except Token.DoesNotExist:
-            return Response({
-                'error': 'Token inválido'
-            }, status=status.HTTP_401_UNAUTHORIZED)
-        
-        # Obtener estadísticas reales del conductor
-        from django.db.models import Sum, Avg, Count
-        from django.utils import timezone
+        # Autenticado por CachedTokenAuthentication
+        user = request.user
         
-        total_rides = Ride.objects.filter(driver=user).count()
-        completed_rides = Ride.objects.filter(driver=user, status='completed').count()
+        # Estadísticas del conductor desde los acumulados diarios
+        from .ride_stats import driver_summary
         
-        # Ganancias totales
-        total_earnings = Ride.objects.filter(
-            driver=user,
-            status='completed',
-            price__isnull=False
-        ).aggregate(total=Sum('price'))['total'] or 0
+        summary = driver_summary(user)
+        total_rides = summary['total_rides']
+        completed_rides = summary['completed_rides']
+        total_earnings = summary['total_earnings']
         
         # Rating promedio (si existe el campo)
         average_rating = 4.5  # Placeholder, ajustar si tienes campo de rating
@@ -424,6 +436,7 @@ def driver_stats_view(request):
 
 # 📜 Obtener historial de carreras del conductor
 @api_view(['GET'])
+@permission_classes([IsAuthenticated])
 def ride_history_view(request):
     """
     Obtener historial de carreras del conductor autenticado
@@ -443,22 +456,8 @@ def ride_history_view(request):
     ]
     """
     try:
-        # Validar token manualmente
-        auth_header = request.headers.get('Authorization', '')
-        if not auth_header.startswith('Token '):
-            return Response({
-                'error': 'Token de autenticación no proporcionado'
-            }, status=status.HTTP_401_UNAUTHORIZED)
-        
-        token_key = auth_header.replace('Token ', '')
-        
-        try:
-            token = Token.objects.get(key=token_key)
-            user = token.user
-        except Token.DoesNotExist:
-            return Response({
-                'error': 'Token inválido'
-            }, status=status.HTTP_401_UNAUTHORIZED)
+        # Autenticado por CachedTokenAuthentication
+        user = request.user
         
         # Obtener carreras completadas y canceladas del conductor
         rides = Ride.objects.filter(
@@ -493,6 +492,7 @@ def ride_history_view(request):
 
 # 🚕 Obtener carreras disponibles para el conductor
 @api_view(['GET'])
+@permission_classes([IsAuthenticated])
 def available_rides_view(request):
     """
     Obtener carreras disponibles (status='requested') para que el conductor acepte
@@ -516,22 +516,8 @@ def available_rides_view(request):
     ]
     """
     try:
-        # Validar token
-        auth_header = request.headers.get('Authorization', '')
-        if not auth_header.startswith('Token '):
-            return Response({
-                'error': 'Token de autenticación no proporcionado'
-            }, status=status.HTTP_401_UNAUTHORIZED)
-        
-        token_key = auth_header.replace('Token ', '')
-        
-        try:
-            token = Token.objects.get(key=token_key)
-            user = token.user
-        except Token.DoesNotExist:
-            return Response({
-                'error': 'Token inválido'
-            }, status=status.HTTP_401_UNAUTHORIZED)
+        # Autenticado por CachedTokenAuthentication
+        user = request.user
         
         # ✅ MULTI-TENANT: Filtrar por organización
         if user.organization:
@@ -578,6 +564,7 @@ def available_rides_view(request):
 
 # 🚗 Obtener carreras en curso del conductor
 @api_view(['GET'])
+@permission_classes([IsAuthenticated])
 def driver_active_rides_view(request):
     """
     Obtener carreras activas del conductor (accepted, in_progress)
@@ -600,22 +587,8 @@ def driver_active_rides_view(request):
     ]
     """
     try:
-        # Validar token
-        auth_header = request.headers.get('Authorization', '')
-        if not auth_header.startswith('Token '):
-            return Response({
-                'error': 'Token de autenticación no proporcionado'
-            }, status=status.HTTP_401_UNAUTHORIZED)
-        
-        token_key = auth_header.replace('Token ', '')
-        
-        try:
-            token = Token.objects.get(key=token_key)
-            user = token.user
-        except Token.DoesNotExist:
-            return Response({
-                'error': 'Token inválido'
-            }, status=status.HTTP_401_UNAUTHORIZED)
+        # Autenticado por CachedTokenAuthentication
+        user = request.user
         
         # Obtener carreras activas del conductor
         rides = Ride.objects.filter(
@@ -668,6 +641,7 @@ def driver_active_rides_view(request):
 
 # ✅ Aceptar una carrera
 @api_view(['POST'])
+@permission_classes([IsAuthenticated])
 def accept_ride_view(request, ride_id):
     """
     Aceptar una carrera disponible
@@ -682,22 +656,8 @@ def accept_ride_view(request, ride_id):
     }
     """
     try:
-        # Validar token
-        auth_header = request.headers.get('Authorization', '')
-        if not auth_header.startswith('Token '):
-            return Response({
-                'error': 'Token de autenticación no proporcionado'
-            }, status=status.HTTP_401_UNAUTHORIZED)
-        
-        token_key = auth_header.replace('Token ', '')
-        
-        try:
-            token = Token.objects.get(key=token_key)
-            user = token.user
-        except Token.DoesNotExist:
-            return Response({
-                'error': 'Token inválido'
-            }, status=status.HTTP_401_UNAUTHORIZED)
+        # Autenticado por CachedTokenAuthentication
+        user = request.user
         
         # Verificar que el usuario sea conductor
         if user.role != 'driver':
@@ -756,6 +716,7 @@ def accept_ride_view(request, ride_id):
 
 # 🏁 Iniciar carrera
 @api_view(['POST'])
+@permission_classes([IsAuthenticated])
 def start_ride_view(request, ride_id):
     """
     Iniciar una carrera aceptada
@@ -770,22 +731,8 @@ def start_ride_view(request, ride_id):
     }
     """
     try:
-        # Validar token
-        auth_header = request.headers.get('Authorization', '')
-        if not auth_header.startswith('Token '):
-            return Response({
-                'error': 'Token de autenticación no proporcionado'
-            }, status=status.HTTP_401_UNAUTHORIZED)
-        
-        token_key = auth_header.replace('Token ', '')
-        
-        try:
-            token = Token.objects.get(key=token_key)
-            user = token.user
-        except Token.DoesNotExist:
-            return Response({
-                'error': 'Token inválido'
-            }, status=status.HTTP_401_UNAUTHORIZED)
+        # Autenticado por CachedTokenAuthentication
+        user = request.user
         
         # Obtener la carrera
         try:
@@ -818,6 +765,7 @@ def start_ride_view(request, ride_id):
 
 # ✅ Completar carrera
 @api_view(['POST'])
+@permission_classes([IsAuthenticated])
 def complete_ride_view(request, ride_id):
     """
     Completar una carrera en progreso
@@ -832,22 +780,8 @@ def complete_ride_view(request, ride_id):
     }
     """
     try:
-        # Validar token
-        auth_header = request.headers.get('Authorization', '')
-        if not auth_header.startswith('Token '):
-            return Response({
-                'error': 'Token de autenticación no proporcionado'
-            }, status=status.HTTP_401_UNAUTHORIZED)
-        
-        token_key = auth_header.replace('Token ', '')
-        
-        try:
-            token = Token.objects.get(key=token_key)
-            user = token.user
-        except Token.DoesNotExist:
-            return Response({
-                'error': 'Token inválido'
-            }, status=status.HTTP_401_UNAUTHORIZED)
+        # Autenticado por CachedTokenAuthentication
+        user = request.user
         
         # Obtener la carrera
         try:
@@ -888,6 +822,7 @@ def complete_ride_view(request, ride_id):
 
 # ❌ Cancelar carrera
 @api_view(['POST'])
+@permission_classes([IsAuthenticated])
 def cancel_ride_view(request, ride_id):
     """
     Cancelar una carrera
@@ -904,22 +839,8 @@ def cancel_ride_view(request, ride_id):
     }
     """
     try:
-        # Validar token
-        auth_header = request.headers.get('Authorization', '')
-        if not auth_header.startswith('Token '):
-            return Response({
-                'error': 'Token de autenticación no proporcionado'
-            }, status=status.HTTP_401_UNAUTHORIZED)
-        
-        token_key = auth_header.replace('Token ', '')
-        
-        try:
-            token = Token.objects.get(key=token_key)
-            user = token.user
-        except Token.DoesNotExist:
-            return Response({
-                'error': 'Token inválido'
-            }, status=status.HTTP_401_UNAUTHORIZED)
+        # Autenticado por CachedTokenAuthentication
+        user = request.user
         
         # Obtener la carrera (puede ser conductor o cliente)
         try:
@@ -969,6 +890,7 @@ def cancel_ride_view(request, ride_id):
 
 # 📋 Obtener detalles de una carrera específica
 @api_view(['GET'])
+@permission_classes([IsAuthenticated])
 def ride_detail_api_view(request, ride_id):
     """
     Obtener detalles completos de una carrera
@@ -997,22 +919,8 @@ def ride_detail_api_view(request, ride_id):
     }
     """
     try:
-        # Validar token
-        auth_header = request.headers.get('Authorization', '')
-        if not auth_header.startswith('Token '):
-            return Response({
-                'error': 'Token de autenticación no proporcionado'
-            }, status=status.HTTP_401_UNAUTHORIZED)
-        
-        token_key = auth_header.replace('Token ', '')
-        
-        try:
-            token = Token.objects.get(key=token_key)
-            user = token.user
-        except Token.DoesNotExist:
-            return Response({
-                'error': 'Token inválido'
-            }, status=status.HTTP_401_UNAUTHORIZED)
+        # Autenticado por CachedTokenAuthentication
+        user = request.user
         
         # Obtener la carrera
         try:
@@ -1044,6 +952,7 @@ def ride_detail_api_view(request, ride_id):
                 'address': dest.destination,
                 'latitude': dest.destination_latitude,
                 'longitude': dest.destination_longitude,
+                'address': dest.address,
                 'order': dest.order
             })
         
@@ -1064,6 +973,7 @@ def ride_detail_api_view(request, ride_id):
                 'phone': getattr(ride.driver, 'phone_number', 'N/A'),
             } if ride.driver else None,
             'origin': ride.origin,
+            'origin_address': ride.display_origin,
             'origin_latitude': ride.origin_latitude,
             'origin_longitude': ride.origin_longitude,
             'destinations': destinations,
@@ -1321,13 +1231,12 @@ def accept_price_negotiation(request, negotiation_id):
                 'type': 'new_ride'
             }
             
-            # Enviar a cada conductor
-            for driver in available_drivers:
-                send_new_ride_notification_fcm(
-                    driver=driver,
-                    ride=ride,
-                    extra_data=ride_data
-                )
+            # Un solo envío multicast para todos los conductores
+            send_new_ride_notification_fcm(
+                ride,
+                drivers=available_drivers,
+                extra_data=ride_data
+            )
             
             print(f"✅ Notificaciones FCM enviadas a conductores para carrera #{ride.id}")
             
@@ -1636,13 +1545,12 @@ def client_accept_counter_offer(request, negotiation_id):
                 'type': 'new_ride'
             }
             
-            # Enviar a cada conductor
-            for driver in available_drivers:
-                send_new_ride_notification_fcm(
-                    driver=driver,
-                    ride=ride,
-                    extra_data=ride_data
-                )
+            # Un solo envío multicast para todos los conductores
+            send_new_ride_notification_fcm(
+                ride,
+                drivers=available_drivers,
+                extra_data=ride_data
+            )
             
             print(f"✅ Notificaciones FCM enviadas a conductores para carrera #{ride.id}")
             
@@ -2039,6 +1947,233 @@ def driver_info(request, driver_id):
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def driver_track_view(request, driver_id):
+    """
+    Recorrido GPS de un conductor en un rango de tiempo (reproducción de rutas,
+    disputas y kilometraje).
+
+    GET /api/drivers/<driver_id>/track/?start=2025-01-01T08:00:00&end=2025-01-01T12:00:00
+    Sin parámetros retorna el recorrido del día de hoy.
+    Con ?points=0 omite la lista de puntos y retorna solo la polyline.
+    """
+    from django.utils.dateparse import parse_datetime
+    from .location_history import get_driver_track, encode_polyline, track_distance_km
+
+    user = request.user
+    driver = AppUser.objects.filter(id=driver_id, role='driver').only('id', 'organization_id').first()
+    if not driver:
+        return Response({'error': 'Conductor no encontrado'}, status=status.HTTP_404_NOT_FOUND)
+
+    # El propio conductor, el admin de su cooperativa o el superadmin
+    is_org_admin = user.role == 'admin' and user.organization_id and user.organization_id == driver.organization_id
+    if not (user.id == driver.id or user.is_superuser or is_org_admin):
+        return Response({'error': 'No tienes permiso para ver este recorrido'}, status=status.HTTP_403_FORBIDDEN)
+
+    def parse_param(name, default):
+        value = request.query_params.get(name)
+        if not value:
+            return default
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise ValueError(f'Fecha inválida en "{name}": {value}')
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
+
+    try:
+        today_start = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        start = parse_param('start', today_start)
+        end = parse_param('end', timezone.now())
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    if end < start:
+        return Response({'error': 'El rango de fechas es inválido'}, status=status.HTTP_400_BAD_REQUEST)
+    if end - start > timedelta(days=7):
+        return Response({'error': 'El rango máximo es de 7 días'}, status=status.HTTP_400_BAD_REQUEST)
+
+    points = get_driver_track(driver.id, start, end)
+
+    data = {
+        'driver_id': driver.id,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'point_count': len(points),
+        'distance_km': round(track_distance_km(points), 3),
+        'polyline': encode_polyline(points),
+    }
+    if request.query_params.get('points', '1') != '0':
+        data['points'] = [
+            {'t': moment.isoformat(), 'lat': lat, 'lng': lng}
+            for moment, lat, lng in points
+        ]
+    return Response(data, status=status.HTTP_200_OK)
+
+
+# ============================================
+# WALKIE-TALKIE: GRUPOS DE CONVERSACIÓN
+# ============================================
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated])
+def talk_groups_view(request):
+    """
+    GET: Grupos de conversación a los que el usuario puede unirse.
+    POST: Crear un grupo (solo la central). Body:
+        {"name": "Zona Norte", "kind": "zone", "member_ids": [1, 2, 3]}
+    """
+    from .talk_groups import add_members, serialize_talk_group, user_talk_groups
+
+    user = request.user
+    if request.method == 'GET':
+        groups = [serialize_talk_group(group) for group in user_talk_groups(user)]
+        return Response({'talk_groups': groups}, status=status.HTTP_200_OK)
+
+    if not (user.is_superuser or (user.role == 'admin' and user.organization_id)):
+        return Response({'error': 'Solo la central puede crear grupos'}, status=status.HTTP_403_FORBIDDEN)
+
+    name = (request.data.get('name') or '').strip()
+    kind = request.data.get('kind', 'zone')
+    if not name:
+        return Response({'error': 'El nombre es requerido'}, status=status.HTTP_400_BAD_REQUEST)
+    if kind not in dict(TalkGroup.KIND_CHOICES):
+        return Response({'error': f'Tipo de grupo inválido: {kind}'}, status=status.HTTP_400_BAD_REQUEST)
+
+    organization_id = user.organization_id
+    if user.is_superuser and request.data.get('organization_id'):
+        organization_id = request.data.get('organization_id')
+    if not organization_id or not Organization.objects.filter(id=organization_id).exists():
+        return Response({'error': 'Cooperativa no encontrada'}, status=status.HTTP_400_BAD_REQUEST)
+
+    group = TalkGroup.objects.create(organization_id=organization_id, name=name, kind=kind, created_by=user)
+    add_members(group, request.data.get('member_ids') or [])
+    return Response(serialize_talk_group(group), status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET', 'POST', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def talk_group_members_view(request, talk_group_id):
+    """
+    GET: Miembros del grupo.
+    POST / DELETE: Agregar o quitar miembros (solo la central). Body: {"user_ids": [1, 2]}
+    Los usuarios quitados se desconectan del canal de inmediato.
+    """
+    from .talk_groups import add_members, can_join, can_manage, remove_members
+
+    group = TalkGroup.objects.filter(id=talk_group_id).first()
+    if group is None or not can_join(request.user, group):
+        return Response({'error': 'Grupo no encontrado'}, status=status.HTTP_404_NOT_FOUND)
+
+    if request.method == 'GET':
+        members = group.memberships.select_related('user').order_by('user__username')
+        return Response({
+            'talk_group_id': group.id,
+            'members': [
+                {'id': m.user_id, 'username': m.user.username, 'name': m.user.get_full_name()}
+                for m in members
+            ],
+        }, status=status.HTTP_200_OK)
+
+    if not can_manage(request.user, group):
+        return Response({'error': 'Solo la central puede administrar los miembros'}, status=status.HTTP_403_FORBIDDEN)
+
+    try:
+        user_ids = [int(user_id) for user_id in request.data.get('user_ids') or []]
+    except (TypeError, ValueError):
+        return Response({'error': 'user_ids debe ser una lista de IDs'}, status=status.HTTP_400_BAD_REQUEST)
+
+    if request.method == 'POST':
+        return Response({'added': add_members(group, user_ids)}, status=status.HTTP_200_OK)
+    return Response({'removed': remove_members(group, user_ids)}, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def audio_clips_view(request):
+    """
+    Últimas transmisiones grabadas de una sala, para ponerse al día al reconectar.
+
+    GET /api/audio/clips/?talk_group_id=3&limit=10&since=2025-01-01T08:00:00&include_audio=1
+    Sin talk_group_id usa el canal general de la cooperativa del usuario
+    (el superadmin la indica con ?organization=<id>).
+    Con include_audio=1 el audio viene en base64 (máximo 20 clips) y no hace falta
+    pedir cada clip por separado.
+    """
+    import base64
+    from django.utils.dateparse import parse_datetime
+    from .audio_clips import read_clip_chunks, recent_clips
+    from .talk_groups import can_access_room, general_audio_group
+
+    talk_group_id = request.query_params.get('talk_group_id')
+    if talk_group_id:
+        room = f'audio_tg_{talk_group_id}'
+    else:
+        room = general_audio_group(request.user, request.query_params.get('organization'))
+        if room is None:
+            return Response({'error': 'organization es requerido'}, status=status.HTTP_400_BAD_REQUEST)
+    if not can_access_room(request.user, room):
+        return Response({'error': 'No tienes acceso a esta sala'}, status=status.HTTP_403_FORBIDDEN)
+
+    include_audio = request.query_params.get('include_audio') == '1'
+    try:
+        limit = min(int(request.query_params.get('limit', 10)), 20 if include_audio else 100)
+    except ValueError:
+        return Response({'error': 'limit debe ser un número'}, status=status.HTTP_400_BAD_REQUEST)
+
+    since = None
+    if request.query_params.get('since'):
+        since = parse_datetime(request.query_params['since'])
+        if since is None:
+            return Response({'error': 'Fecha inválida en "since"'}, status=status.HTTP_400_BAD_REQUEST)
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+
+    clips = []
+    for clip in recent_clips(room, limit=max(limit, 1), since=since):
+        item = {
+            'id': clip.id,
+            'speaker_id': clip.speaker_id,
+            'speaker_name': clip.speaker_name,
+            'mime_type': clip.mime_type,
+            'size_bytes': clip.size_bytes,
+            'started_at': clip.started_at.isoformat(),
+            'ended_at': clip.ended_at.isoformat(),
+            'url': f'/api/audio/clips/{clip.id}/',
+        }
+        if include_audio:
+            try:
+                item['audio'] = base64.b64encode(b''.join(read_clip_chunks(clip))).decode('ascii')
+            except FileNotFoundError:
+                continue
+        clips.append(item)
+
+    return Response({'room': room, 'clips': clips}, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def audio_clip_stream_view(request, clip_id):
+    """Reproduce un clip grabado (respuesta en streaming, sin cargarlo completo en memoria)"""
+    from django.http import StreamingHttpResponse
+    from .audio_clips import clip_full_path, read_clip_chunks
+    from .models import AudioClip
+    from .talk_groups import can_access_room
+    import os
+
+    clip = AudioClip.objects.filter(id=clip_id).first()
+    if clip is None or not can_access_room(request.user, clip.room):
+        return Response({'error': 'Clip no encontrado'}, status=status.HTTP_404_NOT_FOUND)
+    if not os.path.exists(clip_full_path(clip.file_path)):
+        return Response({'error': 'El audio ya no está disponible'}, status=status.HTTP_410_GONE)
+
+    response = StreamingHttpResponse(read_clip_chunks(clip), content_type=clip.mime_type)
+    response['Content-Length'] = str(clip.size_bytes)
+    response['Cache-Control'] = 'private, max-age=3600'
+    return response
+
+
 # ============================================
 # GESTIÓN DE DESTINOS EN CARRERAS ACTIVAS
 # ============================================
@@ -4,3 +4,13 @@ from django.apps import AppConfig
 class TaxisConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "taxis"
+
+    def ready(self):
+        # Registrar el grabador de recorridos, el snapshot de flota y la difusión en la ingesta de ubicaciones
+        from . import fleet_snapshot, location_fanout, location_history  # noqa: F401
+        # Registrar las tareas en segundo plano y la geocodificación de carreras nuevas
+        from . import ride_addresses, tasks  # noqa: F401
+        # Acumulados por conductor al completar o cancelar carreras
+        from . import ride_stats  # noqa: F401
+        # Invalidación de las cachés de autenticación (API por token y handshakes WebSocket)
+        from . import authentication, middleware  # noqa: F401
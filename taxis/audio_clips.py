@@ -0,0 +1,351 @@
+"""
+Grabación y reproducción de transmisiones del walkie-talkie
+
+AudioConsumer solo retransmite en vivo: quien estaba desconectado perdía el
+audio. El ClipRecorder escribe cada transmisión en disco a medida que llegan
+los chunks (sin acumularla en memoria) y al terminar la indexa como
+`AudioClip` (sala, hablante, hora). Un conductor que se reconecta pide los
+últimos N clips de su sala en una sola consulta y los reproduce.
+
+- Una transmisión termina con transmission_stop, al desconectarse o tras
+  AUDIO_CLIP_GAP_SECONDS sin chunks.
+- Los clips se borran después de AUDIO_CLIP_RETENTION_HOURS
+  (comando `purge_audio_clips`).
+- Los frames binarios Opus traen paquetes sueltos, sin contenedor: se
+  empaquetan en Ogg (OpusHead + OpusTags + una página por paquete) para que
+  el clip se pueda reproducir como audio/ogg. AAC (ADTS), WebM y el audio
+  JSON ya llegan en un formato reproducible y se escriben tal cual.
+"""
+import logging
+import os
+import random
+import struct
+import threading
+import time
+import uuid
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+AUDIO_CLIPS_DIR = getattr(settings, 'AUDIO_CLIPS_DIR', os.path.join(settings.MEDIA_ROOT, 'audio_clips'))
+
+# Permite desactivar la grabación (ej. despliegues sin disco)
+AUDIO_CLIPS_ENABLED = getattr(settings, 'AUDIO_CLIPS_ENABLED', True)
+
+# Horas que se conservan los clips
+CLIP_RETENTION_HOURS = getattr(settings, 'AUDIO_CLIP_RETENTION_HOURS', 24)
+
+# Segundos sin chunks tras los cuales una transmisión se da por terminada
+CLIP_GAP_SECONDS = getattr(settings, 'AUDIO_CLIP_GAP_SECONDS', 3)
+
+# Tamaño máximo de un clip (protege el disco de transmisiones colgadas)
+CLIP_MAX_BYTES = 5 * 1024 * 1024
+
+FinishedClip = namedtuple('FinishedClip', [
+    'room', 'speaker_id', 'speaker_name', 'mime_type', 'file_path',
+    'size_bytes', 'chunk_count', 'started_at', 'ended_at',
+])
+
+
+# ============================================
+# OGG / OPUS
+# ============================================
+
+def _ogg_crc_table():
+    table = []
+    for i in range(256):
+        crc = i << 24
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x04C11DB7) if crc & 0x80000000 else crc << 1
+        table.append(crc & 0xFFFFFFFF)
+    return table
+
+
+_OGG_CRC_TABLE = _ogg_crc_table()
+_OGG_PAGE_HEADER = struct.Struct('<4sBBqIII')
+
+OGG_CONTINUED = 0x01
+OGG_BOS = 0x02
+OGG_EOS = 0x04
+
+
+def ogg_crc(data):
+    """CRC-32 de las páginas Ogg (polinomio 0x04C11DB7, sin reflejar)"""
+    crc = 0
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ _OGG_CRC_TABLE[((crc >> 24) ^ byte) & 0xFF]
+    return crc
+
+
+def opus_packet_samples(packet):
+    """Muestras (a 48 kHz) de un paquete Opus según su byte TOC (RFC 6716 §3.1)"""
+    if not packet:
+        return 0
+    config = packet[0] >> 3
+    if config < 12:
+        frame = (480, 960, 1920, 2880)[config % 4]   # SILK: 10, 20, 40, 60 ms
+    elif config < 16:
+        frame = (480, 960)[config % 2]               # Híbrido: 10, 20 ms
+    else:
+        frame = (120, 240, 480, 960)[config % 4]     # CELT: 2.5, 5, 10, 20 ms
+    code = packet[0] & 0x03
+    if code == 0:
+        frames = 1
+    elif code in (1, 2):
+        frames = 2
+    else:
+        frames = packet[1] & 0x3F if len(packet) > 1 else 0
+    return frame * frames
+
+
+class OggOpusWriter:
+    """
+    Escribe paquetes Opus sueltos como un stream Ogg/Opus (RFC 7845)
+
+    El último paquete se retiene hasta el siguiente (o hasta `close`) para
+    poder marcar su página con fin de stream.
+    """
+
+    def __init__(self, handle):
+        self.handle = handle
+        self.serial = random.getrandbits(32)
+        self.sequence = 0
+        self.granule = 0
+        self.bytes_written = 0
+        self._pending = None
+
+    def _page(self, packet, granule, flags):
+        lacing = [255] * (len(packet) // 255) + [len(packet) % 255]
+        offset = 0
+        # Más de 255 segmentos: el paquete sigue en páginas de continuación
+        for first in range(0, len(lacing), 255):
+            segments = lacing[first:first + 255]
+            size = sum(segments)
+            last = first + 255 >= len(lacing)
+            header_type = (flags & ~OGG_EOS if first == 0 else OGG_CONTINUED) | (flags & OGG_EOS if last else 0)
+            header = _OGG_PAGE_HEADER.pack(
+                b'OggS', 0, header_type, granule if last else -1, self.serial, self.sequence, 0
+            ) + bytes([len(segments)]) + bytes(segments)
+            page = header + packet[offset:offset + size]
+            page = page[:22] + struct.pack('<I', ogg_crc(page)) + page[26:]
+            self.handle.write(page)
+            self.bytes_written += len(page)
+            self.sequence += 1
+            offset += size
+
+    def _start(self, first_packet):
+        channels = 2 if first_packet[0] & 0x04 else 1
+        # Versión 1, canales, pre-skip 0, 48 kHz de origen, ganancia 0, mapeo 0
+        self._page(b'OpusHead' + struct.pack('<BBHIhB', 1, channels, 0, 48000, 0, 0), 0, OGG_BOS)
+        vendor = b'taxis'
+        self._page(b'OpusTags' + struct.pack('<I', len(vendor)) + vendor + struct.pack('<I', 0), 0, 0)
+
+    def write_packet(self, packet):
+        if not packet:
+            return
+        if self.sequence == 0:
+            self._start(packet)
+        if self._pending is not None:
+            self._page(self._pending, self.granule, 0)
+        self.granule += opus_packet_samples(packet)
+        self._pending = bytes(packet)
+
+    def close(self):
+        if self._pending is not None:
+            self._page(self._pending, self.granule, OGG_EOS)
+            self._pending = None
+
+
+class _OpenClip:
+    """Transmisión en curso: archivo abierto en modo append"""
+
+    def __init__(self, directory, room, speaker_id, speaker_name, mime_type, opus_packets=False):
+        now = timezone.now()
+        self.room = room
+        self.speaker_id = speaker_id
+        self.speaker_name = speaker_name
+        self.mime_type = mime_type or 'audio/aac'
+        self.opus_packets = opus_packets
+        self.file_path = os.path.join(now.strftime('%Y%m%d'), f'{room}-{uuid.uuid4().hex}.bin')
+        full_path = os.path.join(directory, self.file_path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        self.handle = open(full_path, 'ab')
+        self.ogg = OggOpusWriter(self.handle) if opus_packets else None
+        self.started_at = now
+        self.ended_at = now
+        self.last_chunk = time.monotonic()
+        self.size = 0
+        self.chunks = 0
+
+    def write(self, payload):
+        if self.ogg is not None:
+            self.ogg.write_packet(payload)
+            self.size = self.ogg.bytes_written
+        else:
+            self.handle.write(payload)
+            self.size += len(payload)
+        self.chunks += 1
+        self.ended_at = timezone.now()
+        self.last_chunk = time.monotonic()
+
+    def close(self):
+        if self.ogg is not None:
+            self.ogg.close()
+            self.size = self.ogg.bytes_written
+        self.handle.close()
+        return FinishedClip(
+            self.room, self.speaker_id, self.speaker_name, self.mime_type, self.file_path,
+            self.size, self.chunks, self.started_at, self.ended_at,
+        )
+
+
+class ClipRecorder:
+    """Escribe transmisiones a disco por (sala, socket) y las indexa al terminar"""
+
+    def __init__(self, directory=AUDIO_CLIPS_DIR, gap_seconds=CLIP_GAP_SECONDS,
+                 max_bytes=CLIP_MAX_BYTES, enabled=AUDIO_CLIPS_ENABLED):
+        self.directory = directory
+        self.enabled = enabled
+        self.gap_seconds = gap_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._open = {}   # (room, channel_name) -> _OpenClip
+
+    def append(self, room, channel_name, speaker_id, speaker_name, mime_type, payload, complete=False,
+               opus_packets=False):
+        """
+        Agrega un chunk a la transmisión en curso (bloqueante: llamar desde un hilo)
+
+        Args:
+            complete: El chunk es un clip completo (audio JSON): se indexa de inmediato
+            opus_packets: El chunk es un paquete Opus sin contenedor (frame binario):
+                el clip se escribe como Ogg/Opus
+
+        Returns:
+            list[FinishedClip] terminados en esta llamada (ya indexados)
+        """
+        if not payload or not self.enabled:
+            return []
+        key = (room, channel_name)
+        finished = []
+        with self._lock:
+            clip = self._open.get(key)
+            if clip is not None and (
+                time.monotonic() - clip.last_chunk > self.gap_seconds
+                or clip.size + len(payload) > self.max_bytes
+                or clip.mime_type != (mime_type or clip.mime_type)
+                or clip.opus_packets != opus_packets
+            ):
+                finished.append(self._open.pop(key).close())
+                clip = None
+            if clip is None:
+                clip = self._open[key] = _OpenClip(
+                    self.directory, room, speaker_id, speaker_name, mime_type, opus_packets=opus_packets
+                )
+            clip.write(payload)
+            if complete:
+                finished.append(self._open.pop(key).close())
+        self._index(finished)
+        return finished
+
+    def finish(self, room, channel_name):
+        """Cierra e indexa la transmisión en curso de un socket (si la hay)"""
+        with self._lock:
+            clip = self._open.pop((room, channel_name), None)
+        if clip is None:
+            return None
+        finished = clip.close()
+        self._index([finished])
+        return finished
+
+    def finish_stale(self):
+        """Cierra las transmisiones sin chunks recientes (socket caído sin desconexión limpia)"""
+        now = time.monotonic()
+        with self._lock:
+            stale = [key for key, clip in self._open.items() if now - clip.last_chunk > self.gap_seconds]
+            finished = [self._open.pop(key).close() for key in stale]
+        self._index(finished)
+        return finished
+
+    def _index(self, finished):
+        from .models import AudioClip
+
+        if not finished:
+            return
+        try:
+            AudioClip.objects.bulk_create([
+                AudioClip(
+                    room=clip.room,
+                    speaker_id=clip.speaker_id or None,
+                    speaker_name=clip.speaker_name,
+                    mime_type=clip.mime_type,
+                    file_path=clip.file_path,
+                    size_bytes=clip.size_bytes,
+                    chunk_count=clip.chunk_count,
+                    started_at=clip.started_at,
+                    ended_at=clip.ended_at,
+                )
+                for clip in finished
+            ])
+        except Exception as e:
+            logger.error(f"❌ Error indexando {len(finished)} clips de audio: {e}")
+
+
+# Instancia global
+clip_recorder = ClipRecorder()
+
+
+def clip_full_path(file_path):
+    return os.path.join(clip_recorder.directory, file_path)
+
+
+def recent_clips(room, limit=10, since=None):
+    """Últimos `limit` clips de una sala (más recientes primero)"""
+    from .models import AudioClip
+
+    clips = AudioClip.objects.filter(room=room)
+    if since is not None:
+        clips = clips.filter(started_at__gt=since)
+    return list(clips.order_by('-started_at')[:limit])
+
+
+def read_clip_chunks(clip, chunk_size=64 * 1024):
+    """Generador con el audio de un clip en bloques (para StreamingHttpResponse)"""
+    with open(clip_full_path(clip.file_path), 'rb') as handle:
+        while True:
+            data = handle.read(chunk_size)
+            if not data:
+                return
+            yield data
+
+
+def purge_clips(retention_hours=CLIP_RETENTION_HOURS):
+    """
+    Borra los clips fuera de la ventana de retención (filas y archivos)
+
+    Returns:
+        int: Número de clips borrados
+    """
+    from .models import AudioClip
+
+    clip_recorder.finish_stale()
+    cutoff = timezone.now() - timedelta(hours=retention_hours)
+    expired = AudioClip.objects.filter(started_at__lt=cutoff)
+    removed_ids = []
+    for clip_id, file_path in expired.values_list('id', 'file_path').iterator():
+        try:
+            os.remove(clip_full_path(file_path))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"⚠️ No se pudo borrar {file_path}: {e}")
+            continue
+        removed_ids.append(clip_id)
+
+    for start in range(0, len(removed_ids), 500):
+        AudioClip.objects.filter(id__in=removed_ids[start:start + 500]).delete()
+    return len(removed_ids)
@@ -0,0 +1,83 @@
+"""
+Protocolo binario de audio para el walkie-talkie (ws/audio/conductores/)
+
+Cada frame binario lleva una cabecera fija de 12 bytes seguida del audio
+crudo (Opus, AAC o WebM), sin base64 ni JSON:
+
+    offset  tamaño  campo
+    0       2       magic b'WT'
+    2       1       versión del protocolo (1)
+    3       1       codec (ver CODEC_*)
+    4       4       secuencia (uint32 big-endian)
+    8       4       ID del hablante (uint32 big-endian, lo fija el servidor)
+    12      ...     audio
+
+El servidor solo reescribe el ID del hablante con el del usuario autenticado
+y reenvía los bytes tal cual al channel layer. Los clientes JSON siguen
+funcionando: reciben el mismo audio como base64 en un `audio_broadcast`.
+"""
+import base64
+import struct
+from collections import namedtuple
+
+MAGIC = b'WT'
+PROTOCOL_VERSION = 1
+
+CODEC_UNKNOWN = 0
+CODEC_OPUS = 1
+CODEC_AAC = 2
+CODEC_WEBM = 3
+
+# Codec -> mimeType que entiende el reproductor web (fallback JSON)
+CODEC_MIME_TYPES = {
+    CODEC_OPUS: 'audio/ogg; codecs=opus',
+    CODEC_AAC: 'audio/aac',
+    CODEC_WEBM: 'audio/webm',
+}
+
+_HEADER = struct.Struct('>2sBBII')
+HEADER_SIZE = _HEADER.size
+
+AudioFrameHeader = namedtuple('AudioFrameHeader', ['version', 'codec', 'sequence', 'speaker_id'])
+
+
+def pack_frame(speaker_id, sequence, codec, payload):
+    """Arma un frame binario (cabecera + audio)"""
+    return _HEADER.pack(MAGIC, PROTOCOL_VERSION, codec, sequence & 0xFFFFFFFF, speaker_id or 0) + bytes(payload)
+
+
+def parse_header(frame):
+    """
+    Lee la cabecera de un frame
+
+    Returns:
+        AudioFrameHeader o None si los bytes no usan este protocolo (audio legacy sin cabecera)
+    """
+    if len(frame) < HEADER_SIZE or frame[:2] != MAGIC:
+        return None
+    _, version, codec, sequence, speaker_id = _HEADER.unpack_from(frame)
+    if version != PROTOCOL_VERSION:
+        return None
+    return AudioFrameHeader(version, codec, sequence, speaker_id)
+
+
+def stamp_speaker(frame, speaker_id):
+    """Reescribe el ID del hablante sin tocar el audio (evita suplantación desde el cliente)"""
+    return frame[:8] + struct.pack('>I', speaker_id or 0) + frame[HEADER_SIZE:]
+
+
+def codec_from_mime(mime_type):
+    """Codec a partir del mimeType que envían los clientes JSON"""
+    mime_type = (mime_type or '').lower()
+    if 'opus' in mime_type or 'ogg' in mime_type:
+        return CODEC_OPUS
+    if 'aac' in mime_type or 'mp4' in mime_type or 'm4a' in mime_type:
+        return CODEC_AAC
+    if 'webm' in mime_type:
+        return CODEC_WEBM
+    return CODEC_UNKNOWN
+
+
+def frame_to_base64(frame):
+    """Extrae el audio de un frame como base64 (para clientes JSON)"""
+    return base64.b64encode(memoryview(frame)[HEADER_SIZE:]).decode('ascii')
@@ -3,6 +3,7 @@ Audio Push Notifications Module
 Handles sending audio notifications for walkie-talkie functionality
 """
 from .push_notifications import send_push_notification
+from .notification_fanout import FCM, WEBPUSH, Audience, notification_fanout
 import json
 import logging
 import base64
@@ -16,12 +17,19 @@ def send_audio_push_notification(sender, recipients, audio_data=None, message_ty
     
     Args:
         sender: User who sent the audio
-        recipients: List of users or single user to receive notification
+        recipients: List of users, single user or an Audience
         audio_data: Base64 audio data (optional)
         message_type: Type of audio message
+    
+    Returns:
+        bool: True if the notification was queued
     """
-    if not isinstance(recipients, list):
-        recipients = [recipients]
+    if isinstance(recipients, Audience):
+        audience = recipients
+    else:
+        if not isinstance(recipients, list):
+            recipients = [recipients]
+        audience = Audience.users(recipients)
     
     # Preparar datos del audio
     audio_payload = {
@@ -42,52 +50,45 @@ def send_audio_push_notification(sender, recipients, audio_data=None, message_ty
     else:
         audio_payload["has_audio"] = False
     
-    success_count = 0
+    # Título y mensaje dependiendo del tipo
+    if message_type == "central_audio":
+        title = f"📢 Mensaje de Central"
+        body = f"Audio de {sender.get_full_name() or sender.username}"
+        icon = "/static/imagenes/central-icon.png"
+    else:
+        title = f"🎤 Mensaje de Audio"
+        body = f"Audio de {sender.get_full_name() or sender.username}"
+        icon = "/static/imagenes/audio-icon.png"
     
-    for recipient in recipients:
-        try:
-            # Título y mensaje dependiendo del tipo
-            if message_type == "central_audio":
-                title = f"📢 Mensaje de Central"
-                body = f"Audio de {sender.get_full_name() or sender.username}"
-                icon = "/static/imagenes/central-icon.png"
-            else:
-                title = f"🎤 Mensaje de Audio"
-                body = f"Audio de {sender.get_full_name() or sender.username}"
-                icon = "/static/imagenes/audio-icon.png"
-            
-            # Enviar notificación push
-            result = send_push_notification(
-                user=recipient,
-                title=title,
-                body=body,
-                data=audio_payload,
-                icon=icon,
-                badge="/static/imagenes/audio-badge.png"
-            )
-            
-            if result > 0:
-                success_count += result
-                logger.info(f"Audio push sent to {recipient.username}")
-            
-        except Exception as e:
-            logger.error(f"Error sending audio push to {recipient.username}: {e}")
+    # One queued fan-out for every recipient (native app via FCM, otherwise PWA push)
+    try:
+        notification_fanout.dispatch(
+            audience,
+            "audio_message",
+            {
+                "title": title,
+                "body": body,
+                "data": audio_payload,
+                "icon": icon,
+                "badge": "/static/imagenes/audio-badge.png",
+            },
+            channels=(FCM, WEBPUSH),
+        )
+    except Exception as e:
+        logger.error(f"Error queuing audio push from {sender.username}: {e}")
+        return False
     
-    return success_count
+    return True
 
 
 def send_central_audio_notification(sender, audio_data=None):
     """
     Send audio notification to ALL drivers (central communication)
     """
-    from .models import AppUser
-    
-    # Obtener todos los conductores
-    drivers = AppUser.objects.filter(role='driver')
-    
+    # Todos los conductores (se resuelven al enviar, en una sola consulta)
     return send_audio_push_notification(
         sender=sender,
-        recipients=list(drivers),
+        recipients=Audience(roles=['driver'], exclude_user_ids=[sender.id]),
         audio_data=audio_data,
         message_type="central_audio"
     )
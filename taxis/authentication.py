@@ -0,0 +1,115 @@
+"""
+Autenticación por token con caché
+
+TokenAuthentication consulta el Token y su usuario en cada petición, y varias
+vistas de la app móvil repetían la consulta a mano (Token.objects.get + el
+acceso perezoso a token.user): dos o tres consultas antes de empezar. Ahora
+token → usuario (con su organización) queda en un TTLCache acotado del
+proceso y todas las vistas leen `request.user`.
+
+- Se invalida al borrar o regenerar el token (logout, rotación), al guardar
+  o borrar el usuario (cambio de rol, desactivación, cambio de organización)
+  y al guardar una organización.
+- La caché es por proceso: en los demás procesos un token revocado sigue
+  siendo válido como mucho AUTH_TOKEN_CACHE_TTL segundos.
+- Cada petición recibe su propia copia del usuario: una vista que lo modifica
+  no afecta a las demás.
+"""
+import copy
+import logging
+import threading
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .maps_client import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Vigencia de una entrada (tope de lo que tarda en verse un logout en otro proceso)
+AUTH_TOKEN_CACHE_TTL = getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 60)
+
+AUTH_TOKEN_CACHE_MAX_ENTRIES = getattr(settings, 'AUTH_TOKEN_CACHE_MAX_ENTRIES', 10000)
+
+
+class TokenUserCache:
+    """token → Token (con usuario y organización), con invalidación por token o por usuario"""
+
+    def __init__(self, max_entries=AUTH_TOKEN_CACHE_MAX_ENTRIES, ttl=AUTH_TOKEN_CACHE_TTL):
+        self._cache = TTLCache(max_entries=max_entries, ttl=ttl)
+        self._key_by_user = {}  # user_id -> token (un token por usuario)
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def get(self, key):
+        token = self._cache.get(key)
+        with self._lock:
+            self.stats['hits' if token is not None else 'misses'] += 1
+        return token
+
+    def set(self, key, token):
+        self._cache.set(key, token)
+        with self._lock:
+            self._key_by_user[token.user_id] = key
+
+    def invalidate(self, key):
+        self._cache.delete(key)
+        with self._lock:
+            self.stats['invalidations'] += 1
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            key = self._key_by_user.pop(user_id, None)
+        if key is not None:
+            self.invalidate(key)
+
+    def clear(self):
+        self._cache.clear()
+        with self._lock:
+            self._key_by_user.clear()
+
+
+# Instancia global
+token_cache = TokenUserCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication (`Authorization: Token <key>`) que consulta la base solo en un fallo de caché"""
+
+    def authenticate_credentials(self, key):
+        token = token_cache.get(key)
+        if token is None:
+            try:
+                token = Token.objects.select_related('user__organization').get(key=key)
+            except Token.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            if not token.user.is_active:
+                raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+            token_cache.set(key, token)
+
+        return copy.copy(token.user), token
+
+
+def _token_changed(sender, instance, **kwargs):
+    token_cache.invalidate(instance.key)
+
+
+def _user_changed(sender, instance, **kwargs):
+    token_cache.invalidate_user(instance.pk)
+
+
+def _organization_changed(sender, instance, **kwargs):
+    # Los usuarios cacheados llevan su organización (estado, plan): se descarta todo
+    token_cache.clear()
+
+
+post_save.connect(_token_changed, sender=Token, dispatch_uid='token_cache_token_saved')
+post_delete.connect(_token_changed, sender=Token, dispatch_uid='token_cache_token_deleted')
+post_save.connect(_user_changed, sender=get_user_model(), dispatch_uid='token_cache_user_saved')
+post_delete.connect(_user_changed, sender=get_user_model(), dispatch_uid='token_cache_user_deleted')
+post_save.connect(_organization_changed, sender='taxis.Organization', dispatch_uid='token_cache_organization_saved')
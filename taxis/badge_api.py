@@ -2,7 +2,8 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from django.db.models import Q, Count
-from .models import Ride, ChatMessage
+from .models import Ride
+from .chat_threads import mark_read, unread_total
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -23,11 +24,8 @@ def get_badge_count(request):
             Q(driver=user, status='in_progress')
         ).count()
         
-        # Contar mensajes no leídos recibidos
-        messages_count = ChatMessage.objects.filter(
-            recipient=user,
-            is_read=False
-        ).count()
+        # Mensajes no leídos (contadores de sus conversaciones)
+        messages_count = unread_total(user)
         
     elif user.role == 'customer':
         # Contar carreras activas del cliente
@@ -36,11 +34,8 @@ def get_badge_count(request):
             status__in=['pending', 'accepted', 'in_progress']
         ).count()
         
-        # Contar mensajes no leídos recibidos
-        messages_count = ChatMessage.objects.filter(
-            recipient=user,
-            is_read=False
-        ).count()
+        # Mensajes no leídos (contadores de sus conversaciones)
+        messages_count = unread_total(user)
         
     elif user.role == 'admin':
         # Para administradores: carreras sin asignar + mensajes no leídos
@@ -49,10 +44,7 @@ def get_badge_count(request):
             driver__isnull=True
         ).count()
         
-        messages_count = ChatMessage.objects.filter(
-            recipient=user,
-            is_read=False
-        ).count()
+        messages_count = unread_total(user)
     
     total_count = rides_count + messages_count
     
@@ -92,11 +84,14 @@ def mark_messages_read(request):
         }, status=400)
     
     # Marcar como leídos todos los mensajes del remitente hacia el usuario actual
-    updated = ChatMessage.objects.filter(
-        sender_id=sender_id,
-        recipient=request.user,
-        is_read=False
-    ).update(is_read=True)
+    # (y poner en cero el contador de la conversación, en la misma transacción)
+    try:
+        updated = mark_read(request.user, int(sender_id))
+    except (TypeError, ValueError):
+        return Response({
+            'success': False,
+            'error': 'sender_id inválido'
+        }, status=400)
     
     return Response({
         'success': True,
@@ -0,0 +1,259 @@
+"""
+Facturación mensual de las cooperativas
+
+El modelo Invoice existía pero nadie lo llenaba: las vistas de facturas
+estaban comentadas y la comisión del período no se calculaba en ningún lado.
+
+- `generate_monthly_invoices` factura un mes completo: suscripción (plan
+  activo) + comisiones del mes, leídas de las filas mensuales de
+  OrganizationPeriodStats (taxis.ride_stats) en una sola consulta agrupada
+  para todas las cooperativas, y crea las facturas con un bulk_create.
+- Los números (INV-AAAA-NNNN) salen de InvoiceSequence con la fila
+  bloqueada dentro de la transacción que crea las facturas: sin la carrera
+  de "leer el último número y sumar uno" y sin saltos si algo falla.
+- Re-ejecutar el mes no duplica: las cooperativas ya facturadas se omiten
+  (y la restricción única organización + período lo garantiza).
+- El PDF se genera en la cola de tareas (`render_invoice_pdf`), después del
+  commit, y se guarda en `pdf_file`.
+
+Uso:
+    python manage.py generate_invoices --month 2025-06
+"""
+import logging
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import DecimalField, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .task_queue import task_queue
+
+logger = logging.getLogger(__name__)
+
+# Días entre el fin del período y el vencimiento de la factura
+INVOICE_DUE_DAYS = getattr(settings, 'INVOICE_DUE_DAYS', 15)
+
+# Cooperativas que se facturan; las de prueba solo pagan comisiones
+BILLABLE_STATUSES = ('active', 'trial')
+
+ZERO = Decimal('0.00')
+
+
+def billing_period(month=None):
+    """
+    (primer día, último día) del mes de `month`; por defecto el mes anterior
+    """
+    if month is None:
+        month = timezone.localdate().replace(day=1) - timedelta(days=1)
+    start = month.replace(day=1)
+    end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return start, end
+
+
+# ============================================
+# NUMERACIÓN
+# ============================================
+
+def _highest_issued(year):
+    """Mayor número ya emitido en el año (facturas creadas antes de la secuencia)"""
+    from .models import Invoice
+
+    highest = 0
+    for number in Invoice.objects.filter(invoice_number__startswith=f'INV-{year}-').values_list('invoice_number', flat=True):
+        try:
+            highest = max(highest, int(number.rsplit('-', 1)[-1]))
+        except ValueError:
+            continue
+    return highest
+
+
+def _locked_sequence(year):
+    """Fila de InvoiceSequence del año, bloqueada hasta el fin de la transacción"""
+    from .models import InvoiceSequence
+
+    InvoiceSequence.objects.get_or_create(year=year, defaults={'last_number': _highest_issued(year)})
+    return InvoiceSequence.objects.select_for_update().get(year=year)
+
+
+def _take_numbers(sequence, count):
+    first = sequence.last_number + 1
+    sequence.last_number += count
+    sequence.save(update_fields=['last_number'])
+    return [f'INV-{sequence.year}-{number:04d}' for number in range(first, first + count)]
+
+
+def next_invoice_number(year=None):
+    """
+    Siguiente número de factura del año
+
+    Debe llamarse dentro de la transacción que guarda la factura: el número
+    queda reservado (y la secuencia bloqueada) hasta el commit.
+    """
+    with transaction.atomic():
+        return _take_numbers(_locked_sequence(year or timezone.localdate().year), 1)[0]
+
+
+# ============================================
+# FACTURACIÓN MENSUAL
+# ============================================
+
+def _billable_organizations(start):
+    """
+    Cooperativas sin factura del mes con su comisión del mes, en una consulta
+    agrupada sobre OrganizationPeriodStats
+    """
+    from .models import Organization
+
+    return (
+        Organization.objects
+        .filter(status__in=BILLABLE_STATUSES)
+        .exclude(invoices__period_start=start)
+        .annotate(period_commission=Coalesce(
+            Sum('period_stats__commission', filter=Q(period_stats__period='month', period_stats__period_start=start)),
+            Value(ZERO),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ))
+        .order_by('id')
+        .values_list('id', 'status', 'monthly_fee', 'period_commission')
+    )
+
+
+def generate_monthly_invoices(month=None, render_pdf=True):
+    """
+    Emite las facturas del mes para todas las cooperativas que aún no la tienen
+
+    Args:
+        month: date dentro del mes a facturar (None = mes anterior)
+        render_pdf: encolar la generación del PDF de cada factura
+
+    Returns:
+        list[Invoice]: facturas creadas (vacía si el mes ya estaba facturado)
+    """
+    from .models import Invoice
+
+    start, end = billing_period(month)
+    due_date = end + timedelta(days=INVOICE_DUE_DAYS)
+
+    with transaction.atomic():
+        # Tomar la secuencia antes de consultar serializa los jobs concurrentes:
+        # el segundo ve las facturas que el primero ya confirmó
+        sequence = _locked_sequence(timezone.localdate().year)
+
+        drafts = []
+        for organization_id, status, monthly_fee, commission in _billable_organizations(start):
+            subscription_fee = monthly_fee if status == 'active' else ZERO
+            total = subscription_fee + commission
+            if total <= 0:
+                continue
+            drafts.append(Invoice(
+                organization_id=organization_id,
+                period_start=start,
+                period_end=end,
+                subscription_fee=subscription_fee,
+                commission_amount=commission,
+                total_amount=total,
+                due_date=due_date,
+            ))
+        if not drafts:
+            return []
+
+        for invoice, number in zip(drafts, _take_numbers(sequence, len(drafts))):
+            invoice.invoice_number = number
+        invoices = Invoice.objects.bulk_create(drafts, batch_size=500)
+        if render_pdf:
+            for invoice in invoices:
+                task_queue.enqueue_on_commit('render_invoice_pdf', invoice_id=invoice.id)
+
+    logger.info(f"🧾 {len(invoices)} factura(s) emitidas para {start:%m/%Y}")
+    return invoices
+
+
+# ============================================
+# PDF
+# ============================================
+
+def _pdf_text(text):
+    """Texto de un string PDF (Helvetica con WinAnsiEncoding)"""
+    encoded = str(text).encode('cp1252', errors='replace')
+    return encoded.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+
+def _pdf_document(lines):
+    """
+    PDF de una página A4 con líneas de texto
+
+    Args:
+        lines: lista de (fuente, tamaño, texto); fuente 'F1' normal o 'F2' negrita
+    """
+    stream = [b'BT', b'50 790 Td']
+    for font, size, text in lines:
+        stream.append(b'/%s %d Tf %d TL (%s) Tj T*' % (font.encode(), size, size + 6, _pdf_text(text)))
+    stream.append(b'ET')
+    content = b'\n'.join(stream)
+
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] '
+        b'/Resources << /Font << /F1 4 0 R /F2 5 0 R >> >> /Contents 6 0 R >>',
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>',
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>',
+        b'<< /Length %d >>\nstream\n%s\nendstream' % (len(content), content),
+    ]
+
+    pdf = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b'%d 0 obj\n%s\nendobj\n' % (number, body)
+    xref = len(pdf)
+    pdf += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    for offset in offsets:
+        pdf += b'%010d 00000 n \n' % offset
+    pdf += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return bytes(pdf)
+
+
+def render_invoice_pdf(invoice):
+    """Contenido del PDF de una factura"""
+    organization = invoice.organization
+    lines = [
+        ('F2', 18, f'Factura {invoice.invoice_number}'),
+        ('F1', 10, f'Emitida el {timezone.localtime(invoice.issued_at):%d/%m/%Y}'),
+        ('F1', 10, ''),
+        ('F2', 12, organization.name),
+    ]
+    if organization.tax_id:
+        lines.append(('F1', 10, f'RUC: {organization.tax_id}'))
+    for text in (organization.billing_address or organization.address or '').splitlines():
+        lines.append(('F1', 10, text))
+    lines.append(('F1', 10, organization.billing_email or organization.email))
+    lines += [
+        ('F1', 10, ''),
+        ('F1', 11, f'Período: {invoice.period_start:%d/%m/%Y} al {invoice.period_end:%d/%m/%Y}'),
+        ('F1', 11, f'Suscripción ({organization.get_plan_display()}): ${invoice.subscription_fee:.2f}'),
+        ('F1', 11, f'Comisiones por carreras: ${invoice.commission_amount:.2f}'),
+        ('F2', 13, f'Total a pagar: ${invoice.total_amount:.2f}'),
+        ('F1', 10, f'Vence el {invoice.due_date:%d/%m/%Y}'),
+    ]
+    if invoice.notes:
+        lines.append(('F1', 10, ''))
+        lines += [('F1', 10, text) for text in invoice.notes.splitlines()]
+    return _pdf_document(lines)
+
+
+def store_invoice_pdf(invoice_id):
+    """Genera el PDF de la factura y lo guarda en `pdf_file` (tarea render_invoice_pdf)"""
+    from .models import Invoice
+
+    invoice = Invoice.objects.select_related('organization').filter(id=invoice_id).first()
+    if invoice is None:
+        return None
+    invoice.pdf_file.save(f'{invoice.invoice_number}.pdf', ContentFile(render_invoice_pdf(invoice)), save=False)
+    invoice.save(update_fields=['pdf_file'])
+    logger.info(f"📄 PDF de la factura {invoice.invoice_number} generado")
+    return invoice
@@ -0,0 +1,93 @@
+"""
+Historial de chat paginado por cursor (keyset)
+
+get_chat_history y get_driver_chat_history devolvían la conversación
+completa en cada apertura del chat (más un count() aparte y una consulta de
+remitente por mensaje); las conversaciones conductor ↔ central llegan a
+miles de mensajes. Ahora:
+
+- Sin cursor: los últimos `limit` mensajes.
+- `before=<cursor>`: la página anterior (scroll hacia arriba).
+- `after=<cursor>`: solo lo nuevo desde el último mensaje visto. Es el modo
+  de sincronización al abrir la app: el costo depende de lo nuevo, no del
+  tamaño del historial.
+
+El cursor codifica (timestamp, id) del mensaje y la consulta es un rango del
+índice (pair_key, timestamp, id): nunca hay OFFSET ni COUNT.
+"""
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+from .models import ChatMessage
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    """Cursor mal formado"""
+
+
+def encode_cursor(message):
+    raw = f"{message.timestamp.isoformat()}|{message.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, message_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(timestamp), int(message_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor(f'Cursor inválido: {cursor}') from e
+
+
+def parse_limit(value):
+    try:
+        limit = int(value) if value else DEFAULT_PAGE_SIZE
+    except (TypeError, ValueError):
+        limit = DEFAULT_PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def conversation(user_a, user_b):
+    """Mensajes entre dos usuarios, en cualquier sentido"""
+    return ChatMessage.objects.filter(pair_key=ChatMessage.make_pair_key(user_a.pk, user_b.pk))
+
+
+def history_page(user_a, user_b, before=None, after=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Una página del historial entre dos usuarios
+
+    Returns:
+        dict: {'messages': [ChatMessage en orden cronológico], 'has_more',
+               'before': cursor para la página anterior, 'after': cursor para sincronizar}
+
+    Raises:
+        InvalidCursor: si `before` o `after` no son cursores válidos
+    """
+    messages = conversation(user_a, user_b)
+
+    if after:
+        timestamp, message_id = decode_cursor(after)
+        page = list(messages.filter(
+            Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=message_id)
+        ).order_by('timestamp', 'id')[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit]
+    else:
+        if before:
+            timestamp, message_id = decode_cursor(before)
+            messages = messages.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=message_id))
+        page = list(messages.order_by('-timestamp', '-id')[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit][::-1]
+
+    return {
+        'messages': page,
+        'has_more': has_more,
+        'before': encode_cursor(page[0]) if page else before,
+        'after': encode_cursor(page[-1]) if page else after,
+    }
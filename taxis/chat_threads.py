@@ -0,0 +1,134 @@
+"""
+Conversaciones de chat con contadores de no leídos (ChatThread)
+
+get_badge_count contaba los ChatMessage no leídos en cada consulta del badge
+y chat_central recorría los mensajes de cada conductor para armar la lista.
+Ahora cada par de usuarios tiene una fila ChatThread con el último mensaje,
+la última actividad y un contador de no leídos por participante:
+
+- `record_message` la actualiza en la misma transacción que guarda el
+  mensaje (ChatConsumer.receive).
+- `mark_read` marca los mensajes y pone el contador en cero, también en una
+  transacción (mark_messages_read).
+- `unread_total` e `inbox` leen solo conversaciones.
+
+Los contadores se actualizan con F() en la base, así que dos mensajes
+simultáneos no se pisan.
+"""
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.db.models.functions import Coalesce
+
+from .models import ChatMessage, ChatThread
+
+
+def _sides(user_a_id, user_b_id):
+    low, high = sorted((int(user_a_id), int(user_b_id)))
+    return low, high
+
+
+def get_or_create_thread(user_a_id, user_b_id, last_activity):
+    low, high = _sides(user_a_id, user_b_id)
+    thread, _ = ChatThread.objects.get_or_create(
+        pair_key=ChatMessage.make_pair_key(low, high),
+        defaults={'user_low_id': low, 'user_high_id': high, 'last_activity': last_activity},
+    )
+    return thread
+
+
+def record_message(message):
+    """Actualiza la conversación con un mensaje recién guardado (llamar dentro de su transacción)"""
+    thread = get_or_create_thread(message.sender_id, message.recipient_id, message.timestamp)
+    unread_field = 'unread_low' if message.recipient_id == thread.user_low_id else 'unread_high'
+    ChatThread.objects.filter(pk=thread.pk).update(**{
+        'last_message': message,
+        'last_activity': message.timestamp,
+        unread_field: F(unread_field) + 1,
+    })
+    return thread
+
+
+def create_message(**fields):
+    """Guarda un ChatMessage y actualiza su conversación en una sola transacción"""
+    with transaction.atomic():
+        message = ChatMessage.objects.create(**fields)
+        record_message(message)
+    return message
+
+
+def mark_read(reader, other_user_id):
+    """
+    Marca como leídos los mensajes de `other_user_id` hacia `reader`
+
+    Returns:
+        int: mensajes marcados
+    """
+    low, high = _sides(reader.pk, other_user_id)
+    unread_field = 'unread_low' if reader.pk == low else 'unread_high'
+    with transaction.atomic():
+        updated = ChatMessage.objects.filter(
+            sender_id=other_user_id, recipient=reader, is_read=False
+        ).update(is_read=True)
+        ChatThread.objects.filter(pair_key=ChatMessage.make_pair_key(low, high)).update(**{unread_field: 0})
+    return updated
+
+
+def user_threads(user):
+    """Conversaciones de un usuario, la más reciente primero"""
+    return ChatThread.objects.filter(Q(user_low=user) | Q(user_high=user)).order_by('-last_activity')
+
+
+def unread_total(user):
+    """
+    Mensajes sin leer del usuario, sumando los contadores de sus conversaciones
+
+    El filtro por participante usa chat_thread_low_idx / chat_thread_high_idx:
+    solo se leen las conversaciones del usuario, no las de toda la plataforma.
+    """
+    totals = ChatThread.objects.filter(Q(user_low=user) | Q(user_high=user)).aggregate(
+        low=Coalesce(Sum('unread_low', filter=Q(user_low=user)), 0),
+        high=Coalesce(Sum('unread_high', filter=Q(user_high=user)), 0),
+    )
+    return totals['low'] + totals['high']
+
+
+def inbox(user):
+    """
+    {id del otro usuario: ChatThread} con el último mensaje ya cargado
+
+    Una sola consulta, sin importar cuántos mensajes tenga cada conversación.
+    """
+    return {
+        thread.other_id(user.pk): thread
+        for thread in user_threads(user).select_related('last_message')
+    }
+
+
+def rebuild_threads():
+    """
+    Recalcula todas las conversaciones desde los mensajes (migración o reparación)
+
+    Returns:
+        int: conversaciones escritas
+    """
+    from django.db.models import Count, Max
+
+    unread = {}
+    for row in (ChatMessage.objects.filter(is_read=False)
+                .values('pair_key', 'recipient_id').annotate(n=Count('id'))):
+        unread[(row['pair_key'], row['recipient_id'])] = row['n']
+
+    last_ids = list(ChatMessage.objects.values('pair_key').annotate(last_id=Max('id')).values_list('last_id', flat=True))
+    with transaction.atomic():
+        ChatThread.objects.all().delete()
+        threads = []
+        for message in ChatMessage.objects.filter(id__in=last_ids).only('id', 'sender_id', 'recipient_id', 'timestamp', 'pair_key'):
+            low, high = _sides(message.sender_id, message.recipient_id)
+            threads.append(ChatThread(
+                pair_key=message.pair_key, user_low_id=low, user_high_id=high,
+                last_message_id=message.id, last_activity=message.timestamp,
+                unread_low=unread.get((message.pair_key, low), 0),
+                unread_high=unread.get((message.pair_key, high), 0),
+            ))
+        ChatThread.objects.bulk_create(threads, batch_size=500)
+    return len(threads)
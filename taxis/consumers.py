@@ -1,18 +1,26 @@
 
+import asyncio
+import base64
+import binascii
 import json
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.db import database_sync_to_async
+from .audio_clips import clip_recorder
+from .audio_frames import (
+    CODEC_MIME_TYPES, CODEC_OPUS, HEADER_SIZE, codec_from_mime, frame_to_base64, pack_frame, parse_header, stamp_speaker
+)
+from .floor_control import floor_control, make_holder
+from .location_fanout import (
+    ALL_ORGANIZATIONS_GROUP, location_fanout, organization_group, parse_bounds, in_bounds
+)
+from .location_pipeline import location_ingestor
+from .talk_groups import can_join, general_audio_group
 
 class AudioConsumer(AsyncWebsocketConsumer):
-    # Diccionario para rastrear quién está transmitiendo (por sala)
-    active_transmissions = {}
-    # Diccionario para mapear channel_name a user info
-    user_info = {}
+    # El turno de palabra por sala lo controla floor_control (lease en Redis compartido por los workers)
     
     async def connect(self):
-        # La URL /ws/audio/conductores/ no tiene parámetros, usar valor fijo
-        self.room_name = self.scope['url_route']['kwargs'].get('room_name', 'conductores')
-        self.room_group_name = f'audio_{self.room_name}'
-        
         # Obtener información del usuario de la sesión
         self.user = self.scope.get('user')
         self.driver_id = None
@@ -21,38 +29,82 @@ class AudioConsumer(AsyncWebsocketConsumer):
         if self.user and self.user.is_authenticated:
             self.driver_id = str(self.user.id)
             self.driver_name = self.user.username or f'Usuario {self.user.id}'
+
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+
+        # 📻 Sala: grupo de conversación (ws/audio/grupos/<id>/) o canal general de la cooperativa
+        talk_group_id = self.scope['url_route']['kwargs'].get('talk_group_id')
+        if talk_group_id:
+            talk_group = await self.load_talk_group(talk_group_id)
+            if talk_group is None:
+                print(f'🚫 {self.driver_name} no puede unirse al grupo {talk_group_id}')
+                await self.close()
+                return
+            self.room_name = talk_group.name
+            self.room_group_name = talk_group.channel_group
+        else:
+            self.room_name = 'conductores'
+            self.room_group_name = await database_sync_to_async(general_audio_group)(
+                self.user, query.get('organization', [''])[0]
+            )
+            if self.room_group_name is None:
+                # Superadmin sin cooperativa: la sala global no tiene conductores
+                print(f'🚫 {self.driver_name} no indicó una cooperativa válida para el canal general')
+                await self.accept()
+                await self.send(text_data=json.dumps({
+                    'type': 'error',
+                    'message': 'Indica la cooperativa del canal: ws/audio/conductores/?organization=<id>'
+                }))
+                await self.close(code=4400)
+                return
+
+        # 🎧 Modo de audio: binario (cabecera + Opus/AAC crudo) o JSON con base64 (compatibilidad).
+        # Se activa con ?audio=binary, con {"type": "audio_mode"} o al enviar el primer frame binario.
+        self.binary_audio = query.get('audio', [''])[0] == 'binary'
         
-        # Guardar info del usuario
-        AudioConsumer.user_info[self.channel_name] = {
-            'driver_id': self.driver_id,
-            'driver_name': self.driver_name
-        }
+        # Identidad como titular del turno de palabra
+        self.floor_holder = make_holder(self.channel_name, self.driver_id, self.driver_name)
+        self.floor_heartbeat = None
 
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
+
+        # 📍 Solo la central recibe ubicaciones, y solo las de su organización
+        self.location_group = None
+        if self.user and self.user.is_authenticated:
+            if self.user.is_superuser:
+                self.location_group = ALL_ORGANIZATIONS_GROUP
+            elif getattr(self.user, 'role', None) == 'admin':
+                self.location_group = organization_group(self.user.organization_id)
+        if self.location_group:
+            await self.channel_layer.group_add(self.location_group, self.channel_name)
+            location_fanout.subscribe(self.channel_layer)
+
         await self.accept()
         
         print(f'✅ {self.driver_name} conectado a {self.room_name}')
 
     async def disconnect(self, close_code):
+        if not hasattr(self, 'floor_holder'):
+            # Conexión rechazada en connect()
+            return
+
         # Si este usuario estaba transmitiendo, liberar la transmisión
-        if self.room_group_name in AudioConsumer.active_transmissions:
-            if AudioConsumer.active_transmissions[self.room_group_name] == self.channel_name:
-                # Notificar a todos que terminó la transmisión
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        'type': 'transmission_status',
-                        'isTransmitting': False,
-                        'speakerId': self.driver_id,
-                        'speakerName': self.driver_name
-                    }
-                )
-                del AudioConsumer.active_transmissions[self.room_group_name]
-        
-        # Limpiar info del usuario
-        if self.channel_name in AudioConsumer.user_info:
-            del AudioConsumer.user_info[self.channel_name]
+        await self.finish_recording()
+        if await self.release_floor():
+            # Notificar a todos que terminó la transmisión
+            await self.channel_layer.group_send(
+                self.room_group_name,
+                {
+                    'type': 'transmission_status',
+                    'isTransmitting': False,
+                    'speakerId': self.driver_id,
+                    'speakerName': self.driver_name
+                }
+            )
         
+        if getattr(self, 'location_group', None):
+            await self.channel_layer.group_discard(self.location_group, self.channel_name)
+            location_fanout.unsubscribe()
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
         print(f'🔴 {self.driver_name} desconectado de {self.room_name}')
 
@@ -67,19 +119,19 @@ class AudioConsumer(AsyncWebsocketConsumer):
                     driver_id = data.get('driver_id', self.driver_id)
                     driver_name = data.get('driver_name', self.driver_name)
                     
-                    # Verificar si alguien más está transmitiendo
-                    if self.room_group_name in AudioConsumer.active_transmissions:
-                        current_speaker = AudioConsumer.active_transmissions[self.room_group_name]
-                        # Rechazar si no es el mismo usuario
-                        if current_speaker != self.channel_name:
-                            await self.send(text_data=json.dumps({
-                                'type': 'error',
-                                'message': 'Alguien más está transmitiendo'
-                            }))
-                            return
-                    
-                    # Registrar transmisión
-                    AudioConsumer.active_transmissions[self.room_group_name] = self.channel_name
+                    # Tomar el turno (atómico en todo el cluster); rechazar si otro lo tiene
+                    try:
+                        acquired = await floor_control.acquire(self.room_group_name, self.floor_holder)
+                    except Exception as e:
+                        print(f'❌ Error tomando turno en {self.room_name}: {e}')
+                        acquired = False
+                    if not acquired:
+                        await self.send(text_data=json.dumps({
+                            'type': 'error',
+                            'message': 'Alguien más está transmitiendo'
+                        }))
+                        return
+                    self.start_floor_heartbeat()
                     
                     # Broadcast a TODOS
                     await self.channel_layer.group_send(
@@ -98,10 +150,9 @@ class AudioConsumer(AsyncWebsocketConsumer):
                     driver_id = data.get('driver_id', self.driver_id)
                     driver_name = data.get('driver_name', self.driver_name)
                     
-                    # Liberar transmisión
-                    if self.room_group_name in AudioConsumer.active_transmissions:
-                        if AudioConsumer.active_transmissions[self.room_group_name] == self.channel_name:
-                            del AudioConsumer.active_transmissions[self.room_group_name]
+                    # Liberar transmisión y cerrar su grabación
+                    await self.release_floor()
+                    await self.finish_recording()
                     
                     # Broadcast a TODOS
                     await self.channel_layer.group_send(
@@ -115,6 +166,10 @@ class AudioConsumer(AsyncWebsocketConsumer):
                     )
                     print(f'⏹️ {driver_name} terminó transmisión en {self.room_name}')
                 
+                # CAMBIO DE MODO DE AUDIO
+                elif msg_type == 'audio_mode':
+                    self.binary_audio = data.get('mode') == 'binary'
+
                 # UBICACIÓN CON TYPE='location' (desde app Flutter)
                 elif msg_type == 'location':
                     lat = data.get('latitude') or data.get('lat')
@@ -123,67 +178,15 @@ class AudioConsumer(AsyncWebsocketConsumer):
                     
                     print(f'📍 Ubicación (type=location) recibida: lat={lat}, lng={lng}, driver_id={driver_id}')
                     
-                    # ✅ Guardar ubicación en la base de datos para que la API pueda consultarla
+                    # ✅ Encolar ubicación (se vuelca a la BD en lote, sin consultas por ping).
+                    # La difusión a la central la hace location_fanout, agrupada por organización.
                     if lat and lng and driver_id:
-                        from channels.db import database_sync_to_async
-                        from .models import Taxi, AppUser
-                        
-                        @database_sync_to_async
-                        def save_driver_location():
-                            try:
-                                # Buscar el conductor (puede ser ID numérico o username)
-                                if isinstance(driver_id, str) and not driver_id.isdigit():
-                                    # Es un username (ej: 'carlos')
-                                    driver = AppUser.objects.get(username=driver_id, role='driver')
-                                    print(f'🔍 Conductor encontrado por username: {driver.username} (ID: {driver.id})')
-                                else:
-                                    # Es un ID numérico
-                                    driver = AppUser.objects.get(id=driver_id, role='driver')
-                                    print(f'🔍 Conductor encontrado por ID: {driver.id}')
-                                
-                                # Buscar o crear el taxi del conductor
-                                taxi, created = Taxi.objects.get_or_create(user=driver)
-                                
-                                # Actualizar ubicación
-                                taxi.latitude = float(lat)
-                                taxi.longitude = float(lng)
-                                taxi.save(update_fields=['latitude', 'longitude', 'updated_at'])
-                                
-                                print(f'💾 Ubicación guardada en BD para conductor {driver.username} (ID: {driver.id}): lat={lat}, lng={lng}')
-                                
-                                if created:
-                                    print(f'✨ Nuevo registro Taxi creado para {driver.username}')
-                                    
-                            except AppUser.DoesNotExist:
-                                print(f'⚠️ Conductor {driver_id} no encontrado (buscado como ID y username)')
-                            except Exception as e:
-                                print(f'❌ Error guardando ubicación: {e}')
-                        
-                        await save_driver_location()
-                    
-                    await self.channel_layer.group_send(
-                        self.room_group_name,
-                        {
-                            'type': 'send_location',
-                            'lat': lat,
-                            'lng': lng,
-                            'driver_id': driver_id
-                        }
-                    )
+                        await self.ingest_location(driver_id, lat, lng)
                 
                 # AUDIO
                 elif "audio" in data:
                     driver_id = data.get('driver_id', self.driver_id)
-                    await self.channel_layer.group_send(
-                        self.room_group_name,
-                        {
-                            'type': 'send_audio',
-                            'audio': data["audio"],
-                            'driver_id': driver_id,
-                            'senderId': data.get("senderId", driver_id),
-                            'sender_channel': self.channel_name,
-                        }
-                    )
+                    await self.broadcast_json_audio(data, driver_id)
                 
                 # UBICACIÓN SIN TYPE (legacy)
                 elif "lat" in data and "lng" in data:
@@ -193,72 +196,49 @@ class AudioConsumer(AsyncWebsocketConsumer):
                     
                     print(f'📍 Ubicación recibida: lat={lat}, lng={lng}, driver_id={driver_id}')
                     
-                    # ✅ Guardar ubicación en BD
+                    # ✅ Encolar ubicación (escritura diferida)
                     if lat and lng and driver_id:
-                        from channels.db import database_sync_to_async
-                        from .models import Taxi, AppUser
-                        
-                        @database_sync_to_async
-                        def save_driver_location():
-                            try:
-                                driver = AppUser.objects.get(id=driver_id, role='driver')
-                                taxi, created = Taxi.objects.get_or_create(user=driver)
-                                taxi.latitude = float(lat)
-                                taxi.longitude = float(lng)
-                                taxi.save(update_fields=['latitude', 'longitude', 'updated_at'])
-                                print(f'💾 Ubicación guardada en BD para conductor {driver_id}')
-                            except AppUser.DoesNotExist:
-                                print(f'⚠️ Conductor {driver_id} no encontrado')
-                            except Exception as e:
-                                print(f'❌ Error guardando ubicación: {e}')
-                        
-                        await save_driver_location()
-                    
-                    await self.channel_layer.group_send(
-                        self.room_group_name,
-                        {
-                            'type': 'send_location',
-                            'lat': lat,
-                            'lng': lng,
-                            'driver_id': driver_id
-                        }
-                    )
+                        await self.ingest_location(driver_id, lat, lng)
                 
                 # MENSAJE SIN TYPE (legacy o formato antiguo)
                 else:
                     # Si no tiene type pero tiene lat/lng, es ubicación
                     if "lat" in data and "lng" in data:
                         print(f'📍 Ubicación (sin type) recibida: lat={data["lat"]}, lng={data["lng"]}')
-                        await self.channel_layer.group_send(
-                            self.room_group_name,
-                            {
-                                'type': 'send_location',
-                                'lat': data["lat"],
-                                'lng': data["lng"],
-                                'driver_id': data.get('driver_id', self.driver_id)
-                            }
-                        )
+                        driver_id = data.get('driver_id', self.driver_id)
+                        if data["lat"] and data["lng"] and driver_id:
+                            await self.ingest_location(driver_id, data["lat"], data["lng"])
                     # Si tiene audio, procesarlo
                     elif "audio" in data:
                         driver_id = data.get('driver_id', self.driver_id)
-                        await self.channel_layer.group_send(
-                            self.room_group_name,
-                            {
-                                'type': 'send_audio',
-                                'audio': data["audio"],
-                                'driver_id': driver_id,
-                                'senderId': data.get("senderId", driver_id),
-                                'sender_channel': self.channel_name,
-                            }
-                        )
+                        await self.broadcast_json_audio(data, driver_id)
                     
             except json.JSONDecodeError:
                 print('❌ Error al decodificar JSON')
         
-        # Manejar datos binarios (si la app envía ubicación como bytes)
+        # Manejar datos binarios
         elif bytes_data:
+            header = parse_header(bytes_data)
+            if header is not None:
+                # 🎧 Frame binario: se reenvía tal cual, solo con el hablante fijado por el servidor
+                self.binary_audio = True
+                await self.channel_layer.group_send(
+                    self.room_group_name,
+                    {
+                        'type': 'send_audio_frame',
+                        'frame': stamp_speaker(bytes_data, self.speaker_id),
+                        'driver_id': self.driver_id,
+                        'sender_channel': self.channel_name,
+                    }
+                )
+                await self.record_audio(
+                    bytes_data[HEADER_SIZE:], CODEC_MIME_TYPES.get(header.codec),
+                    opus_packets=header.codec == CODEC_OPUS,
+                )
+                return
+
             print(f'📦 Bytes recibidos: {len(bytes_data)} bytes')
-            # Si son bytes de audio, reenviar
+            # Bytes sin cabecera (legacy), reenviar
             await self.channel_layer.group_send(
                 self.room_group_name,
                 {
@@ -267,6 +247,109 @@ class AudioConsumer(AsyncWebsocketConsumer):
                 }
             )
 
+    @database_sync_to_async
+    def load_talk_group(self, talk_group_id):
+        """Grupo de conversación si el usuario puede unirse (una consulta al conectar)"""
+        from .models import TalkGroup
+
+        talk_group = TalkGroup.objects.filter(id=talk_group_id).first()
+        if talk_group is None or not can_join(self.user, talk_group):
+            return None
+        return talk_group
+
+    async def membership_revoked(self, event):
+        """El usuario fue quitado del grupo: cerrar su socket"""
+        if self.user and self.user.is_authenticated and event.get('user_id') == self.user.id:
+            await self.close()
+
+    def start_floor_heartbeat(self):
+        """Renueva el lease del turno mientras dure la transmisión"""
+        if self.floor_heartbeat is None or self.floor_heartbeat.done():
+            self.floor_heartbeat = asyncio.ensure_future(self._renew_floor())
+
+    async def _renew_floor(self):
+        interval = floor_control.lease_seconds / 3
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if not await floor_control.heartbeat(self.room_group_name, self.floor_holder):
+                    print(f'⚠️ {self.driver_name} perdió el turno en {self.room_name} (lease expirado)')
+                    return
+            except Exception as e:
+                print(f'❌ Error renovando turno de {self.driver_name}: {e}')
+
+    async def release_floor(self):
+        """Detiene el heartbeat y libera el turno; True si lo tenía"""
+        if self.floor_heartbeat is not None:
+            self.floor_heartbeat.cancel()
+            self.floor_heartbeat = None
+        try:
+            return await floor_control.release(self.room_group_name, self.floor_holder)
+        except Exception as e:
+            print(f'❌ Error liberando turno de {self.driver_name}: {e}')
+            return False
+
+    @property
+    def speaker_id(self):
+        return int(self.driver_id) if self.driver_id else 0
+
+    async def broadcast_json_audio(self, data, driver_id):
+        """
+        Audio en modo JSON: se valida y decodifica una sola vez aquí, y se
+        difunde ya serializado (texto para clientes JSON, frame para binarios)
+        """
+        mime_type = data.get('mimeType') or data.get('mime_type')
+        try:
+            payload = base64.b64decode(data["audio"], validate=True)
+        except (binascii.Error, TypeError, ValueError):
+            await self.send(text_data=json.dumps({'type': 'error', 'message': 'Audio base64 inválido'}))
+            return
+
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {
+                'type': 'send_audio',
+                'text': json.dumps({
+                    "type": "audio_broadcast",
+                    "audio": data["audio"],
+                    "driver_id": driver_id,
+                    "senderId": data.get("senderId", driver_id)
+                }),
+                'frame': pack_frame(self.speaker_id, 0, codec_from_mime(mime_type), payload),
+                'sender_channel': self.channel_name,
+            }
+        )
+        # Fuera de una transmisión (sin turno tomado), cada mensaje JSON es un clip completo
+        await self.record_audio(payload, mime_type, complete=self.floor_heartbeat is None)
+
+    async def record_audio(self, payload, mime_type, complete=False, opus_packets=False):
+        """💾 Graba el audio para reproducirlo después (un fallo no afecta la retransmisión en vivo)"""
+        try:
+            await database_sync_to_async(clip_recorder.append)(
+                self.room_group_name, self.channel_name, self.speaker_id or None,
+                self.driver_name, mime_type, payload, complete=complete, opus_packets=opus_packets
+            )
+        except Exception as e:
+            print(f'❌ Error grabando audio de {self.driver_name}: {e}')
+
+    async def finish_recording(self):
+        try:
+            await database_sync_to_async(clip_recorder.finish)(self.room_group_name, self.channel_name)
+        except Exception as e:
+            print(f'❌ Error cerrando grabación de {self.driver_name}: {e}')
+
+    async def ingest_location(self, driver_id, lat, lng):
+        """Registra el ping en el buffer de ubicaciones; solo consulta la BD la primera vez por conductor"""
+        driver = location_ingestor.cached_driver(driver_id)
+        if driver is None:
+            driver = await database_sync_to_async(location_ingestor.resolve_driver)(driver_id)
+        if driver is not None and not location_ingestor.record(driver, lat, lng):
+            # El ping se descarta: avisar al cliente en vez de ignorarlo en silencio
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': f'Coordenadas inválidas: lat={lat}, lng={lng}'
+            }))
+
     async def transmission_status(self, event):
         """Enviar estado de transmisión a todos los clientes"""
         await self.send(text_data=json.dumps({
@@ -280,20 +363,39 @@ class AudioConsumer(AsyncWebsocketConsumer):
         # No reenviar el audio al mismo canal que lo envió (evitar eco)
         if event.get('sender_channel') == self.channel_name:
             return
-        await self.send(text_data=json.dumps({
+        if self.binary_audio:
+            await self.send(bytes_data=event['frame'])
+        else:
+            await self.send(text_data=event['text'])
+
+    async def send_audio_frame(self, event):
+        """Frame binario: sin recodificar para clientes binarios, base64 solo para clientes JSON"""
+        if event.get('sender_channel') == self.channel_name:
+            return
+        frame = event['frame']
+        if self.binary_audio:
+            await self.send(bytes_data=frame)
+            return
+        header = parse_header(frame)
+        message = {
             "type": "audio_broadcast",
-            "audio": event["audio"],
+            "audio": frame_to_base64(frame),
             "driver_id": event.get("driver_id"),
-            "senderId": event.get("senderId")
-        }))
+            "senderId": event.get("driver_id")
+        }
+        if header.codec in CODEC_MIME_TYPES:
+            message["mimeType"] = CODEC_MIME_TYPES[header.codec]
+        await self.send(text_data=json.dumps(message))
 
-    async def send_location(self, event):
-        await self.send(text_data=json.dumps({
-            "type": "driver_location_update",
-            "lat": event["lat"],
-            "lng": event["lng"],
-            "driver_id": event.get("driver_id")
-        }))
+    async def location_batch(self, event):
+        """Lote de ubicaciones de la organización (formato legacy: un mensaje por conductor)"""
+        for update in event['updates']:
+            await self.send(text_data=json.dumps({
+                "type": "driver_location_update",
+                "lat": update["lat"],
+                "lng": update["lng"],
+                "driver_id": update["driver_id"]
+            }))
     
     async def send_audio_bytes(self, event):
         """Enviar audio como bytes binarios"""
@@ -392,7 +494,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
         # ✅ Guardar mensaje en la base de datos para historial persistente
         try:
             from channels.db import database_sync_to_async
-            from taxis.models import ChatMessage, AppUser
+            from taxis.models import AppUser
+            from taxis.chat_threads import create_message
             
             @database_sync_to_async
             def save_message_to_db():
@@ -400,7 +503,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
                     sender = AppUser.objects.get(id=sender_id)
                     recipient = AppUser.objects.get(id=recipient_id)
                     
-                    chat_message = ChatMessage.objects.create(
+                    # Mensaje + conversación (último mensaje, no leídos) en una transacción
+                    chat_message = create_message(
                         sender=sender,
                         recipient=recipient,
                         message=message,
@@ -447,50 +551,41 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.channel_layer.group_send(recipient_group, payload)
             print(f'📨 Mensaje reenviado al grupo del destinatario: {recipient_group}')
             
-            # 3. Enviar notificación FCM al destinatario (para apps móviles Android/iOS)
-            try:
-                from channels.db import database_sync_to_async
-                from taxis.models import AppUser
-                from taxis.fcm_notifications import send_chat_message_notification_fcm
-                
-                @database_sync_to_async
-                def send_fcm_notification():
-                    try:
-                        recipient = AppUser.objects.get(id=recipient_id)
-                        sender = AppUser.objects.get(id=sender_id)
-                        
-                        # Determinar el mensaje según el tipo
-                        if payload.get('message_type') == 'image':
-                            notification_message = message if message else "📸 Te ha enviado una imagen"
-                        elif payload.get('message_type') == 'video':
-                            notification_message = message if message else "🎥 Te ha enviado un video"
-                        else:
-                            notification_message = message[:100] if message else "Nuevo mensaje"
-                        
-                        # Enviar notificación FCM (funciona con apps Android/iOS)
-                        result = send_chat_message_notification_fcm(
-                            sender=sender,
-                            recipient=recipient,
-                            message=notification_message
-                        )
-                        
-                        if result.get('sent', 0) > 0:
-                            print(f'✅ Notificación FCM enviada a {recipient.username}')
-                        else:
-                            print(f'⚠️ No se pudo enviar notificación FCM a {recipient.username}')
-                            print(f'   Razón: {result.get("error", "Desconocido")}')
-                            
-                    except AppUser.DoesNotExist:
-                        print(f'❌ Usuario destinatario {recipient_id} no encontrado')
-                    except Exception as e:
-                        print(f'❌ Error enviando notificación FCM: {e}')
-                        import traceback
-                        traceback.print_exc()
-                
-                await send_fcm_notification()
-                
-            except Exception as e:
-                print(f'❌ Error en proceso de notificación FCM: {e}')
+            # 3. Notificación push al destinatario (app móvil por FCM o PWA):
+            #    se encola, el consumer no espera a FCM
+            if str(recipient_id).isdigit():
+                try:
+                    await self.queue_chat_notification(recipient_id, sender_id, payload['sender_name'], message, payload['message_type'])
+                except Exception as e:
+                    print(f'❌ Error encolando notificación push del chat: {e}')
+
+    @database_sync_to_async
+    def queue_chat_notification(self, recipient_id, sender_id, sender_name, message, message_type):
+        from taxis.notification_fanout import FCM, WEBPUSH, Audience, notification_fanout
+
+        # Determinar el mensaje según el tipo
+        if message_type == 'image':
+            notification_message = message if message else "📸 Te ha enviado una imagen"
+        elif message_type == 'video':
+            notification_message = message if message else "🎥 Te ha enviado un video"
+        else:
+            notification_message = message[:100] if message else "Nuevo mensaje"
+
+        notification_fanout.dispatch(
+            Audience(user_ids=[recipient_id]),
+            'chat_message',
+            {
+                'title': f"💬 {sender_name}",
+                'body': notification_message,
+                'data': {
+                    'sender_id': str(sender_id),
+                    'sender_name': sender_name,
+                    'message': message,
+                    'click_action': 'FLUTTER_NOTIFICATION_CLICK',  # Para que Flutter maneje el tap
+                },
+            },
+            channels=(FCM, WEBPUSH),
+        )
     
     async def chat_message(self, event):
         await self.send(text_data=json.dumps({
@@ -540,3 +635,66 @@ class RidesConsumer(AsyncWebsocketConsumer):
             'status': event.get('status'),
             'data': event.get('data', {})
         }))
+
+
+class LocationConsumer(AsyncWebsocketConsumer):
+    """
+    Ubicaciones de la flota filtradas por organización y viewport
+
+    El cliente envía {"type": "subscribe", "bounds": {"north", "south", "east", "west"}}
+    (bounds null = toda la organización) y recibe, como máximo una vez por tick,
+    {"type": "locations", "drivers": [{"driver_id", "lat", "lng", "ts"}, ...]}
+    solo con los conductores que se movieron dentro de su viewport.
+    """
+
+    async def connect(self):
+        self.user = self.scope.get('user')
+        self.bounds = None
+        self.location_group = None
+
+        if not self.user or not self.user.is_authenticated:
+            await self.close()
+            return
+
+        if self.user.is_superuser:
+            # Superadmin: todas las organizaciones o una específica con ?organization=<id>
+            query = parse_qs(self.scope.get('query_string', b'').decode())
+            organization_id = query.get('organization', [None])[0]
+            if organization_id and organization_id.isdigit():
+                self.location_group = organization_group(int(organization_id))
+            else:
+                self.location_group = ALL_ORGANIZATIONS_GROUP
+        else:
+            self.location_group = organization_group(self.user.organization_id)
+
+        await self.channel_layer.group_add(self.location_group, self.channel_name)
+        location_fanout.subscribe(self.channel_layer)
+        await self.accept()
+        print(f'✅ Ubicaciones conectado: {self.user.username} ({self.location_group})')
+
+    async def disconnect(self, close_code):
+        if self.location_group:
+            await self.channel_layer.group_discard(self.location_group, self.channel_name)
+            location_fanout.unsubscribe()
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            data = json.loads(text_data or '{}')
+        except json.JSONDecodeError:
+            return
+
+        if data.get('type') == 'subscribe':
+            try:
+                self.bounds = parse_bounds(data.get('bounds'))
+            except ValueError as e:
+                await self.send(text_data=json.dumps({'type': 'error', 'message': str(e)}))
+                return
+            await self.send(text_data=json.dumps({'type': 'subscribed', 'bounds': data.get('bounds')}))
+
+    async def location_batch(self, event):
+        drivers = [
+            update for update in event['updates']
+            if in_bounds(self.bounds, update['lat'], update['lng'])
+        ]
+        if drivers:
+            await self.send(text_data=json.dumps({'type': 'locations', 'drivers': drivers}))
@@ -0,0 +1,247 @@
+"""
+Exportación masiva de carreras (CSV / XLSX) en streaming
+
+Las cooperativas no tenían forma de sacar sus datos: solo las páginas del
+admin y los resúmenes de FinancialReportsView. La exportación recorre las
+carreras con `iterator(chunk_size=...)` (destinos, conductor y cliente
+cargados por bloque) y entrega el archivo con StreamingHttpResponse a
+medida que se genera: la memoria no crece con el número de carreras.
+Bajo ASGI (daphne) el generador se entrega como iterador asíncrono que pide
+cada bloque con sync_to_async; si no, Django lo consumiría entero con
+`sync_to_async(list)` antes de enviar el primer byte.
+
+- CSV: con BOM UTF-8 para que Excel respete los acentos. Los textos que
+  empiezan con = + - @ se prefijan con ' para que Excel no los ejecute como
+  fórmulas.
+- XLSX: se escribe con zipfile de la biblioteca estándar en un zip que se
+  vacía por bloques (sin openpyxl ni archivo temporal). Las celdas de texto
+  van como inlineStr, así que no hace falta la tabla de strings compartidos.
+"""
+import csv
+import re
+import zipfile
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from asgiref.sync import sync_to_async
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from .models import Ride, RideDestination
+
+EXPORT_CHUNK_SIZE = 1000
+
+COLUMNS = (
+    'id', 'fecha', 'estado', 'cooperativa', 'conductor', 'cliente', 'teléfono cliente',
+    'origen', 'destinos', 'precio', 'comisión', 'neto conductor',
+)
+
+
+def ride_export_queryset(organization=None, driver=None, start=None, end=None):
+    """
+    Carreras a exportar, en orden de id
+
+    Args:
+        organization, driver: id o instancia (None = todas)
+        start, end: date, ambos incluidos (hora local)
+    """
+    rides = Ride.objects.select_related('organization', 'driver', 'customer').prefetch_related(
+        Prefetch('destinations', queryset=RideDestination.objects.order_by('order'))
+    )
+    if organization is not None:
+        rides = rides.filter(organization=organization)
+    if driver is not None:
+        rides = rides.filter(driver=driver)
+    if start is not None:
+        rides = rides.filter(created_at__gte=timezone.make_aware(datetime.combine(start, time())))
+    if end is not None:
+        rides = rides.filter(created_at__lt=timezone.make_aware(datetime.combine(end + timedelta(days=1), time())))
+    return rides.order_by('id')
+
+
+def _name(user):
+    return (user.get_full_name() or user.username) if user else ''
+
+
+def ride_rows(rides, chunk_size=EXPORT_CHUNK_SIZE):
+    """Genera una fila (lista de valores) por carrera, leyendo de a `chunk_size`"""
+    for ride in rides.iterator(chunk_size=chunk_size):
+        price = ride.price
+        commission = ride.commission_amount
+        yield [
+            ride.id,
+            timezone.localtime(ride.created_at).strftime('%Y-%m-%d %H:%M'),
+            ride.get_status_display(),
+            ride.organization.name if ride.organization else '',
+            _name(ride.driver),
+            _name(ride.customer),
+            ride.customer.phone_number or '',
+            ride.display_origin,
+            ' → '.join(d.address or d.destination for d in ride.destinations.all()),
+            price,
+            commission,
+            price - (commission or Decimal('0')) if price is not None else None,
+        ]
+
+
+# ============================================
+# CSV
+# ============================================
+
+class _Echo:
+    """Pseudo-archivo: csv.writer devuelve la línea en lugar de guardarla"""
+
+    def write(self, value):
+        return value
+
+
+# Caracteres con los que Excel / LibreOffice interpretan una celda como fórmula
+_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_stream(rows, rows_per_chunk=500):
+    """Genera el CSV en bloques de líneas (para StreamingHttpResponse)"""
+    writer = csv.writer(_Echo())
+    buffered = ['\ufeff' + writer.writerow(COLUMNS)]
+    for row in rows:
+        buffered.append(writer.writerow([_csv_value(value) for value in row]))
+        if len(buffered) >= rows_per_chunk:
+            yield ''.join(buffered)
+            buffered.clear()
+    if buffered:
+        yield ''.join(buffered)
+
+
+# ============================================
+# XLSX
+# ============================================
+
+class _Sink:
+    """Destino del zip sin seek: acumula lo escrito hasta que se vacía"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+_XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Carreras" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+# Caracteres de control que XML 1.0 no admite
+_INVALID_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def _cell(value):
+    if value is None or value == '':
+        return '<c/>'
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return f'<c><v>{value}</v></c>'
+    text = escape(_INVALID_XML.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _xml_row(values):
+    return '<row>' + ''.join(_cell(value) for value in values) + '</row>'
+
+
+def xlsx_stream(rows, rows_per_chunk=500):
+    """Genera el XLSX en bloques de bytes (para StreamingHttpResponse)"""
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as workbook:
+        for name, content in _XLSX_PARTS.items():
+            workbook.writestr(name, content)
+        yield sink.drain()
+
+        with workbook.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+                + _xml_row(COLUMNS)
+            ).encode())
+            buffered = []
+            for row in rows:
+                buffered.append(_xml_row(row))
+                if len(buffered) >= rows_per_chunk:
+                    sheet.write(''.join(buffered).encode())
+                    buffered.clear()
+                    yield sink.drain()
+            sheet.write((''.join(buffered) + '</sheetData></worksheet>').encode())
+    yield sink.drain()
+
+
+# ============================================
+# ASGI
+# ============================================
+
+async def async_chunks(chunks):
+    """
+    Iterador asíncrono sobre un generador síncrono, un bloque por vez
+
+    Cada bloque se pide con sync_to_async en el hilo de las vistas síncronas
+    (thread_sensitive), el mismo donde vive el cursor del iterator().
+    """
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    done = object()
+    try:
+        while True:
+            chunk = await next_chunk(chunks, done)
+            if chunk is done:
+                break
+            yield chunk
+    finally:
+        # Cierra el cursor también si el cliente corta la descarga
+        await sync_to_async(chunks.close, thread_sensitive=True)()
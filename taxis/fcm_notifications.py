@@ -6,6 +6,7 @@ Reemplaza Web Push para apps nativas Flutter/React Native
 import os
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Optional, Dict, Any
 from django.conf import settings
 from django.contrib.auth import get_user_model
@@ -67,6 +68,161 @@ initialize_firebase()
 # FUNCIONES DE ENVÍO
 # =====================================================
 
+# Tokens por llamada multicast (límite de FCM)
+FCM_MULTICAST_BATCH_SIZE = 500
+
+# Lotes multicast enviados en paralelo
+FCM_MAX_CONCURRENT_BATCHES = getattr(settings, 'FCM_MAX_CONCURRENT_BATCHES', 4)
+
+# Errores que indican que el token ya no sirve (app desinstalada, proyecto distinto)
+_DEAD_TOKEN_ERRORS = (messaging.UnregisteredError, messaging.SenderIdMismatchError)
+
+
+def _stringify_data(data: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    """FCM requiere que todos los valores de 'data' sean strings"""
+    data_payload = {}
+    if data:
+        for key, value in data.items():
+            data_payload[str(key)] = str(value) if value is not None else ''
+    return data_payload
+
+
+def _message_options(title, body, data=None, image_url=None, sound='default') -> Dict[str, Any]:
+    """
+    Partes comunes del mensaje (se arman una vez por envío, no por token)
+
+    ⚠️ IMPORTANTE: Para que las notificaciones funcionen cuando la app está cerrada,
+    necesitamos tanto 'notification' (para mostrar la notificación) como 'data' (para el handler)
+    """
+    return {
+        'notification': messaging.Notification(
+            title=title,
+            body=body,
+            image=image_url
+        ),
+        'data': _stringify_data(data),  # Datos para el handler de background
+        'android': messaging.AndroidConfig(
+            priority='high',  # Alta prioridad para que llegue incluso cuando la app está cerrada
+            ttl=86400,  # 24 horas de validez
+            notification=messaging.AndroidNotification(
+                sound=sound,
+                channel_id='high_importance_channel',  # Usar el mismo canal que Flutter
+                color='#FF6B35',  # Color de la app
+                icon='ic_notification',
+                priority='high',  # Alta prioridad
+                visibility='public',  # Visible incluso cuando el dispositivo está bloqueado
+                default_sound=True,
+                default_vibrate_timings=True,
+                default_light_settings=True,
+            )
+        ),
+        'apns': messaging.APNSConfig(
+            payload=messaging.APNSPayload(
+                aps=messaging.Aps(
+                    sound=sound,
+                    badge=1,
+                    content_available=True,  # Permite que el handler se ejecute en background
+                    alert=messaging.ApsAlert(
+                        title=title,
+                        body=body,
+                    ),
+                )
+            )
+        ),
+    }
+
+
+def _send_batch(batch, options):
+    """Un lote multicast; retorna (enviados, ids_de_tokens_muertos, errores)"""
+    message = messaging.MulticastMessage(tokens=[token for _, token in batch], **options)
+    try:
+        response = messaging.send_each_for_multicast(message)
+    except Exception as e:
+        logger.error(f"❌ Error enviando lote FCM de {len(batch)} tokens: {e}")
+        return 0, [], [str(e)] * len(batch)
+
+    dead_ids = []
+    errors = []
+    for (token_id, _), result in zip(batch, response.responses):
+        if result.success:
+            continue
+        if isinstance(result.exception, _DEAD_TOKEN_ERRORS):
+            dead_ids.append(token_id)
+            errors.append('Token no registrado')
+        else:
+            errors.append(str(result.exception))
+    return response.success_count, dead_ids, errors
+
+
+def send_fcm_to_tokens(
+    tokens,
+    title: str,
+    body: str,
+    data: Optional[Dict[str, Any]] = None,
+    image_url: Optional[str] = None,
+    sound: str = 'default'
+) -> Dict[str, Any]:
+    """
+    Envío masivo: lotes multicast de 500 tokens en paralelo
+
+    Args:
+        tokens: Lista de (id de FCMToken, token)
+
+    Returns:
+        Dict con 'sent', 'failed', 'deactivated' y 'errors'
+    """
+    if not tokens:
+        return {'success': True, 'sent': 0, 'failed': 0, 'deactivated': 0, 'errors': []}
+
+    results, dead_ids = multicast_fcm(tokens, title, body, data, image_url, sound)
+    results['deactivated'] = deactivate_fcm_tokens(dead_ids)
+    return results
+
+
+def multicast_fcm(tokens, title, body, data=None, image_url=None, sound='default'):
+    """
+    Solo la parte de red de send_fcm_to_tokens (no toca la base de datos)
+
+    Returns:
+        (resultados, ids de tokens muertos para deactivate_fcm_tokens)
+    """
+    results = {'success': True, 'sent': 0, 'failed': 0, 'deactivated': 0, 'errors': []}
+    options = _message_options(title, body, data, image_url, sound)
+    batches = [tokens[i:i + FCM_MULTICAST_BATCH_SIZE] for i in range(0, len(tokens), FCM_MULTICAST_BATCH_SIZE)]
+
+    if len(batches) == 1:
+        outcomes = [_send_batch(batches[0], options)]
+    else:
+        with ThreadPoolExecutor(max_workers=min(FCM_MAX_CONCURRENT_BATCHES, len(batches))) as executor:
+            outcomes = list(executor.map(lambda batch: _send_batch(batch, options), batches))
+
+    dead_ids = []
+    for sent, dead, errors in outcomes:
+        results['sent'] += sent
+        results['failed'] += len(errors)
+        results['errors'].extend(errors)
+        dead_ids.extend(dead)
+
+    logger.info(f"📤 FCM: {results['sent']} enviados, {results['failed']} fallidos ({len(tokens)} tokens)")
+    return results, dead_ids
+
+
+def deactivate_fcm_tokens(dead_ids):
+    """Tokens inválidos: se desactivan todos en un solo UPDATE"""
+    if not dead_ids:
+        return 0
+    FCMToken = get_fcm_token_model()
+    deactivated = FCMToken.objects.filter(id__in=dead_ids).update(is_active=False)
+    logger.warning(f"⚠️ {deactivated} token(s) FCM inválidos desactivados")
+    return deactivated
+
+
+def _active_tokens(**filters):
+    """Tokens activos (id, token) en una sola consulta"""
+    FCMToken = get_fcm_token_model()
+    return list(FCMToken.objects.filter(is_active=True, **filters).values_list('id', 'token'))
+
+
 def send_fcm_notification(
     user: User,
     title: str,
@@ -93,95 +249,15 @@ def send_fcm_notification(
         logger.error("❌ Firebase no está inicializado")
         return {'success': False, 'error': 'Firebase no configurado'}
     
-    # Obtener tokens activos del usuario
-    FCMToken = get_fcm_token_model()
-    tokens = FCMToken.objects.filter(user=user, is_active=True)
-    
-    if not tokens.exists():
+    # Todos los dispositivos del usuario en un solo multicast
+    tokens = _active_tokens(user=user)
+    if not tokens:
         logger.warning(f"⚠️ Usuario {user.username} no tiene tokens FCM")
         return {'success': False, 'error': 'No hay tokens registrados'}
     
-    results = {
-        'success': True,
-        'sent': 0,
-        'failed': 0,
-        'errors': []
-    }
-    
-    for fcm_token in tokens:
-        try:
-            # ⚠️ IMPORTANTE: Para que las notificaciones funcionen cuando la app está cerrada,
-            # necesitamos tanto 'notification' (para mostrar la notificación) como 'data' (para el handler)
-            # Además, el payload 'data' debe tener todos los valores como strings
-            
-            # Convertir data a strings (FCM requiere que todos los valores sean strings)
-            data_payload = {}
-            if data:
-                for key, value in data.items():
-                    data_payload[str(key)] = str(value) if value is not None else ''
-            
-            # Construir mensaje
-            message = messaging.Message(
-                notification=messaging.Notification(
-                    title=title,
-                    body=body,
-                    image=image_url
-                ),
-                data=data_payload,  # Datos para el handler de background
-                android=messaging.AndroidConfig(
-                    priority='high',  # Alta prioridad para que llegue incluso cuando la app está cerrada
-                    ttl=86400,  # 24 horas de validez
-                    notification=messaging.AndroidNotification(
-                        sound=sound,
-                        channel_id='high_importance_channel',  # Usar el mismo canal que Flutter
-                        color='#FF6B35',  # Color de la app
-                        icon='ic_notification',
-                        priority='high',  # Alta prioridad
-                        visibility='public',  # Visible incluso cuando el dispositivo está bloqueado
-                        default_sound=True,
-                        default_vibrate_timings=True,
-                        default_light_settings=True,
-                    )
-                ),
-                apns=messaging.APNSConfig(
-                    payload=messaging.APNSPayload(
-                        aps=messaging.Aps(
-                            sound=sound,
-                            badge=1,
-                            content_available=True,  # Permite que el handler se ejecute en background
-                            alert=messaging.ApsAlert(
-                                title=title,
-                                body=body,
-                            ),
-                        )
-                    )
-                ),
-                token=fcm_token.token
-            )
-            
-            # Enviar
-            response = messaging.send(message)
-            results['sent'] += 1
-            logger.info(f"✅ Notificación FCM enviada a {user.username}")
-            logger.info(f"   Token: {fcm_token.token[:30]}...")
-            logger.info(f"   Título: {title}")
-            logger.info(f"   Cuerpo: {body[:50]}...")
-            logger.info(f"   Data: {data_payload}")
-            logger.info(f"   Response: {response}")
-            
-        except messaging.UnregisteredError:
-            # Token inválido - desactivar
-            logger.warning(f"⚠️ Token inválido para {user.username} - desactivando")
-            fcm_token.is_active = False
-            fcm_token.save()
-            results['failed'] += 1
-            results['errors'].append('Token no registrado')
-            
-        except Exception as e:
-            logger.error(f"❌ Error enviando a {user.username}: {e}")
-            results['failed'] += 1
-            results['errors'].append(str(e))
-    
+    results = send_fcm_to_tokens(tokens, title, body, data, image_url, sound)
+    if results['sent']:
+        logger.info(f"✅ Notificación FCM enviada a {user.username} ({results['sent']} dispositivo(s))")
     return results
 
 
@@ -195,7 +271,7 @@ def send_fcm_to_multiple_users(
     Enviar notificación FCM a múltiples usuarios
     
     Args:
-        users: Lista de usuarios
+        users: Lista o queryset de usuarios
         title: Título de la notificación
         body: Cuerpo del mensaje
         data: Datos adicionales (opcional)
@@ -203,26 +279,26 @@ def send_fcm_to_multiple_users(
     Returns:
         Dict con resultados del envío
     """
-    results = {
-        'success': True,
-        'total_users': len(users),
-        'sent': 0,
-        'failed': 0
-    }
-    
-    for user in users:
-        result = send_fcm_notification(user, title, body, data)
-        if result['success']:
-            results['sent'] += result['sent']
-        results['failed'] += result.get('failed', 0)
-    
+    if not firebase_admin._apps:
+        logger.error("❌ Firebase no está inicializado")
+        return {'success': False, 'error': 'Firebase no configurado'}
+
+    # Un queryset se usa como subconsulta: tokens de todos los usuarios en una consulta
+    if hasattr(users, 'values_list'):
+        total_users = users.count()
+    else:
+        users = [user.id for user in users]
+        total_users = len(users)
+    results = send_fcm_to_tokens(_active_tokens(user__in=users), title, body, data)
+    results['total_users'] = total_users
     return results
 
 
 def send_fcm_to_all_drivers(
     title: str,
     body: str,
-    data: Optional[Dict[str, str]] = None
+    data: Optional[Dict[str, str]] = None,
+    organization=None
 ) -> Dict[str, Any]:
     """
     Enviar notificación a todos los conductores
@@ -231,26 +307,36 @@ def send_fcm_to_all_drivers(
         title: Título de la notificación
         body: Cuerpo del mensaje
         data: Datos adicionales (opcional)
+        organization: Limitar a los conductores de una cooperativa (opcional)
     
     Returns:
         Dict con resultados del envío
     """
-    drivers = User.objects.filter(role='driver')
-    return send_fcm_to_multiple_users(drivers, title, body, data)
+    if not firebase_admin._apps:
+        logger.error("❌ Firebase no está inicializado")
+        return {'success': False, 'error': 'Firebase no configurado'}
+
+    filters = {'user__role': 'driver'}
+    if organization is not None:
+        filters['user__organization'] = organization
+    return send_fcm_to_tokens(_active_tokens(**filters), title, body, data)
 
 
 # =====================================================
 # FUNCIONES ESPECÍFICAS DE LA APP
 # =====================================================
 
-def send_new_ride_notification_fcm(ride):
+def send_new_ride_notification_fcm(ride, drivers=None, extra_data=None):
     """
     Notificar a conductores sobre nueva carrera
     
     Args:
         ride: Objeto Ride
+        drivers: Queryset de conductores destinatarios (por defecto: todos)
+        extra_data: Datos adicionales de la carrera para la app (opcional)
     """
-    drivers = User.objects.filter(role='driver')
+    if drivers is None:
+        drivers = User.objects.filter(role='driver')
     
     title = "🚖 Nueva Carrera Disponible"
     body = f"Origen: {ride.origin}"
@@ -261,6 +347,8 @@ def send_new_ride_notification_fcm(ride):
         'price': str(ride.price) if ride.price else '0',
         'customer_name': ride.customer.get_full_name()
     }
+    if extra_data:
+        data.update(extra_data)
     
     return send_fcm_to_multiple_users(drivers, title, body, data)
 
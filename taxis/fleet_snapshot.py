@@ -0,0 +1,199 @@
+"""
+Snapshot versionado de la flota para el mapa de la central
+
+Mantiene en memoria la última posición y los datos de presentación de cada
+taxi, con un número de versión que aumenta en cada cambio. El mapa pide
+`?since=<cursor>` y recibe solo los taxis que se movieron desde entonces, así
+el costo de refrescar depende del movimiento y no del tamaño de la flota.
+
+La ingesta de ubicaciones alimenta el snapshot; una recarga periódica desde la
+BD recoge cambios hechos por otros procesos (altas, bajas, datos del vehículo).
+"""
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+
+from .location_pipeline import location_ingestor
+
+logger = logging.getLogger(__name__)
+
+# Cada cuánto se recarga el snapshot completo desde la BD
+RELOAD_SECONDS = 30
+
+# Cambios recordados; un cursor más antiguo recibe el snapshot completo
+CHANGE_LOG_SIZE = 20000
+
+DEFAULT_PHOTO = '/static/imagenes/logo1.png'
+
+
+class FleetSnapshot:
+    """Estado de la flota con registro de cambios para respuestas incrementales"""
+
+    def __init__(self, reload_seconds=RELOAD_SECONDS, log_size=CHANGE_LOG_SIZE):
+        self.reload_seconds = reload_seconds
+        self._lock = threading.RLock()
+        # Identifica esta instancia: un cursor de otro proceso o de antes de un reinicio no es válido
+        self._epoch = uuid.uuid4().hex[:8]
+        self._version = 0
+        self._entries = {}            # taxi_id -> dict (payload + 'organization_id')
+        self._log = deque(maxlen=log_size)   # (version, organization_id, taxi_id)
+        self._removed_ids = {}        # taxi_id -> id del conductor, para informar bajas
+        self._loaded_at = None
+
+    # ------------------------------------------------------------------
+    # Mantenimiento
+    # ------------------------------------------------------------------
+
+    def _bump(self, taxi_id, organization_id):
+        self._version += 1
+        self._log.append((self._version, organization_id, taxi_id))
+        return self._version
+
+    @staticmethod
+    def _build_entry(taxi):
+        user = taxi.user
+        return {
+            'id': user.id,
+            'taxi_id': taxi.id,
+            'username': user.username,
+            'nombre': user.get_full_name(),
+            'lat': taxi.latitude,
+            'lng': taxi.longitude,
+            'foto': user.profile_picture.url if user.profile_picture else DEFAULT_PHOTO,
+            'placa': taxi.plate_number,
+            'descripcion': taxi.vehicle_description,
+            'numero_unidad': user.driver_number or 'S/N',
+            'telefono': user.phone_number or 'N/A',
+            'organization_id': user.organization_id,
+        }
+
+    def reload(self):
+        """Relee la flota desde la BD y versiona solo lo que cambió"""
+        from .models import Taxi
+
+        taxis = Taxi.objects.select_related('user').filter(user__role='driver')
+        fresh = {taxi.id: self._build_entry(taxi) for taxi in taxis}
+
+        with self._lock:
+            for taxi_id, entry in fresh.items():
+                current = self._entries.get(taxi_id)
+                if current is not None and current.get('_live'):
+                    # La posición en memoria viene de la ingesta y puede ser más nueva que la BD
+                    entry['lat'], entry['lng'] = current['lat'], current['lng']
+                    entry['_live'] = True
+                if current is None or {k: v for k, v in current.items() if k not in ('version', '_live')} != \
+                        {k: v for k, v in entry.items() if k != '_live'}:
+                    entry['version'] = self._bump(taxi_id, entry['organization_id'])
+                else:
+                    entry['version'] = current['version']
+                self._entries[taxi_id] = entry
+
+            for taxi_id in set(self._entries) - set(fresh):
+                removed = self._entries.pop(taxi_id)
+                self._removed_ids[taxi_id] = removed['id']
+                self._bump(taxi_id, removed['organization_id'])
+
+            self._loaded_at = time.monotonic()
+
+    def _ensure_loaded(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.reload_seconds:
+            try:
+                self.reload()
+            except Exception as e:
+                logger.error(f"❌ Error recargando snapshot de flota: {e}")
+                if self._loaded_at is None:
+                    raise
+
+    def on_location(self, driver, latitude, longitude, timestamp):
+        """Listener del LocationIngestor: actualiza la posición y la versiona"""
+        with self._lock:
+            entry = self._entries.get(driver.taxi_id)
+            if entry is None:
+                # Taxi nuevo: faltan los datos de presentación, recargar en la próxima consulta
+                self._loaded_at = None
+                return
+            if entry['lat'] == latitude and entry['lng'] == longitude:
+                return
+            entry['lat'] = latitude
+            entry['lng'] = longitude
+            entry['_live'] = True
+            entry['version'] = self._bump(driver.taxi_id, entry['organization_id'])
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+
+    def cursor(self):
+        self._ensure_loaded()
+        return f"{self._epoch}:{self._version}"
+
+    def _parse_cursor(self, cursor):
+        """Retorna la versión del cursor o None si no es de esta instancia"""
+        if not cursor:
+            return None
+        epoch, _, version = str(cursor).partition(':')
+        if epoch != self._epoch or not version.isdigit():
+            return None
+        version = int(version)
+        if version > self._version:
+            return None
+        # Cambios anteriores al registro ya no se pueden reconstruir
+        if self._log and version < self._log[0][0] - 1:
+            return None
+        return version
+
+    @staticmethod
+    def _visible(entry_org, organization_id):
+        return organization_id is None or entry_org == organization_id
+
+    @staticmethod
+    def _public(entry):
+        return {k: v for k, v in entry.items() if k not in ('organization_id', 'version', '_live')}
+
+    def changes(self, organization_id=None, since=None):
+        """
+        Taxis cambiados desde el cursor `since`
+
+        Args:
+            organization_id: Limitar a una cooperativa (None = todas, solo superadmin)
+            since: Cursor devuelto por una respuesta anterior
+
+        Returns:
+            dict: {'cursor', 'full', 'taxis': [...], 'removed': [ids de conductor]}
+        """
+        self._ensure_loaded()
+        with self._lock:
+            since_version = self._parse_cursor(since)
+            cursor = f"{self._epoch}:{self._version}"
+
+            if since_version is None:
+                taxis = [
+                    self._public(entry) for entry in self._entries.values()
+                    if self._visible(entry['organization_id'], organization_id)
+                ]
+                return {'cursor': cursor, 'full': True, 'taxis': taxis, 'removed': []}
+
+            changed = set()
+            for version, entry_org, taxi_id in reversed(self._log):
+                if version <= since_version:
+                    break
+                if self._visible(entry_org, organization_id):
+                    changed.add(taxi_id)
+
+            taxis = []
+            removed = []
+            for taxi_id in changed:
+                entry = self._entries.get(taxi_id)
+                if entry is not None and self._visible(entry['organization_id'], organization_id):
+                    taxis.append(self._public(entry))
+                else:
+                    # Dado de baja o movido a otra cooperativa
+                    removed.append(entry['id'] if entry is not None else self._removed_ids.get(taxi_id, taxi_id))
+            return {'cursor': cursor, 'full': False, 'taxis': taxis, 'removed': removed}
+
+
+# Instancia global, alimentada por la ingesta de ubicaciones
+fleet_snapshot = FleetSnapshot()
+location_ingestor.add_listener(fleet_snapshot.on_location)
@@ -0,0 +1,183 @@
+"""
+Control de turno de palabra (floor control) del walkie-talkie
+
+Solo un hablante por sala puede transmitir. Antes el turno vivía en un dict
+de clase de AudioConsumer: con varios workers ASGI dos conductores en
+procesos distintos podían transmitir a la vez, y si un proceso moría el
+turno quedaba tomado para siempre.
+
+Ahora el turno es una concesión (lease) con TTL en el mismo Redis del
+channel layer:
+
+- acquire: SET NX PX (atómico); si ya es nuestro, se renueva.
+- heartbeat: mientras se transmite el consumer renueva el lease cada
+  TTL/3; si el proceso muere, el turno expira solo.
+- release: borra la llave solo si sigue siendo nuestra (script Lua).
+
+Todas las operaciones son O(1) y sin consultas a la BD. Sin Redis (desarrollo
+con InMemoryChannelLayer) se usa un backend local con la misma semántica.
+"""
+import json
+import logging
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Duración del lease; se renueva con heartbeat mientras dure la transmisión
+FLOOR_LEASE_SECONDS = getattr(settings, 'AUDIO_FLOOR_LEASE_SECONDS', 10)
+
+KEY_PREFIX = 'walkie:floor:'
+
+# Renovar / liberar solo si el turno sigue siendo del mismo titular
+_RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def make_holder(channel_name, speaker_id, speaker_name):
+    """Valor guardado como titular del turno (el channel_name es único en el cluster)"""
+    return json.dumps({'channel': channel_name, 'speakerId': speaker_id, 'speakerName': speaker_name})
+
+
+def parse_holder(value):
+    """Retorna el dict del titular o None"""
+    if not value:
+        return None
+    if isinstance(value, bytes):
+        value = value.decode()
+    try:
+        return json.loads(value)
+    except ValueError:
+        return None
+
+
+class LocalFloorBackend:
+    """Leases en memoria del proceso (desarrollo / un solo worker)"""
+
+    def __init__(self):
+        self._leases = {}   # room -> (holder, expira)
+
+    def _current(self, room):
+        lease = self._leases.get(room)
+        if lease and lease[1] > time.monotonic():
+            return lease[0]
+        self._leases.pop(room, None)
+        return None
+
+    async def acquire(self, room, holder, ttl):
+        current = self._current(room)
+        if current is not None and current != holder:
+            return False
+        self._leases[room] = (holder, time.monotonic() + ttl)
+        return True
+
+    async def renew(self, room, holder, ttl):
+        if self._current(room) != holder:
+            return False
+        self._leases[room] = (holder, time.monotonic() + ttl)
+        return True
+
+    async def release(self, room, holder):
+        if self._current(room) != holder:
+            return False
+        del self._leases[room]
+        return True
+
+    async def current(self, room):
+        return self._current(room)
+
+
+class RedisFloorBackend:
+    """Leases en Redis, compartidos por todos los workers"""
+
+    def __init__(self, redis_url):
+        import redis.asyncio as aioredis
+
+        self._client = aioredis.from_url(redis_url, decode_responses=True)
+        self._renew = self._client.register_script(_RENEW_SCRIPT)
+        self._release = self._client.register_script(_RELEASE_SCRIPT)
+
+    async def acquire(self, room, holder, ttl):
+        key = KEY_PREFIX + room
+        ttl_ms = int(ttl * 1000)
+        if await self._client.set(key, holder, nx=True, px=ttl_ms):
+            return True
+        # Ya es nuestro: renovar
+        return bool(await self._renew(keys=[key], args=[holder, ttl_ms]))
+
+    async def renew(self, room, holder, ttl):
+        return bool(await self._renew(keys=[KEY_PREFIX + room], args=[holder, int(ttl * 1000)]))
+
+    async def release(self, room, holder):
+        return bool(await self._release(keys=[KEY_PREFIX + room], args=[holder]))
+
+    async def current(self, room):
+        return await self._client.get(KEY_PREFIX + room)
+
+
+def _channel_layer_redis_url():
+    """URL del Redis del channel layer, o None si se usa InMemoryChannelLayer"""
+    layer = getattr(settings, 'CHANNEL_LAYERS', {}).get('default', {})
+    if 'redis' not in layer.get('BACKEND', '').lower():
+        return None
+    hosts = layer.get('CONFIG', {}).get('hosts') or []
+    if not hosts:
+        return None
+    host = hosts[0]
+    if isinstance(host, dict):
+        host = host.get('address')
+    if isinstance(host, (list, tuple)):
+        host = f'redis://{host[0]}:{host[1]}'
+    return host
+
+
+class FloorControl:
+    """Turno de palabra por sala, sobre el backend configurado"""
+
+    def __init__(self, backend=None, lease_seconds=FLOOR_LEASE_SECONDS):
+        self._backend = backend
+        self.lease_seconds = lease_seconds
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            redis_url = _channel_layer_redis_url()
+            if redis_url:
+                self._backend = RedisFloorBackend(redis_url)
+                logger.info("🎙️ Control de turno de audio en Redis")
+            else:
+                self._backend = LocalFloorBackend()
+                logger.info("🎙️ Control de turno de audio en memoria (sin Redis)")
+        return self._backend
+
+    async def acquire(self, room, holder):
+        """True si el turno quedó para `holder` (nuevo o renovado)"""
+        return await self.backend.acquire(room, holder, self.lease_seconds)
+
+    async def heartbeat(self, room, holder):
+        """Renueva el lease; False si el turno ya no es de `holder`"""
+        return await self.backend.renew(room, holder, self.lease_seconds)
+
+    async def release(self, room, holder):
+        """Libera el turno si sigue siendo de `holder`"""
+        return await self.backend.release(room, holder)
+
+    async def current_holder(self, room):
+        """Dict del titular actual ({'channel', 'speakerId', 'speakerName'}) o None"""
+        return parse_holder(await self.backend.current(room))
+
+
+# Instancia global
+floor_control = FloorControl()
@@ -0,0 +1,331 @@
+"""
+Índice geoespacial en memoria para el despacho de conductores
+
+Mantiene una grilla (celdas de ~1 km) por organización con la última posición
+conocida de cada taxi. Las actualizaciones de ubicación la mantienen al día y
+las búsquedas de k-vecinos o por radio solo revisan las celdas cercanas, en
+lugar de calcular la distancia contra todos los taxis de la base de datos.
+"""
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Tamaño de celda en grados (~1.1 km en el ecuador)
+CELL_SIZE_DEG = 0.01
+
+# Cada cuánto se recarga el índice desde la BD (cubre cambios hechos por otros procesos)
+REFRESH_SECONDS = 60
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEG_LAT = math.pi * EARTH_RADIUS_KM / 180
+
+# Clave del índice global (todas las organizaciones)
+ALL_ORGANIZATIONS = object()
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Distancia en km entre dos puntos (fórmula de Haversine)"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class DriverLocationIndex:
+    """
+    Grilla espacial de taxis, una por organización más una global.
+
+    Las posiciones se guardan por id de Taxi. El índice se carga perezosamente
+    desde la BD y se recarga cada `refresh_seconds`; entre recargas lo
+    actualizan los puntos de ingesta de ubicación mediante `update()`.
+    """
+
+    def __init__(self, cell_size=CELL_SIZE_DEG, refresh_seconds=REFRESH_SECONDS):
+        self.cell_size = cell_size
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.RLock()
+        self._positions = {}   # taxi_id -> (organization_id, lat, lng)
+        self._grids = {}       # organization_id | ALL_ORGANIZATIONS -> {(cx, cy): set(taxi_id)}
+        self._touched = {}     # taxi_id -> momento de la última actualización en memoria
+        self._loaded_at = None
+
+    # ------------------------------------------------------------------
+    # Mantenimiento
+    # ------------------------------------------------------------------
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_size), math.floor(lng / self.cell_size))
+
+    def _insert(self, taxi_id, organization_id, lat, lng):
+        cell = self._cell(lat, lng)
+        for key in (organization_id, ALL_ORGANIZATIONS):
+            self._grids.setdefault(key, {}).setdefault(cell, set()).add(taxi_id)
+        self._positions[taxi_id] = (organization_id, lat, lng)
+
+    def _discard(self, taxi_id):
+        previous = self._positions.pop(taxi_id, None)
+        if previous is None:
+            return
+        organization_id, lat, lng = previous
+        cell = self._cell(lat, lng)
+        for key in (organization_id, ALL_ORGANIZATIONS):
+            grid = self._grids.get(key)
+            if not grid:
+                continue
+            bucket = grid.get(cell)
+            if bucket is not None:
+                bucket.discard(taxi_id)
+                if not bucket:
+                    del grid[cell]
+
+    def update(self, taxi_id, lat, lng, organization_id=None):
+        """Registra la nueva posición de un taxi"""
+        try:
+            lat = float(lat)
+            lng = float(lng)
+        except (TypeError, ValueError):
+            return
+        with self._lock:
+            self._discard(taxi_id)
+            self._insert(taxi_id, organization_id, lat, lng)
+            self._touched[taxi_id] = time.monotonic()
+
+    def remove(self, taxi_id):
+        """Elimina un taxi del índice (ej. al borrar el conductor)"""
+        with self._lock:
+            self._discard(taxi_id)
+            self._touched.pop(taxi_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._positions.clear()
+            self._grids.clear()
+            self._touched.clear()
+            self._loaded_at = None
+
+    def reload(self):
+        """Recarga todas las posiciones desde la BD en una sola consulta"""
+        from .models import Taxi
+
+        started = time.monotonic()
+        rows = list(
+            Taxi.objects.filter(
+                user__role='driver',
+                latitude__isnull=False,
+                longitude__isnull=False,
+            ).values_list('id', 'user__organization_id', 'latitude', 'longitude')
+        )
+
+        with self._lock:
+            # Conservar las posiciones recibidas en memoria después de la lectura:
+            # pueden ser más nuevas que lo que todavía está en la BD.
+            fresh = {
+                taxi_id: self._positions[taxi_id]
+                for taxi_id, touched in self._touched.items()
+                if touched >= started - self.refresh_seconds and taxi_id in self._positions
+            }
+            self._positions = {}
+            self._grids = {}
+            for taxi_id, organization_id, lat, lng in rows:
+                if taxi_id not in fresh:
+                    self._insert(taxi_id, organization_id, lat, lng)
+            for taxi_id, (organization_id, lat, lng) in fresh.items():
+                self._insert(taxi_id, organization_id, lat, lng)
+            self._touched = {
+                taxi_id: touched for taxi_id, touched in self._touched.items() if taxi_id in fresh
+            }
+            self._loaded_at = time.monotonic()
+
+        logger.info(f"🗺️ Índice de conductores recargado: {len(self._positions)} taxis")
+
+    def _ensure_loaded(self):
+        loaded_at = self._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at > self.refresh_seconds:
+            self.reload()
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+
+    def position(self, taxi_id):
+        """Retorna (lat, lng) del taxi o None"""
+        self._ensure_loaded()
+        entry = self._positions.get(taxi_id)
+        return (entry[1], entry[2]) if entry else None
+
+    def count(self, organization_id=ALL_ORGANIZATIONS):
+        self._ensure_loaded()
+        with self._lock:
+            grid = self._grids.get(organization_id, {})
+            return sum(len(bucket) for bucket in grid.values())
+
+    def nearest(self, lat, lng, k=1, organization_id=ALL_ORGANIZATIONS, max_km=None, exclude=None):
+        """
+        Busca los k taxis más cercanos a un punto
+
+        Args:
+            lat, lng: Coordenadas del punto de búsqueda
+            k: Número de taxis a retornar
+            organization_id: Limitar a una cooperativa (None = conductores sin cooperativa)
+            max_km: Distancia máxima opcional
+            exclude: Conjunto de ids de taxi a ignorar
+
+        Returns:
+            list: [(taxi_id, distancia_km), ...] ordenada por distancia
+        """
+        self._ensure_loaded()
+        lat = float(lat)
+        lng = float(lng)
+        exclude = exclude or ()
+
+        with self._lock:
+            grid = self._grids.get(organization_id)
+            if not grid or k <= 0:
+                return []
+
+            cx, cy = self._cell(lat, lng)
+            # Lado mínimo de una celda en km: toda celda fuera del anillo r
+            # está al menos a r * min_cell_km del punto de búsqueda.
+            cos_lat = max(math.cos(math.radians(min(abs(lat) + self.cell_size, 90))), 1e-6)
+            min_cell_km = self.cell_size * KM_PER_DEG_LAT * min(1.0, cos_lat)
+
+            # Último anillo que puede tener taxis dentro de max_km
+            last_ring = math.inf if max_km is None else int(max_km / min_cell_km) + 1
+
+            found = []
+
+            def collect(bucket):
+                for taxi_id in bucket:
+                    if taxi_id in exclude:
+                        continue
+                    _, t_lat, t_lng = self._positions[taxi_id]
+                    found.append((taxi_id, haversine_km(lat, lng, t_lat, t_lng)))
+
+            ring = 0
+            while ring <= last_ring:
+                if (2 * ring + 1) ** 2 > len(grid):
+                    # Los anillos ya cubren más celdas de las que hay ocupadas
+                    # (p. ej. un taxi suelto a cientos de km): revisar las
+                    # ocupadas que faltan y terminar, sin seguir ensanchando.
+                    for (x, y), bucket in grid.items():
+                        if ring <= max(abs(x - cx), abs(y - cy)) <= last_ring:
+                            collect(bucket)
+                    break
+
+                for cell in self._ring_cells(cx, cy, ring):
+                    bucket = grid.get(cell)
+                    if bucket:
+                        collect(bucket)
+
+                if len(found) >= k:
+                    found.sort(key=lambda item: item[1])
+                    if found[k - 1][1] <= ring * min_cell_km:
+                        break
+                ring += 1
+
+        found.sort(key=lambda item: item[1])
+        if max_km is not None:
+            found = [item for item in found if item[1] <= max_km]
+        return found[:k]
+
+    def within_radius(self, lat, lng, radius_km, organization_id=ALL_ORGANIZATIONS):
+        """
+        Retorna los taxis a menos de `radius_km` del punto
+
+        Returns:
+            list: [(taxi_id, distancia_km), ...] ordenada por distancia
+        """
+        self._ensure_loaded()
+        lat = float(lat)
+        lng = float(lng)
+
+        lat_delta = radius_km / KM_PER_DEG_LAT
+        cos_lat = max(math.cos(math.radians(min(abs(lat) + lat_delta, 89.9))), 1e-6)
+        lng_delta = lat_delta / cos_lat
+        min_cx, min_cy = self._cell(lat - lat_delta, lng - lng_delta)
+        max_cx, max_cy = self._cell(lat + lat_delta, lng + lng_delta)
+
+        result = []
+        with self._lock:
+            grid = self._grids.get(organization_id)
+            if not grid:
+                return []
+            for x in range(min_cx, max_cx + 1):
+                for y in range(min_cy, max_cy + 1):
+                    for taxi_id in grid.get((x, y), ()):
+                        _, t_lat, t_lng = self._positions[taxi_id]
+                        distance = haversine_km(lat, lng, t_lat, t_lng)
+                        if distance <= radius_km:
+                            result.append((taxi_id, distance))
+
+        result.sort(key=lambda item: item[1])
+        return result
+
+    @staticmethod
+    def _ring_cells(cx, cy, ring):
+        if ring == 0:
+            yield (cx, cy)
+            return
+        for x in range(cx - ring, cx + ring + 1):
+            yield (x, cy - ring)
+            yield (x, cy + ring)
+        for y in range(cy - ring + 1, cy + ring):
+            yield (cx - ring, y)
+            yield (cx + ring, y)
+
+
+# Instancia global
+driver_index = DriverLocationIndex()
+
+
+def buscar_taxi_cercano(lat, lng, queryset=None, organization=None, batch_size=10, max_km=None):
+    """
+    Retorna (taxi, distancia_km) del taxi más cercano que cumpla `queryset`.
+
+    El índice propone candidatos por distancia y la BD solo valida los filtros
+    de negocio (rol, contacto, carreras activas) sobre ese pequeño lote.
+
+    Args:
+        lat, lng: Punto de recogida
+        queryset: QuerySet de Taxi con los filtros a aplicar (por defecto todos)
+        organization: Organization o id para limitar a una cooperativa (None = todas)
+        batch_size: Candidatos validados por consulta
+        max_km: Distancia máxima opcional del taxi al punto de recogida
+
+    Returns:
+        tuple: (Taxi, distancia_km) o (None, None)
+    """
+    from .models import Taxi
+
+    if lat is None or lng is None:
+        return None, None
+
+    if queryset is None:
+        queryset = Taxi.objects.select_related('user')
+
+    organization_id = ALL_ORGANIZATIONS
+    if organization is not None:
+        organization_id = getattr(organization, 'pk', organization)
+
+    checked = set()
+    k = batch_size
+    while True:
+        nearest = driver_index.nearest(lat, lng, k=k, organization_id=organization_id, max_km=max_km)
+        candidates = [(taxi_id, distance) for taxi_id, distance in nearest if taxi_id not in checked]
+        if not candidates:
+            return None, None
+
+        ids = [taxi_id for taxi_id, _ in candidates]
+        valid = {taxi.id: taxi for taxi in queryset.filter(id__in=ids)}
+        for taxi_id, distance in candidates:
+            if taxi_id in valid:
+                return valid[taxi_id], distance
+
+        checked.update(ids)
+        # Menos de k resultados: ya no quedan taxis (dentro de max_km) por validar
+        if len(nearest) < k:
+            return None, None
+        k *= 4
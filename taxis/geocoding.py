@@ -0,0 +1,291 @@
+"""
+Servicio de geocodificación compartido (coordenadas ↔ dirección)
+
+Antes cada módulo geocodificaba por su cuenta: `Ride.get_origin_address`
+llamaba a Nominatim en cada render de ride_detail, request_ride pedía a Google
+la misma dirección dos veces y los agentes de WhatsApp usaban geopy. Ahora
+todas las búsquedas pasan por `geocoder`, con caché en dos niveles:
+
+1. LRU en memoria del proceso (TTLCache de maps_client).
+2. Tabla `GeocodeCacheEntry`, compartida entre procesos y reinicios.
+
+Las búsquedas inversas se indexan por coordenadas redondeadas (~11 m) y las
+directas por el texto normalizado, así que los orígenes repetidos (centros
+comerciales, terminales) no vuelven a salir a la red. Los "sin resultado"
+también se guardan (caché negativa, con vigencia más corta); los errores de
+red no se guardan.
+
+Proveedores: Google Geocoding si hay GOOGLE_API_KEY, Nominatim como respaldo.
+"""
+import hashlib
+import logging
+from collections import namedtuple
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.utils import timezone
+
+from .maps_client import TTLCache, maps_client
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_GEOCODE_URL = 'https://maps.googleapis.com/maps/api/geocode/json'
+NOMINATIM_REVERSE_URL = 'https://nominatim.openstreetmap.org/reverse'
+NOMINATIM_SEARCH_URL = 'https://nominatim.openstreetmap.org/search'
+NOMINATIM_USER_AGENT = 'taxi_app'
+
+UNKNOWN_ADDRESS = 'Dirección desconocida'
+
+# Decimales de las coordenadas en la llave de caché (4 ≈ 11 m)
+CACHE_PRECISION = 4
+
+# Vigencia de un resultado en la tabla (las direcciones casi no cambian)
+CACHE_TTL_SECONDS = getattr(settings, 'GEOCODE_CACHE_TTL', 30 * 24 * 3600)
+
+# Vigencia de un "sin resultado" (caché negativa)
+NEGATIVE_TTL_SECONDS = getattr(settings, 'GEOCODE_NEGATIVE_TTL', 3600)
+
+# Vigencia en la caché en memoria (acota la memoria y permite ver cambios de la tabla)
+MEMORY_TTL_SECONDS = 3600
+MEMORY_MAX_ENTRIES = 10000
+
+REQUEST_TIMEOUT = 5
+
+# Largo máximo de la llave (CharField de GeocodeCacheEntry)
+MAX_KEY_LENGTH = 255
+
+GeoResult = namedtuple('GeoResult', ['address', 'latitude', 'longitude'])
+
+# Marca de "sin resultado" en la caché en memoria
+_NOT_FOUND = object()
+
+
+class GeocodingError(Exception):
+    """El proveedor no pudo responder (red, cuota, llave inválida); no se guarda en caché"""
+
+
+def normalize_address(text):
+    """Texto de búsqueda normalizado para la llave de caché"""
+    normalized = ' '.join(str(text).lower().split()).strip(' ,.')
+    if len(normalized) > MAX_KEY_LENGTH:
+        normalized = hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+    return normalized
+
+
+def reverse_key(lat, lng):
+    return f'{round(float(lat), CACHE_PRECISION)},{round(float(lng), CACHE_PRECISION)}'
+
+
+class Geocoder:
+    """Geocodificación directa e inversa con caché en memoria + tabla"""
+
+    def __init__(self, api_key=None, cache=None, session=None):
+        self._api_key = api_key
+        self.cache = cache or TTLCache(max_entries=MEMORY_MAX_ENTRIES, ttl=MEMORY_TTL_SECONDS)
+        self._session = session
+        self.stats = {'memory_hits': 0, 'db_hits': 0, 'requests': 0}
+
+    @property
+    def api_key(self):
+        return self._api_key or getattr(settings, 'GOOGLE_API_KEY', None)
+
+    @property
+    def session(self):
+        # Reutiliza el pool de conexiones de maps_client
+        return self._session or maps_client.session
+
+    # ------------------------------------------------------------------
+    # API pública
+    # ------------------------------------------------------------------
+
+    def reverse(self, lat, lng, timeout=None):
+        """
+        Dirección legible de unas coordenadas
+
+        Returns:
+            GeoResult o None si no hay resultado
+        """
+        if lat is None or lng is None:
+            return None
+        key = reverse_key(lat, lng)
+        return self._lookup('reverse', key, lambda: self._fetch_reverse(key, timeout))
+
+    def geocode(self, text, timeout=None):
+        """
+        Coordenadas de una dirección escrita
+
+        Returns:
+            GeoResult o None si no hay resultado
+        """
+        if not text or not str(text).strip():
+            return None
+        query = ' '.join(str(text).split())
+        return self._lookup('forward', normalize_address(query), lambda: self._fetch_forward(query, timeout))
+
+    def address_for(self, lat, lng, default=UNKNOWN_ADDRESS):
+        """Dirección de unas coordenadas como texto (`default` si no se pudo obtener)"""
+        result = self.reverse(lat, lng)
+        return result.address if result else default
+
+    # ------------------------------------------------------------------
+    # Caché
+    # ------------------------------------------------------------------
+
+    def _lookup(self, kind, key, fetch):
+        cached = self.cache.get((kind, key))
+        if cached is not None:
+            self.stats['memory_hits'] += 1
+            return None if cached is _NOT_FOUND else cached
+
+        found, result = self._load(kind, key)
+        if found:
+            self.stats['db_hits'] += 1
+            self.cache.set((kind, key), result or _NOT_FOUND)
+            return result
+
+        try:
+            result, provider = fetch()
+        except GeocodingError as e:
+            logger.warning(f"⚠️ Geocodificación {kind} de '{key}' falló: {e}")
+            return None
+
+        ttl = CACHE_TTL_SECONDS if result else NEGATIVE_TTL_SECONDS
+        self.cache.set((kind, key), result or _NOT_FOUND, ttl=min(ttl, MEMORY_TTL_SECONDS))
+        self._store(kind, key, result, provider, ttl)
+        return result
+
+    def _load(self, kind, key):
+        """Busca en la tabla; retorna (hay_entrada_vigente, resultado)"""
+        from .models import GeocodeCacheEntry
+
+        try:
+            entry = GeocodeCacheEntry.objects.filter(
+                kind=kind, key=key, expires_at__gt=timezone.now()
+            ).first()
+        except Exception as e:
+            logger.error(f"❌ Error leyendo caché de geocodificación: {e}")
+            return False, None
+        if entry is None:
+            return False, None
+        if not entry.found:
+            return True, None
+        return True, GeoResult(entry.address, entry.latitude, entry.longitude)
+
+    def _store(self, kind, key, result, provider, ttl):
+        from .models import GeocodeCacheEntry
+
+        try:
+            GeocodeCacheEntry.objects.update_or_create(
+                kind=kind, key=key,
+                defaults={
+                    'address': result.address if result else '',
+                    'latitude': result.latitude if result else None,
+                    'longitude': result.longitude if result else None,
+                    'found': result is not None,
+                    'provider': provider,
+                    'expires_at': timezone.now() + timedelta(seconds=ttl),
+                },
+            )
+        except Exception as e:
+            logger.error(f"❌ Error guardando caché de geocodificación: {e}")
+
+    def clear_memory(self):
+        self.cache.clear()
+
+    # ------------------------------------------------------------------
+    # Proveedores
+    # ------------------------------------------------------------------
+
+    def _providers(self):
+        providers = []
+        if self.api_key:
+            providers.append(('google', self._google))
+        providers.append(('nominatim', self._nominatim))
+        return providers
+
+    def _resolve(self, kind, value, timeout):
+        """
+        Consulta los proveedores en orden hasta obtener un resultado
+
+        Returns:
+            tuple: (GeoResult o None, proveedor)
+
+        Raises:
+            GeocodingError: Si ningún proveedor respondió (no se guarda como "sin resultado")
+        """
+        errors = []
+        answered = ''
+        for name, provider in self._providers():
+            self.stats['requests'] += 1
+            try:
+                result = provider(kind, value, timeout or REQUEST_TIMEOUT)
+            except (requests.RequestException, ValueError, KeyError, GeocodingError) as e:
+                errors.append(f'{name}: {e}')
+                continue
+            if result is not None:
+                return result, name
+            answered = answered or name
+        if answered:
+            return None, answered
+        raise GeocodingError('; '.join(errors))
+
+    def _fetch_reverse(self, key, timeout):
+        lat, lng = (float(part) for part in key.split(','))
+        return self._resolve('reverse', (lat, lng), timeout)
+
+    def _fetch_forward(self, query, timeout):
+        return self._resolve('forward', query, timeout)
+
+    def _google(self, kind, value, timeout):
+        params = {'key': self.api_key, 'language': 'es'}
+        if kind == 'reverse':
+            params['latlng'] = f'{value[0]},{value[1]}'
+        else:
+            params['address'] = value
+        data = self.session.get(GOOGLE_GEOCODE_URL, params=params, timeout=timeout).json()
+        status = data.get('status')
+        if status == 'ZERO_RESULTS':
+            return None
+        if status != 'OK':
+            raise GeocodingError(f"{status} {data.get('error_message', '')}".strip())
+
+        results = data.get('results', [])
+        if not results:
+            return None
+        chosen = results[0]
+        if kind == 'reverse':
+            # Evitar plus_code y preferir tipo de calle o ruta
+            for resultado in results:
+                tipos = resultado.get('types', [])
+                if 'plus_code' not in tipos and any(t in tipos for t in ('street_address', 'route', 'premise', 'sublocality')):
+                    chosen = resultado
+                    break
+            return GeoResult(chosen.get('formatted_address'), value[0], value[1])
+        location = chosen['geometry']['location']
+        return GeoResult(chosen.get('formatted_address'), location['lat'], location['lng'])
+
+    def _nominatim(self, kind, value, timeout):
+        headers = {'User-Agent': NOMINATIM_USER_AGENT, 'Accept-Language': 'es'}
+        if kind == 'reverse':
+            response = self.session.get(NOMINATIM_REVERSE_URL, params={
+                'lat': value[0], 'lon': value[1], 'format': 'jsonv2',
+            }, headers=headers, timeout=timeout)
+            response.raise_for_status()
+            data = response.json()
+            if not data.get('display_name'):
+                return None
+            return GeoResult(data['display_name'], value[0], value[1])
+
+        response = self.session.get(NOMINATIM_SEARCH_URL, params={
+            'q': value, 'format': 'jsonv2', 'limit': 1,
+        }, headers=headers, timeout=timeout)
+        response.raise_for_status()
+        data = response.json()
+        if not data:
+            return None
+        return GeoResult(data[0].get('display_name', value), float(data[0]['lat']), float(data[0]['lon']))
+
+
+# Instancia global
+geocoder = Geocoder()
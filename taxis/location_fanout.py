@@ -0,0 +1,217 @@
+"""
+Difusión de ubicaciones de conductores por organización
+
+Antes cada ping se reenviaba a todo el grupo `audio_conductores`: todos los
+conductores y centrales recibían la posición de toda la flota, de todas las
+cooperativas, un mensaje por ping. Ahora:
+
+- Los pings llegan desde el LocationIngestor y se agrupan por organización,
+  quedándose solo con la última posición de cada conductor.
+- Una vez por tick (LOCATION_FANOUT_TICK, 1 s por defecto) se hace un solo
+  group_send por organización con el lote de cambios.
+- Cada socket filtra el lote por su viewport (bounding box del mapa) y envía
+  un único frame con lo que cae dentro; si no hay nada, no envía.
+- Con un channel layer compartido (Redis) el ping puede llegar a un proceso
+  sin centrales conectadas mientras la central escucha en otro: se acumula y
+  publica siempre, desde un hilo propio con su event loop. Solo con el layer
+  en memoria (un único proceso) se descarta cuando no hay suscriptores locales.
+
+Grupos del channel layer:
+    locations_org_<id>   Ubicaciones de una organización
+    locations_all        Todas las organizaciones (superadmin)
+"""
+import asyncio
+import logging
+import threading
+import time
+
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from django.conf import settings
+
+from .location_pipeline import location_ingestor
+
+logger = logging.getLogger(__name__)
+
+# Segundos entre envíos agrupados
+FANOUT_TICK = getattr(settings, 'LOCATION_FANOUT_TICK', 1.0)
+
+ALL_ORGANIZATIONS_GROUP = 'locations_all'
+
+
+def organization_group(organization_id):
+    """Nombre del grupo de ubicaciones de una organización"""
+    return f'locations_org_{organization_id or "none"}'
+
+
+def parse_bounds(bounds):
+    """
+    Valida un viewport {'north', 'south', 'east', 'west'}
+
+    Returns:
+        tuple (south, west, north, east) o None si no hay viewport (ver toda la organización)
+
+    Raises:
+        ValueError: Si el viewport está incompleto o no es numérico
+    """
+    if not bounds:
+        return None
+    try:
+        south = float(bounds['south'])
+        west = float(bounds['west'])
+        north = float(bounds['north'])
+        east = float(bounds['east'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('Viewport inválido: se requieren north, south, east y west numéricos')
+    if south > north:
+        raise ValueError('Viewport inválido: south mayor que north')
+    return (south, west, north, east)
+
+
+def in_bounds(bounds, lat, lng):
+    """True si el punto cae en el viewport (None = sin filtro)"""
+    if bounds is None:
+        return True
+    south, west, north, east = bounds
+    if not south <= lat <= north:
+        return False
+    if west <= east:
+        return west <= lng <= east
+    # Viewport que cruza el antimeridiano
+    return lng >= west or lng <= east
+
+
+class LocationFanout:
+    """Agrupa los pings por organización y los difunde una vez por tick"""
+
+    def __init__(self, tick=FANOUT_TICK, cross_process=None):
+        self.tick = tick
+        self._cross_process = cross_process
+        self._lock = threading.Lock()
+        self._pending = {}       # organization_id -> {driver_id: update}
+        self._task = None
+        self._publisher = None
+        self._stop = threading.Event()
+        self._subscribers = 0
+        self.stats = {'received': 0, 'sent_updates': 0, 'group_sends': 0}
+
+    @property
+    def cross_process(self):
+        """True si el channel layer llega a otros procesos (Redis); False con el layer en memoria"""
+        if self._cross_process is None:
+            layer = get_channel_layer()
+            self._cross_process = layer is not None and not isinstance(layer, InMemoryChannelLayer)
+        return self._cross_process
+
+    def on_location(self, driver, latitude, longitude, timestamp):
+        """Listener del LocationIngestor (solo memoria)"""
+        if not self.cross_process and not self._subscribers:
+            # Layer en memoria: solo llega a los sockets de este proceso y aquí
+            # no hay ninguno suscrito, así que no hay a quién enviarle el lote
+            return
+        update = {
+            'driver_id': driver.user_id,
+            'lat': latitude,
+            'lng': longitude,
+            'ts': int(timestamp.timestamp()),
+        }
+        with self._lock:
+            self._pending.setdefault(driver.organization_id, {})[driver.user_id] = update
+            self.stats['received'] += 1
+        if self.cross_process:
+            self._ensure_publisher()
+
+    def take_pending(self):
+        """Retorna y vacía los lotes pendientes: {organization_id: [updates]}"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return {org_id: list(updates.values()) for org_id, updates in pending.items()}
+
+    async def broadcast_pending(self, channel_layer):
+        """Envía un group_send por organización con sus cambios (y uno global para superadmin)"""
+        pending = self.take_pending()
+        if not pending:
+            return 0
+
+        everything = []
+        for organization_id, updates in pending.items():
+            everything.extend(updates)
+            await channel_layer.group_send(organization_group(organization_id), {
+                'type': 'location_batch',
+                'updates': updates,
+            })
+        await channel_layer.group_send(ALL_ORGANIZATIONS_GROUP, {
+            'type': 'location_batch',
+            'updates': everything,
+        })
+        self.stats['sent_updates'] += len(everything)
+        self.stats['group_sends'] += len(pending) + 1
+        return len(everything)
+
+    # ------------------------------------------------------------------
+    # Ciclo de envío (en el event loop del servidor ASGI)
+    # ------------------------------------------------------------------
+
+    def subscribe(self, channel_layer):
+        """Registra un socket suscrito y arranca el ciclo si no está corriendo"""
+        self._subscribers += 1
+        if self.cross_process:
+            # Publica el hilo de difusión, haya o no suscriptores en este proceso
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run(channel_layer))
+
+    def unsubscribe(self):
+        self._subscribers = max(0, self._subscribers - 1)
+
+    async def _run(self, channel_layer):
+        logger.info("📡 Ciclo de difusión de ubicaciones iniciado")
+        while self._subscribers:
+            started = time.monotonic()
+            try:
+                await self.broadcast_pending(channel_layer)
+            except Exception as e:
+                logger.error(f"❌ Error difundiendo ubicaciones: {e}")
+            await asyncio.sleep(max(0, self.tick - (time.monotonic() - started)))
+        # Sin suscriptores: descartar lo acumulado
+        self.take_pending()
+        logger.info("📡 Ciclo de difusión de ubicaciones detenido (sin suscriptores)")
+
+    # ------------------------------------------------------------------
+    # Hilo de difusión (channel layer compartido entre procesos)
+    # ------------------------------------------------------------------
+
+    def _ensure_publisher(self, channel_layer=None):
+        if self._publisher is not None and self._publisher.is_alive():
+            return
+        with self._lock:
+            if self._publisher is not None and self._publisher.is_alive():
+                return
+            self._stop.clear()
+            self._publisher = threading.Thread(
+                target=self._publish_forever, args=(channel_layer or get_channel_layer(),),
+                name='location-fanout', daemon=True
+            )
+            self._publisher.start()
+
+    def _publish_forever(self, channel_layer):
+        # Event loop propio: channels_redis mantiene un pool de conexiones por loop
+        loop = asyncio.new_event_loop()
+        logger.info("📡 Hilo de difusión de ubicaciones iniciado")
+        delay = 0
+        while not self._stop.wait(delay):
+            started = time.monotonic()
+            try:
+                loop.run_until_complete(self.broadcast_pending(channel_layer))
+            except Exception as e:
+                logger.error(f"❌ Error difundiendo ubicaciones: {e}")
+            delay = max(0, self.tick - (time.monotonic() - started))
+        loop.close()
+
+    def stop(self):
+        """Detiene el hilo de difusión"""
+        self._stop.set()
+
+
+# Instancia global, alimentada por la ingesta de ubicaciones
+location_fanout = LocationFanout()
+location_ingestor.add_listener(location_fanout.on_location)
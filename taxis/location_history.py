@@ -0,0 +1,306 @@
+"""
+Historial de ubicaciones de conductores (serie temporal compacta)
+
+Los pings que llegan al LocationIngestor se acumulan por conductor y se
+guardan como segmentos `LocationTrack` de algunos minutos. Cada segmento
+codifica sus puntos como deltas (segundos, lat*1e5, lng*1e5) en varint con
+zigzag: ~4-6 bytes por punto y una sola fila por segmento, en lugar de una
+fila por ping.
+
+Uso:
+    get_driver_track(driver_id, start, end) -> [(datetime, lat, lng), ...]
+    encode_polyline(points) -> polyline de Google Maps para reproducir la ruta
+"""
+import logging
+import threading
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import transaction
+from django.utils import timezone
+
+from .geo_index import haversine_km
+from .location_pipeline import location_ingestor
+
+logger = logging.getLogger(__name__)
+
+# Duración máxima de un segmento antes de guardarlo
+SEGMENT_SECONDS = 300
+
+# Máximo de puntos por segmento
+SEGMENT_MAX_POINTS = 500
+
+# Precisión de coordenadas (1e5 ≈ 1.1 m)
+COORD_SCALE = 100000
+
+FORMAT_VERSION = 1
+
+
+# ============================================
+# CODIFICACIÓN
+# ============================================
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def _unzigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def _write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def encode_points(points, base_time):
+    """
+    Codifica [(datetime, lat, lng), ...] en bytes.
+
+    Args:
+        points: Puntos ordenados por tiempo
+        base_time: Datetime de referencia (started_at del segmento)
+
+    Returns:
+        bytes
+    """
+    out = bytearray([FORMAT_VERSION])
+    base_ts = int(base_time.timestamp())
+    prev = (base_ts, 0, 0)
+    for moment, lat, lng in points:
+        current = (int(moment.timestamp()), round(lat * COORD_SCALE), round(lng * COORD_SCALE))
+        for value, previous in zip(current, prev):
+            _write_varint(out, _zigzag(value - previous))
+        prev = current
+    return bytes(out)
+
+
+def decode_points(data, base_time):
+    """Decodifica bytes generados por encode_points en [(datetime, lat, lng), ...]"""
+    data = bytes(data)
+    if not data:
+        return []
+    if data[0] != FORMAT_VERSION:
+        raise ValueError(f"Versión de codificación desconocida: {data[0]}")
+
+    points = []
+    values = [int(base_time.timestamp()), 0, 0]
+    pos = 1
+    while pos < len(data):
+        for i in range(3):
+            delta, pos = _read_varint(data, pos)
+            values[i] += _unzigzag(delta)
+        points.append((
+            datetime.fromtimestamp(values[0], tz=dt_timezone.utc),
+            values[1] / COORD_SCALE,
+            values[2] / COORD_SCALE,
+        ))
+    return points
+
+
+def encode_polyline(points):
+    """Codifica [(_, lat, lng), ...] en el formato polyline de Google Maps"""
+    result = []
+    prev_lat = prev_lng = 0
+    for _, lat, lng in points:
+        lat_e5 = round(lat * 1e5)
+        lng_e5 = round(lng * 1e5)
+        for delta in (lat_e5 - prev_lat, lng_e5 - prev_lng):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                result.append(chr((0x20 | (value & 0x1F)) + 63))
+                value >>= 5
+            result.append(chr(value + 63))
+        prev_lat, prev_lng = lat_e5, lng_e5
+    return ''.join(result)
+
+
+def track_distance_km(points):
+    """Distancia recorrida sumando los tramos entre puntos consecutivos"""
+    total = 0.0
+    for (_, lat1, lng1), (_, lat2, lng2) in zip(points, points[1:]):
+        total += haversine_km(lat1, lng1, lat2, lng2)
+    return total
+
+
+# ============================================
+# GRABACIÓN
+# ============================================
+
+class TrackRecorder:
+    """Acumula puntos por conductor y los guarda como segmentos LocationTrack"""
+
+    def __init__(self, segment_seconds=SEGMENT_SECONDS, max_points=SEGMENT_MAX_POINTS):
+        self.segment_seconds = segment_seconds
+        self.max_points = max_points
+        self._lock = threading.Lock()
+        self._buffers = {}   # user_id -> [(datetime, lat, lng), ...]
+
+    def add_point(self, driver, latitude, longitude, timestamp):
+        """Listener del LocationIngestor (solo memoria)"""
+        with self._lock:
+            buffer = self._buffers.setdefault(driver.user_id, [])
+            if buffer:
+                last_time = buffer[-1][0]
+                # Pings en el mismo segundo (o desordenados) no aportan al recorrido
+                if int(timestamp.timestamp()) <= int(last_time.timestamp()):
+                    return
+            buffer.append((timestamp, latitude, longitude))
+
+    def pending_points(self, user_id):
+        with self._lock:
+            return list(self._buffers.get(user_id, ()))
+
+    def _take_ready(self, force):
+        """Separa los buffers listos para guardar (por antigüedad, tamaño o cambio de día)"""
+        now = timezone.now()
+        ready = []
+        with self._lock:
+            for user_id, buffer in list(self._buffers.items()):
+                if not buffer:
+                    del self._buffers[user_id]
+                    continue
+                first_day = timezone.localdate(buffer[0][0])
+                cut = len(buffer)
+                for i, (moment, _, _) in enumerate(buffer):
+                    if timezone.localdate(moment) != first_day:
+                        cut = i
+                        break
+                age = (now - buffer[0][0]).total_seconds()
+                if force or cut < len(buffer) or age >= self.segment_seconds or len(buffer) >= self.max_points:
+                    ready.append((user_id, first_day, buffer[:cut]))
+                    rest = buffer[cut:]
+                    if rest:
+                        self._buffers[user_id] = rest
+                    else:
+                        del self._buffers[user_id]
+        return ready
+
+    def flush(self, force=False):
+        """
+        Guarda los segmentos listos con un solo bulk_create
+
+        Returns:
+            int: Número de segmentos creados
+        """
+        from .models import LocationTrack
+
+        ready = self._take_ready(force)
+        if not ready:
+            return 0
+
+        tracks = [
+            LocationTrack(
+                driver_id=user_id,
+                day=day,
+                started_at=points[0][0],
+                ended_at=points[-1][0],
+                point_count=len(points),
+                points=encode_points(points, points[0][0]),
+            )
+            for user_id, day, points in ready
+        ]
+        try:
+            LocationTrack.objects.bulk_create(tracks)
+        except Exception as e:
+            logger.error(f"❌ Error guardando {len(tracks)} segmentos de recorrido: {e}")
+            with self._lock:
+                for user_id, _, points in ready:
+                    self._buffers[user_id] = points + self._buffers.get(user_id, [])
+            return 0
+        return len(tracks)
+
+
+# Instancia global, alimentada por la ingesta de ubicaciones
+track_recorder = TrackRecorder()
+location_ingestor.add_listener(track_recorder.add_point)
+location_ingestor.add_flush_hook(track_recorder.flush)
+
+
+# ============================================
+# CONSULTAS
+# ============================================
+
+def get_driver_track(driver_id, start, end):
+    """
+    Retorna los puntos de un conductor en un rango de tiempo
+
+    Args:
+        driver_id: ID del conductor (AppUser)
+        start, end: Datetimes (aware) del rango
+
+    Returns:
+        list: [(datetime, lat, lng), ...] ordenados por tiempo
+    """
+    from .models import LocationTrack
+
+    segments = LocationTrack.objects.filter(
+        driver_id=driver_id,
+        started_at__lte=end,
+        ended_at__gte=start,
+    ).order_by('started_at').values_list('started_at', 'points')
+
+    points = []
+    for started_at, data in segments.iterator():
+        points.extend(decode_points(data, started_at))
+    # Puntos aún en memoria (segmento en curso)
+    points.extend(track_recorder.pending_points(int(driver_id)))
+
+    points = [p for p in points if start <= p[0] <= end]
+    points.sort(key=lambda p: p[0])
+    return points
+
+
+def compact_day(day, driver_id=None):
+    """
+    Une los segmentos de un día en una sola fila por conductor
+
+    Returns:
+        int: Número de filas eliminadas
+    """
+    from .models import LocationTrack
+
+    queryset = LocationTrack.objects.filter(day=day)
+    if driver_id is not None:
+        queryset = queryset.filter(driver_id=driver_id)
+
+    removed = 0
+    driver_ids = queryset.values_list('driver_id', flat=True).distinct()
+    for current_driver in list(driver_ids):
+        with transaction.atomic():
+            segments = list(
+                queryset.filter(driver_id=current_driver)
+                .select_for_update()
+                .order_by('started_at')
+            )
+            if len(segments) < 2:
+                continue
+            points = []
+            for segment in segments:
+                points.extend(decode_points(segment.points, segment.started_at))
+            points.sort(key=lambda p: p[0])
+
+            LocationTrack.objects.create(
+                driver_id=current_driver,
+                day=day,
+                started_at=points[0][0],
+                ended_at=points[-1][0],
+                point_count=len(points),
+                points=encode_points(points, points[0][0]),
+            )
+            LocationTrack.objects.filter(id__in=[s.id for s in segments]).delete()
+            removed += len(segments) - 1
+    return removed
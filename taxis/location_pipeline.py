@@ -0,0 +1,266 @@
+"""
+Ingesta de ubicaciones de conductores con escritura diferida (write-behind)
+
+Cada ping GPS se guarda en un buffer en memoria (uno por conductor, gana el
+más reciente) y un hilo de fondo lo vuelca a la BD cada pocos segundos con
+UPDATEs en lote. Con toda la flota reportando cada 2-5 s, el costo en BD pasa
+de 3 consultas por ping a 2 UPDATEs por intervalo.
+
+El índice geoespacial se actualiza de inmediato, así que el despacho ve la
+posición nueva sin esperar al volcado.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .geo_index import driver_index
+
+logger = logging.getLogger(__name__)
+
+# Segundos entre volcados a la BD
+FLUSH_INTERVAL = getattr(settings, 'LOCATION_FLUSH_INTERVAL', 3)
+
+# Cuánto tiempo se recuerda la resolución conductor -> taxi
+DRIVER_CACHE_TTL = 600
+
+DriverRef = namedtuple('DriverRef', ['user_id', 'taxi_id', 'organization_id', 'username'])
+PendingLocation = namedtuple('PendingLocation', ['driver', 'latitude', 'longitude', 'timestamp'])
+
+
+class LocationIngestor:
+    """Buffer de ubicaciones con deduplicación por conductor y volcado periódico"""
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending = {}        # taxi_id -> PendingLocation
+        self._drivers = {}        # clave (id o username) -> (DriverRef, expira)
+        self._worker = None
+        self._stop = threading.Event()
+        self._listeners = []
+        self._flush_hooks = []
+        self.stats = {'received': 0, 'flushed': 0, 'flushes': 0}
+
+    # ------------------------------------------------------------------
+    # Resolución de conductores
+    # ------------------------------------------------------------------
+
+    def cached_driver(self, driver_key):
+        """Retorna el DriverRef en caché sin tocar la BD (o None)"""
+        entry = self._drivers.get(str(driver_key))
+        if entry and entry[1] > time.monotonic():
+            return entry[0]
+        return None
+
+    def resolve_driver(self, driver_key, create_taxi=True):
+        """
+        Resuelve un conductor por ID numérico o username (consulta la BD solo si no está en caché)
+
+        Args:
+            driver_key: ID o username del conductor
+            create_taxi: Crear el registro Taxi si el conductor no tiene uno
+
+        Returns:
+            DriverRef o None si el conductor no existe / no tiene taxi
+        """
+        from .models import AppUser, Taxi
+
+        cached = self.cached_driver(driver_key)
+        if cached:
+            return cached
+
+        key = str(driver_key)
+        lookup = {'id': key} if key.isdigit() else {'username': key}
+        try:
+            driver = AppUser.objects.only('id', 'username', 'organization_id').get(role='driver', **lookup)
+        except AppUser.DoesNotExist:
+            logger.warning(f"⚠️ Conductor {driver_key} no encontrado (buscado como ID y username)")
+            return None
+
+        if create_taxi:
+            taxi, created = Taxi.objects.get_or_create(user=driver)
+            if created:
+                logger.info(f"✨ Nuevo registro Taxi creado para {driver.username}")
+            taxi_id = taxi.id
+        else:
+            taxi_id = Taxi.objects.filter(user=driver).values_list('id', flat=True).first()
+            if taxi_id is None:
+                return None
+
+        ref = DriverRef(driver.id, taxi_id, driver.organization_id, driver.username)
+        expires = time.monotonic() + DRIVER_CACHE_TTL
+        self._drivers[str(driver.id)] = (ref, expires)
+        self._drivers[driver.username] = (ref, expires)
+        return ref
+
+    def forget_driver(self, driver_key):
+        """Invalida la caché de un conductor (ej. cambió de organización o de taxi)"""
+        entry = self._drivers.pop(str(driver_key), None)
+        if entry:
+            ref = entry[0]
+            self._drivers.pop(str(ref.user_id), None)
+            self._drivers.pop(ref.username, None)
+
+    # ------------------------------------------------------------------
+    # Ingesta
+    # ------------------------------------------------------------------
+
+    def add_listener(self, callback):
+        """Registra callback(driver_ref, lat, lng, timestamp) invocado por cada ping aceptado"""
+        self._listeners.append(callback)
+
+    def add_flush_hook(self, callback):
+        """Registra callback(force) ejecutado por el hilo de volcado después de cada ciclo"""
+        self._flush_hooks.append(callback)
+
+    def _run_flush_hooks(self, force=False):
+        for callback in self._flush_hooks:
+            try:
+                callback(force)
+            except Exception as e:
+                logger.error(f"❌ Error en hook de volcado: {e}")
+
+    def record(self, driver, latitude, longitude, timestamp=None):
+        """
+        Registra un ping en memoria (sin acceso a BD)
+
+        Returns:
+            bool: True si el ping fue aceptado
+        """
+        try:
+            latitude = float(latitude)
+            longitude = float(longitude)
+        except (TypeError, ValueError):
+            return False
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            return False
+
+        timestamp = timestamp or timezone.now()
+        with self._lock:
+            previous = self._pending.get(driver.taxi_id)
+            if previous is None or previous.timestamp <= timestamp:
+                self._pending[driver.taxi_id] = PendingLocation(driver, latitude, longitude, timestamp)
+            self.stats['received'] += 1
+
+        driver_index.update(driver.taxi_id, latitude, longitude, organization_id=driver.organization_id)
+        for callback in self._listeners:
+            try:
+                callback(driver, latitude, longitude, timestamp)
+            except Exception as e:
+                logger.error(f"❌ Error en listener de ubicación: {e}")
+
+        self._ensure_worker()
+        return True
+
+    def pending_location(self, taxi_id):
+        """Última ubicación aún no volcada a la BD para un taxi (o None)"""
+        return self._pending.get(taxi_id)
+
+    def flush(self):
+        """
+        Vuelca las ubicaciones pendientes con dos UPDATEs en lote (Taxi y AppUser)
+
+        Returns:
+            int: Número de conductores actualizados
+        """
+        from .models import AppUser, Taxi
+
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return 0
+
+        taxis = []
+        users = []
+        for taxi_id, pending in batch.items():
+            taxis.append(Taxi(
+                id=taxi_id,
+                latitude=pending.latitude,
+                longitude=pending.longitude,
+                updated_at=pending.timestamp,
+            ))
+            users.append(AppUser(
+                id=pending.driver.user_id,
+                last_latitude=pending.latitude,
+                last_longitude=pending.longitude,
+            ))
+
+        try:
+            with transaction.atomic():
+                Taxi.objects.bulk_update(taxis, ['latitude', 'longitude', 'updated_at'])
+                AppUser.objects.bulk_update(users, ['last_latitude', 'last_longitude'])
+        except Exception as e:
+            logger.error(f"❌ Error volcando {len(batch)} ubicaciones: {e}")
+            # Devolver al buffer lo que no haya sido reemplazado por un ping más nuevo
+            with self._lock:
+                for taxi_id, pending in batch.items():
+                    current = self._pending.get(taxi_id)
+                    if current is None or current.timestamp < pending.timestamp:
+                        self._pending[taxi_id] = pending
+            return 0
+
+        self.stats['flushed'] += len(batch)
+        self.stats['flushes'] += 1
+        return len(batch)
+
+    # ------------------------------------------------------------------
+    # Hilo de volcado
+    # ------------------------------------------------------------------
+
+    def _ensure_worker(self):
+        if self.flush_interval <= 0:
+            return
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._stop.clear()
+            self._worker = threading.Thread(
+                target=self._run, name='location-flush', daemon=True
+            )
+            self._worker.start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+                self._run_flush_hooks()
+            finally:
+                close_old_connections()
+
+    def stop(self):
+        """Detiene el hilo y vuelca lo pendiente"""
+        self._stop.set()
+        try:
+            self.flush()
+            self._run_flush_hooks(force=True)
+        except Exception as e:
+            logger.error(f"❌ Error en volcado final de ubicaciones: {e}")
+
+
+# Instancia global
+location_ingestor = LocationIngestor()
+atexit.register(location_ingestor.stop)
+
+
+def ingest_driver_location(driver_key, latitude, longitude, create_taxi=True):
+    """
+    Resuelve el conductor y encola su ubicación. Solo toca la BD si el
+    conductor no está en caché.
+
+    Returns:
+        DriverRef o None si el conductor no existe
+    """
+    driver = location_ingestor.resolve_driver(driver_key, create_taxi=create_taxi)
+    if driver is None:
+        return None
+    if not location_ingestor.record(driver, latitude, longitude):
+        return None
+    return driver
@@ -0,0 +1,57 @@
+"""
+Management command para completar las direcciones de carreras históricas.
+
+Geocodifica (con la caché compartida de taxis.geocoding) el origen y los
+destinos de las carreras que aún no tienen `origin_address` / `address`
+guardada, en lotes y empezando por las más recientes.
+
+Uso:
+    python manage.py backfill_ride_addresses                # todas las pendientes
+    python manage.py backfill_ride_addresses --limit 500
+    python manage.py backfill_ride_addresses --delay 1      # respetar el límite de Nominatim (1 req/s)
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from taxis.models import Ride
+from taxis.ride_addresses import resolve_ride_addresses
+
+
+class Command(BaseCommand):
+    help = 'Geocodifica y guarda las direcciones de carreras que no las tienen'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int, default=None,
+            help='Máximo de carreras a procesar (por defecto: todas)'
+        )
+        parser.add_argument(
+            '--delay', type=float, default=0,
+            help='Segundos de espera entre carreras (por defecto: 0)'
+        )
+
+    def handle(self, *args, **options):
+        if options['limit'] is not None and options['limit'] <= 0:
+            raise CommandError('--limit debe ser positivo')
+
+        pending = Ride.objects.filter(
+            Q(origin_address='', origin_latitude__isnull=False, origin_longitude__isnull=False)
+            | Q(destinations__address='', destinations__destination_latitude__isnull=False)
+        ).distinct().order_by('-created_at').values_list('id', flat=True)
+        if options['limit']:
+            pending = pending[:options['limit']]
+        ride_ids = list(pending)
+
+        saved = 0
+        for index, ride_id in enumerate(ride_ids, 1):
+            saved += resolve_ride_addresses(ride_id)
+            if index % 100 == 0:
+                self.stdout.write(f'   {index}/{len(ride_ids)} carreras procesadas...')
+            if options['delay']:
+                time.sleep(options['delay'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f'📍 {saved} dirección(es) guardadas en {len(ride_ids)} carrera(s)')
+        )
@@ -0,0 +1,59 @@
+"""
+Management command para compactar el historial de ubicaciones.
+
+Une los segmentos de LocationTrack de cada conductor en una sola fila por día
+y, opcionalmente, elimina el historial más antiguo que la retención.
+
+Uso:
+    python manage.py compact_location_tracks              # compacta el día de ayer
+    python manage.py compact_location_tracks --date 2025-01-15
+    python manage.py compact_location_tracks --retention-days 180
+
+Para ejecutar automáticamente cada noche, agregar a crontab:
+    30 3 * * * cd /path/to/project && python manage.py compact_location_tracks --retention-days 180
+"""
+
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from taxis.location_history import compact_day
+from taxis.models import LocationTrack
+
+
+class Command(BaseCommand):
+    help = 'Une los segmentos del historial de ubicaciones en una fila por conductor y día'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Día a compactar (YYYY-MM-DD). Por defecto: ayer')
+        parser.add_argument('--driver', type=int, help='Compactar solo este conductor (ID)')
+        parser.add_argument(
+            '--retention-days', type=int, default=0,
+            help='Eliminar historial más antiguo que N días (0 = conservar todo)'
+        )
+
+    def handle(self, *args, **options):
+        if options['date']:
+            try:
+                day = date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError(f"Fecha inválida: {options['date']}")
+        else:
+            day = timezone.localdate() - timedelta(days=1)
+
+        if day >= timezone.localdate():
+            raise CommandError('Solo se pueden compactar días ya terminados')
+
+        removed = compact_day(day, driver_id=options['driver'])
+        self.stdout.write(
+            self.style.SUCCESS(f'✅ {day}: {removed} segmento(s) unidos')
+        )
+
+        retention = options['retention_days']
+        if retention > 0:
+            cutoff = timezone.localdate() - timedelta(days=retention)
+            deleted, _ = LocationTrack.objects.filter(day__lt=cutoff).delete()
+            self.stdout.write(
+                self.style.SUCCESS(f'🗑️ {deleted} segmento(s) anteriores a {cutoff} eliminados')
+            )
@@ -0,0 +1,37 @@
+"""
+Management command para emitir las facturas mensuales de las cooperativas.
+
+Factura suscripción + comisiones del mes de cada cooperativa activa o en
+prueba que aún no tenga factura de ese mes; los PDFs se generan en la cola
+de tareas. Pensado para correr una vez al mes (cron), re-ejecutable sin
+duplicar facturas.
+
+Uso:
+    python manage.py generate_invoices                  # mes anterior
+    python manage.py generate_invoices --month 2025-06
+"""
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from taxis.billing import generate_monthly_invoices
+
+
+class Command(BaseCommand):
+    help = 'Emite las facturas mensuales (suscripción + comisiones) de las cooperativas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', help='Mes a facturar (YYYY-MM); por defecto el mes anterior')
+        parser.add_argument('--no-pdf', action='store_true', help='No encolar la generación de PDFs')
+
+    def handle(self, *args, **options):
+        month = None
+        if options['month']:
+            try:
+                month = date.fromisoformat(f"{options['month']}-01")
+            except ValueError:
+                raise CommandError(f"Mes inválido: {options['month']}")
+
+        invoices = generate_monthly_invoices(month, render_pdf=not options['no_pdf'])
+        total = sum(invoice.total_amount for invoice in invoices)
+        self.stdout.write(self.style.SUCCESS(f'🧾 {len(invoices)} factura(s) emitidas por ${total:.2f}'))
@@ -0,0 +1,36 @@
+"""
+Management command para borrar las grabaciones del walkie-talkie vencidas.
+
+Elimina los AudioClip (y sus archivos) más antiguos que la ventana de
+retención y cierra las transmisiones que quedaron abiertas.
+
+Uso:
+    python manage.py purge_audio_clips                 # usa AUDIO_CLIP_RETENTION_HOURS (24 h)
+    python manage.py purge_audio_clips --hours 6
+
+Para ejecutar automáticamente cada hora, agregar a crontab:
+    0 * * * * cd /path/to/project && python manage.py purge_audio_clips
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from taxis.audio_clips import CLIP_RETENTION_HOURS, purge_clips
+
+
+class Command(BaseCommand):
+    help = 'Elimina las grabaciones de audio fuera de la ventana de retención'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=int, default=CLIP_RETENTION_HOURS,
+            help=f'Conservar solo las últimas N horas (por defecto: {CLIP_RETENTION_HOURS})'
+        )
+
+    def handle(self, *args, **options):
+        if options['hours'] < 0:
+            raise CommandError('--hours debe ser positivo')
+
+        removed = purge_clips(retention_hours=options['hours'])
+        self.stdout.write(
+            self.style.SUCCESS(f'🗑️ {removed} clip(s) de audio eliminados')
+        )
@@ -0,0 +1,22 @@
+"""
+Management command para recalcular las conversaciones de chat (ChatThread).
+
+Reconstruye el último mensaje, la última actividad y los contadores de no
+leídos de cada conversación a partir de los mensajes. Sirve para reparar
+los contadores si algún proceso escribió mensajes sin pasar por
+taxis.chat_threads.
+
+Uso:
+    python manage.py rebuild_chat_threads
+"""
+from django.core.management.base import BaseCommand
+
+from taxis.chat_threads import rebuild_threads
+
+
+class Command(BaseCommand):
+    help = 'Recalcula las conversaciones de chat y sus contadores de no leídos'
+
+    def handle(self, *args, **options):
+        total = rebuild_threads()
+        self.stdout.write(self.style.SUCCESS(f'💬 {total} conversación(es) recalculadas'))
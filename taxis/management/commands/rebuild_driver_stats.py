@@ -0,0 +1,21 @@
+"""
+Management command para recalcular los acumulados diarios de conductores (DriverDailyStats).
+
+Reconstruye carreras completadas, canceladas y ganancias por conductor y día
+a partir de Ride. Sirve para reparar los acumulados si alguna carrera cambió
+de estado con QuerySet.update() (sin pasar por las señales de taxis.ride_stats).
+
+Uso:
+    python manage.py rebuild_driver_stats
+"""
+from django.core.management.base import BaseCommand
+
+from taxis.ride_stats import rebuild_driver_stats
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los acumulados diarios de carreras y ganancias por conductor'
+
+    def handle(self, *args, **options):
+        total = rebuild_driver_stats()
+        self.stdout.write(self.style.SUCCESS(f'📊 {total} fila(s) de acumulados recalculadas'))
@@ -0,0 +1,33 @@
+"""
+Management command para recalcular los buckets del motor de reportes (RideStatsBucket).
+
+Recalcula los buckets por hora y por día desde las carreras, un mes por vez
+(consultas cortas, sin bloquear la tabla de carreras).
+
+Uso:
+    python manage.py rebuild_stats_buckets                     # todo el historial
+    python manage.py rebuild_stats_buckets --since 2025-01-01
+"""
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from taxis.ride_stats import rebuild_stats_buckets
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los buckets por hora y por día del motor de reportes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Recalcular desde esta fecha (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError(f"Fecha inválida: {options['since']}")
+
+        total = rebuild_stats_buckets(since=since)
+        self.stdout.write(self.style.SUCCESS(f'📊 {total} bucket(s) recalculados'))
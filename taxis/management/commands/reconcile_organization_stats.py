@@ -0,0 +1,35 @@
+"""
+Management command para conciliar las estadísticas de organizaciones.
+
+Compara Organization.total_rides / total_revenue / total_commission y las
+filas OrganizationPeriodStats (día y mes) con las carreras, y corrige las
+diferencias (por ejemplo, carreras cambiadas con QuerySet.update()).
+
+Uso:
+    python manage.py reconcile_organization_stats            # corrige
+    python manage.py reconcile_organization_stats --dry-run  # solo reporta
+
+Para ejecutar automáticamente cada noche, agregar a crontab:
+    15 4 * * * cd /path/to/project && python manage.py reconcile_organization_stats
+"""
+from django.core.management.base import BaseCommand
+
+from taxis.ride_stats import reconcile_organization_stats
+
+
+class Command(BaseCommand):
+    help = 'Concilia los contadores y acumulados por período de las organizaciones con las carreras'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Solo reportar diferencias')
+
+    def handle(self, *args, **options):
+        drift = reconcile_organization_stats(fix=not options['dry_run'])
+        for line in drift:
+            self.stdout.write(f'  {line}')
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('✅ Estadísticas de organizaciones al día'))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'⚠️ {len(drift)} diferencia(s) encontradas'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'✅ {len(drift)} diferencia(s) corregidas'))
@@ -0,0 +1,44 @@
+"""
+Management command que atiende la cola de tareas en segundo plano.
+
+Ejecuta las tareas de taxis.tasks (notificaciones de carreras nuevas,
+geocodificación, etc.) con reintentos y backoff. Con Redis configurado se
+pueden correr varios workers a la vez; al usar un worker dedicado conviene
+poner TASK_QUEUE_INLINE_WORKER = False en los procesos web.
+
+Uso:
+    python manage.py run_jobs              # atiende la cola indefinidamente
+    python manage.py run_jobs --burst      # ejecuta lo pendiente y termina
+"""
+import signal
+
+from django.core.management.base import BaseCommand
+
+from taxis import tasks  # noqa: F401  (registra las tareas)
+from taxis.task_queue import task_queue
+
+
+class Command(BaseCommand):
+    help = 'Atiende la cola de tareas en segundo plano'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='Ejecutar las tareas pendientes y terminar'
+        )
+
+    def handle(self, *args, **options):
+        # Terminar la tarea en curso antes de salir
+        signal.signal(signal.SIGTERM, lambda *_: task_queue.stop())
+
+        self.stdout.write('📬 Atendiendo la cola de tareas...')
+        try:
+            processed = task_queue.work(burst=options['burst'])
+        except KeyboardInterrupt:
+            task_queue.stop()
+            processed = 0
+        stats = task_queue.stats
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {processed} tarea(s) ejecutadas "
+            f"({stats['succeeded']} ok, {stats['retried']} reintentos, {stats['dead']} fallidas)"
+        ))
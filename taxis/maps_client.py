@@ -0,0 +1,219 @@
+"""
+Cliente compartido de Google Maps (Directions) para rutas y precios
+
+Antes cada cálculo creaba su propio cliente y hacía una llamada por tramo, en
+secuencia: una carrera con 4 destinos eran 4 requests bloqueantes en cada
+alta, edición o borrado de destino. Ahora:
+
+- Una sola `requests.Session` con pool de conexiones (keep-alive) y reintentos.
+- Los tramos consecutivos de una carrera multi-destino que no estén en caché
+  se piden en UNA sola consulta de Directions con paradas intermedias, que
+  devuelve la distancia de cada tramo. Distance Matrix cobraría la matriz
+  completa origen × destino (N² elementos para N tramos útiles).
+- Cada tramo se guarda en una caché LRU con TTL, con las coordenadas
+  redondeadas (~11 m), así que editar un destino solo recalcula los tramos
+  que cambiaron.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+DIRECTIONS_URL = 'https://maps.googleapis.com/maps/api/directions/json'
+
+# Decimales con que se redondean las coordenadas de la llave de caché (4 ≈ 11 m)
+CACHE_PRECISION = 4
+
+# Vigencia de un tramo en caché (el tráfico cambia la duración)
+CACHE_TTL_SECONDS = getattr(settings, 'MAPS_CACHE_TTL', 30 * 60)
+
+CACHE_MAX_ENTRIES = 5000
+
+# Paradas intermedias por consulta de Directions (con más de 10 se cobra como
+# Advanced, el doble: partir la ruta en dos consultas cuesta lo mismo)
+MAX_WAYPOINTS = 10
+
+REQUEST_TIMEOUT = 5
+
+Leg = namedtuple('Leg', ['distance_m', 'duration_s', 'distance_text', 'duration_text'])
+
+
+class TTLCache:
+    """LRU con expiración por entrada, segura entre hilos"""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+def _point(lat, lng):
+    return (round(float(lat), CACHE_PRECISION), round(float(lng), CACHE_PRECISION))
+
+
+def _format(point):
+    return f'{point[0]},{point[1]}'
+
+
+class MapsClient:
+    """Directions con sesión HTTP compartida, consultas agrupadas y caché por tramo"""
+
+    def __init__(self, api_key=None, cache=None, session=None):
+        self._api_key = api_key
+        self.cache = cache or TTLCache()
+        self._session = session
+        self._session_lock = threading.Lock()
+        self.stats = {'requests': 0, 'cache_hits': 0, 'cache_misses': 0}
+
+    @property
+    def api_key(self):
+        return self._api_key or getattr(settings, 'GOOGLE_API_KEY', None)
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    retries = Retry(total=2, backoff_factor=0.3, status_forcelist=[500, 502, 503, 504])
+                    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=20, max_retries=retries)
+                    session.mount('https://', adapter)
+                    self._session = session
+        return self._session
+
+    def _request_route(self, points):
+        """Una consulta de Directions por points[0] → … → points[-1]; retorna sus tramos (o None)"""
+        self.stats['requests'] += 1
+        params = {
+            'origin': _format(points[0]),
+            'destination': _format(points[-1]),
+            'mode': 'driving',
+            'units': 'metric',
+            'key': self.api_key,
+        }
+        if len(points) > 2:
+            params['waypoints'] = '|'.join(_format(p) for p in points[1:-1])
+        response = self.session.get(DIRECTIONS_URL, params=params, timeout=REQUEST_TIMEOUT)
+        data = response.json()
+        if data.get('status') != 'OK' or not data.get('routes'):
+            logger.error(f"❌ Directions respondió {data.get('status')}: {data.get('error_message', '')}")
+            return None
+        return data['routes'][0]['legs']
+
+    def _fetch_legs(self, pairs):
+        """
+        Resuelve los tramos (origen, destino) que no están en caché
+
+        Los tramos faltantes consecutivos forman una cadena que se pide en una
+        sola consulta con paradas intermedias: una ruta normal es una consulta.
+        """
+        chains = []
+        for origin, destination in pairs:
+            if chains and chains[-1][-1] == origin and len(chains[-1]) < MAX_WAYPOINTS + 2:
+                chains[-1].append(destination)
+            else:
+                chains.append([origin, destination])
+
+        results = {}
+        for chain in chains:
+            try:
+                route_legs = self._request_route(chain)
+            except (requests.RequestException, ValueError) as e:
+                logger.error(f"❌ Error consultando Directions: {e}")
+                continue
+            if route_legs is None or len(route_legs) != len(chain) - 1:
+                continue
+            for pair, element in zip(zip(chain, chain[1:]), route_legs):
+                leg = Leg(
+                    element['distance']['value'],
+                    element['duration']['value'],
+                    element['distance']['text'],
+                    element['duration']['text'],
+                )
+                self.cache.set(pair, leg)
+                results[pair] = leg
+        return results
+
+    def legs(self, waypoints):
+        """
+        Tramos consecutivos de una ruta [(lat, lng), ...]
+
+        Returns:
+            list: Un Leg por tramo (None si Google no pudo calcularlo)
+        """
+        points = [_point(lat, lng) for lat, lng in waypoints]
+        pairs = list(zip(points, points[1:]))
+
+        found = {}
+        missing = []
+        for pair in pairs:
+            if pair[0] == pair[1]:
+                found[pair] = Leg(0, 0, '0 km', '0 min')
+                continue
+            leg = self.cache.get(pair)
+            if leg is None:
+                missing.append(pair)
+            else:
+                found[pair] = leg
+        self.stats['cache_hits'] += len(pairs) - len(missing)
+        self.stats['cache_misses'] += len(missing)
+
+        if missing:
+            found.update(self._fetch_legs(missing))
+        return [found.get(pair) for pair in pairs]
+
+    def leg(self, lat1, lng1, lat2, lng2):
+        """Un solo tramo (Leg o None)"""
+        return self.legs([(lat1, lng1), (lat2, lng2)])[0]
+
+    def route_distance_m(self, waypoints):
+        """
+        Distancia total de una ruta en metros
+
+        Returns:
+            tuple: (metros, tramos_sin_calcular)
+        """
+        legs = self.legs(waypoints)
+        return sum(leg.distance_m for leg in legs if leg), sum(1 for leg in legs if leg is None)
+
+
+# Instancia global
+maps_client = MapsClient()
@@ -1,10 +1,90 @@
 """
 Middleware para autenticación de WebSockets con Token y Sesiones
+
+Los conductores con 3G inestable reconectan ws/audio/conductores/ y ws/chat/
+muchas veces por hora; después de una caída de Redis todos reconectan a la
+vez y cada handshake consultaba la base (sesión + usuario, o token +
+usuario). La identidad ahora se cachea unos segundos entre handshakes:
+
+- Token → usuario: la misma caché de la API (taxis.authentication.token_cache).
+- Sesión → usuario: `ws_auth_cache`, por llave de sesión, con TTL corto
+  (WS_AUTH_CACHE_TTL). Se invalida al cerrar sesión y al guardar o borrar el
+  usuario; en un fallo se autentica como siempre (verificando el hash de la
+  sesión).
+- `ws_auth_cache.stats` cuenta aciertos y fallos de ambos caminos.
 """
+import copy
+import threading
+from urllib.parse import parse_qs
+
+from channels.auth import get_user
 from channels.db import database_sync_to_async
 from channels.middleware import BaseMiddleware
-from channels.auth import AuthMiddlewareStack
-from urllib.parse import parse_qs
+from django.conf import settings
+from django.contrib.auth.signals import user_logged_out
+from django.db.models.signals import post_delete, post_save
+
+from .maps_client import TTLCache
+
+# Vigencia de una identidad de sesión en caché
+WS_AUTH_CACHE_TTL = getattr(settings, 'WS_AUTH_CACHE_TTL', 60)
+
+WS_AUTH_CACHE_MAX_ENTRIES = getattr(settings, 'WS_AUTH_CACHE_MAX_ENTRIES', 10000)
+
+
+class HandshakeAuthCache:
+    """Identidades resueltas en handshakes anteriores, con métricas de aciertos"""
+
+    def __init__(self, max_entries=WS_AUTH_CACHE_MAX_ENTRIES, ttl=WS_AUTH_CACHE_TTL):
+        self._sessions = TTLCache(max_entries=max_entries, ttl=ttl)
+        self._sessions_by_user = {}  # user_id -> {session_key}
+        self._lock = threading.Lock()
+        self.stats = {
+            'token_hits': 0, 'token_misses': 0,
+            'session_hits': 0, 'session_misses': 0,
+            'invalidations': 0,
+        }
+
+    def count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def get_session_user(self, session_key):
+        user = self._sessions.get(session_key)
+        self.count('session_hits' if user is not None else 'session_misses')
+        return copy.copy(user) if user is not None else None
+
+    def set_session_user(self, session_key, user):
+        self._sessions.set(session_key, user)
+        with self._lock:
+            keys = self._sessions_by_user.setdefault(user.pk, set())
+            # Las sesiones vencidas salen del índice al agregar una nueva
+            keys.intersection_update(k for k in keys if self._sessions.get(k) is not None)
+            keys.add(session_key)
+
+    def invalidate_session(self, session_key):
+        self._sessions.delete(session_key)
+        self.count('invalidations')
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            session_keys = self._sessions_by_user.pop(user_id, set())
+        for session_key in session_keys:
+            self.invalidate_session(session_key)
+
+    def hit_rate(self):
+        hits = self.stats['token_hits'] + self.stats['session_hits']
+        total = hits + self.stats['token_misses'] + self.stats['session_misses']
+        return hits / total if total else 0.0
+
+    def clear(self):
+        self._sessions.clear()
+        with self._lock:
+            self._sessions_by_user.clear()
+
+
+# Instancia global
+ws_auth_cache = HandshakeAuthCache()
 
 
 class TokenAuthMiddleware(BaseMiddleware):
@@ -12,70 +92,103 @@ class TokenAuthMiddleware(BaseMiddleware):
     Middleware para autenticar WebSockets usando:
     1. Token de DRF (para apps móviles)
     2. Sesiones de Django (para web)
-    
+
     Busca el token en:
     1. Query string: ?token=xxxxx
     2. Headers: Authorization: Token xxxxx
     3. Sesión de Django (fallback para web)
     """
-    
+
     async def __call__(self, scope, receive, send):
         # Intentar obtener token de query string
         query_string = scope.get('query_string', b'').decode()
         query_params = parse_qs(query_string)
         token_key = query_params.get('token', [None])[0]
-        
+
         # Si no está en query string, buscar en headers
         if not token_key:
             headers = dict(scope.get('headers', []))
             auth_header = headers.get(b'authorization', b'').decode()
-            
+
             if auth_header.startswith('Token '):
                 token_key = auth_header.split(' ')[1]
-        
+
         # Si hay token, autenticar con token
         if token_key:
             scope['user'] = await self.get_user_from_token(token_key)
         # Si no hay token, intentar con sesión de Django (para web)
         elif 'session' in scope:
-            # Usar AuthMiddleware de Channels para sesiones
             scope['user'] = await self.get_user_from_session(scope)
         else:
             # Sin token ni sesión
             from django.contrib.auth.models import AnonymousUser
             scope['user'] = AnonymousUser()
-        
+
         return await super().__call__(scope, receive, send)
-    
-    @database_sync_to_async
-    def get_user_from_session(self, scope):
-        """Obtener usuario desde la sesión de Django"""
+
+    async def get_user_from_session(self, scope):
+        """Obtener usuario desde la sesión de Django (caché por llave de sesión)"""
         from django.contrib.auth.models import AnonymousUser
-        from channels.auth import _get_user_session_key
-        
+
+        session_key = scope.get('cookies', {}).get(settings.SESSION_COOKIE_NAME)
+        if session_key:
+            user = ws_auth_cache.get_session_user(session_key)
+            if user is not None:
+                return user
+
         try:
-            session_key = _get_user_session_key(scope.get('session', {}))
-            if session_key:
-                from django.contrib.auth import get_user_model
-                User = get_user_model()
-                return User.objects.get(pk=session_key)
+            user = await get_user(scope)
         except Exception as e:
             print(f"⚠️ Error obteniendo usuario de sesión: {e}")
-        
-        return AnonymousUser()
-    
-    @database_sync_to_async
-    def get_user_from_token(self, token_key):
+            return AnonymousUser()
+
+        if session_key and user.is_authenticated:
+            ws_auth_cache.set_session_user(session_key, user)
+            return copy.copy(user)
+        return user
+
+    async def get_user_from_token(self, token_key):
         """Obtener usuario desde el token"""
         # Importar aquí para evitar AppRegistryNotReady
+        from .authentication import token_cache
+
+        token = token_cache.get(token_key)
+        if token is not None:
+            ws_auth_cache.count('token_hits')
+            return copy.copy(token.user)
+
+        ws_auth_cache.count('token_misses')
+        return await self._load_token_user(token_key)
+
+    @database_sync_to_async
+    def _load_token_user(self, token_key):
         from django.contrib.auth.models import AnonymousUser
         from rest_framework.authtoken.models import Token
-        
+        from .authentication import token_cache
+
         try:
-            token = Token.objects.select_related('user').get(key=token_key)
-            return token.user
+            token = Token.objects.select_related('user__organization').get(key=token_key)
         except Token.DoesNotExist:
             return AnonymousUser()
+        # La API rechaza usuarios inactivos solo en un fallo de caché: no se cachean
+        if token.user.is_active:
+            token_cache.set(token_key, token)
+        return copy.copy(token.user)
+
+
+def _user_logged_out(sender, request, user, **kwargs):
+    session_key = getattr(getattr(request, 'session', None), 'session_key', None)
+    if session_key:
+        ws_auth_cache.invalidate_session(session_key)
+
+
+def _user_changed(sender, instance, **kwargs):
+    ws_auth_cache.invalidate_user(instance.pk)
+
+
+user_logged_out.connect(_user_logged_out, dispatch_uid='ws_auth_cache_logged_out')
+post_save.connect(_user_changed, sender=settings.AUTH_USER_MODEL, dispatch_uid='ws_auth_cache_user_saved')
+post_delete.connect(_user_changed, sender=settings.AUTH_USER_MODEL, dispatch_uid='ws_auth_cache_user_deleted')
 
 
 def TokenAuthMiddlewareStack(inner):
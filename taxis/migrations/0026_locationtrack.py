@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:52
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taxis', '0025_appuser_vehicle_brand_appuser_vehicle_color_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LocationTrack',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(help_text='Día (hora local) al que pertenece el segmento')),
+                ('started_at', models.DateTimeField(help_text='Hora del primer punto')),
+                ('ended_at', models.DateTimeField(help_text='Hora del último punto')),
+                ('point_count', models.PositiveIntegerField(default=0)),
+                ('points', models.BinaryField(help_text='Puntos codificados (ver taxis.location_history)')),
+                ('driver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='location_tracks', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Segmento de Recorrido',
+                'verbose_name_plural': 'Segmentos de Recorrido',
+                'ordering': ['started_at'],
+                'indexes': [models.Index(fields=['driver', 'day'], name='taxis_locat_driver__8059bf_idx'), models.Index(fields=['driver', 'started_at'], name='taxis_locat_driver__2fad65_idx')],
+            },
+        ),
+    ]
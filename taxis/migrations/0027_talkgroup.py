@@ -0,0 +1,59 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:01
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taxis', '0026_locationtrack'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TalkGroup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('kind', models.CharField(choices=[('organization', 'Toda la cooperativa'), ('zone', 'Zona'), ('shift', 'Turno'), ('dispatch', 'Privado con la central')], default='zone', help_text="Los grupos de tipo 'organization' incluyen a todos los usuarios de la cooperativa", max_length=20)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Grupo de Conversación',
+                'verbose_name_plural': 'Grupos de Conversación',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='TalkGroupMembership',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('joined_at', models.DateTimeField(auto_now_add=True)),
+                ('talk_group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='taxis.talkgroup')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='talk_group_memberships', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Miembro de Grupo',
+                'verbose_name_plural': 'Miembros de Grupo',
+                'unique_together': {('talk_group', 'user')},
+            },
+        ),
+        migrations.AddField(
+            model_name='talkgroup',
+            name='members',
+            field=models.ManyToManyField(blank=True, related_name='talk_groups', through='taxis.TalkGroupMembership', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='talkgroup',
+            name='organization',
+            field=models.ForeignKey(help_text='Cooperativa dueña del grupo', on_delete=django.db.models.deletion.CASCADE, related_name='talk_groups', to='taxis.organization'),
+        ),
+        migrations.AddIndex(
+            model_name='talkgroup',
+            index=models.Index(fields=['organization', 'is_active'], name='taxis_talkg_organiz_dd064a_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:03
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taxis', '0027_talkgroup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AudioClip',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('room', models.CharField(help_text='Grupo del channel layer (audio_org_<id> o audio_tg_<id>)', max_length=100)),
+                ('speaker_name', models.CharField(blank=True, default='', max_length=150)),
+                ('mime_type', models.CharField(default='audio/aac', max_length=50)),
+                ('file_path', models.CharField(help_text='Ruta relativa dentro de AUDIO_CLIPS_DIR', max_length=255)),
+                ('size_bytes', models.PositiveIntegerField(default=0)),
+                ('chunk_count', models.PositiveIntegerField(default=0)),
+                ('started_at', models.DateTimeField()),
+                ('ended_at', models.DateTimeField()),
+                ('speaker', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='audio_clips', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Clip de Audio',
+                'verbose_name_plural': 'Clips de Audio',
+                'ordering': ['-started_at'],
+                'indexes': [models.Index(fields=['room', 'started_at'], name='taxis_audio_room_6489c2_idx'), models.Index(fields=['speaker', 'started_at'], name='taxis_audio_speaker_d3cc70_idx'), models.Index(fields=['started_at'], name='taxis_audio_started_5d372b_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taxis', '0028_audioclip'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodeCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('reverse', 'Coordenadas → dirección'), ('forward', 'Dirección → coordenadas')], max_length=10)),
+                ('key', models.CharField(help_text="'lat,lng' redondeado o texto normalizado", max_length=255)),
+                ('address', models.TextField(blank=True, default='')),
+                ('latitude', models.FloatField(blank=True, null=True)),
+                ('longitude', models.FloatField(blank=True, null=True)),
+                ('found', models.BooleanField(default=True)),
+                ('provider', models.CharField(blank=True, default='', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now=True)),
+                ('expires_at', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name': 'Caché de Geocodificación',
+                'verbose_name_plural': 'Caché de Geocodificación',
+                'indexes': [models.Index(fields=['expires_at'], name='taxis_geoco_expires_e40e85_idx')],
+                'unique_together': {('kind', 'key')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taxis', '0029_geocodecacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ride',
+            name='origin_address',
+            field=models.CharField(blank=True, default='', help_text='Dirección geocodificada del origen (se resuelve en segundo plano, ver taxis.ride_addresses)', max_length=500),
+        ),
+        migrations.AddField(
+            model_name='ridedestination',
+            name='address',
+            field=models.CharField(blank=True, default='', help_text='Dirección geocodificada del destino (se resuelve en segundo plano)', max_length=500),
+        ),
+    ]
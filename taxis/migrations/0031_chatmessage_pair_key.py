@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:27
+
+from django.db import migrations, models
+from django.db.models import CharField, F, Value
+from django.db.models.functions import Cast, Concat
+
+
+def fill_pair_key(apps, schema_editor):
+    ChatMessage = apps.get_model('taxis', 'ChatMessage')
+
+    def key(low, high):
+        return Concat(Cast(low, CharField()), Value('-'), Cast(high, CharField()))
+
+    # Dos UPDATE en lugar de guardar mensaje por mensaje
+    ChatMessage.objects.filter(sender_id__lte=F('recipient_id')).update(pair_key=key('sender_id', 'recipient_id'))
+    ChatMessage.objects.filter(sender_id__gt=F('recipient_id')).update(pair_key=key('recipient_id', 'sender_id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taxis', '0030_ride_resolved_addresses'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmessage',
+            name='pair_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=41),
+        ),
+        migrations.RunPython(fill_pair_key, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['pair_key', 'timestamp', 'id'], name='chat_pair_keyset_idx'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Max
+
+
+def build_threads(apps, schema_editor):
+    """Una conversación por pair_key, con el último mensaje y los no leídos de cada lado"""
+    ChatMessage = apps.get_model('taxis', 'ChatMessage')
+    ChatThread = apps.get_model('taxis', 'ChatThread')
+
+    unread = {
+        (row['pair_key'], row['recipient_id']): row['n']
+        for row in ChatMessage.objects.filter(is_read=False).values('pair_key', 'recipient_id').annotate(n=Count('id'))
+    }
+    last_ids = ChatMessage.objects.values('pair_key').annotate(last_id=Max('id')).values_list('last_id', flat=True)
+    threads = []
+    for message in ChatMessage.objects.filter(id__in=list(last_ids)):
+        low, high = sorted((message.sender_id, message.recipient_id))
+        threads.append(ChatThread(
+            pair_key=message.pair_key, user_low_id=low, user_high_id=high,
+            last_message_id=message.id, last_activity=message.timestamp,
+            unread_low=unread.get((message.pair_key, low), 0),
+            unread_high=unread.get((message.pair_key, high), 0),
+        ))
+    ChatThread.objects.bulk_create(threads, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taxis', '0031_chatmessage_pair_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatThread',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pair_key', models.CharField(max_length=41, unique=True)),
+                ('last_activity', models.DateTimeField()),
+                ('unread_low', models.PositiveIntegerField(default=0)),
+                ('unread_high', models.PositiveIntegerField(default=0)),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='taxis.chatmessage')),
+                ('user_high', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user_low', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Conversación de Chat',
+                'verbose_name_plural': 'Conversaciones de Chat',
+                'indexes': [models.Index(fields=['user_low', '-last_activity'], name='chat_thread_low_idx'), models.Index(fields=['user_high', '-last_activity'], name='chat_thread_high_idx')],
+            },
+        ),
+        migrations.RunPython(build_threads, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:34
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate
+
+
+def build_driver_stats(apps, schema_editor):
+    """Acumulados por (conductor, organización, día de creación) de las carreras terminadas"""
+    Ride = apps.get_model('taxis', 'Ride')
+    DriverDailyStats = apps.get_model('taxis', 'DriverDailyStats')
+
+    rows = (
+        Ride.objects.filter(driver__isnull=False, status__in=['completed', 'canceled'])
+        .annotate(day=TruncDate('created_at'))
+        .values('driver_id', 'organization_id', 'day')
+        .annotate(
+            completed=Count('id', filter=Q(status='completed')),
+            canceled=Count('id', filter=Q(status='canceled')),
+            earnings=Sum('price', filter=Q(status='completed')),
+        )
+        .order_by()
+    )
+    DriverDailyStats.objects.bulk_create([
+        DriverDailyStats(
+            driver_id=row['driver_id'], organization_id=row['organization_id'], date=row['day'],
+            completed_rides=row['completed'], canceled_rides=row['canceled'],
+            earnings=row['earnings'] or 0,
+        )
+        for row in rows
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taxis', '0032_chatthread'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DriverDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('completed_rides', models.IntegerField(default=0)),
+                ('canceled_rides', models.IntegerField(default=0)),
+                ('earnings', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('driver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to=settings.AUTH_USER_MODEL)),
+                ('organization', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='driver_daily_stats', to='taxis.organization')),
+            ],
+            options={
+                'verbose_name': 'Estadística Diaria de Conductor',
+                'verbose_name_plural': 'Estadísticas Diarias de Conductores',
+                'indexes': [models.Index(fields=['driver', 'date'], name='driver_daily_stats_idx')],
+                'unique_together': {('driver', 'organization', 'date')},
+            },
+        ),
+        migrations.RunPython(build_driver_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+
+def build_organization_stats(apps, schema_editor):
+    """Contadores de Organization y filas por día / mes desde las carreras terminadas"""
+    Ride = apps.get_model('taxis', 'Ride')
+    Organization = apps.get_model('taxis', 'Organization')
+    OrganizationPeriodStats = apps.get_model('taxis', 'OrganizationPeriodStats')
+
+    finished = Ride.objects.filter(organization__isnull=False, status__in=['completed', 'canceled'])
+    completed = Q(status='completed')
+
+    for row in finished.values('organization_id').annotate(
+            rides=Count('id', filter=completed),
+            revenue=Sum('price', filter=completed),
+            commission=Sum('commission_amount', filter=completed)).order_by():
+        Organization.objects.filter(pk=row['organization_id']).update(
+            total_rides=row['rides'], total_revenue=row['revenue'] or 0, total_commission=row['commission'] or 0,
+        )
+
+    stats = []
+    for period, trunc in (('day', TruncDate('created_at')), ('month', TruncMonth('created_at'))):
+        for row in finished.annotate(start=trunc).values('organization_id', 'start').annotate(
+                completed=Count('id', filter=completed),
+                canceled=Count('id', filter=Q(status='canceled')),
+                revenue=Sum('price', filter=completed),
+                commission=Sum('commission_amount', filter=completed)).order_by():
+            start = row['start']
+            stats.append(OrganizationPeriodStats(
+                organization_id=row['organization_id'], period=period,
+                period_start=timezone.localtime(start).date() if hasattr(start, 'hour') else start,
+                completed_rides=row['completed'], canceled_rides=row['canceled'],
+                revenue=row['revenue'] or 0, commission=row['commission'] or 0,
+            ))
+    OrganizationPeriodStats.objects.bulk_create(stats, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taxis', '0033_driverdailystats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrganizationPeriodStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Día'), ('month', 'Mes')], max_length=5)),
+                ('period_start', models.DateField(help_text='Día, o primer día del mes')),
+                ('completed_rides', models.IntegerField(default=0)),
+                ('canceled_rides', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('commission', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='period_stats', to='taxis.organization')),
+            ],
+            options={
+                'verbose_name': 'Estadística de Organización por Período',
+                'verbose_name_plural': 'Estadísticas de Organizaciones por Período',
+                'indexes': [models.Index(fields=['period', 'period_start'], name='org_period_stats_idx')],
+                'unique_together': {('organization', 'period', 'period_start')},
+            },
+        ),
+        migrations.RunPython(build_organization_stats, migrations.RunPython.noop),
+    ]
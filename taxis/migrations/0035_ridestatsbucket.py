@@ -0,0 +1,69 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:41
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from datetime import datetime, time
+
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate, TruncHour
+from django.utils import timezone
+
+
+def build_buckets(apps, schema_editor):
+    """Buckets por hora y por día de las carreras terminadas"""
+    Ride = apps.get_model('taxis', 'Ride')
+    RideStatsBucket = apps.get_model('taxis', 'RideStatsBucket')
+
+    finished = Ride.objects.filter(status__in=['completed', 'canceled']).exclude(
+        driver__isnull=True, organization__isnull=True
+    )
+    completed = Q(status='completed')
+    buckets = []
+    for granularity, trunc in (('hour', TruncHour('created_at')), ('day', TruncDate('created_at'))):
+        for row in finished.annotate(start=trunc).values('organization_id', 'driver_id', 'start').annotate(
+                completed=Count('id', filter=completed),
+                canceled=Count('id', filter=Q(status='canceled')),
+                revenue=Sum('price', filter=completed),
+                commission=Sum('commission_amount', filter=completed)).order_by():
+            start = row['start']
+            if granularity == 'day':
+                start = timezone.make_aware(datetime.combine(start, time()))
+            buckets.append(RideStatsBucket(
+                granularity=granularity, bucket_start=start,
+                organization_id=row['organization_id'], driver_id=row['driver_id'],
+                completed_rides=row['completed'], canceled_rides=row['canceled'],
+                revenue=row['revenue'] or 0, commission=row['commission'] or 0,
+            ))
+    RideStatsBucket.objects.bulk_create(buckets, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taxis', '0034_organizationperiodstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RideStatsBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Hora'), ('day', 'Día')], max_length=4)),
+                ('bucket_start', models.DateTimeField(help_text='Inicio de la hora o del día (hora local)')),
+                ('completed_rides', models.IntegerField(default=0)),
+                ('canceled_rides', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('commission', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('driver', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='stats_buckets', to=settings.AUTH_USER_MODEL)),
+                ('organization', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='stats_buckets', to='taxis.organization')),
+            ],
+            options={
+                'verbose_name': 'Bucket de Estadísticas de Carreras',
+                'verbose_name_plural': 'Buckets de Estadísticas de Carreras',
+                'indexes': [models.Index(fields=['granularity', 'organization', 'bucket_start'], name='stats_bucket_org_idx'), models.Index(fields=['granularity', 'driver', 'bucket_start'], name='stats_bucket_driver_idx')],
+                'unique_together': {('granularity', 'bucket_start', 'organization', 'driver')},
+            },
+        ),
+        migrations.RunPython(build_buckets, migrations.RunPython.noop),
+    ]
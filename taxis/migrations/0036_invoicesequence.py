@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('taxis', '0035_ridestatsbucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceSequence',
+            fields=[
+                ('year', models.PositiveIntegerField(primary_key=True, serialize=False)),
+                ('last_number', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Secuencia de Facturas',
+                'verbose_name_plural': 'Secuencias de Facturas',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='invoice',
+            constraint=models.UniqueConstraint(fields=('organization', 'period_start'), name='invoice_org_period_unique'),
+        ),
+    ]
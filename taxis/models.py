@@ -3,9 +3,7 @@ from django.db import models
 from django.core.exceptions import ValidationError
 from django.contrib.auth.models import AbstractUser
 from django.conf import settings
-import requests
-from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderTimedOut
+from .geocoding import UNKNOWN_ADDRESS, geocoder
 from django.contrib.auth import get_user_model
 from cloudinary.models import CloudinaryField
 from django.core.files.storage import FileSystemStorage
@@ -179,7 +177,7 @@ class Organization(models.Model):
         help_text="RUC o identificación fiscal"
     )
     
-    # Estadísticas (se actualizan automáticamente)
+    # Estadísticas (se actualizan automáticamente con F(), ver taxis.ride_stats)
     total_rides = models.IntegerField(
         default=0,
         help_text="Total de carreras completadas"
@@ -202,9 +200,22 @@ class Organization(models.Model):
         verbose_name_plural = 'Organizaciones'
         ordering = ['name']
     
+    # Contadores mantenidos por taxis.ride_stats
+    COUNTER_FIELDS = ('total_rides', 'total_revenue', 'total_commission')
+    
     def __str__(self):
         return self.name
     
+    def save(self, *args, **kwargs):
+        # Guardar la organización (formularios, admin) no debe pisar con valores
+        # viejos los contadores que las carreras actualizan con F() mientras tanto
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+    
     def is_active(self):
         """Verifica si la organización está activa"""
         return self.status == 'active'
@@ -423,14 +434,10 @@ class Taxi(models.Model):
 
     def save(self, *args, **kwargs):
         if self.direccion_origen and (self.latitude is None or self.longitude is None):
-            geolocator = Nominatim(user_agent="mi_aplicacion")
-            try:
-                location = geolocator.geocode(self.direccion_origen, timeout=10)
-                if location:
-                    self.latitude = location.latitude
-                    self.longitude = location.longitude
-            except GeocoderTimedOut:
-                print("Error: Tiempo de espera agotado al obtener la ubicación.")
+            location = geocoder.geocode(self.direccion_origen)
+            if location:
+                self.latitude = location.latitude
+                self.longitude = location.longitude
         super().save(*args, **kwargs)
 
 
@@ -473,6 +480,12 @@ class Ride(models.Model):
     origin = models.CharField(max_length=255)
     origin_latitude = models.FloatField(null=True, blank=True)
     origin_longitude = models.FloatField(null=True, blank=True)
+    origin_address = models.CharField(
+        max_length=500,
+        blank=True,
+        default='',
+        help_text="Dirección geocodificada del origen (se resuelve en segundo plano, ver taxis.ride_addresses)"
+    )
     start_time = models.DateTimeField(null=True, blank=True)
     end_time = models.DateTimeField(null=True, blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
@@ -507,26 +520,19 @@ class Ride(models.Model):
         return f'Carrera de {self.customer.username} desde {self.origin} ({self.get_status_display()})'
 
     def get_origin_address(self):
+        if self.origin_address:
+            return self.origin_address
         return self._get_address(self.origin_latitude, self.origin_longitude)
 
+    @property
+    def display_origin(self):
+        """Dirección guardada o, si aún no se resolvió, el texto ingresado (sin llamadas externas)"""
+        return self.origin_address or self.origin
+
     @staticmethod
     def _get_address(lat, lon):
-        if lat is None or lon is None:
-            return "Dirección desconocida"
-        url = "https://nominatim.openstreetmap.org/reverse"
-        params = {
-            'lat': lat,
-            'lon': lon,
-            'format': 'jsonv2'
-        }
-        try:
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            return data.get('display_name', 'Dirección desconocida')
-        except requests.RequestException as e:
-            print(f"Error en la solicitud: {e}")
-            return "Dirección desconocida"
+        # Cacheado (memoria + GeocodeCacheEntry): no sale a la red en cada render
+        return geocoder.address_for(lat, lon, default=UNKNOWN_ADDRESS)
 
 class RideDestination(models.Model):
     ride = models.ForeignKey(
@@ -537,6 +543,12 @@ class RideDestination(models.Model):
     destination = models.CharField(max_length=255)
     destination_latitude = models.FloatField(null=True, blank=True)
     destination_longitude = models.FloatField(null=True, blank=True)
+    address = models.CharField(
+        max_length=500,
+        blank=True,
+        default='',
+        help_text="Dirección geocodificada del destino (se resuelve en segundo plano)"
+    )
     order = models.PositiveIntegerField(default=0)  # Para mantener el orden de los destinos
 
     class Meta:
@@ -544,6 +556,128 @@ class RideDestination(models.Model):
 
     def __str__(self):
         return f'{self.destination} ({self.destination_latitude}, {self.destination_longitude})'
+
+
+class DriverDailyStats(models.Model):
+    """
+    Carreras terminadas y ganancias de un conductor por día (desnormalizado)
+
+    El día es el de creación de la carrera (hora local), igual que los filtros
+    `created_at__date` que usaba el dashboard. Se mantiene con F() cada vez
+    que una carrera entra o sale de completed/canceled (ver taxis.ride_stats);
+    `rebuild_driver_stats` lo recalcula desde Ride.
+    """
+    driver = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='daily_stats'
+    )
+    organization = models.ForeignKey(
+        Organization,
+        on_delete=models.CASCADE,
+        related_name='driver_daily_stats',
+        null=True,
+        blank=True
+    )
+    date = models.DateField()
+    completed_rides = models.IntegerField(default=0)
+    canceled_rides = models.IntegerField(default=0)
+    earnings = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = 'Estadística Diaria de Conductor'
+        verbose_name_plural = 'Estadísticas Diarias de Conductores'
+        unique_together = ['driver', 'organization', 'date']
+        indexes = [
+            models.Index(fields=['driver', 'date'], name='driver_daily_stats_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.driver_id} {self.date}: {self.completed_rides} carreras, ${self.earnings}"
+
+
+class OrganizationPeriodStats(models.Model):
+    """
+    Carreras, ingresos y comisiones de una organización por día y por mes
+
+    Se mantiene junto con los contadores de Organization (taxis.ride_stats);
+    `reconcile_organization_stats` compara ambos con Ride y corrige diferencias.
+    """
+    PERIOD_CHOICES = [
+        ('day', 'Día'),
+        ('month', 'Mes'),
+    ]
+
+    organization = models.ForeignKey(
+        Organization,
+        on_delete=models.CASCADE,
+        related_name='period_stats'
+    )
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    period_start = models.DateField(help_text="Día, o primer día del mes")
+    completed_rides = models.IntegerField(default=0)
+    canceled_rides = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    commission = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = 'Estadística de Organización por Período'
+        verbose_name_plural = 'Estadísticas de Organizaciones por Período'
+        unique_together = ['organization', 'period', 'period_start']
+        indexes = [
+            models.Index(fields=['period', 'period_start'], name='org_period_stats_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.organization_id} {self.period} {self.period_start}: {self.completed_rides} carreras"
+
+
+class RideStatsBucket(models.Model):
+    """
+    Carreras, ingresos, comisiones y cancelaciones por hora y por día, de cada
+    (organización, conductor)
+
+    Es la fuente del motor de reportes (taxis.analytics): los reportes leen
+    estas filas y nunca la tabla de carreras. Se mantiene en la misma
+    transacción que los demás acumulados (taxis.ride_stats).
+    """
+    GRANULARITY_CHOICES = [
+        ('hour', 'Hora'),
+        ('day', 'Día'),
+    ]
+
+    granularity = models.CharField(max_length=4, choices=GRANULARITY_CHOICES)
+    bucket_start = models.DateTimeField(help_text="Inicio de la hora o del día (hora local)")
+    organization = models.ForeignKey(
+        Organization,
+        on_delete=models.CASCADE,
+        related_name='stats_buckets',
+        null=True,
+        blank=True
+    )
+    driver = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='stats_buckets',
+        null=True,
+        blank=True
+    )
+    completed_rides = models.IntegerField(default=0)
+    canceled_rides = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    commission = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = 'Bucket de Estadísticas de Carreras'
+        verbose_name_plural = 'Buckets de Estadísticas de Carreras'
+        unique_together = ['granularity', 'bucket_start', 'organization', 'driver']
+        indexes = [
+            models.Index(fields=['granularity', 'organization', 'bucket_start'], name='stats_bucket_org_idx'),
+            models.Index(fields=['granularity', 'driver', 'bucket_start'], name='stats_bucket_driver_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.granularity} {self.bucket_start:%Y-%m-%d %H:%M} org={self.organization_id} driver={self.driver_id}"
 User = get_user_model()
 
 class ConexionWebSocket(models.Model):
@@ -897,6 +1031,9 @@ class ChatMessage(models.Model):
         default=dict,
         help_text="Metadatos adicionales: {width, height, size, duration, format, etc.}"
     )
+    # Conversación sin importar el sentido ("menor-mayor" de los ids): el
+    # historial se pagina con un solo rango del índice (pair_key, timestamp, id)
+    pair_key = models.CharField(max_length=41, blank=True, default='', editable=False)
 
     class Meta:
         ordering = ['timestamp']
@@ -905,6 +1042,7 @@ class ChatMessage(models.Model):
         indexes = [
             models.Index(fields=['sender', 'recipient', 'timestamp']),
             models.Index(fields=['message_type']),
+            models.Index(fields=['pair_key', 'timestamp', 'id'], name='chat_pair_keyset_idx'),
         ]
 
     def __str__(self):
@@ -912,6 +1050,15 @@ class ChatMessage(models.Model):
         media_info = f" [{self.get_message_type_display()}]" if self.message_type != 'text' else ""
         return f"De {self.sender} para {self.recipient}: {msg_preview}{media_info}..."
     
+    @staticmethod
+    def make_pair_key(user_a_id, user_b_id):
+        low, high = sorted((int(user_a_id), int(user_b_id)))
+        return f"{low}-{high}"
+    
+    def save(self, *args, **kwargs):
+        self.pair_key = self.make_pair_key(self.sender_id, self.recipient_id)
+        super().save(*args, **kwargs)
+    
     def has_media(self):
         """Verificar si el mensaje tiene archivo multimedia"""
         return bool(self.media_url)
@@ -928,6 +1075,55 @@ class ChatMessage(models.Model):
         """Obtener URL del thumbnail (o media_url si no hay thumbnail)"""
         return self.thumbnail_url or self.media_url
 
+
+class ChatThread(models.Model):
+    """
+    Conversación entre dos usuarios (desnormalizada)
+
+    Se actualiza en la misma transacción que cada mensaje nuevo y que cada
+    "marcar como leído" (ver taxis.chat_threads): la bandeja y el badge leen
+    una fila por conversación en lugar de contar mensajes.
+    """
+    pair_key = models.CharField(max_length=41, unique=True)  # igual que ChatMessage.pair_key
+    user_low = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    user_high = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    last_message = models.ForeignKey(
+        ChatMessage,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    last_activity = models.DateTimeField()
+    # Mensajes sin leer de cada participante
+    unread_low = models.PositiveIntegerField(default=0)
+    unread_high = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Conversación de Chat'
+        verbose_name_plural = 'Conversaciones de Chat'
+        indexes = [
+            models.Index(fields=['user_low', '-last_activity'], name='chat_thread_low_idx'),
+            models.Index(fields=['user_high', '-last_activity'], name='chat_thread_high_idx'),
+        ]
+
+    def __str__(self):
+        return f"Conversación {self.pair_key}"
+
+    def other_id(self, user_id):
+        return self.user_high_id if user_id == self.user_low_id else self.user_low_id
+
+    def unread_for(self, user_id):
+        return self.unread_low if user_id == self.user_low_id else self.unread_high
+
 # ============================================
 # CÓDIGOS DE INVITACIÓN (MULTI-TENANT)
 # ============================================
@@ -1394,6 +1590,10 @@ class Invoice(models.Model):
         verbose_name = 'Factura'
         verbose_name_plural = 'Facturas'
         ordering = ['-issued_at']
+        constraints = [
+            # El job mensual puede re-ejecutarse sin facturar dos veces el mismo período
+            models.UniqueConstraint(fields=['organization', 'period_start'], name='invoice_org_period_unique'),
+        ]
     
     def __str__(self):
         return f"{self.invoice_number} - {self.organization.name}"
@@ -1412,3 +1612,230 @@ class Invoice(models.Model):
         self.paid_at = timezone.now()
         self.save()
 
+
+class InvoiceSequence(models.Model):
+    """
+    Último número de factura emitido por año
+
+    Los números se toman con la fila bloqueada (taxis.billing), en la misma
+    transacción que crea las facturas: dos emisiones simultáneas no pueden
+    leer el mismo último número.
+    """
+    year = models.PositiveIntegerField(primary_key=True)
+    last_number = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Secuencia de Facturas'
+        verbose_name_plural = 'Secuencias de Facturas'
+
+    def __str__(self):
+        return f"{self.year}: {self.last_number}"
+
+
+
+# ============================================
+# HISTORIAL DE UBICACIONES
+# ============================================
+
+class LocationTrack(models.Model):
+    """
+    Segmento del recorrido de un conductor.
+    Los puntos GPS se guardan comprimidos (deltas + varint) en un solo campo
+    binario: una fila cubre varios minutos de pings en lugar de una fila por ping.
+    """
+    driver = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='location_tracks'
+    )
+    day = models.DateField(
+        help_text="Día (hora local) al que pertenece el segmento"
+    )
+    started_at = models.DateTimeField(
+        help_text="Hora del primer punto"
+    )
+    ended_at = models.DateTimeField(
+        help_text="Hora del último punto"
+    )
+    point_count = models.PositiveIntegerField(default=0)
+    points = models.BinaryField(
+        help_text="Puntos codificados (ver taxis.location_history)"
+    )
+
+    class Meta:
+        verbose_name = 'Segmento de Recorrido'
+        verbose_name_plural = 'Segmentos de Recorrido'
+        ordering = ['started_at']
+        indexes = [
+            models.Index(fields=['driver', 'day']),
+            models.Index(fields=['driver', 'started_at']),
+        ]
+
+    def __str__(self):
+        return f"Recorrido de {self.driver_id} el {self.day} ({self.point_count} puntos)"
+
+
+# ============================================
+# WALKIE-TALKIE: GRUPOS DE CONVERSACIÓN
+# ============================================
+
+class TalkGroup(models.Model):
+    """
+    Canal de walkie-talkie de una cooperativa.
+    El audio de un grupo solo llega a sus miembros (grupo `audio_tg_<id>` del channel layer).
+    """
+    KIND_CHOICES = [
+        ('organization', 'Toda la cooperativa'),
+        ('zone', 'Zona'),
+        ('shift', 'Turno'),
+        ('dispatch', 'Privado con la central'),
+    ]
+
+    organization = models.ForeignKey(
+        Organization,
+        on_delete=models.CASCADE,
+        related_name='talk_groups',
+        help_text="Cooperativa dueña del grupo"
+    )
+    name = models.CharField(max_length=100)
+    kind = models.CharField(
+        max_length=20,
+        choices=KIND_CHOICES,
+        default='zone',
+        help_text="Los grupos de tipo 'organization' incluyen a todos los usuarios de la cooperativa"
+    )
+    members = models.ManyToManyField(
+        settings.AUTH_USER_MODEL,
+        through='TalkGroupMembership',
+        related_name='talk_groups',
+        blank=True
+    )
+    is_active = models.BooleanField(default=True)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Grupo de Conversación'
+        verbose_name_plural = 'Grupos de Conversación'
+        ordering = ['name']
+        indexes = [
+            models.Index(fields=['organization', 'is_active']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.get_kind_display()}) - {self.organization.name}"
+
+    @property
+    def channel_group(self):
+        """Nombre del grupo en el channel layer"""
+        return f'audio_tg_{self.id}'
+
+
+class TalkGroupMembership(models.Model):
+    """Miembro de un grupo de conversación"""
+    talk_group = models.ForeignKey(
+        TalkGroup,
+        on_delete=models.CASCADE,
+        related_name='memberships'
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='talk_group_memberships'
+    )
+    joined_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Miembro de Grupo'
+        verbose_name_plural = 'Miembros de Grupo'
+        unique_together = ['talk_group', 'user']
+
+    def __str__(self):
+        return f"{self.user} en {self.talk_group.name}"
+
+
+class AudioClip(models.Model):
+    """
+    Transmisión de walkie-talkie grabada para reproducirla después.
+    El audio vive en disco (ver taxis.audio_clips); aquí solo el índice por sala, hablante y hora.
+    """
+    room = models.CharField(
+        max_length=100,
+        help_text="Grupo del channel layer (audio_org_<id> o audio_tg_<id>)"
+    )
+    speaker = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='audio_clips'
+    )
+    speaker_name = models.CharField(max_length=150, blank=True, default='')
+    mime_type = models.CharField(max_length=50, default='audio/aac')
+    file_path = models.CharField(
+        max_length=255,
+        help_text="Ruta relativa dentro de AUDIO_CLIPS_DIR"
+    )
+    size_bytes = models.PositiveIntegerField(default=0)
+    chunk_count = models.PositiveIntegerField(default=0)
+    started_at = models.DateTimeField()
+    ended_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Clip de Audio'
+        verbose_name_plural = 'Clips de Audio'
+        ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['room', 'started_at']),
+            models.Index(fields=['speaker', 'started_at']),
+            models.Index(fields=['started_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.speaker_name} en {self.room} ({self.started_at:%Y-%m-%d %H:%M:%S})"
+
+
+# ============================================
+# GEOCODIFICACIÓN: CACHÉ PERSISTENTE
+# ============================================
+
+class GeocodeCacheEntry(models.Model):
+    """
+    Resultado de geocodificación guardado para no repetir la consulta externa.
+    Las direcciones inversas se indexan por coordenadas redondeadas y las directas
+    por el texto normalizado (ver taxis.geocoding). `found=False` es caché negativa.
+    """
+    KIND_CHOICES = [
+        ('reverse', 'Coordenadas → dirección'),
+        ('forward', 'Dirección → coordenadas'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    key = models.CharField(
+        max_length=255,
+        help_text="'lat,lng' redondeado o texto normalizado"
+    )
+    address = models.TextField(blank=True, default='')
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    found = models.BooleanField(default=True)
+    provider = models.CharField(max_length=20, blank=True, default='')
+    created_at = models.DateTimeField(auto_now=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Caché de Geocodificación'
+        verbose_name_plural = 'Caché de Geocodificación'
+        unique_together = ['kind', 'key']
+        indexes = [
+            models.Index(fields=['expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.key} → {self.address or '(sin resultado)'}"
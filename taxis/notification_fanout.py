@@ -0,0 +1,389 @@
+"""
+Envío unificado de notificaciones (fan-out)
+
+Cada módulo de notificaciones buscaba por su cuenta los dispositivos de cada
+usuario y enviaba en serie: NotificationService hacía un group_send por
+administrador, el walkie-talkie llamaba a send_push_notification por
+conductor (una consulta y un envío por cabeza) y el chat enviaba FCM desde el
+consumer. Cada destinatario nuevo sumaba consultas y llamadas de red a la
+petición que lo originaba.
+
+`notification_fanout` recibe (audiencia, evento, payload):
+
+- Resuelve todos los destinos de la audiencia (tokens FCM activos,
+  suscripciones Web Push, teléfono y chat de Telegram) en una sola consulta.
+- Deduplica: un mismo token, endpoint, teléfono o chat se usa una sola vez y,
+  por defecto, cada usuario recibe el aviso por un solo canal de dispositivo:
+  el primero de `channels` para el que tenga destino (app nativa antes que
+  PWA). WebSocket no cuenta: es en vivo y no muestra una notificación.
+- Los canales se envían en paralelo (FCM y Web Push ya envían sus lotes de
+  forma concurrente); WhatsApp y Telegram se encolan como tareas con
+  reintentos.
+- Lleva métricas por canal en `notification_fanout.stats`.
+
+Desde una vista o un consumer se usa `dispatch`, que solo encola la tarea
+'notify'; `deliver` envía en el momento y es lo que ejecuta el worker.
+
+    notification_fanout.dispatch(
+        Audience(roles=['driver'], organization_id=org.id),
+        'nueva_carrera',
+        {'title': '🚕 Nueva carrera', 'body': 'Origen: ...', 'data': {'ride_id': 5}},
+    )
+
+Claves del payload: title, body, data, icon, badge, image_url; `text` para
+WhatsApp/Telegram (por defecto título y cuerpo) y `websocket` para el mensaje
+en vivo (por defecto evento, título, cuerpo y data).
+"""
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.db.models import FilteredRelation, Q
+
+logger = logging.getLogger(__name__)
+
+FCM = 'fcm'
+WEBPUSH = 'webpush'
+WEBSOCKET = 'websocket'
+WHATSAPP = 'whatsapp'
+TELEGRAM = 'telegram'
+
+CHANNELS = (FCM, WEBPUSH, WEBSOCKET, WHATSAPP, TELEGRAM)
+
+# En vivo + un push por usuario (app nativa si la tiene, si no la PWA)
+DEFAULT_CHANNELS = (WEBSOCKET, FCM, WEBPUSH)
+
+
+class Audience:
+    """
+    Destinatarios de una notificación
+
+    Unión de `user_ids` y de los usuarios activos con alguno de `roles`
+    (opcionalmente de una organización), menos `exclude_user_ids`. Se
+    serializa con to_dict() para viajar en la cola.
+    """
+
+    def __init__(self, user_ids=(), roles=(), organization_id=None, exclude_user_ids=()):
+        self.user_ids = sorted({int(u) for u in user_ids})
+        self.roles = sorted(set(roles))
+        self.organization_id = organization_id
+        self.exclude_user_ids = sorted({int(u) for u in exclude_user_ids})
+
+    @classmethod
+    def users(cls, users, exclude=()):
+        """Usuarios sueltos (objetos o ids; se ignoran los None)"""
+        return cls(
+            user_ids=[getattr(u, 'pk', u) for u in users if u is not None],
+            exclude_user_ids=[getattr(u, 'pk', u) for u in exclude if u is not None],
+        )
+
+    def is_empty(self):
+        return not self.user_ids and not self.roles
+
+    def filter(self):
+        q = Q(pk__in=self.user_ids)
+        if self.roles:
+            by_role = Q(role__in=self.roles, is_active=True)
+            if self.organization_id is not None:
+                by_role &= Q(organization_id=self.organization_id)
+            q |= by_role
+        return q
+
+    def to_dict(self):
+        return {
+            'user_ids': self.user_ids,
+            'roles': self.roles,
+            'organization_id': self.organization_id,
+            'exclude_user_ids': self.exclude_user_ids,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def __repr__(self):
+        return f'Audience({self.to_dict()})'
+
+
+class Recipient:
+    """Destinos de un usuario, tal como salen de la consulta"""
+
+    __slots__ = ('user_id', 'phone_number', 'telegram_chat_id', 'fcm_tokens', 'webpush_subscriptions')
+
+    def __init__(self, user_id, phone_number, telegram_chat_id):
+        self.user_id = user_id
+        self.phone_number = phone_number or ''
+        self.telegram_chat_id = telegram_chat_id or ''
+        self.fcm_tokens = {}             # id -> token
+        self.webpush_subscriptions = {}  # id -> subscription_info
+
+    def has(self, channel):
+        if channel == FCM:
+            return bool(self.fcm_tokens)
+        if channel == WEBPUSH:
+            return bool(self.webpush_subscriptions)
+        if channel == WHATSAPP:
+            return bool(self.phone_number)
+        if channel == TELEGRAM:
+            return bool(self.telegram_chat_id)
+        return channel == WEBSOCKET
+
+
+class NotificationFanout:
+    """Resuelve una audiencia y entrega un evento por todos sus canales"""
+
+    def __init__(self, max_workers=len(CHANNELS)):
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self.stats = {
+            'notifications': 0,
+            'recipients': 0,
+            'deduped': 0,
+            'last_duration_ms': 0,
+            'channels': {channel: {'sent': 0, 'failed': 0} for channel in CHANNELS},
+        }
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='fanout')
+        return self._executor
+
+    # ------------------------------------------------------------------
+    # Entradas
+    # ------------------------------------------------------------------
+
+    def dispatch(self, audience, event, payload, channels=DEFAULT_CHANNELS, dedupe=True):
+        """Encola la notificación (tarea 'notify') al confirmar la transacción actual"""
+        if audience.is_empty():
+            return
+        from .task_queue import task_queue
+
+        task_queue.enqueue_on_commit(
+            'notify', audience=audience.to_dict(), event=event, payload=payload,
+            channels=list(channels), dedupe=dedupe,
+        )
+
+    def deliver(self, audience, event, payload, channels=DEFAULT_CHANNELS, dedupe=True):
+        """
+        Envía en el momento por todos los canales
+
+        Returns:
+            dict: {'event', 'recipients', 'deduped', 'duration_ms', 'channels': {canal: reporte}}
+        """
+        started = time.monotonic()
+        recipients = self.resolve(audience) if not audience.is_empty() else []
+        plan, deduped = self.plan(recipients, self._configured(channels), dedupe)
+
+        # Solo red en los hilos; la limpieza de tokens/suscripciones muertas
+        # se hace aquí, en el hilo que tiene la conexión a la base de datos
+        futures = {
+            channel: self.executor.submit(getattr(self, f'_send_{channel}'), targets, event, payload)
+            for channel, targets in plan.items()
+            if channel in (FCM, WEBPUSH, WEBSOCKET)
+        }
+        report = {}
+        for channel in (WHATSAPP, TELEGRAM):
+            if channel in plan:
+                report[channel] = self._enqueue_messages(channel, plan[channel], payload)
+        for channel, future in futures.items():
+            try:
+                report[channel] = self._finish(channel, future.result())
+            except Exception as e:
+                logger.error(f"❌ Error enviando '{event}' por {channel}: {e}")
+                report[channel] = {'sent': 0, 'failed': len(plan[channel]), 'error': str(e)}
+
+        duration_ms = int((time.monotonic() - started) * 1000)
+        self._record(len(recipients), deduped, report, duration_ms)
+        logger.info(
+            f"📣 '{event}' a {len(recipients)} usuario(s) en {duration_ms} ms: "
+            + ', '.join(f"{channel} {r['sent']}/{r['sent'] + r['failed']}" for channel, r in report.items())
+        )
+        return {
+            'event': event,
+            'recipients': len(recipients),
+            'deduped': deduped,
+            'duration_ms': duration_ms,
+            'channels': report,
+        }
+
+    # ------------------------------------------------------------------
+    # Resolución y deduplicación
+    # ------------------------------------------------------------------
+
+    def resolve(self, audience):
+        """Destinos de toda la audiencia en una sola consulta (LEFT JOIN a tokens y suscripciones)"""
+        User = get_user_model()
+        rows = (
+            User.objects.filter(audience.filter())
+            .exclude(pk__in=audience.exclude_user_ids)
+            .annotate(active_fcm=FilteredRelation('fcm_tokens', condition=Q(fcm_tokens__is_active=True)))
+            .values_list(
+                'id', 'phone_number', 'telegram_chat_id',
+                'active_fcm__id', 'active_fcm__token',
+                'webpush_subscriptions__id', 'webpush_subscriptions__subscription_info',
+            )
+        )
+        recipients = {}
+        for user_id, phone, chat_id, token_id, token, subscription_id, subscription_info in rows:
+            recipient = recipients.get(user_id)
+            if recipient is None:
+                recipient = recipients[user_id] = Recipient(user_id, phone, chat_id)
+            if token_id is not None:
+                recipient.fcm_tokens[token_id] = token
+            if subscription_id is not None:
+                recipient.webpush_subscriptions[subscription_id] = subscription_info
+        return list(recipients.values())
+
+    def plan(self, recipients, channels, dedupe=True):
+        """
+        Destinos por canal, sin repetidos
+
+        Returns:
+            (plan, deduped): plan = {canal: [destinos]}; deduped = destinos omitidos
+        """
+        channels = [channel for channel in channels if channel in CHANNELS]
+        device_channels = [channel for channel in channels if channel != WEBSOCKET]
+        plan = {channel: [] for channel in channels}
+        seen = {channel: set() for channel in channels}
+        deduped = 0
+
+        def add(channel, key, target):
+            nonlocal deduped
+            if key in seen[channel]:
+                deduped += 1
+                return
+            seen[channel].add(key)
+            plan[channel].append(target)
+
+        for recipient in recipients:
+            if WEBSOCKET in plan:
+                add(WEBSOCKET, recipient.user_id, recipient.user_id)
+
+            available = [channel for channel in device_channels if recipient.has(channel)]
+            if dedupe and available:
+                deduped += len(available) - 1
+                available = available[:1]
+
+            for channel in available:
+                if channel == FCM:
+                    for token_id, token in recipient.fcm_tokens.items():
+                        add(FCM, token, (token_id, token))
+                elif channel == WEBPUSH:
+                    for subscription_id, info in recipient.webpush_subscriptions.items():
+                        endpoint = info.get('endpoint') if isinstance(info, dict) else None
+                        add(WEBPUSH, endpoint or subscription_id, (subscription_id, info))
+                elif channel == WHATSAPP:
+                    add(WHATSAPP, recipient.phone_number, recipient.phone_number)
+                elif channel == TELEGRAM:
+                    add(TELEGRAM, recipient.telegram_chat_id, recipient.telegram_chat_id)
+
+        return {channel: targets for channel, targets in plan.items() if targets}, deduped
+
+    def _configured(self, channels):
+        """Sin Firebase configurado FCM no cuenta: esos usuarios caen al siguiente canal"""
+        import firebase_admin
+
+        if firebase_admin._apps:
+            return channels
+        return [channel for channel in channels if channel != FCM]
+
+    # ------------------------------------------------------------------
+    # Canales (corren en el pool; solo red)
+    # ------------------------------------------------------------------
+
+    def _send_fcm(self, tokens, event, payload):
+        from .fcm_notifications import multicast_fcm
+
+        data = dict(payload.get('data') or {})
+        data.setdefault('type', event)
+        return multicast_fcm(
+            tokens, payload.get('title', ''), payload.get('body', ''), data,
+            image_url=payload.get('image_url'),
+        )
+
+    def _send_webpush(self, subscriptions, event, payload):
+        from .push_notifications import build_payload
+        from .webpush_dispatcher import webpush_dispatcher
+
+        data = dict(payload.get('data') or {})
+        data.setdefault('type', event)
+        message = build_payload(
+            payload.get('title', ''), payload.get('body', ''), data,
+            payload.get('icon'), payload.get('badge'),
+        )
+        return webpush_dispatcher.send_many(subscriptions, message)
+
+    def _send_websocket(self, user_ids, event, payload):
+        from channels.layers import get_channel_layer
+
+        channel_layer = get_channel_layer()
+        message = {
+            'type': 'user_notification',
+            'data': payload.get('websocket') or {
+                'type': event,
+                'title': payload.get('title', ''),
+                'body': payload.get('body', ''),
+                'data': payload.get('data') or {},
+            },
+        }
+
+        async def send_all():
+            results = await asyncio.gather(
+                *(channel_layer.group_send(f'user_{user_id}', message) for user_id in user_ids),
+                return_exceptions=True,
+            )
+            return [r for r in results if isinstance(r, Exception)]
+
+        errors = async_to_sync(send_all)()
+        return {'sent': len(user_ids) - len(errors), 'failed': len(errors)}
+
+    def _finish(self, channel, result):
+        """Reporte del canal + limpieza de destinos muertos (en el hilo llamador)"""
+        if channel == FCM:
+            from .fcm_notifications import deactivate_fcm_tokens
+
+            results, dead_ids = result
+            results['deactivated'] = deactivate_fcm_tokens(dead_ids)
+            return {'sent': results['sent'], 'failed': results['failed'], 'deactivated': results['deactivated']}
+        if channel == WEBPUSH:
+            from .push_notifications import drop_expired
+            from .webpush_dispatcher import summarize
+
+            drop_expired(result)
+            summary = summarize(result)
+            return {'sent': summary['sent'], 'failed': summary['failed'], 'expired': summary['expired']}
+        return result
+
+    def _enqueue_messages(self, channel, targets, payload):
+        """WhatsApp y Telegram: una tarea por destino, cada una con sus reintentos"""
+        from .task_queue import task_queue
+
+        text = payload.get('text') or f"{payload.get('title', '')}\n{payload.get('body', '')}".strip()
+        for target in targets:
+            if channel == WHATSAPP:
+                task_queue.enqueue('send_whatsapp', numero=target, mensaje=text)
+            else:
+                task_queue.enqueue('send_telegram', chat_id=target, mensaje=text)
+        return {'sent': len(targets), 'failed': 0, 'queued': len(targets)}
+
+    def _record(self, recipients, deduped, report, duration_ms):
+        with self._lock:
+            self.stats['notifications'] += 1
+            self.stats['recipients'] += recipients
+            self.stats['deduped'] += deduped
+            self.stats['last_duration_ms'] = duration_ms
+            for channel, result in report.items():
+                self.stats['channels'][channel]['sent'] += result['sent']
+                self.stats['channels'][channel]['failed'] += result['failed']
+
+
+# Instancia global
+notification_fanout = NotificationFanout()
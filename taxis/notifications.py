@@ -8,6 +8,7 @@ from django.contrib.auth import get_user_model
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 from .models import Ride, AppUser
+from .notification_fanout import WEBSOCKET, Audience, notification_fanout
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
@@ -146,20 +147,15 @@ class NotificationService:
             logger.error(f"❌ Error enviando a usuario {user.id}: {str(e)}")
     
     def _send_to_relevant_users(self, ride, notification_data):
-        """Envía notificación a usuarios relevantes para la carrera"""
+        """Envía notificación a usuarios relevantes para la carrera (cliente, conductor y administradores)"""
         try:
-            # Enviar al cliente
-            if ride.customer:
-                self._send_to_user(ride.customer, notification_data)
-            
-            # Enviar al conductor si existe
-            if ride.driver:
-                self._send_to_user(ride.driver, notification_data)
-            
-            # Enviar a administradores
-            admins = User.objects.filter(role='admin', is_active=True)
-            for admin in admins:
-                self._send_to_user(admin, notification_data)
+            # Un solo envío encolado en lugar de un group_send por administrador
+            notification_fanout.dispatch(
+                Audience(user_ids=[uid for uid in (ride.customer_id, ride.driver_id) if uid], roles=['admin']),
+                notification_data['notification_type'],
+                {'websocket': notification_data},
+                channels=(WEBSOCKET,),
+            )
                 
         except Exception as e:
             logger.error(f"❌ Error enviando a usuarios relevantes: {str(e)}")
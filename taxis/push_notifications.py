@@ -2,12 +2,13 @@
 Push Notifications Module
 Handles sending web push notifications to users
 """
-from pywebpush import webpush, WebPushException
 from django.conf import settings
 import json
 import logging
 import time
 
+from .webpush_dispatcher import summarize, webpush_dispatcher
+
 logger = logging.getLogger(__name__)
 
 
@@ -54,14 +55,21 @@ def send_push_notification(user, title, body, data=None, icon=None, badge=None):
             logger.warning("Could not convert data to dict, using empty dict")
             data = {}
     
-    subscriptions = WebPushSubscription.objects.filter(user=user)
+    subscriptions = list(WebPushSubscription.objects.filter(user=user).values_list('id', 'subscription_info'))
     
-    if not subscriptions.exists():
+    if not subscriptions:
         logger.info(f"No push subscriptions found for user {user.username}")
         return 0
     
-    # Prepare notification payload
-    payload = {
+    report = deliver_push(subscriptions, build_payload(title, body, data, icon, badge))
+    if report['sent']:
+        logger.info(f"📱 Notificación push enviada a {user.username} ({report['sent']} dispositivo(s))")
+    return report['sent']
+
+
+def build_payload(title, body, data=None, icon=None, badge=None):
+    """Notification payload shared by every subscription of a send"""
+    return {
         "title": str(title),
         "body": str(body),
         "icon": icon or "/static/imagenes/DE_AQU_PALL_Logo.png",
@@ -69,74 +77,59 @@ def send_push_notification(user, title, body, data=None, icon=None, badge=None):
         "data": data or {},
         "timestamp": int(time.time() * 1000),
     }
+
+
+def deliver_push(subscriptions, payload):
+    """
+    Send one payload to many subscriptions concurrently and drop the expired ones
     
-    success_count = 0
-    expired_subscriptions = []
+    Args:
+        subscriptions: List of (subscription id, subscription_info)
+        payload: Notification payload dict
     
-    for subscription in subscriptions:
-        try:
-            # Validate subscription_info
-            if not hasattr(subscription, 'subscription_info') or not subscription.subscription_info:
-                logger.warning(f"Invalid subscription_info for user {user.username}")
-                continue
-                
-            # subscription_info should already be a dict thanks to JSONField
-            subscription_info = subscription.subscription_info
-            
-            if not isinstance(subscription_info, dict):
-                logger.warning(f"subscription_info must be a dict, got {type(subscription_info)}")
-                continue
-                
-            # Construir audience correctamente para VAPID
-            endpoint = subscription_info.get('endpoint', '')
-            if not endpoint:
-                logger.warning(f"Missing endpoint for user {user.username}")
-                continue
-                
-            from urllib.parse import urlparse
-            parsed_endpoint = urlparse(endpoint)
-            aud = f"{parsed_endpoint.scheme}://{parsed_endpoint.netloc}"
-            
-            webpush(
-                subscription_info=subscription_info,
-                data=json.dumps(payload),
-                vapid_private_key=settings.WEBPUSH_SETTINGS['VAPID_PRIVATE_KEY'],
-                vapid_claims={
-                    "sub": f"mailto:{settings.WEBPUSH_SETTINGS['VAPID_ADMIN_EMAIL']}",
-                    "aud": aud
-                }
-            )
-            success_count += 1
-            logger.info(f"📱 Notificación push enviada a {user.username}")
-            
-        except WebPushException as e:
-            # If subscription is expired or invalid, mark for deletion
-            error_message = str(e).lower()
-            is_expired = (
-                (e.response and e.response.status_code in [404, 410]) or
-                'unsubscribed' in error_message or
-                'expired' in error_message or
-                'invalid' in error_message
-            )
-            
-            if is_expired:
-                logger.warning(f"⚠️ Suscripción expirada/inválida para {user.username} - será eliminada")
-                logger.warning(f"   Razón: {e}")
-                expired_subscriptions.append(subscription.id)
-            else:
-                logger.error(f"❌ Error al enviar notificación push: {e}")
-        except Exception as e:
-            logger.error(f"❌ Error inesperado al enviar notificación push: {e}")
-            logger.error(f"Debug - payload: {payload}")
-            logger.error(f"Debug - subscription_info type: {type(subscription.subscription_info)}")
-            logger.error(f"Debug - subscription_info: {subscription.subscription_info}")
+    Returns:
+        dict: Batch report with 'sent', 'failed', 'expired' and per-endpoint 'endpoints'
+    """
+    outcomes = webpush_dispatcher.send_many(subscriptions, payload)
+    drop_expired(outcomes)
+    return summarize(outcomes)
+
+
+def drop_expired(outcomes):
+    """
+    Log failed sends and delete the expired subscriptions in a single query
     
-    # Clean up expired subscriptions
-    if expired_subscriptions:
-        WebPushSubscription.objects.filter(id__in=expired_subscriptions).delete()
-        logger.info(f"Removed {len(expired_subscriptions)} expired subscriptions")
+    Args:
+        outcomes: PushOutcome list returned by webpush_dispatcher.send_many
+    """
+    from taxis.models import WebPushSubscription
+    
+    for outcome in outcomes:
+        if not outcome.ok and not outcome.expired:
+            logger.error(f"❌ Error al enviar notificación push a {outcome.endpoint[:60]}: {outcome.error}")
+    
+    expired_ids = [outcome.subscription_id for outcome in outcomes if outcome.expired]
+    if expired_ids:
+        WebPushSubscription.objects.filter(id__in=expired_ids).delete()
+        logger.warning(f"⚠️ Removed {len(expired_ids)} expired/invalid push subscriptions")
+
+
+def send_push_to_users(users, title, body, data=None, icon=None, badge=None):
+    """
+    Send a push notification to many users (one query for all their subscriptions)
     
-    return success_count
+    Args:
+        users: Queryset or list of users
+    
+    Returns:
+        dict: Batch report (see deliver_push)
+    """
+    from taxis.models import WebPushSubscription
+    
+    subscriptions = list(
+        WebPushSubscription.objects.filter(user__in=users).values_list('id', 'subscription_info')
+    )
+    return deliver_push(subscriptions, build_payload(title, body, data, icon, badge))
 
 
 def send_push_to_all_drivers(title, body, data=None):
@@ -155,11 +148,7 @@ def send_push_to_all_drivers(title, body, data=None):
     User = get_user_model()
     
     drivers = User.objects.filter(role='driver', is_active=True)
-    total_sent = 0
-    
-    for driver in drivers:
-        sent = send_push_notification(driver, title, body, data)
-        total_sent += sent
+    total_sent = send_push_to_users(drivers, title, body, data)['sent']
     
     logger.info(f"Sent push notification to {total_sent} drivers")
     return total_sent
@@ -0,0 +1,68 @@
+"""
+Direcciones geocodificadas guardadas en Ride / RideDestination
+
+ride_detail y los serializers llamaban a Nominatim por cada carrera mostrada:
+una lista de 50 carreras eran hasta 50 requests bloqueantes. Ahora la
+dirección se resuelve una sola vez, en segundo plano después de crear la
+carrera o el destino, y se guarda en `Ride.origin_address` /
+`RideDestination.address`. Las vistas y APIs solo leen esos campos.
+
+- post_save encola la tarea `resolve_ride_addresses` (taxis.task_queue) al
+  confirmar la transacción, así que cubre todos los puntos donde se crean
+  carreras (web, API, WhatsApp).
+- La tarea usa `geocoder` (con caché) y es idempotente: solo completa campos vacíos.
+- Las carreras históricas se completan con `backfill_ride_addresses`.
+"""
+import logging
+
+from django.db.models.signals import post_save
+
+from .geocoding import geocoder
+from .task_queue import task_queue
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_ride_addresses(ride_id):
+    """
+    Geocodifica y guarda las direcciones pendientes de una carrera
+
+    Returns:
+        int: Número de direcciones guardadas
+    """
+    from .models import Ride, RideDestination
+
+    saved = 0
+    ride = Ride.objects.filter(id=ride_id).values('origin_address', 'origin_latitude', 'origin_longitude').first()
+    if ride is None:
+        return 0
+
+    if not ride['origin_address'] and ride['origin_latitude'] is not None and ride['origin_longitude'] is not None:
+        result = geocoder.reverse(ride['origin_latitude'], ride['origin_longitude'])
+        if result and result.address:
+            # Solo si sigue vacía: no pisar una dirección escrita mientras tanto
+            saved += Ride.objects.filter(id=ride_id, origin_address='').update(origin_address=result.address[:500])
+
+    pending = RideDestination.objects.filter(
+        ride_id=ride_id, address='',
+        destination_latitude__isnull=False, destination_longitude__isnull=False,
+    ).values_list('id', 'destination_latitude', 'destination_longitude')
+    for destination_id, lat, lng in pending:
+        result = geocoder.reverse(lat, lng)
+        if result and result.address:
+            saved += RideDestination.objects.filter(id=destination_id, address='').update(address=result.address[:500])
+    return saved
+
+
+def _ride_saved(sender, instance, created, **kwargs):
+    if created and not instance.origin_address:
+        task_queue.enqueue_on_commit('resolve_ride_addresses', ride_id=instance.id)
+
+
+def _destination_saved(sender, instance, created, **kwargs):
+    if created and not instance.address:
+        task_queue.enqueue_on_commit('resolve_ride_addresses', ride_id=instance.ride_id)
+
+
+post_save.connect(_ride_saved, sender='taxis.Ride', dispatch_uid='ride_addresses_ride')
+post_save.connect(_destination_saved, sender='taxis.RideDestination', dispatch_uid='ride_addresses_destination')
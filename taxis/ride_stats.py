@@ -0,0 +1,467 @@
+"""
+Acumulados de carreras por conductor y por organización
+
+driver_dashboard hacía unas ocho consultas COUNT/SUM sobre todas las carreras
+del conductor en cada carga, driver_stats_view repetía la mayoría para la app
+y los paneles financieros (superadmin_dashboard, SuperAdminDashboardView,
+FinancialReportsView, admin_dashboard) sumaban todas las carreras con joins
+a Organization. Ahora las carreras terminadas se acumulan en el momento en
+que cambian:
+
+- DriverDailyStats: por (conductor, organización, día).
+- Organization.total_rides / total_revenue / total_commission: contadores
+  de carreras completadas de la organización.
+- OrganizationPeriodStats: por organización y día / mes.
+- RideStatsBucket: por (organización, conductor) y hora / día; es la fuente
+  del motor de reportes (taxis.analytics).
+
+Cómo se mantienen:
+
+- post_init guarda lo que la carrera aporta a los acumulados; post_save
+  resta ese aporte y suma el nuevo (completar, cancelar, corregir el precio
+  o la comisión, reasignar conductor). Todas las transiciones pasan por
+  Ride.save().
+- Los contadores se actualizan con F() en la base, así que dos carreras
+  terminadas a la vez no se pisan (y Organization.save() no escribe los
+  contadores).
+- Los cambios hechos con QuerySet.update() no pasan por aquí: se corrigen
+  con `rebuild_driver_stats`, `reconcile_organization_stats` y
+  `rebuild_stats_buckets`.
+
+El día es el de creación de la carrera (hora local), igual que los filtros
+`created_at__date` / `created_at__gte` que usaban las vistas.
+"""
+import logging
+from collections import namedtuple
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+FINAL_STATUSES = ('completed', 'canceled')
+ACTIVE_STATUSES = ('accepted', 'in_progress')
+
+# Campos de Ride que definen su aporte a los acumulados
+_TRACKED_FIELDS = ('driver', 'organization', 'status', 'price', 'commission_amount', 'created_at')
+_TRACKED_ATTNAMES = ('driver_id', 'organization_id', 'status', 'price', 'commission_amount', 'created_at')
+
+ZERO = Decimal('0')
+
+
+class Contribution(namedtuple('Contribution', 'driver_id organization_id hour status price commission')):
+    """Aporte de una carrera terminada (precio y comisión solo si está completada)"""
+    __slots__ = ()
+
+    @property
+    def day(self):
+        return self.hour.date()
+
+    @property
+    def day_start(self):
+        return timezone.make_aware(datetime.combine(self.day, time()))
+
+
+def _decimal(value):
+    return Decimal(str(value)) if value is not None else ZERO
+
+
+def _contribution(ride):
+    """Contribution de la carrera, o None si no suma a ningún acumulado"""
+    if ride.status not in FINAL_STATUSES or (ride.driver_id is None and ride.organization_id is None):
+        return None
+    completed = ride.status == 'completed'
+    hour = timezone.localtime(ride.created_at or timezone.now()).replace(minute=0, second=0, microsecond=0)
+    return Contribution(
+        ride.driver_id, ride.organization_id, hour, ride.status,
+        _decimal(ride.price) if completed else ZERO,
+        _decimal(ride.commission_amount) if completed else ZERO,
+    )
+
+
+def _bump_row(model, keys, changes, sign):
+    rows = model.objects.filter(**keys)
+    if sign > 0:
+        row, _ = model.objects.get_or_create(**keys)
+        rows = model.objects.filter(pk=row.pk)
+    # Al restar no se crean filas: la organización o el conductor pueden estar borrándose
+    rows.update(**changes)
+
+
+def _bump(contribution, sign):
+    from .models import DriverDailyStats, Organization, OrganizationPeriodStats, RideStatsBucket
+
+    c = contribution
+    completed = c.status == 'completed'
+    counter = 'completed_rides' if completed else 'canceled_rides'
+
+    changes = {
+        counter: F(counter) + sign,
+        'revenue': F('revenue') + sign * c.price,
+        'commission': F('commission') + sign * c.commission,
+    }
+    for granularity, start in (('hour', c.hour), ('day', c.day_start)):
+        _bump_row(
+            RideStatsBucket,
+            {'granularity': granularity, 'bucket_start': start,
+             'organization_id': c.organization_id, 'driver_id': c.driver_id},
+            changes, sign,
+        )
+
+    if c.driver_id is not None:
+        _bump_row(
+            DriverDailyStats,
+            {'driver_id': c.driver_id, 'organization_id': c.organization_id, 'date': c.day},
+            {counter: F(counter) + sign, 'earnings': F('earnings') + sign * c.price},
+            sign,
+        )
+
+    if c.organization_id is not None:
+        for period, start in (('day', c.day), ('month', c.day.replace(day=1))):
+            _bump_row(
+                OrganizationPeriodStats,
+                {'organization_id': c.organization_id, 'period': period, 'period_start': start},
+                changes, sign,
+            )
+        if completed:
+            Organization.objects.filter(pk=c.organization_id).update(
+                total_rides=F('total_rides') + sign,
+                total_revenue=F('total_revenue') + sign * c.price,
+                total_commission=F('total_commission') + sign * c.commission,
+            )
+
+
+def apply_change(old, new):
+    """Resta el aporte anterior de una carrera y suma el nuevo, en una transacción"""
+    if old == new:
+        return
+    with transaction.atomic():
+        if old is not None:
+            _bump(old, -1)
+        if new is not None:
+            _bump(new, 1)
+
+
+# ============================================
+# LECTURA
+# ============================================
+
+def driver_summary(driver, organization=None):
+    """
+    Estadísticas del conductor desde los acumulados
+
+    Args:
+        organization: limitar a una organización (None = todas)
+
+    Returns:
+        dict: total_rides, completed_rides, canceled_rides, active_rides,
+              today_rides, today_earnings, month_earnings, total_earnings
+    """
+    from .models import DriverDailyStats, Ride
+
+    today = timezone.localdate()
+    stats = DriverDailyStats.objects.filter(driver=driver)
+    rides = Ride.objects.filter(driver=driver, status__in=('requested',) + ACTIVE_STATUSES)
+    if organization is not None:
+        stats = stats.filter(organization=organization)
+        rides = rides.filter(organization=organization)
+
+    totals = stats.aggregate(
+        completed=Sum('completed_rides'),
+        canceled=Sum('canceled_rides'),
+        total_earnings=Sum('earnings'),
+        today_rides=Sum('completed_rides', filter=Q(date=today)),
+        today_earnings=Sum('earnings', filter=Q(date=today)),
+        month_earnings=Sum('earnings', filter=Q(date__gte=today.replace(day=1))),
+    )
+    summary = {key: value or 0 for key, value in totals.items()}
+    summary['completed_rides'] = summary.pop('completed')
+    summary['canceled_rides'] = summary.pop('canceled')
+
+    open_rides = rides.aggregate(
+        open=Count('id'),
+        active=Count('id', filter=Q(status__in=ACTIVE_STATUSES)),
+    )
+    summary['active_rides'] = open_rides['active']
+    summary['total_rides'] = summary['completed_rides'] + summary['canceled_rides'] + open_rides['open']
+    return summary
+
+
+def period_range(period, today=None):
+    """
+    (granularidad, primer día) de los períodos de los reportes: 'week' son los
+    últimos 7 días, 'month' el mes en curso y 'year' el año en curso
+    """
+    today = today or timezone.localdate()
+    if period == 'year':
+        return 'month', today.replace(month=1, day=1)
+    if period == 'month':
+        return 'month', today.replace(day=1)
+    return 'day', today - timedelta(days=7)
+
+
+def organization_period_stats(period, start, organization=None):
+    """
+    Filas OrganizationPeriodStats de granularidad `period` ('day' o 'month')
+    desde `start` (incluido), de una organización o de todas
+    """
+    from .models import OrganizationPeriodStats
+
+    stats = OrganizationPeriodStats.objects.filter(period=period, period_start__gte=start)
+    if organization is not None:
+        stats = stats.filter(organization=organization)
+    return stats
+
+
+def period_totals(period, start, organization=None):
+    """
+    Carreras completadas, ingresos y comisiones desde `start`
+
+    Returns:
+        dict: total_rides, total_revenue, total_commission
+    """
+    totals = organization_period_stats(period, start, organization).aggregate(
+        total_rides=Sum('completed_rides'),
+        total_revenue=Sum('revenue'),
+        total_commission=Sum('commission'),
+    )
+    return {
+        'total_rides': totals['total_rides'] or 0,
+        'total_revenue': totals['total_revenue'] or Decimal('0.00'),
+        'total_commission': totals['total_commission'] or Decimal('0.00'),
+    }
+
+
+# ============================================
+# RECONSTRUCCIÓN Y CONCILIACIÓN
+# ============================================
+
+def rebuild_driver_stats():
+    """
+    Recalcula todos los acumulados de conductores desde Ride (migración o reparación)
+
+    Returns:
+        int: filas escritas
+    """
+    from .models import DriverDailyStats, Ride
+
+    rows = (
+        Ride.objects.filter(driver__isnull=False, status__in=FINAL_STATUSES)
+        .annotate(day=TruncDate('created_at'))
+        .values('driver_id', 'organization_id', 'day')
+        .annotate(
+            completed=Count('id', filter=Q(status='completed')),
+            canceled=Count('id', filter=Q(status='canceled')),
+            earnings=Sum('price', filter=Q(status='completed')),
+        )
+        .order_by()
+    )
+    stats = [
+        DriverDailyStats(
+            driver_id=row['driver_id'], organization_id=row['organization_id'], date=row['day'],
+            completed_rides=row['completed'], canceled_rides=row['canceled'],
+            earnings=row['earnings'] or 0,
+        )
+        for row in rows.iterator()
+    ]
+    with transaction.atomic():
+        DriverDailyStats.objects.all().delete()
+        DriverDailyStats.objects.bulk_create(stats, batch_size=500)
+    logger.info(f"📊 Acumulados de conductores recalculados: {len(stats)} filas")
+    return len(stats)
+
+
+def _month_starts(first, last):
+    month = first.replace(day=1)
+    while month <= last:
+        yield month
+        month = (month + timedelta(days=32)).replace(day=1)
+
+
+def rebuild_stats_buckets(since=None):
+    """
+    Recalcula los RideStatsBucket desde Ride, un mes por vez
+
+    Cada mes es una consulta agrupada corta sobre el rango de created_at (y
+    una transacción corta para reemplazar sus filas): no hay una sola
+    consulta larga sobre toda la tabla de carreras.
+
+    Args:
+        since: date desde la cual recalcular (None = desde la primera carrera)
+
+    Returns:
+        int: filas escritas
+    """
+    from .models import Ride, RideStatsBucket
+
+    finished = Ride.objects.filter(status__in=FINAL_STATUSES).exclude(driver__isnull=True, organization__isnull=True)
+    first = finished.order_by('created_at').values_list('created_at', flat=True).first()
+    if first is None:
+        return 0
+    first = max(timezone.localtime(first).date(), since) if since else timezone.localtime(first).date()
+
+    written = 0
+    for month in _month_starts(first, timezone.localdate()):
+        start = timezone.make_aware(datetime.combine(month, time()))
+        end = timezone.make_aware(datetime.combine((month + timedelta(days=32)).replace(day=1), time()))
+        buckets = {}
+        for ride in (finished.filter(created_at__gte=start, created_at__lt=end)
+                     .only(*_TRACKED_FIELDS).iterator(chunk_size=2000)):
+            c = _contribution(ride)
+            for granularity, bucket_start in (('hour', c.hour), ('day', c.day_start)):
+                key = (granularity, bucket_start, c.organization_id, c.driver_id)
+                row = buckets.setdefault(key, [0, 0, ZERO, ZERO])
+                row[0 if c.status == 'completed' else 1] += 1
+                row[2] += c.price
+                row[3] += c.commission
+        with transaction.atomic():
+            RideStatsBucket.objects.filter(bucket_start__gte=start, bucket_start__lt=end).delete()
+            RideStatsBucket.objects.bulk_create([
+                RideStatsBucket(
+                    granularity=granularity, bucket_start=bucket_start,
+                    organization_id=organization_id, driver_id=driver_id,
+                    completed_rides=completed, canceled_rides=canceled, revenue=revenue, commission=commission,
+                )
+                for (granularity, bucket_start, organization_id, driver_id), (completed, canceled, revenue, commission)
+                in buckets.items()
+            ], batch_size=500)
+        written += len(buckets)
+    logger.info(f"📊 Buckets de estadísticas recalculados: {written} filas")
+    return written
+
+
+def _expected_period_rows(period):
+    """{(organization_id, period_start): (completadas, canceladas, ingresos, comisión)} desde Ride"""
+    from .models import Ride
+
+    trunc = TruncDate('created_at') if period == 'day' else TruncMonth('created_at')
+    rows = (
+        Ride.objects.filter(organization__isnull=False, status__in=FINAL_STATUSES)
+        .annotate(start=trunc)
+        .values('organization_id', 'start')
+        .annotate(
+            completed=Count('id', filter=Q(status='completed')),
+            canceled=Count('id', filter=Q(status='canceled')),
+            revenue=Sum('price', filter=Q(status='completed')),
+            commission=Sum('commission_amount', filter=Q(status='completed')),
+        )
+        .order_by()
+    )
+    expected = {}
+    for row in rows.iterator():
+        start = row['start']
+        # TruncMonth devuelve datetime (con zona horaria local)
+        start = timezone.localtime(start).date() if hasattr(start, 'hour') else start
+        expected[(row['organization_id'], start)] = (
+            row['completed'], row['canceled'], row['revenue'] or ZERO, row['commission'] or ZERO,
+        )
+    return expected
+
+
+def reconcile_organization_stats(fix=True):
+    """
+    Compara los contadores de Organization y OrganizationPeriodStats con Ride
+
+    Una consulta agrupada por nivel (organización, día, mes); solo se
+    reescriben las filas que difieren.
+
+    Args:
+        fix: False para solo reportar
+
+    Returns:
+        list[str]: diferencias encontradas
+    """
+    from .models import Organization, OrganizationPeriodStats, Ride
+
+    drift = []
+    empty = (0, 0, ZERO, ZERO)
+
+    totals = {
+        row['organization_id']: (row['rides'], row['revenue'] or ZERO, row['commission'] or ZERO)
+        for row in Ride.objects.filter(organization__isnull=False, status='completed')
+        .values('organization_id')
+        .annotate(rides=Count('id'), revenue=Sum('price'), commission=Sum('commission_amount'))
+        .order_by()
+    }
+    for org_id, *found in Organization.objects.values_list('id', 'total_rides', 'total_revenue', 'total_commission'):
+        expected = totals.get(org_id, empty[1:])
+        if tuple(found) == expected:
+            continue
+        drift.append(f"organización {org_id}: {tuple(found)} → {expected}")
+        if fix:
+            Organization.objects.filter(pk=org_id).update(
+                total_rides=expected[0], total_revenue=expected[1], total_commission=expected[2],
+            )
+
+    fields = ('completed_rides', 'canceled_rides', 'revenue', 'commission')
+    for period in ('day', 'month'):
+        expected_rows = _expected_period_rows(period)
+        current = {
+            (row.organization_id, row.period_start): row
+            for row in OrganizationPeriodStats.objects.filter(period=period)
+        }
+        for key in set(expected_rows) | set(current):
+            expected = expected_rows.get(key, empty)
+            row = current.get(key)
+            found = tuple(getattr(row, f) for f in fields) if row else empty
+            if found == expected:
+                continue
+            drift.append(f"{period} {key[0]} {key[1]}: {found} → {expected}")
+            if not fix:
+                continue
+            if row:
+                OrganizationPeriodStats.objects.filter(pk=row.pk).update(**dict(zip(fields, expected)))
+            else:
+                OrganizationPeriodStats.objects.create(
+                    organization_id=key[0], period=period, period_start=key[1], **dict(zip(fields, expected))
+                )
+
+    if drift:
+        logger.warning(f"⚠️ Estadísticas de organizaciones con diferencias: {len(drift)}")
+    return drift
+
+
+# ============================================
+# SEÑALES DE Ride
+# ============================================
+
+def _ride_initialized(sender, instance, **kwargs):
+    # Con campos diferidos (.only()/.defer()) leerlos aquí haría una consulta:
+    # el aporte se lee de la base en pre_save si hace falta
+    if not instance.get_deferred_fields().intersection(_TRACKED_ATTNAMES):
+        instance._ride_stats = _contribution(instance)
+
+
+def _ride_saving(sender, instance, raw=False, **kwargs):
+    if raw or instance._state.adding or hasattr(instance, '_ride_stats'):
+        return
+    previous = sender.objects.filter(pk=instance.pk).only(*_TRACKED_FIELDS).first()
+    instance._ride_stats = _contribution(previous) if previous else None
+
+
+def _ride_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    update_fields = kwargs.get('update_fields')
+    if update_fields and not set(_TRACKED_FIELDS).intersection(update_fields):
+        return
+    old = None if created else getattr(instance, '_ride_stats', None)
+    new = _contribution(instance)
+    apply_change(old, new)
+    instance._ride_stats = new
+
+
+def _ride_deleted(sender, instance, **kwargs):
+    old = getattr(instance, '_ride_stats', None) or _contribution(instance)
+    apply_change(old, None)
+
+
+post_init.connect(_ride_initialized, sender='taxis.Ride', dispatch_uid='ride_stats_init')
+pre_save.connect(_ride_saving, sender='taxis.Ride', dispatch_uid='ride_stats_pre_save')
+post_save.connect(_ride_saved, sender='taxis.Ride', dispatch_uid='ride_stats_saved')
+post_delete.connect(_ride_deleted, sender='taxis.Ride', dispatch_uid='ride_stats_deleted')
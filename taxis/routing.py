@@ -1,9 +1,11 @@
 from django.urls import re_path
-from taxis.consumers import AudioConsumer, ChatConsumer, RidesConsumer
+from taxis.consumers import AudioConsumer, ChatConsumer, LocationConsumer, RidesConsumer
 
 websocket_urlpatterns = [
-    re_path(r"ws/audio/conductores/$", AudioConsumer.as_asgi()),  # Audio + Ubicación
+    re_path(r"ws/audio/conductores/$", AudioConsumer.as_asgi()),  # Audio + Ubicación (canal general de la cooperativa)
+    re_path(r"ws/audio/grupos/(?P<talk_group_id>\d+)/$", AudioConsumer.as_asgi()),  # Grupos de conversación
     re_path(r"ws/chat/(?P<user_id>\w+)/$", ChatConsumer.as_asgi()),  # Chat con user_id (Android)
     re_path(r"ws/chat/$", ChatConsumer.as_asgi()),  # Chat sin user_id (Web con sesión)
     re_path(r"ws/rides/$", RidesConsumer.as_asgi()),  # Actualizaciones de carreras en tiempo real
+    re_path(r"ws/locations/$", LocationConsumer.as_asgi()),  # Ubicaciones por organización y viewport
 ]
@@ -130,9 +130,9 @@ class RideDestinationSerializer(serializers.ModelSerializer):
         model = RideDestination
         fields = [
             'id', 'destination', 'destination_latitude',
-            'destination_longitude', 'order'
+            'destination_longitude', 'address', 'order'
         ]
-        read_only_fields = ['id']
+        read_only_fields = ['id', 'address']
 
 
 # =====================================================
@@ -149,7 +149,7 @@ class RideListSerializer(serializers.ModelSerializer):
     class Meta:
         model = Ride
         fields = [
-            'id', 'customer_name', 'driver_name', 'origin',
+            'id', 'customer_name', 'driver_name', 'origin', 'origin_address',
             'status', 'status_display', 'price', 'created_at',
             'start_time', 'end_time', 'destinations_count'
         ]
@@ -171,7 +171,7 @@ class RideDetailSerializer(serializers.ModelSerializer):
     driver = UserSerializer(read_only=True)
     destinations = RideDestinationSerializer(many=True, read_only=True)
     status_display = serializers.CharField(source='get_status_display', read_only=True)
-    origin_address = serializers.SerializerMethodField()
+    origin_address = serializers.CharField(source='display_origin', read_only=True)
     
     class Meta:
         model = Ride
@@ -182,13 +182,6 @@ class RideDetailSerializer(serializers.ModelSerializer):
             'created_at', 'notified'
         ]
         read_only_fields = ['id', 'created_at', 'notified']
-    
-    def get_origin_address(self, obj):
-        """Obtener dirección de origen si está disponible"""
-        try:
-            return obj.get_origin_address()
-        except:
-            return obj.origin
 
 
 class RideCreateSerializer(serializers.ModelSerializer):
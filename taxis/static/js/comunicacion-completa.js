@@ -22,6 +22,8 @@ let Maps_API_KEY;
 // Almacenamiento persistente del historial de chat por conductor
 // Estructura: { driverId: [{ message, sender_name, timestamp, is_sent, ... }] }
 let chatHistoryStorage = {};
+// Cursores del historial paginado por conductor: { driverId: { before, after, hasMore } }
+let chatHistoryCursors = {};
 let currentChatDriverId = null; // ID del conductor con el que estamos chateando actualmente
 
 // Variables de reconexión WebSocket
@@ -570,6 +572,76 @@ function addMessageToHistory(driverId, message) {
     saveChatHistoryToStorage(driverId, chatHistoryStorage[driverId]);
 }
 
+// Función para cargar los cursores del historial (memoria o localStorage)
+function loadChatHistoryCursors(driverId) {
+    if (!chatHistoryCursors[driverId]) {
+        try {
+            chatHistoryCursors[driverId] = JSON.parse(localStorage.getItem(`chat_history_cursors_${driverId}`)) || {};
+        } catch (error) {
+            console.error('❌ Error cargando cursores del historial:', error);
+            chatHistoryCursors[driverId] = {};
+        }
+    }
+    return chatHistoryCursors[driverId];
+}
+
+// Función para guardar los cursores junto con el historial
+function saveChatHistoryCursors(driverId, cursors) {
+    chatHistoryCursors[driverId] = cursors;
+    try {
+        localStorage.setItem(`chat_history_cursors_${driverId}`, JSON.stringify(cursors));
+    } catch (error) {
+        console.error('❌ Error guardando cursores del historial:', error);
+    }
+}
+
+// Una página del historial: sin parámetros los últimos mensajes,
+// { before } la página anterior, { after } solo lo nuevo
+async function fetchChatHistoryPage(driverId, params = {}) {
+    const query = new URLSearchParams(params).toString();
+    const response = await fetch(`/api/chat_history/${driverId}/${query ? `?${query}` : ''}`);
+    if (!response.ok) {
+        throw new Error(`No se pudo cargar el historial (HTTP ${response.status})`);
+    }
+    return response.json();
+}
+
+// Cargar la página anterior del historial (botón "Cargar mensajes anteriores")
+async function loadOlderChatHistory(driverId) {
+    const cursors = loadChatHistoryCursors(driverId);
+    if (!cursors.hasMore || !cursors.before) {
+        return;
+    }
+    const chatLog = document.getElementById('chat-log');
+    const button = document.getElementById('load-older-messages');
+    if (button) {
+        button.disabled = true;
+        button.textContent = 'Cargando...';
+    }
+
+    try {
+        const page = await fetchChatHistoryPage(driverId, { before: cursors.before });
+        saveChatHistoryCursors(driverId, { ...cursors, before: page.before, hasMore: page.has_more });
+        const messages = page.messages.concat(loadChatHistoryFromStorage(driverId));
+        saveChatHistoryToStorage(driverId, messages);
+        console.log(`📜 ${page.messages.length} mensajes anteriores cargados para conductor ${driverId}`);
+
+        if (currentChatDriverId == driverId && chatLog) {
+            // Mantener a la vista lo que el usuario estaba leyendo
+            const previousHeight = chatLog.scrollHeight;
+            const previousTop = chatLog.scrollTop;
+            renderMessages(messages);
+            chatLog.scrollTop = chatLog.scrollHeight - previousHeight + previousTop;
+        }
+    } catch (error) {
+        console.error('❌ Error cargando mensajes anteriores:', error);
+        if (button) {
+            button.disabled = false;
+            button.textContent = 'Reintentar';
+        }
+    }
+}
+
 // Función para renderizar mensajes en el chat log
 function renderMessages(messages) {
     console.log(`\n📝 ========================================`);
@@ -610,6 +682,18 @@ function renderMessages(messages) {
         return;
     }
         
+    // Botón para la página anterior si el servidor tiene más mensajes
+    if (currentChatDriverId && loadChatHistoryCursors(currentChatDriverId).hasMore) {
+        const olderButton = document.createElement('button');
+        olderButton.id = 'load-older-messages';
+        olderButton.type = 'button';
+        olderButton.textContent = '⬆️ Cargar mensajes anteriores';
+        olderButton.style.cssText = 'display: block; margin: 0 auto 10px; padding: 6px 14px; border: none; border-radius: 12px; background: #e9ecef; color: #333; font-size: 13px; cursor: pointer;';
+        const driverId = currentChatDriverId;
+        olderButton.addEventListener('click', () => loadOlderChatHistory(driverId));
+        chatLog.appendChild(olderButton);
+    }
+        
         // Agregar mensajes al chat
     console.log(`📝 Renderizando ${messages.length} mensajes en el chat log...`);
     messages.forEach((msg, index) => {
@@ -792,96 +876,39 @@ async function loadChatHistory(driverId) {
             console.log(`⏳ Mostrando indicador de carga`);
         }
 
-        // Luego cargar desde el servidor para obtener mensajes nuevos/actualizados
+        // Luego sincronizar con el servidor. El historial viene paginado por cursor
+        // (ver taxis.chat_history): si ya hay historial guardado solo se pide lo nuevo
         try {
-            const response = await fetch(`/api/chat_history/${driverId}/`);
-            if (!response.ok) {
-                console.warn('⚠️ No se pudo cargar el historial del servidor');
-                // Si no se puede cargar del servidor pero tenemos mensajes guardados, mantener esos
-                if (storedMessages.length > 0) {
-                    console.log('📂 Manteniendo mensajes guardados localmente');
-                    return;
+            const cursors = loadChatHistoryCursors(driverId);
+            let serverMessages = null;
+
+            if (cursors.after && storedMessages.length > 0) {
+                const page = await fetchChatHistoryPage(driverId, { after: cursors.after });
+                if (page.has_more) {
+                    // Demasiados mensajes nuevos para una página: volver a la última página
+                    console.log('⚠️ Historial guardado desactualizado, recargando la última página');
+                } else {
+                    // Los mensajes sin id son ecos locales (enviados o recibidos en vivo):
+                    // el servidor los devuelve ahora con su id
+                    const saved = storedMessages.filter(msg => msg.id != null);
+                    const known = new Set(saved.map(msg => msg.id));
+                    serverMessages = saved.concat(page.messages.filter(msg => !known.has(msg.id)));
+                    saveChatHistoryCursors(driverId, { ...cursors, after: page.after });
+                    console.log(`🔄 Historial sincronizado: ${page.messages.length} mensajes nuevos`);
                 }
-                // Si no hay mensajes guardados y falla el servidor, mostrar error
-                chatLog.innerHTML = `
-                    <div style="text-align: center; padding: 20px; color: #e74c3c;">
-                        <strong>⚠️ Error cargando historial</strong><br>
-                        <small>No se pudo conectar al servidor</small>
-                    </div>
-                `;
-                return;
             }
 
-            const payload = await response.json();
-            console.log(`📦 Payload completo del servidor:`, payload);
-            
-            // El servidor puede devolver {messages: [...]} o directamente un array
-            let serverMessages = [];
-            if (Array.isArray(payload)) {
-                serverMessages = payload;
-            } else if (payload.messages && Array.isArray(payload.messages)) {
-                serverMessages = payload.messages;
-            } else {
-                console.warn('⚠️ Formato de respuesta inesperado:', payload);
-                serverMessages = [];
-            }
-            
-            console.log(`✅ Historial del servidor: ${serverMessages.length || 0} mensajes`);
-            if (serverMessages.length > 0) {
-                console.log(`   Primer mensaje:`, serverMessages[0]);
-                console.log(`   Último mensaje:`, serverMessages[serverMessages.length - 1]);
+            if (serverMessages === null) {
+                const page = await fetchChatHistoryPage(driverId);
+                serverMessages = page.messages;
+                saveChatHistoryCursors(driverId, { before: page.before, after: page.after, hasMore: page.has_more });
+                console.log(`✅ Historial del servidor: ${serverMessages.length} mensajes (hay anteriores: ${page.has_more})`);
             }
-            
-            // Si hay mensajes del servidor, actualizar el almacenamiento
-            if (serverMessages.length > 0) {
-                // IMPORTANTE: Guardar historial completo del servidor (es la fuente de verdad)
-                saveChatHistoryToStorage(driverId, serverMessages);
-                
-                // Verificar si ya hay mensajes renderizados (usar la variable guardada)
-                const hasExisting = window._hasExistingMessages || false;
-                const currentMessages = chatLog.querySelectorAll('.message');
-                
-                if (hasExisting && currentMessages.length > 0) {
-                    // Si ya hay mensajes, solo actualizar si el servidor tiene más mensajes
-                    console.log(`✅ Ya hay ${currentMessages.length} mensajes renderizados. El servidor tiene ${serverMessages.length} mensajes.`);
-                    if (serverMessages.length > currentMessages.length) {
-                        console.log(`📝 Actualizando con ${serverMessages.length} mensajes del servidor (más que los existentes)`);
-                        renderMessages(serverMessages);
-                    } else {
-                        console.log(`✅ Manteniendo mensajes existentes (servidor no tiene más mensajes)`);
-                    }
-                } else {
-                    // Si no hay mensajes renderizados, renderizar los del servidor
-                    console.log(`✅ Renderizando ${serverMessages.length} mensajes del servidor`);
-                    renderMessages(serverMessages);
-                }
-                
-                // Verificar que los mensajes se renderizaron
-                setTimeout(() => {
-                    const renderedMessages = chatLog.querySelectorAll('.message');
-                    console.log(`   ✅ Mensajes finales en DOM: ${renderedMessages.length}`);
-                    if (renderedMessages.length === 0 && serverMessages.length > 0) {
-                        console.error('❌ ERROR: Los mensajes no se renderizaron correctamente!');
-                    }
-                }, 100);
-            } else if (storedMessages.length > 0) {
-                // Si el servidor no tiene mensajes pero tenemos guardados, mostrar los guardados solo si no hay mensajes renderizados
-                const currentMessages = chatLog.querySelectorAll('.message');
-                if (currentMessages.length === 0) {
-                    console.log('📂 Mostrando mensajes guardados localmente (servidor vacío, no hay mensajes renderizados)');
-                    renderMessages(storedMessages);
-                } else {
-                    console.log('✅ Manteniendo mensajes renderizados (servidor vacío pero hay mensajes en DOM)');
-                }
-            } else {
-                // No hay mensajes ni en servidor ni guardados
-                const currentMessages = chatLog.querySelectorAll('.message');
-                if (currentMessages.length === 0) {
-                    console.log('📭 No hay mensajes en servidor ni guardados localmente ni renderizados');
-                    renderMessages([]);
-                } else {
-                    console.log('✅ Manteniendo mensajes renderizados');
-                }
+
+            // El servidor es la fuente de verdad
+            saveChatHistoryToStorage(driverId, serverMessages);
+            if (currentChatDriverId == driverId) {
+                renderMessages(serverMessages);
             }
 
         } catch (fetchError) {
@@ -0,0 +1,167 @@
+"""
+Grupos de conversación del walkie-talkie
+
+Cada cooperativa tiene su canal general y puede crear grupos por zona, turno
+o privados con la central. Cada grupo es un grupo propio del channel layer
+(`audio_tg_<id>`), así que el audio solo se envía a los sockets de sus
+miembros: el costo de difusión depende del tamaño del grupo y no de la
+cantidad total de conductores conectados.
+
+Rutas WebSocket:
+    ws/audio/conductores/          Canal general de la cooperativa del usuario
+                                   (superadmin: ?organization=<id>)
+    ws/audio/grupos/<id>/          Grupo de conversación (solo miembros)
+"""
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+logger = logging.getLogger(__name__)
+
+# Sala del canal general para usuarios sin cooperativa (superadmin, anónimos)
+GLOBAL_AUDIO_GROUP = 'audio_conductores'
+
+
+def organization_audio_group(organization_id):
+    """Grupo del channel layer del canal general de una cooperativa"""
+    if not organization_id:
+        return GLOBAL_AUDIO_GROUP
+    return f'audio_org_{organization_id}'
+
+
+def general_audio_group(user, requested_organization=None):
+    """
+    Sala del canal general de un usuario
+
+    El superadmin no pertenece a una cooperativa: elige la sala con
+    `requested_organization` (?organization=<id>). Nadie de las cooperativas
+    escucha GLOBAL_AUDIO_GROUP, así que no se lo manda ahí.
+
+    Returns:
+        str | None: Grupo del channel layer, o None si el superadmin no indicó
+        una cooperativa válida
+    """
+    from .models import Organization
+
+    if not (user and user.is_authenticated and user.is_superuser):
+        return organization_audio_group(user.organization_id if user and user.is_authenticated else None)
+
+    organization_id = user.organization_id
+    if requested_organization:
+        if not str(requested_organization).isdigit():
+            return None
+        organization_id = Organization.objects.filter(id=requested_organization).values_list('id', flat=True).first()
+    if not organization_id:
+        return None
+    return organization_audio_group(organization_id)
+
+
+def can_join(user, talk_group):
+    """
+    Verifica si un usuario puede escuchar/hablar en un grupo
+
+    - Superadmin: cualquier grupo
+    - Admin (central) de la cooperativa: todos los grupos de su cooperativa
+    - Grupo de tipo 'organization': todos los usuarios de la cooperativa
+    - Resto: solo miembros explícitos
+    """
+    if not user or not user.is_authenticated or not talk_group.is_active:
+        return False
+    if user.is_superuser:
+        return True
+    if user.organization_id != talk_group.organization_id:
+        return False
+    if user.role == 'admin' or talk_group.kind == 'organization':
+        return True
+    return talk_group.memberships.filter(user_id=user.id).exists()
+
+
+def can_manage(user, talk_group):
+    """Solo la central de la cooperativa (o el superadmin) administra los miembros"""
+    if user.is_superuser:
+        return True
+    return user.role == 'admin' and user.organization_id == talk_group.organization_id
+
+
+def user_talk_groups(user):
+    """Grupos activos a los que el usuario puede unirse"""
+    from django.db.models import Q
+    from .models import TalkGroup
+
+    groups = TalkGroup.objects.filter(is_active=True)
+    if user.is_superuser:
+        return groups
+    groups = groups.filter(organization_id=user.organization_id)
+    if user.role == 'admin':
+        return groups
+    return groups.filter(Q(kind='organization') | Q(memberships__user_id=user.id)).distinct()
+
+
+def add_members(talk_group, user_ids):
+    """
+    Agrega miembros (solo usuarios de la misma cooperativa)
+
+    Returns:
+        int: Número de usuarios válidos procesados
+    """
+    from .models import AppUser, TalkGroupMembership
+
+    valid_ids = list(
+        AppUser.objects.filter(id__in=user_ids, organization_id=talk_group.organization_id)
+        .values_list('id', flat=True)
+    )
+    TalkGroupMembership.objects.bulk_create(
+        [TalkGroupMembership(talk_group=talk_group, user_id=user_id) for user_id in valid_ids],
+        ignore_conflicts=True,
+    )
+    return len(valid_ids)
+
+
+def remove_members(talk_group, user_ids):
+    """
+    Quita miembros y desconecta sus sockets del grupo
+
+    Returns:
+        int: Número de membresías eliminadas
+    """
+    deleted, _ = talk_group.memberships.filter(user_id__in=user_ids).delete()
+
+    channel_layer = get_channel_layer()
+    if channel_layer is not None:
+        for user_id in user_ids:
+            try:
+                async_to_sync(channel_layer.group_send)(talk_group.channel_group, {
+                    'type': 'membership_revoked',
+                    'user_id': int(user_id),
+                })
+            except Exception as e:
+                logger.error(f"❌ Error notificando baja del grupo {talk_group.id}: {e}")
+    return deleted
+
+
+def serialize_talk_group(talk_group):
+    return {
+        'id': talk_group.id,
+        'name': talk_group.name,
+        'kind': talk_group.kind,
+        'organization_id': talk_group.organization_id,
+        'websocket_path': f'/ws/audio/grupos/{talk_group.id}/',
+    }
+
+
+def can_access_room(user, room):
+    """Verifica si el usuario puede escuchar una sala (grupo del channel layer)"""
+    from .models import TalkGroup
+
+    if not user or not user.is_authenticated:
+        return False
+    if user.is_superuser:
+        return True
+    if room.startswith('audio_tg_'):
+        talk_group_id = room[len('audio_tg_'):]
+        if not talk_group_id.isdigit():
+            return False
+        talk_group = TalkGroup.objects.filter(id=talk_group_id).first()
+        return talk_group is not None and can_join(user, talk_group)
+    return bool(user.organization_id) and room == organization_audio_group(user.organization_id)
@@ -0,0 +1,287 @@
+"""
+Cola de tareas en segundo plano con reintentos y backoff
+
+request_ride enviaba Telegram (grupo y conductor), WhatsApp, push PWA y
+geocodificaba antes de responder al cliente: la respuesta esperaba varias
+APIs externas y un fallo de cualquiera se perdía. Ahora la vista guarda la
+carrera, encola `ride_created` y responde; las notificaciones salen desde la
+cola, cada una como tarea propia con sus reintentos.
+
+- Backend Redis (el mismo del channel layer): lista de tareas listas + sorted
+  set de reintentos programados. Varios workers pueden consumir a la vez.
+- Sin Redis (desarrollo con InMemoryChannelLayer) se usa una cola en memoria.
+- Worker: `python manage.py run_jobs`. Mientras TASK_QUEUE_INLINE_WORKER esté
+  activo, cada proceso web también atiende la cola en un hilo propio.
+- Una tarea que falla se reintenta con backoff exponencial (con jitter) hasta
+  `max_retries`; después queda en la lista de tareas muertas.
+
+Definir una tarea (en taxis/tasks.py):
+
+    @task('ride_created')
+    def ride_created(ride_id, source='web'):
+        ...
+
+Encolarla:
+
+    task_queue.enqueue_on_commit('ride_created', ride_id=ride.id)
+"""
+import heapq
+import itertools
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .floor_control import _channel_layer_redis_url
+
+logger = logging.getLogger(__name__)
+
+# Reintentos por defecto de una tarea antes de darla por muerta
+TASK_MAX_RETRIES = getattr(settings, 'TASK_QUEUE_MAX_RETRIES', 5)
+
+# Backoff: BASE * 2^(intento-1) segundos, hasta MAX
+BACKOFF_BASE_SECONDS = getattr(settings, 'TASK_QUEUE_BACKOFF_BASE', 2)
+BACKOFF_MAX_SECONDS = getattr(settings, 'TASK_QUEUE_BACKOFF_MAX', 300)
+
+# Atender la cola desde un hilo de cada proceso web (desactivar con un worker dedicado)
+TASK_QUEUE_INLINE_WORKER = getattr(settings, 'TASK_QUEUE_INLINE_WORKER', True)
+
+KEY_PREFIX = 'jobs:'
+READY_KEY = KEY_PREFIX + 'ready'
+DELAYED_KEY = KEY_PREFIX + 'delayed'
+DEAD_KEY = KEY_PREFIX + 'dead'
+
+# Tareas muertas que se conservan para inspección
+DEAD_MAX_ENTRIES = 1000
+
+# Mover a la lista de tareas listas los reintentos cuyo momento ya llegó (atómico)
+_PROMOTE_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, 100)
+for _, job in ipairs(due) do
+    redis.call('ZREM', KEYS[1], job)
+    redis.call('LPUSH', KEYS[2], job)
+end
+return #due
+"""
+
+_registry = {}
+
+
+class Task:
+    def __init__(self, name, func, max_retries):
+        self.name = name
+        self.func = func
+        self.max_retries = max_retries
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+
+def task(name, max_retries=TASK_MAX_RETRIES):
+    """Registra una función como tarea encolable"""
+    def decorator(func):
+        _registry[name] = Task(name, func, max_retries)
+        return _registry[name]
+    return decorator
+
+
+def backoff_delay(attempt):
+    """Segundos de espera antes del reintento número `attempt` (1, 2, ...)"""
+    delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempt - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+class LocalJobBackend:
+    """Cola en memoria del proceso (desarrollo / un solo worker)"""
+
+    def __init__(self):
+        self._heap = []   # (run_at, seq, job)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self.dead = []
+
+    def push(self, job, delay=0):
+        with self._cond:
+            heapq.heappush(self._heap, (time.time() + delay, next(self._seq), job))
+            self._cond.notify()
+
+    def pop(self, timeout):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if self._heap and self._heap[0][0] <= time.time():
+                    return heapq.heappop(self._heap)[2]
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                if self._heap:
+                    remaining = min(remaining, max(0, self._heap[0][0] - time.time()))
+                self._cond.wait(remaining)
+
+    def bury(self, job):
+        with self._cond:
+            self.dead.append(job)
+            del self.dead[:-DEAD_MAX_ENTRIES]
+
+    def size(self):
+        return len(self._heap)
+
+
+class RedisJobBackend:
+    """Cola en Redis, compartida por todos los procesos"""
+
+    def __init__(self, redis_url):
+        import redis
+
+        self._client = redis.from_url(redis_url, decode_responses=True)
+        self._promote = self._client.register_script(_PROMOTE_SCRIPT)
+
+    def push(self, job, delay=0):
+        data = json.dumps(job)
+        if delay > 0:
+            self._client.zadd(DELAYED_KEY, {data: time.time() + delay})
+        else:
+            self._client.lpush(READY_KEY, data)
+
+    def pop(self, timeout):
+        self._promote(keys=[DELAYED_KEY, READY_KEY], args=[time.time()])
+        item = self._client.brpop(READY_KEY, timeout=max(1, int(timeout)))
+        if item is None:
+            return None
+        return json.loads(item[1])
+
+    def bury(self, job):
+        pipe = self._client.pipeline()
+        pipe.lpush(DEAD_KEY, json.dumps(job))
+        pipe.ltrim(DEAD_KEY, 0, DEAD_MAX_ENTRIES - 1)
+        pipe.execute()
+
+    def size(self):
+        return self._client.llen(READY_KEY) + self._client.zcard(DELAYED_KEY)
+
+
+class TaskQueue:
+    """Encola tareas registradas y las ejecuta con reintentos"""
+
+    def __init__(self, backend=None, inline_worker=TASK_QUEUE_INLINE_WORKER):
+        self._backend = backend
+        self.inline_worker = inline_worker
+        self._worker = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.stats = {'enqueued': 0, 'succeeded': 0, 'retried': 0, 'dead': 0}
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            redis_url = _channel_layer_redis_url()
+            if redis_url:
+                self._backend = RedisJobBackend(redis_url)
+                logger.info("📬 Cola de tareas en Redis")
+            else:
+                self._backend = LocalJobBackend()
+                logger.info("📬 Cola de tareas en memoria (sin Redis)")
+        return self._backend
+
+    def enqueue(self, name, delay=0, **payload):
+        """
+        Encola una tarea registrada
+
+        Returns:
+            dict: La tarea encolada (id, name, payload, attempt)
+        """
+        if name not in _registry:
+            raise KeyError(f'Tarea no registrada: {name}')
+        job = {'id': uuid.uuid4().hex, 'name': name, 'payload': payload, 'attempt': 0}
+        self.backend.push(job, delay)
+        self.stats['enqueued'] += 1
+        if self.inline_worker:
+            self._ensure_worker()
+        return job
+
+    def enqueue_on_commit(self, name, **payload):
+        """Encola la tarea cuando la transacción actual confirme (nunca antes de que existan los datos)"""
+        transaction.on_commit(lambda: self.enqueue(name, **payload))
+
+    def run_job(self, job):
+        """
+        Ejecuta una tarea; si falla la reprograma con backoff o la entierra
+
+        Returns:
+            bool: True si terminó bien
+        """
+        registered = _registry.get(job['name'])
+        if registered is None:
+            logger.error(f"❌ Tarea desconocida descartada: {job['name']}")
+            self.backend.bury(job)
+            self.stats['dead'] += 1
+            return False
+
+        try:
+            registered.func(**job['payload'])
+        except Exception as e:
+            job['attempt'] += 1
+            job['error'] = str(e)
+            if job['attempt'] > registered.max_retries:
+                logger.error(f"❌ Tarea {job['name']} ({job['id']}) falló {job['attempt']} veces: {e}")
+                self.backend.bury(job)
+                self.stats['dead'] += 1
+            else:
+                delay = backoff_delay(job['attempt'])
+                logger.warning(f"⚠️ Tarea {job['name']} falló ({e}); reintento {job['attempt']} en {delay:.0f}s")
+                self.backend.push(job, delay)
+                self.stats['retried'] += 1
+            return False
+
+        self.stats['succeeded'] += 1
+        return True
+
+    def work(self, burst=False, poll_timeout=5):
+        """
+        Atiende la cola hasta stop() (o hasta vaciarla si burst=True)
+
+        Returns:
+            int: Número de tareas ejecutadas
+        """
+        processed = 0
+        while not self._stop.is_set():
+            try:
+                job = self.backend.pop(0 if burst else poll_timeout)
+            except Exception as e:
+                logger.error(f"❌ Error leyendo la cola de tareas: {e}")
+                if burst:
+                    break
+                self._stop.wait(poll_timeout)
+                continue
+            if job is None:
+                if burst:
+                    break
+                continue
+            try:
+                self.run_job(job)
+            finally:
+                close_old_connections()
+            processed += 1
+        return processed
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._stop.clear()
+            self._worker = threading.Thread(target=self.work, name='task-queue', daemon=True)
+            self._worker.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+# Instancia global
+task_queue = TaskQueue()
@@ -0,0 +1,164 @@
+"""
+Tareas en segundo plano (ver taxis.task_queue)
+
+`ride_created` arma los mensajes de una carrera nueva y encola un envío por
+canal (grupo de Telegram, Telegram / WhatsApp / push al conductor más
+cercano): si un canal falla solo ese envío se reintenta, sin duplicar los
+demás.
+"""
+import logging
+
+from .task_queue import task, task_queue
+
+logger = logging.getLogger(__name__)
+
+
+class DeliveryError(Exception):
+    """Fallo transitorio de un envío; la cola lo reintenta"""
+
+
+@task('resolve_ride_addresses')
+def resolve_ride_addresses_task(ride_id):
+    from .ride_addresses import resolve_ride_addresses
+
+    resolve_ride_addresses(ride_id)
+
+
+@task('ride_created')
+def ride_created(ride_id, source='web'):
+    """Geocodifica la carrera y encola sus notificaciones"""
+    from .models import Ride
+    from .ride_addresses import resolve_ride_addresses
+    from .views import TELEGRAM_CHAT_ID_GRUPO_TAXISTAS, obtener_taxista_mas_cercano
+
+    resolve_ride_addresses(ride_id)
+    ride = Ride.objects.select_related('customer', 'organization').filter(id=ride_id).first()
+    if ride is None:
+        logger.warning(f"⚠️ Carrera {ride_id} no existe; notificaciones descartadas")
+        return
+
+    customer = ride.customer
+    direccion_legible = ride.display_origin
+    destinos = [d.destination for d in ride.destinations.all().order_by('order')]
+    lista_destinos = "\n".join([f"➡️ Destino {i+1}: {d}" for i, d in enumerate(destinos)])
+    price = ride.price or 0
+
+    titulo = "Nueva carrera solicitada (WhatsApp)" if source == 'whatsapp' else "Nueva carrera solicitada"
+    mensaje_grupo = (
+        f"🚕 <b>{titulo}</b>\n"
+        f"📍 Origen: {direccion_legible}\n"
+        f"{lista_destinos}\n"
+        f"👤 Cliente: {customer.get_full_name()}\n"
+        + (f"📱 Teléfono: {customer.phone_number}\n" if source == 'whatsapp' else "")
+        + f"💰 Precio estimado: ${price:.2f}"
+    )
+    botones = [[
+        {"text": "✅ Aceptar carrera", "callback_data": f"aceptar_{ride.id}"},
+        {"text": "🗺 Ver en Google Maps", "url": f"https://maps.google.com/?q={ride.origin_latitude},{ride.origin_longitude}"}
+    ]]
+
+    # Se arman todos los envíos antes de encolarlos: si algo falla aquí y la
+    # tarea se reintenta, no se duplica ningún mensaje
+    envios = [('send_telegram', {'chat_id': TELEGRAM_CHAT_ID_GRUPO_TAXISTAS, 'mensaje': mensaje_grupo, 'botones': botones})]
+
+    # Notificar al taxista más cercano de la misma organización
+    taxista_cercano = obtener_taxista_mas_cercano(
+        ride.origin_latitude, ride.origin_longitude,
+        organization=ride.organization
+    )
+    if taxista_cercano:
+        envios.extend(_driver_notifications(ride, taxista_cercano.user, direccion_legible, lista_destinos, price))
+
+    for name, payload in envios:
+        task_queue.enqueue(name, **payload)
+
+
+def _driver_notifications(ride, conductor, direccion_legible, lista_destinos, price):
+    """Envíos al conductor más cercano (Telegram, WhatsApp y push PWA)"""
+    customer = ride.customer
+    envios = []
+
+    if conductor.telegram_chat_id:
+        mensaje_telegram = (
+            f"📣 Hola {conductor.get_full_name()}, hay una carrera cerca de ti:\n"
+            f"🛫 Desde: {direccion_legible}\n"
+            f"👤 Cliente: {customer.get_full_name()}"
+        )
+        envios.append(('send_telegram', {'chat_id': conductor.telegram_chat_id, 'mensaje': mensaje_telegram}))
+
+    if conductor.phone_number:
+        mensaje_whatsapp = (
+            f"🚕 *Nueva carrera cerca de ti!*\n\n"
+            f"📍 *Origen:* {direccion_legible}\n"
+            f"{lista_destinos}\n"
+            f"👤 *Cliente:* {customer.get_full_name()}\n"
+            f"📱 *Teléfono:* {customer.phone_number}\n"
+            f"💰 *Precio:* ${price:.2f}\n\n"
+            f"🆔 *Carrera #*{ride.id}\n\n"
+            f"Para aceptar, responde:\n"
+            f"*ACEPTAR {ride.id}*"
+        )
+        envios.append(('send_whatsapp', {'numero': conductor.phone_number, 'mensaje': mensaje_whatsapp}))
+
+    envios.append(('send_driver_push', {
+        'conductor_id': conductor.id,
+        'titulo': '🚕 Nueva carrera cerca de ti!',
+        'mensaje': f'Origen: {direccion_legible}\nPrecio: ${price:.2f}',
+        'datos': {
+            'ride_id': ride.id,
+            'origin': direccion_legible,
+            'price': float(price),
+            'url': '/available-rides/'
+        },
+    }))
+    return envios
+
+
+@task('send_telegram')
+def send_telegram(chat_id, mensaje, botones=None):
+    from .views import enviar_telegram
+
+    response = enviar_telegram(chat_id, mensaje, botones)
+    # 4xx (chat inexistente, bot bloqueado) no se arregla reintentando
+    if response.status_code == 429 or response.status_code >= 500:
+        raise DeliveryError(f'Telegram respondió {response.status_code}')
+
+
+@task('send_whatsapp')
+def send_whatsapp(numero, mensaje):
+    from .whatsapp_agent_ai import whatsapp_agent_ai
+
+    if not whatsapp_agent_ai.enviar_mensaje(numero, mensaje):
+        raise DeliveryError(f'WhatsApp no entregó el mensaje a {numero}')
+    logger.info(f"✅ Notificación WhatsApp enviada a {numero}")
+
+
+@task('send_driver_push')
+def send_driver_push(conductor_id, titulo, mensaje, datos=None):
+    from .models import AppUser
+    from .views import enviar_notificacion_pwa_conductor
+
+    conductor = AppUser.objects.filter(id=conductor_id).first()
+    if conductor is None:
+        return
+    if not enviar_notificacion_pwa_conductor(conductor=conductor, titulo=titulo, mensaje=mensaje, datos=datos):
+        raise DeliveryError(f'No se pudo enviar la notificación PWA a {conductor.username}')
+
+
+@task('notify')
+def notify(audience, event, payload, channels=None, dedupe=True):
+    """Envío de notification_fanout.dispatch (ver taxis.notification_fanout)"""
+    from .notification_fanout import DEFAULT_CHANNELS, Audience, notification_fanout
+
+    notification_fanout.deliver(
+        Audience.from_dict(audience), event, payload,
+        channels=channels or DEFAULT_CHANNELS, dedupe=dedupe,
+    )
+
+
+@task('render_invoice_pdf')
+def render_invoice_pdf(invoice_id):
+    """PDF de una factura emitida (ver taxis.billing)"""
+    from .billing import store_invoice_pdf
+
+    store_invoice_pdf(invoice_id)
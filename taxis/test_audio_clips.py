@@ -0,0 +1,153 @@
+"""
+Tests de la grabación y reproducción de transmisiones del walkie-talkie
+"""
+import base64
+import shutil
+import struct
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from channels.testing import WebsocketCommunicator
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .audio_clips import ClipRecorder, clip_recorder, ogg_crc, purge_clips
+from .consumers import AudioConsumer
+from .models import AppUser, AudioClip, Organization
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class AudioClipsTest(TransactionTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        patcher = mock.patch.object(clip_recorder, 'directory', self.directory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.org = Organization.objects.create(
+            name='Coop Test', slug='coop-test', phone='0999999999',
+            email='coop@test.com', city='Guayaquil'
+        )
+        self.other_org = Organization.objects.create(
+            name='Coop Otra', slug='coop-otra', phone='0988888888',
+            email='otra@test.com', city='Quito'
+        )
+        self.driver = AppUser.objects.create_user(
+            username='ana', password='testpass123', role='driver', organization=self.org
+        )
+        self.room = f'audio_org_{self.org.id}'
+
+    def test_chunks_are_written_and_indexed_on_finish(self):
+        recorder = ClipRecorder(directory=self.directory)
+        recorder.append(self.room, 'canal-1', self.driver.id, 'ana', 'audio/aac', b'abc')
+        recorder.append(self.room, 'canal-1', self.driver.id, 'ana', 'audio/aac', b'def')
+        self.assertEqual(AudioClip.objects.count(), 0)
+
+        clip = recorder.finish(self.room, 'canal-1')
+
+        self.assertEqual((clip.size_bytes, clip.chunk_count), (6, 2))
+        row = AudioClip.objects.get()
+        self.assertEqual((row.room, row.speaker_id, row.mime_type), (self.room, self.driver.id, 'audio/aac'))
+        with open(f'{self.directory}/{row.file_path}', 'rb') as handle:
+            self.assertEqual(handle.read(), b'abcdef')
+
+    def test_opus_packets_are_muxed_into_ogg(self):
+        # TOC 0xF8: CELT 20 ms, mono, un frame (960 muestras)
+        packets = [b'\xf8' + bytes([i]) * 40 for i in range(3)] + [b'\xf8' + b'x' * 70000]
+        recorder = ClipRecorder(directory=self.directory)
+        for packet in packets:
+            recorder.append(self.room, 'canal-1', self.driver.id, 'ana', 'audio/ogg; codecs=opus', packet,
+                            opus_packets=True)
+        clip = recorder.finish(self.room, 'canal-1')
+
+        with open(f'{self.directory}/{clip.file_path}', 'rb') as handle:
+            data = handle.read()
+        self.assertEqual(clip.size_bytes, len(data))
+        self.assertEqual(ogg_crc(b'123456789'), 0x89A1897F)
+
+        # Leer las páginas: cabecera, CRC y paquetes reensamblados con la tabla de segmentos
+        pages, stream, partial = [], [], b''
+        offset = 0
+        while offset < len(data):
+            magic, version, flags, granule, serial, sequence, crc, count = struct.unpack_from('<4sBBqIIIB', data, offset)
+            self.assertEqual((magic, version, sequence), (b'OggS', 0, len(pages)))
+            lacing = data[offset + 27:offset + 27 + count]
+            end = offset + 27 + count + sum(lacing)
+            page = data[offset:end]
+            self.assertEqual(crc, ogg_crc(page[:22] + b'\0\0\0\0' + page[26:]))
+            body = page[27 + count:]
+            for size in lacing:
+                partial += body[:size]
+                body = body[size:]
+                if size < 255:
+                    stream.append(partial)
+                    partial = b''
+            pages.append((flags, granule))
+            offset = end
+
+        self.assertTrue(stream[0].startswith(b'OpusHead'))
+        self.assertEqual(stream[0][9], 1)  # mono
+        self.assertTrue(stream[1].startswith(b'OpusTags'))
+        self.assertEqual(stream[2:], packets)
+        self.assertEqual(pages[0][0], 0x02)  # inicio de stream
+        # El paquete grande sigue en una página de continuación, que cierra el stream con la duración total
+        self.assertEqual(pages[-1], (0x01 | 0x04, 960 * len(packets)))
+        self.assertEqual(pages[-2][1], -1)
+        self.assertEqual(AudioClip.objects.get().mime_type, 'audio/ogg; codecs=opus')
+
+    def test_gap_starts_a_new_clip(self):
+        recorder = ClipRecorder(directory=self.directory, gap_seconds=0.01)
+        recorder.append(self.room, 'canal-1', self.driver.id, 'ana', 'audio/aac', b'uno')
+        time.sleep(0.02)
+        recorder.append(self.room, 'canal-1', self.driver.id, 'ana', 'audio/aac', b'dos', complete=True)
+
+        self.assertEqual(AudioClip.objects.count(), 2)
+
+    def test_purge_removes_expired_clips(self):
+        recorder = ClipRecorder(directory=self.directory)
+        recorder.append(self.room, 'canal-1', self.driver.id, 'ana', 'audio/aac', b'viejo', complete=True)
+        AudioClip.objects.update(started_at=timezone.now() - timedelta(hours=30))
+        clip_recorder.append(self.room, 'canal-2', self.driver.id, 'ana', 'audio/aac', b'nuevo', complete=True)
+
+        self.assertEqual(purge_clips(retention_hours=24), 1)
+        self.assertEqual(AudioClip.objects.count(), 1)
+
+    def test_api_lists_and_streams_clips(self):
+        clip_recorder.append(self.room, 'canal-1', self.driver.id, 'ana', 'audio/aac', b'hola', complete=True)
+        client = APIClient()
+        client.force_authenticate(self.driver)
+
+        data = client.get('/api/audio/clips/', {'include_audio': '1'}).data
+        self.assertEqual(len(data['clips']), 1)
+        self.assertEqual(base64.b64decode(data['clips'][0]['audio']), b'hola')
+
+        response = client.get(data['clips'][0]['url'])
+        self.assertEqual(response['Content-Type'], 'audio/aac')
+        self.assertEqual(b''.join(response.streaming_content), b'hola')
+
+        outsider = AppUser.objects.create_user(
+            username='pedro', password='testpass123', role='driver', organization=self.other_org
+        )
+        client.force_authenticate(outsider)
+        self.assertEqual(client.get(data['clips'][0]['url']).status_code, 404)
+
+    def test_consumer_records_json_audio(self):
+        async def scenario():
+            communicator = WebsocketCommunicator(AudioConsumer.as_asgi(), '/ws/audio/conductores/')
+            communicator.scope['user'] = self.driver
+            communicator.scope['url_route'] = {'kwargs': {}}
+            await communicator.connect()
+            await communicator.send_json_to({'audio': base64.b64encode(b'clip').decode(), 'mimeType': 'audio/webm'})
+            await communicator.receive_nothing()
+            await communicator.disconnect()
+
+        async_to_sync(scenario)()
+
+        clip = AudioClip.objects.get()
+        self.assertEqual((clip.room, clip.speaker_id, clip.mime_type), (self.room, self.driver.id, 'audio/webm'))
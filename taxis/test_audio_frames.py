@@ -0,0 +1,106 @@
+"""
+Tests del protocolo binario de audio del walkie-talkie
+"""
+import base64
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from channels.testing import WebsocketCommunicator
+from django.test import SimpleTestCase
+
+from .audio_clips import clip_recorder
+from .audio_frames import CODEC_AAC, CODEC_OPUS, pack_frame, parse_header, stamp_speaker
+from .consumers import AudioConsumer
+
+
+class FakeDriver:
+    is_authenticated = True
+    is_superuser = False
+    role = 'driver'
+    organization_id = 1
+
+    def __init__(self, user_id):
+        self.id = user_id
+        self.username = f'driver{user_id}'
+
+
+class AudioFramesTest(SimpleTestCase):
+
+    def test_pack_and_parse(self):
+        frame = pack_frame(7, 42, CODEC_OPUS, b'\x01\x02\x03')
+
+        self.assertEqual(parse_header(frame), (1, CODEC_OPUS, 42, 7))
+        self.assertEqual(frame[12:], b'\x01\x02\x03')
+
+    def test_stamp_speaker_keeps_payload(self):
+        frame = stamp_speaker(pack_frame(999, 1, CODEC_OPUS, b'opus'), 5)
+
+        self.assertEqual(parse_header(frame).speaker_id, 5)
+        self.assertEqual(frame[12:], b'opus')
+
+    def test_legacy_bytes_have_no_header(self):
+        self.assertIsNone(parse_header(b'\x00\x01raw audio'))
+        self.assertIsNone(parse_header(b'WT'))
+
+
+class AudioConsumerBinaryTest(SimpleTestCase):
+
+    def setUp(self):
+        # Sin grabación: estos tests no usan la BD
+        patcher = mock.patch.object(clip_recorder, 'enabled', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _communicator(self, user_id, query=''):
+        communicator = WebsocketCommunicator(AudioConsumer.as_asgi(), f'/ws/audio/conductores/{query}')
+        communicator.scope['user'] = FakeDriver(user_id)
+        communicator.scope['url_route'] = {'kwargs': {}}
+        return communicator
+
+    def test_binary_frames_are_relayed_without_reencoding(self):
+        async def scenario():
+            sender = self._communicator(1, '?audio=binary')
+            binary_listener = self._communicator(2, '?audio=binary')
+            json_listener = self._communicator(3)
+            for communicator in (sender, binary_listener, json_listener):
+                await communicator.connect()
+
+            await sender.send_to(bytes_data=pack_frame(0, 9, CODEC_AAC, b'aac-bytes'))
+
+            relayed = await binary_listener.receive_from()
+            self.assertEqual(relayed, pack_frame(1, 9, CODEC_AAC, b'aac-bytes'))
+
+            message = await json_listener.receive_json_from()
+            self.assertEqual(message['type'], 'audio_broadcast')
+            self.assertEqual(base64.b64decode(message['audio']), b'aac-bytes')
+            self.assertEqual(message['mimeType'], 'audio/aac')
+
+            # Fallback JSON: un cliente base64 llega como frame a los clientes binarios
+            await json_listener.send_json_to({'audio': base64.b64encode(b'legacy').decode(), 'mimeType': 'audio/aac'})
+            frame = await binary_listener.receive_from()
+            self.assertEqual(parse_header(frame).speaker_id, 3)
+            self.assertEqual(frame[12:], b'legacy')
+
+            # El emisor no recibe su propio audio, solo el del otro cliente
+            self.assertEqual((await sender.receive_from())[12:], b'legacy')
+            self.assertTrue(await sender.receive_nothing())
+            for communicator in (sender, binary_listener, json_listener):
+                await communicator.disconnect()
+
+        async_to_sync(scenario)()
+
+    def test_invalid_base64_is_rejected_at_the_sender(self):
+        async def scenario():
+            sender = self._communicator(1)
+            listener = self._communicator(2, '?audio=binary')
+            for communicator in (sender, listener):
+                await communicator.connect()
+
+            await sender.send_json_to({'audio': 'no es base64!', 'mimeType': 'audio/aac'})
+
+            self.assertEqual((await sender.receive_json_from())['type'], 'error')
+            self.assertTrue(await listener.receive_nothing())
+            for communicator in (sender, listener):
+                await communicator.disconnect()
+
+        async_to_sync(scenario)()
@@ -0,0 +1,55 @@
+"""
+Tests de la autenticación por token con caché
+"""
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
+
+from .authentication import CachedTokenAuthentication, token_cache
+from .models import AppUser, Organization
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class CachedTokenAuthenticationTest(TestCase):
+
+    def setUp(self):
+        token_cache.clear()
+        self.addCleanup(token_cache.clear)
+        self.org = Organization.objects.create(
+            name='Coop Test', slug='coop-test', phone='0999999999',
+            email='coop@test.com', city='Guayaquil'
+        )
+        self.driver = AppUser.objects.create_user(
+            username='conductor', password='testpass123', role='driver', organization=self.org
+        )
+        self.token = Token.objects.create(user=self.driver)
+        self.auth = {'HTTP_AUTHORIZATION': f'Token {self.token.key}'}
+
+    def test_cached_user_needs_no_queries(self):
+        CachedTokenAuthentication().authenticate_credentials(self.token.key)
+
+        with self.assertNumQueries(0):
+            user, token = CachedTokenAuthentication().authenticate_credentials(self.token.key)
+            self.assertEqual(user.organization.name, 'Coop Test')
+        self.assertEqual(token, self.token)
+
+    def test_each_request_gets_its_own_user_copy(self):
+        first, _ = CachedTokenAuthentication().authenticate_credentials(self.token.key)
+        first.first_name = 'Cambiado'
+        second, _ = CachedTokenAuthentication().authenticate_credentials(self.token.key)
+
+        self.assertEqual(second.first_name, '')
+
+    def test_logout_invalidates_the_token(self):
+        self.assertEqual(self.client.get('/api/driver/stats/', **self.auth).status_code, 200)
+
+        self.assertEqual(self.client.post('/api/logout/', **self.auth).status_code, 200)
+
+        self.assertEqual(self.client.get('/api/driver/stats/', **self.auth).status_code, 401)
+
+    def test_deactivated_user_is_rejected(self):
+        self.assertEqual(self.client.get('/api/rides/history/', **self.auth).status_code, 200)
+
+        self.driver.is_active = False
+        self.driver.save()
+
+        self.assertEqual(self.client.get('/api/rides/history/', **self.auth).status_code, 401)
@@ -0,0 +1,112 @@
+"""
+Tests de la facturación mensual
+"""
+import tempfile
+from datetime import date
+from decimal import Decimal
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from .billing import billing_period, generate_monthly_invoices, next_invoice_number, store_invoice_pdf
+from .models import AppUser, Invoice, Organization, Ride
+from .task_queue import task_queue
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class MonthlyBillingTest(TestCase):
+
+    def setUp(self):
+        self.customer = AppUser.objects.create_user(username='cliente', password='testpass123', role='customer')
+        self.active = self.organization('coop-activa', status='active', monthly_fee=Decimal('30.00'))
+        self.trial = self.organization('coop-prueba', status='trial')
+        self.organization('coop-sin-carreras', status='trial')
+        suspended = self.organization('coop-suspendida', status='suspended')
+        self.ride(self.active, commission='0.50')
+        self.ride(self.active, commission='0.75')
+        self.ride(self.trial, commission='1.00')
+        self.ride(suspended, commission='2.00')
+        self.month = timezone.localdate()
+        self.year = self.month.year
+
+    def organization(self, slug, **fields):
+        return Organization.objects.create(
+            name=slug.replace('-', ' ').title(), slug=slug, phone='0999999999',
+            email=f'{slug}@test.com', city='Guayaquil', **fields
+        )
+
+    def ride(self, organization, commission):
+        return Ride.objects.create(
+            customer=self.customer, organization=organization, origin='Centro', status='completed',
+            price=Decimal('5.00'), commission_amount=Decimal(commission),
+        )
+
+    def test_monthly_job_bills_subscription_and_commission_once(self):
+        with mock.patch.object(task_queue, 'enqueue') as enqueue:
+            with self.captureOnCommitCallbacks(execute=True):
+                invoices = generate_monthly_invoices(self.month)
+
+        by_org = {invoice.organization_id: invoice for invoice in invoices}
+        self.assertEqual(set(by_org), {self.active.id, self.trial.id})
+        active = by_org[self.active.id]
+        self.assertEqual(
+            (active.subscription_fee, active.commission_amount, active.total_amount),
+            (Decimal('30.00'), Decimal('1.25'), Decimal('31.25')),
+        )
+        self.assertEqual(by_org[self.trial.id].total_amount, Decimal('1.00'))
+        self.assertEqual((active.period_start, active.period_end), billing_period(self.month))
+        self.assertEqual(
+            sorted(invoice.invoice_number for invoice in invoices),
+            [f'INV-{self.year}-0001', f'INV-{self.year}-0002'],
+        )
+        self.assertEqual(enqueue.call_count, 2)
+
+        # Re-ejecutar el mes no duplica ni consume números
+        self.assertEqual(generate_monthly_invoices(self.month), [])
+        self.assertEqual(Invoice.objects.count(), 2)
+        self.assertEqual(next_invoice_number(), f'INV-{self.year}-0003')
+
+    def test_numbers_continue_after_existing_invoices(self):
+        Invoice.objects.create(
+            organization=self.active, invoice_number=f'INV-{self.year}-0007',
+            period_start=date(2020, 1, 1), period_end=date(2020, 1, 31),
+            subscription_fee=Decimal('30.00'), total_amount=Decimal('30.00'), due_date=date(2020, 2, 15),
+        )
+        self.assertEqual(next_invoice_number(), f'INV-{self.year}-0008')
+        self.assertEqual(next_invoice_number(), f'INV-{self.year}-0009')
+
+    def test_pdf_is_rendered_into_the_invoice(self):
+        invoice = generate_monthly_invoices(self.month, render_pdf=False)[0]
+
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            store_invoice_pdf(invoice.id)
+            invoice.refresh_from_db()
+            with invoice.pdf_file.open('rb') as pdf:
+                content = pdf.read()
+
+        self.assertTrue(content.startswith(b'%PDF-1.4'))
+        self.assertTrue(content.rstrip().endswith(b'%%EOF'))
+        self.assertIn(invoice.invoice_number.encode(), content)
+
+    def test_superadmin_can_list_and_pay_invoices(self):
+        invoice = generate_monthly_invoices(self.month, render_pdf=False)[0]
+        admin = AppUser.objects.create_superuser(username='root', password='testpass123', email='r@test.com')
+        self.client.force_login(admin)
+
+        response = self.client.get('/manage/invoices/?status=pending')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['invoices']), 2)
+
+        self.client.post(f'/manage/invoices/{invoice.pk}/mark-paid/')
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.status, 'paid')
+
+        self.assertEqual(self.client.get('/manage/invoices/create/').status_code, 200)
+        with mock.patch.object(task_queue, 'enqueue'):
+            self.client.post('/manage/invoices/create/', {
+                'organization': self.active.pk, 'period_start': '2020-01-01', 'period_end': '2020-01-31',
+                'subscription_fee': '30.00', 'commission_amount': '2.50', 'due_date': '2020-02-15',
+            })
+        manual = Invoice.objects.get(period_start=date(2020, 1, 1))
+        self.assertEqual((manual.invoice_number, manual.total_amount), (f'INV-{self.year}-0003', Decimal('32.50')))
@@ -0,0 +1,74 @@
+"""
+Tests del historial de chat paginado por cursor
+"""
+from django.test import TestCase, override_settings
+
+from .chat_history import history_page
+from .models import AppUser, ChatMessage
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class ChatHistoryTest(TestCase):
+
+    def setUp(self):
+        self.central = AppUser.objects.create_superuser(username='central', password='testpass123', email='c@test.com')
+        self.driver = AppUser.objects.create_user(username='conductor', password='testpass123', role='driver')
+        other = AppUser.objects.create_user(username='otro', password='testpass123', role='driver')
+        for i in range(7):
+            sender, recipient = (self.driver, self.central) if i % 2 else (self.central, self.driver)
+            ChatMessage.objects.create(sender=sender, recipient=recipient, message=f'm{i}')
+        ChatMessage.objects.create(sender=other, recipient=self.central, message='ajeno')
+
+    def texts(self, page):
+        return [msg.message for msg in page['messages']]
+
+    def test_pages_walk_back_through_the_conversation(self):
+        with self.assertNumQueries(1):
+            latest = history_page(self.driver, self.central, limit=3)
+        self.assertEqual(self.texts(latest), ['m4', 'm5', 'm6'])
+        self.assertTrue(latest['has_more'])
+
+        older = history_page(self.driver, self.central, before=latest['before'], limit=3)
+        self.assertEqual(self.texts(older), ['m1', 'm2', 'm3'])
+
+        oldest = history_page(self.central, self.driver, before=older['before'], limit=3)
+        self.assertEqual(self.texts(oldest), ['m0'])
+        self.assertFalse(oldest['has_more'])
+
+    def test_after_cursor_returns_only_new_messages(self):
+        latest = history_page(self.driver, self.central)
+        self.assertEqual(self.texts(history_page(self.driver, self.central, after=latest['after'])), [])
+
+        ChatMessage.objects.create(sender=self.central, recipient=self.driver, message='nuevo')
+
+        sync = history_page(self.driver, self.central, after=latest['after'])
+        self.assertEqual(self.texts(sync), ['nuevo'])
+        self.assertNotEqual(sync['after'], latest['after'])
+
+    def test_driver_endpoint(self):
+        response = self.client.get(f'/api/driver/chat_history/{self.driver.id}/?limit=2')
+        data = response.json()
+        self.assertEqual([m['message'] for m in data['messages']], ['m5', 'm6'])
+        self.assertEqual(data['messages'][0]['sender_name'], 'conductor')
+        self.assertTrue(data['messages'][0]['is_sent'])
+
+        response = self.client.get(f'/api/driver/chat_history/{self.driver.id}/?before=basura')
+        self.assertEqual(response.status_code, 400)
+
+    def test_central_endpoint_pages_with_cursors(self):
+        """La central carga anteriores con `before` y al reabrir pide solo lo nuevo con `after`"""
+        self.client.force_login(self.central)
+        url = f'/api/chat_history/{self.driver.id}/'
+
+        latest = self.client.get(url, {'limit': 4}).json()
+        self.assertEqual([m['message'] for m in latest['messages']], ['m3', 'm4', 'm5', 'm6'])
+        self.assertTrue(latest['has_more'])
+
+        older = self.client.get(url, {'limit': 4, 'before': latest['before']}).json()
+        self.assertEqual([m['message'] for m in older['messages']], ['m0', 'm1', 'm2'])
+        self.assertFalse(older['has_more'])
+
+        ChatMessage.objects.create(sender=self.driver, recipient=self.central, message='nuevo')
+        reopened = self.client.get(url, {'after': latest['after']}).json()
+        self.assertEqual([m['message'] for m in reopened['messages']], ['nuevo'])
+        self.assertFalse(reopened['messages'][0]['is_sent'])
@@ -0,0 +1,70 @@
+"""
+Tests de las conversaciones de chat con contadores de no leídos
+"""
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from .chat_threads import create_message, inbox, rebuild_threads, unread_total
+from .models import AppUser, ChatMessage, ChatThread
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class ChatThreadTest(TestCase):
+
+    def setUp(self):
+        self.central = AppUser.objects.create_user(username='central', password='testpass123', role='admin')
+        self.driver = AppUser.objects.create_user(username='conductor', password='testpass123', role='driver')
+        self.other = AppUser.objects.create_user(username='otro', password='testpass123', role='driver')
+
+    def test_messages_update_the_thread_counters(self):
+        for i in range(3):
+            create_message(sender=self.driver, recipient=self.central, message=f'hola {i}')
+        last = create_message(sender=self.central, recipient=self.driver, message='recibido')
+        create_message(sender=self.other, recipient=self.central, message='ajeno')
+
+        thread = ChatThread.objects.get(pair_key=ChatMessage.make_pair_key(self.driver.pk, self.central.pk))
+        self.assertEqual(thread.last_message, last)
+        self.assertEqual(thread.unread_for(self.central.pk), 3)
+        self.assertEqual(thread.unread_for(self.driver.pk), 1)
+
+        create_message(sender=self.other, recipient=self.driver, message='entre conductores')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(unread_total(self.central), 4)
+        self.assertEqual(len(queries), 1)
+        # Solo las conversaciones del usuario, no toda la tabla
+        self.assertIn('WHERE', queries[0]['sql'])
+
+    def test_mark_messages_read_resets_the_counter(self):
+        create_message(sender=self.driver, recipient=self.central, message='hola')
+        create_message(sender=self.driver, recipient=self.central, message='¿me copias?')
+        token = Token.objects.create(user=self.central)
+        auth = {'HTTP_AUTHORIZATION': f'Token {token.key}'}
+
+        self.assertEqual(self.client.get('/api/badge-count/', **auth).json()['messages'], 2)
+
+        response = self.client.post('/api/mark-messages-read/', {'sender_id': self.driver.pk}, **auth)
+        self.assertEqual(response.json()['marked'], 2)
+        self.assertEqual(unread_total(self.central), 0)
+        self.assertFalse(ChatMessage.objects.filter(recipient=self.central, is_read=False).exists())
+
+        response = self.client.post('/api/mark-messages-read/', {'sender_id': 'x'}, **auth)
+        self.assertEqual(response.status_code, 400)
+
+    def test_inbox_is_a_single_query(self):
+        create_message(sender=self.driver, recipient=self.central, message='uno')
+        create_message(sender=self.other, recipient=self.central, message='dos')
+
+        with self.assertNumQueries(1):
+            threads = inbox(self.central)
+            last_messages = {other_id: t.last_message.message for other_id, t in threads.items()}
+        self.assertEqual(last_messages, {self.driver.pk: 'uno', self.other.pk: 'dos'})
+
+    def test_rebuild_matches_incremental_counters(self):
+        create_message(sender=self.driver, recipient=self.central, message='uno')
+        create_message(sender=self.central, recipient=self.driver, message='dos')
+        before = list(ChatThread.objects.values('pair_key', 'last_message', 'unread_low', 'unread_high'))
+
+        self.assertEqual(rebuild_threads(), 1)
+        self.assertEqual(list(ChatThread.objects.values('pair_key', 'last_message', 'unread_low', 'unread_high')), before)
@@ -0,0 +1,111 @@
+"""
+Tests de la exportación de carreras en streaming
+"""
+import csv
+import io
+import warnings
+import zipfile
+from decimal import Decimal
+from functools import partial
+from unittest import mock
+from xml.etree import ElementTree
+
+from asgiref.sync import sync_to_async
+from django.test import TestCase, override_settings
+
+from .admin_views import RideExportView
+from .exports import COLUMNS, csv_stream, ride_export_queryset, ride_rows
+from .models import AppUser, Organization, Ride, RideDestination
+
+SHEET_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class RideExportTest(TestCase):
+
+    def setUp(self):
+        self.org = Organization.objects.create(
+            name='Coop Test', slug='coop-test', phone='0999999999',
+            email='coop@test.com', city='Guayaquil'
+        )
+        other_org = Organization.objects.create(
+            name='Otra Coop', slug='otra-coop', phone='0988888888',
+            email='otra@test.com', city='Quito'
+        )
+        customer = AppUser.objects.create_user(
+            username='cliente', password='testpass123', role='customer', first_name='Ana', last_name='Pérez',
+            phone_number='+593999999999',
+        )
+        self.driver = AppUser.objects.create_user(
+            username='conductor', password='testpass123', role='driver', organization=self.org
+        )
+        for i in range(5):
+            ride = Ride.objects.create(
+                customer=customer, driver=self.driver, organization=self.org, origin=f'Calle {i} & <Av>',
+                price=Decimal('5.00'), commission_amount=Decimal('0.50'), status='completed',
+            )
+            RideDestination.objects.create(ride=ride, destination='Centro', order=1)
+            RideDestination.objects.create(ride=ride, destination='Malecón', order=0)
+        Ride.objects.create(customer=customer, organization=other_org, origin='Ajena', status='requested')
+
+    def test_rows_are_read_in_chunks(self):
+        # Un solo cursor de carreras y una consulta de destinos por bloque
+        with self.assertNumQueries(4):
+            rows = list(ride_rows(ride_export_queryset(organization=self.org), chunk_size=2))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0][8], 'Malecón → Centro')
+        self.assertEqual(rows[0][11], Decimal('4.50'))
+
+    def test_csv_export_is_scoped_to_the_admin_organization(self):
+        admin = AppUser.objects.create_user(username='admin', password='testpass123', role='admin', organization=self.org)
+        self.client.force_login(admin)
+
+        response = self.client.get('/manage/exports/rides/?format=csv&organization=999')
+        self.assertTrue(response.streaming)
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode('utf-8-sig'))))
+        self.assertEqual(rows[0], list(COLUMNS))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[1][5], 'Ana Pérez')
+
+        self.assertEqual(rows[1][6], "'+593999999999")
+
+        self.assertEqual(self.client.get('/manage/exports/rides/?format=pdf').status_code, 400)
+        self.assertEqual(self.client.get('/manage/exports/rides/?start=ayer').status_code, 400)
+
+    def test_xlsx_export_is_a_valid_workbook(self):
+        admin = AppUser.objects.create_superuser(username='root', password='testpass123', email='r@test.com')
+        self.client.force_login(admin)
+
+        response = self.client.get(f'/manage/exports/rides/?format=xlsx&driver={self.driver.pk}')
+        workbook = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertIsNone(workbook.testzip())
+
+        sheet = ElementTree.fromstring(workbook.read('xl/worksheets/sheet1.xml'))
+        rows = sheet.findall(f'{SHEET_NS}sheetData/{SHEET_NS}row')
+        self.assertEqual(len(rows), 6)
+        origin = rows[1].findall(f'{SHEET_NS}c')[7]
+        self.assertEqual(origin.find(f'{SHEET_NS}is/{SHEET_NS}t').text, 'Calle 0 & <Av>')
+        self.assertEqual(rows[1].findall(f'{SHEET_NS}c')[9].find(f'{SHEET_NS}v').text, '5.00')
+
+    def test_csv_neutralizes_formulas(self):
+        rows = [[1, '=HYPERLINK("http://x")', '@SUM(A1)', '-2+3', 'Centro', Decimal('-1.50'), None]]
+        line = next(csv.reader(io.StringIO(''.join(csv_stream(rows)).splitlines()[1])))
+        self.assertEqual(line, ['1', '\'=HYPERLINK("http://x")', "'@SUM(A1)", "'-2+3", 'Centro', '-1.50', ''])
+
+    async def test_asgi_export_streams_chunk_by_chunk(self):
+        admin = await sync_to_async(AppUser.objects.create_superuser)(
+            username='root', password='testpass123', email='r@test.com'
+        )
+        await sync_to_async(self.async_client.force_login)(admin)
+        formats = {'csv': ('text/csv; charset=utf-8', partial(csv_stream, rows_per_chunk=2))}
+
+        with mock.patch.dict(RideExportView.FORMATS, formats), warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            response = await self.async_client.get('/manage/exports/rides/?format=csv')
+            self.assertTrue(response.is_async)
+            chunks = [chunk async for chunk in response.streaming_content]
+
+        # Un bloque por cada 2 filas (6 carreras + encabezado), no el archivo entero de una vez
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(len(b''.join(chunks).decode('utf-8-sig').splitlines()), 7)
+        self.assertFalse([w for w in caught if 'synchronous iterators' in str(w.message)])
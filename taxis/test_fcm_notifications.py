@@ -0,0 +1,61 @@
+"""
+Tests del envío masivo de notificaciones FCM
+"""
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import TestCase
+from firebase_admin import messaging
+
+from . import fcm_notifications
+from .fcm_notifications import send_fcm_notification, send_fcm_to_all_drivers
+from .models import AppUser, FCMToken
+
+
+def fake_multicast(message):
+    # Los tokens que empiezan con "muerto" ya no están registrados
+    responses = [
+        SimpleNamespace(success=False, exception=messaging.UnregisteredError('no registrado'))
+        if token.startswith('muerto') else SimpleNamespace(success=True, exception=None)
+        for token in message.tokens
+    ]
+    return SimpleNamespace(
+        responses=responses,
+        success_count=sum(1 for r in responses if r.success),
+        failure_count=sum(1 for r in responses if not r.success),
+    )
+
+
+@mock.patch('firebase_admin._apps', {'[DEFAULT]': object()})
+class FCMBulkTest(TestCase):
+
+    def setUp(self):
+        self.drivers = [
+            AppUser.objects.create_user(username=f'conductor{i}', password='testpass123', role='driver')
+            for i in range(3)
+        ]
+        for i, driver in enumerate(self.drivers):
+            FCMToken.objects.create(user=driver, token=f'token-{i}')
+        FCMToken.objects.create(user=self.drivers[0], token='muerto-0')
+        customer = AppUser.objects.create_user(username='cliente', password='testpass123', role='customer')
+        FCMToken.objects.create(user=customer, token='token-cliente')
+
+    @mock.patch('taxis.fcm_notifications.messaging.send_each_for_multicast', side_effect=fake_multicast)
+    def test_all_drivers_in_batches_and_dead_tokens_purged(self, send):
+        with mock.patch.object(fcm_notifications, 'FCM_MULTICAST_BATCH_SIZE', 2):
+            with self.assertNumQueries(2):  # tokens + desactivación
+                result = send_fcm_to_all_drivers('Aviso', 'Hola')
+
+        self.assertEqual(send.call_count, 2)
+        sent_tokens = sorted(t for call in send.call_args_list for t in call.args[0].tokens)
+        self.assertEqual(sent_tokens, ['muerto-0', 'token-0', 'token-1', 'token-2'])
+        self.assertEqual((result['sent'], result['failed'], result['deactivated']), (3, 1, 1))
+        self.assertFalse(FCMToken.objects.get(token='muerto-0').is_active)
+
+    @mock.patch('taxis.fcm_notifications.messaging.send_each_for_multicast', side_effect=fake_multicast)
+    def test_single_user_devices_share_one_multicast(self, send):
+        result = send_fcm_notification(self.drivers[0], 'Hola', 'Mensaje', data={'ride_id': 5, 'vacio': None})
+
+        send.assert_called_once()
+        self.assertEqual(send.call_args.args[0].data, {'ride_id': '5', 'vacio': ''})
+        self.assertEqual(result['sent'], 1)
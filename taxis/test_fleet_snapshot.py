@@ -0,0 +1,106 @@
+"""
+Tests del snapshot versionado de la flota (mapa de la central)
+"""
+from django.test import TestCase, override_settings
+from .models import AppUser, Taxi, Organization
+from .fleet_snapshot import FleetSnapshot, fleet_snapshot
+from .location_pipeline import DriverRef
+
+
+class FleetSnapshotTest(TestCase):
+
+    def setUp(self):
+        self.snapshot = FleetSnapshot()
+        self.org = Organization.objects.create(
+            name='Coop Test', slug='coop-test', phone='0999999999',
+            email='coop@test.com', city='Guayaquil'
+        )
+        self.other_org = Organization.objects.create(
+            name='Coop Otra', slug='coop-otra', phone='0988888888',
+            email='otra@test.com', city='Quito'
+        )
+        self.refs = []
+        for i, org in enumerate([self.org, self.org, self.other_org]):
+            driver = AppUser.objects.create_user(
+                username=f'driver{i}', password='testpass123', role='driver',
+                first_name='Driver', last_name=str(i), organization=org
+            )
+            taxi = Taxi.objects.create(user=driver, plate_number=f'GYE{i}', latitude=-2.17, longitude=-79.92)
+            self.refs.append(DriverRef(driver.id, taxi.id, org.id, driver.username))
+
+    def test_full_snapshot_is_scoped_by_organization(self):
+        result = self.snapshot.changes(organization_id=self.org.id)
+
+        self.assertTrue(result['full'])
+        self.assertEqual({t['id'] for t in result['taxis']}, {self.refs[0].user_id, self.refs[1].user_id})
+        self.assertEqual(len(self.snapshot.changes()['taxis']), 3)
+
+    def test_delta_returns_only_moved_taxis(self):
+        cursor = self.snapshot.changes(organization_id=self.org.id)['cursor']
+
+        self.snapshot.on_location(self.refs[0], -2.18, -79.93, None)
+        self.snapshot.on_location(self.refs[2], -0.18, -78.46, None)  # Otra cooperativa
+
+        with self.assertNumQueries(0):
+            result = self.snapshot.changes(organization_id=self.org.id, since=cursor)
+
+        self.assertFalse(result['full'])
+        self.assertEqual([(t['id'], t['lat'], t['lng']) for t in result['taxis']],
+                         [(self.refs[0].user_id, -2.18, -79.93)])
+
+        # Sin movimiento nuevo, el delta viene vacío
+        again = self.snapshot.changes(organization_id=self.org.id, since=result['cursor'])
+        self.assertEqual(again['taxis'], [])
+
+    def test_reload_reports_removed_drivers(self):
+        cursor = self.snapshot.changes(organization_id=self.org.id)['cursor']
+        Taxi.objects.filter(id=self.refs[1].taxi_id).delete()
+
+        self.snapshot.reload()
+        result = self.snapshot.changes(organization_id=self.org.id, since=cursor)
+
+        self.assertEqual(result['taxis'], [])
+        self.assertEqual(result['removed'], [self.refs[1].user_id])
+
+    def test_unknown_cursor_returns_full_snapshot(self):
+        self.snapshot.changes()
+        result = self.snapshot.changes(since='otro:5')
+        self.assertTrue(result['full'])
+        self.assertEqual(len(result['taxis']), 3)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class UbicacionesTaxisViewTest(TestCase):
+
+    def setUp(self):
+        fleet_snapshot._loaded_at = None
+        self.org = Organization.objects.create(
+            name='Coop Test', slug='coop-test', phone='0999999999',
+            email='coop@test.com', city='Guayaquil'
+        )
+        self.admin = AppUser.objects.create_user(
+            username='admin', password='testpass123', role='admin', organization=self.org
+        )
+        driver = AppUser.objects.create_user(
+            username='driver', password='testpass123', role='driver', organization=self.org
+        )
+        Taxi.objects.create(user=driver, plate_number='GYE1', latitude=-2.17, longitude=-79.92)
+
+    def test_etag_and_since_cursor(self):
+        self.client.login(username='admin', password='testpass123')
+
+        response = self.client.get('/api/ubicaciones_taxis/')
+        data = response.json()
+        self.assertEqual(len(data['taxis']), 1)
+        self.assertTrue(data['full'])
+
+        not_modified = self.client.get('/api/ubicaciones_taxis/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+        delta = self.client.get('/api/ubicaciones_taxis/', {'since': data['cursor']}).json()
+        self.assertFalse(delta['full'])
+        self.assertEqual(delta['taxis'], [])
+
+    def test_anonymous_sees_nothing(self):
+        self.assertEqual(self.client.get('/api/taxis_ubicacion/').json(), [])
+        self.assertEqual(self.client.get('/api/ubicaciones_taxis/').json(), {'taxis': []})
@@ -0,0 +1,110 @@
+"""
+Tests del control de turno de palabra del walkie-talkie
+"""
+import time
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from channels.testing import WebsocketCommunicator
+from django.test import SimpleTestCase, override_settings
+
+from .audio_clips import clip_recorder
+from .consumers import AudioConsumer
+from .floor_control import FloorControl, LocalFloorBackend, _channel_layer_redis_url, make_holder
+
+
+class FakeDriver:
+    is_authenticated = True
+    is_superuser = False
+    role = 'driver'
+    organization_id = 1
+
+    def __init__(self, user_id):
+        self.id = user_id
+        self.username = f'driver{user_id}'
+
+
+class FloorControlTest(SimpleTestCase):
+
+    def setUp(self):
+        self.floor = FloorControl(backend=LocalFloorBackend(), lease_seconds=10)
+        self.ana = make_holder('canal-1', '1', 'ana')
+        self.luis = make_holder('canal-2', '2', 'luis')
+
+    def test_only_one_holder_per_room(self):
+        async def scenario():
+            self.assertTrue(await self.floor.acquire('audio_conductores', self.ana))
+            self.assertFalse(await self.floor.acquire('audio_conductores', self.luis))
+            # Otra sala es independiente; volver a pedirlo renueva
+            self.assertTrue(await self.floor.acquire('audio_otra', self.luis))
+            self.assertTrue(await self.floor.acquire('audio_conductores', self.ana))
+            self.assertEqual((await self.floor.current_holder('audio_conductores'))['speakerName'], 'ana')
+
+        async_to_sync(scenario)()
+
+    def test_release_only_by_holder(self):
+        async def scenario():
+            await self.floor.acquire('audio_conductores', self.ana)
+            self.assertFalse(await self.floor.release('audio_conductores', self.luis))
+            self.assertTrue(await self.floor.release('audio_conductores', self.ana))
+            self.assertTrue(await self.floor.acquire('audio_conductores', self.luis))
+
+        async_to_sync(scenario)()
+
+    def test_lease_expires_without_heartbeat(self):
+        async def scenario():
+            self.floor.lease_seconds = 0.05
+            await self.floor.acquire('audio_conductores', self.ana)
+            time.sleep(0.06)
+            self.assertFalse(await self.floor.heartbeat('audio_conductores', self.ana))
+            self.assertTrue(await self.floor.acquire('audio_conductores', self.luis))
+
+        async_to_sync(scenario)()
+
+    @override_settings(CHANNEL_LAYERS={'default': {
+        'BACKEND': 'channels_redis.core.RedisChannelLayer',
+        'CONFIG': {'hosts': ['redis://redis:6379/0']},
+    }})
+    def test_uses_channel_layer_redis(self):
+        self.assertEqual(_channel_layer_redis_url(), 'redis://redis:6379/0')
+
+    @override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+    def test_in_memory_layer_has_no_redis(self):
+        self.assertIsNone(_channel_layer_redis_url())
+
+
+class AudioConsumerFloorTest(SimpleTestCase):
+
+    def setUp(self):
+        # Sin grabación: estos tests no usan la BD
+        patcher = mock.patch.object(clip_recorder, 'enabled', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _communicator(self, user_id):
+        communicator = WebsocketCommunicator(AudioConsumer.as_asgi(), '/ws/audio/conductores/')
+        communicator.scope['user'] = FakeDriver(user_id)
+        communicator.scope['url_route'] = {'kwargs': {}}
+        return communicator
+
+    def test_second_speaker_is_rejected_until_release(self):
+        async def scenario():
+            ana, luis = self._communicator(1), self._communicator(2)
+            await ana.connect()
+            await luis.connect()
+
+            await ana.send_json_to({'type': 'transmission_start'})
+            self.assertTrue((await ana.receive_json_from())['isTransmitting'])
+            self.assertTrue((await luis.receive_json_from())['isTransmitting'])
+
+            await luis.send_json_to({'type': 'transmission_start'})
+            self.assertEqual((await luis.receive_json_from())['type'], 'error')
+
+            # Al desconectarse, el turno se libera y se avisa a la sala
+            await ana.disconnect()
+            self.assertFalse((await luis.receive_json_from())['isTransmitting'])
+            await luis.send_json_to({'type': 'transmission_start'})
+            self.assertEqual((await luis.receive_json_from())['speakerName'], 'driver2')
+            await luis.disconnect()
+
+        async_to_sync(scenario)()
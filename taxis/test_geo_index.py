@@ -0,0 +1,104 @@
+"""
+Tests del índice geoespacial de conductores
+"""
+from django.test import TestCase
+from .models import AppUser, Taxi, Organization
+from .geo_index import DriverLocationIndex, driver_index, buscar_taxi_cercano, haversine_km
+
+
+class DriverLocationIndexTest(TestCase):
+    """Tests de la grilla en memoria (sin BD)"""
+
+    def setUp(self):
+        self.index = DriverLocationIndex()
+        # Evitar la recarga desde BD: el índice se alimenta solo con update()
+        self.index.reload = lambda: setattr(self.index, '_loaded_at', float('inf'))
+
+    def test_nearest_returns_closest_first(self):
+        self.index.update(1, -2.170, -79.922, organization_id=1)
+        self.index.update(2, -2.190, -79.890, organization_id=1)
+        self.index.update(3, -2.100, -79.950, organization_id=1)
+
+        result = self.index.nearest(-2.171, -79.921, k=2, organization_id=1)
+
+        self.assertEqual([taxi_id for taxi_id, _ in result], [1, 2])
+        self.assertAlmostEqual(result[0][1], haversine_km(-2.171, -79.921, -2.170, -79.922))
+
+    def test_nearest_is_scoped_by_organization(self):
+        self.index.update(1, -2.170, -79.922, organization_id=1)
+        self.index.update(2, -2.171, -79.921, organization_id=2)
+
+        result = self.index.nearest(-2.171, -79.921, k=5, organization_id=1)
+
+        self.assertEqual([taxi_id for taxi_id, _ in result], [1])
+        self.assertEqual(len(self.index.nearest(-2.171, -79.921, k=5)), 2)
+
+    def test_update_moves_taxi_between_cells(self):
+        self.index.update(1, -2.170, -79.922, organization_id=1)
+        self.index.update(1, -0.180, -78.467, organization_id=1)
+
+        self.assertEqual(self.index.within_radius(-2.170, -79.922, 5, organization_id=1), [])
+        self.assertEqual(self.index.count(1), 1)
+
+    def test_within_radius(self):
+        self.index.update(1, -2.170, -79.922)
+        self.index.update(2, -2.200, -79.922)  # ~3.3 km al sur
+
+        ids = [taxi_id for taxi_id, _ in self.index.within_radius(-2.170, -79.922, 2)]
+        self.assertEqual(ids, [1])
+
+    def test_nearest_far_away_driver(self):
+        self.index.update(1, -0.180, -78.467)  # Quito
+
+        result = self.index.nearest(-2.170, -79.922, k=1)  # Guayaquil
+
+        self.assertEqual(result[0][0], 1)
+
+    def test_outlier_does_not_widen_the_search(self):
+        for taxi_id, lng in enumerate((-79.922, -79.925, -79.930), start=1):
+            self.index.update(taxi_id, -2.170, lng)
+        self.index.update(99, 0.0, 0.0)  # GPS sin fijar
+        rings = []
+        ring_cells = self.index._ring_cells
+        self.index._ring_cells = lambda cx, cy, ring: rings.append(ring) or ring_cells(cx, cy, ring)
+
+        self.assertEqual(self.index.nearest(-2.170, -79.922, k=1)[0][0], 1)
+        self.assertEqual([taxi_id for taxi_id, _ in self.index.nearest(-2.170, -79.922, k=5)], [1, 2, 3, 99])
+        self.assertEqual(len(self.index.nearest(-2.170, -79.922, k=5, max_km=10)), 3)
+        # Ni con k mayor que los taxis disponibles se recorren miles de anillos
+        self.assertLess(max(rings), 3)
+
+
+class BuscarTaxiCercanoTest(TestCase):
+    """Tests de la búsqueda con validación de filtros en BD"""
+
+    def setUp(self):
+        driver_index.clear()
+        self.org = Organization.objects.create(
+            name='Coop Test', slug='coop-test', phone='0999999999',
+            email='coop@test.com', city='Guayaquil'
+        )
+        self.taxis = []
+        for i, (lat, lng) in enumerate([(-2.170, -79.922), (-2.175, -79.925)]):
+            driver = AppUser.objects.create_user(
+                username=f'driver{i}', password='testpass123', role='driver',
+                first_name='Driver', last_name=str(i), organization=self.org
+            )
+            self.taxis.append(Taxi.objects.create(user=driver, plate_number=f'GYE{i}', latitude=lat, longitude=lng))
+
+    def tearDown(self):
+        driver_index.clear()
+
+    def test_returns_nearest_matching_queryset(self):
+        taxi, distance = buscar_taxi_cercano(-2.170, -79.922, organization=self.org)
+        self.assertEqual(taxi, self.taxis[0])
+        self.assertLess(distance, 0.01)
+
+        queryset = Taxi.objects.exclude(id=self.taxis[0].id)
+        taxi, _ = buscar_taxi_cercano(-2.170, -79.922, queryset=queryset)
+        self.assertEqual(taxi, self.taxis[1])
+
+    def test_no_match(self):
+        taxi, distance = buscar_taxi_cercano(-2.170, -79.922, queryset=Taxi.objects.none())
+        self.assertIsNone(taxi)
+        self.assertIsNone(distance)
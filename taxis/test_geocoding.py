@@ -0,0 +1,91 @@
+"""
+Tests del servicio de geocodificación con caché
+"""
+from datetime import timedelta
+from unittest import mock
+
+import requests
+from django.test import TestCase
+from django.utils import timezone
+
+from .geocoding import Geocoder, normalize_address
+from .models import GeocodeCacheEntry
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
+
+    def raise_for_status(self):
+        pass
+
+
+def google_reverse(url, params, timeout):
+    return FakeResponse({'status': 'OK', 'results': [
+        {'types': ['plus_code'], 'formatted_address': 'QQ2V+9C Guayaquil'},
+        {'types': ['street_address'], 'formatted_address': 'Av. 9 de Octubre 100, Guayaquil'},
+    ]})
+
+
+class GeocoderTest(TestCase):
+
+    def setUp(self):
+        self.session = mock.Mock()
+        self.geocoder = Geocoder(api_key='test', session=self.session)
+
+    def test_reverse_is_cached_in_memory_and_table(self):
+        self.session.get.side_effect = google_reverse
+
+        first = self.geocoder.reverse(-2.19001, -79.88799)
+        # Mismo punto redondeado (~11 m): no vuelve a salir a la red
+        second = self.geocoder.reverse(-2.19004, -79.88802)
+
+        self.assertEqual(first.address, 'Av. 9 de Octubre 100, Guayaquil')
+        self.assertEqual(first, second)
+        self.assertEqual(self.session.get.call_count, 1)
+
+        # Otro proceso (caché en memoria vacía) lee la tabla
+        other = Geocoder(api_key='test', session=self.session)
+        self.assertEqual(other.address_for(-2.19001, -79.88799), first.address)
+        self.assertEqual(self.session.get.call_count, 1)
+        self.assertEqual(other.stats['db_hits'], 1)
+
+    def test_forward_normalizes_text_and_caches_misses(self):
+        self.session.get.side_effect = [
+            FakeResponse({'status': 'ZERO_RESULTS', 'results': []}),  # Google
+            FakeResponse([]),                                          # Nominatim
+        ]
+
+        self.assertIsNone(self.geocoder.geocode('Calle  Inexistente 123'))
+        self.assertIsNone(self.geocoder.geocode('calle inexistente 123 '))
+        self.assertEqual(self.session.get.call_count, 2)  # Google + Nominatim, una sola vez
+
+        entry = GeocodeCacheEntry.objects.get(kind='forward', key=normalize_address('Calle Inexistente 123'))
+        self.assertFalse(entry.found)
+        self.assertLess(entry.expires_at, timezone.now() + timedelta(hours=2))
+
+    def test_network_errors_are_not_cached(self):
+        self.session.get.side_effect = requests.ConnectionError('sin red')
+
+        self.assertIsNone(self.geocoder.geocode('Mall del Sol'))
+        self.assertFalse(GeocodeCacheEntry.objects.exists())
+
+        self.session.get.side_effect = [FakeResponse({'status': 'OK', 'results': [{
+            'formatted_address': 'Mall del Sol, Guayaquil',
+            'geometry': {'location': {'lat': -2.154, 'lng': -79.892}},
+        }]})]
+        result = self.geocoder.geocode('Mall del Sol')
+        self.assertEqual((result.latitude, result.longitude), (-2.154, -79.892))
+
+    def test_expired_entries_are_refreshed(self):
+        self.session.get.side_effect = google_reverse
+        self.geocoder.reverse(-2.19, -79.88)
+        GeocodeCacheEntry.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        other = Geocoder(api_key='test', session=self.session)
+        other.reverse(-2.19, -79.88)
+        self.assertEqual(self.session.get.call_count, 2)
+        self.assertEqual(GeocodeCacheEntry.objects.count(), 1)
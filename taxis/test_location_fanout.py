@@ -0,0 +1,123 @@
+"""
+Tests de la difusión de ubicaciones por organización y viewport
+"""
+import time
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer
+from channels.testing import WebsocketCommunicator
+from django.test import SimpleTestCase
+from django.utils import timezone
+
+from .consumers import LocationConsumer
+from .location_fanout import LocationFanout, in_bounds, organization_group, parse_bounds
+from .location_pipeline import DriverRef
+
+
+class FakeUser:
+    is_authenticated = True
+    is_superuser = False
+    username = 'central'
+    role = 'admin'
+    organization_id = 1
+
+
+class LocationFanoutTest(SimpleTestCase):
+
+    def setUp(self):
+        self.fanout = LocationFanout(tick=0)
+        self.fanout._subscribers = 1
+        self.ref = DriverRef(10, 100, 1, 'carlos')
+
+    def test_pings_are_coalesced_per_driver(self):
+        now = timezone.now()
+        self.fanout.on_location(self.ref, -2.10, -79.90, now - timedelta(seconds=1))
+        self.fanout.on_location(self.ref, -2.17, -79.92, now)
+        self.fanout.on_location(DriverRef(11, 101, 2, 'ana'), -0.18, -78.46, now)
+
+        pending = self.fanout.take_pending()
+
+        self.assertEqual([(u['driver_id'], u['lat']) for u in pending[1]], [(10, -2.17)])
+        self.assertEqual(len(pending[2]), 1)
+        self.assertEqual(self.fanout.take_pending(), {})
+
+    def test_no_subscribers_nothing_is_buffered(self):
+        # Layer en memoria: sin sockets en este proceso no hay a quién enviar
+        self.fanout._subscribers = 0
+        self.fanout.on_location(self.ref, -2.17, -79.92, timezone.now())
+        self.assertEqual(self.fanout.take_pending(), {})
+
+    def test_shared_layer_publishes_without_local_subscribers(self):
+        class RecordingLayer:
+            def __init__(self):
+                self.sent = []
+
+            async def group_send(self, group, message):
+                self.sent.append((group, message))
+
+        layer = RecordingLayer()
+        fanout = LocationFanout(tick=0.01, cross_process=True)
+        fanout._ensure_publisher(layer)
+        self.addCleanup(fanout.stop)
+
+        # El ping llega a un proceso sin centrales; la central escucha en otro worker
+        fanout.on_location(self.ref, -2.17, -79.92, timezone.now())
+        deadline = time.monotonic() + 2
+        while not layer.sent and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        group, message = layer.sent[0]
+        self.assertEqual(group, organization_group(1))
+        self.assertEqual([u['driver_id'] for u in message['updates']], [10])
+
+    def test_broadcast_sends_one_message_per_organization(self):
+        layer = InMemoryChannelLayer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)(organization_group(1), channel)
+
+        self.fanout.on_location(self.ref, -2.17, -79.92, timezone.now())
+        self.fanout.on_location(DriverRef(12, 102, 1, 'luis'), -2.18, -79.93, timezone.now())
+        async_to_sync(self.fanout.broadcast_pending)(layer)
+
+        message = async_to_sync(layer.receive)(channel)
+        self.assertEqual(message['type'], 'location_batch')
+        self.assertEqual({u['driver_id'] for u in message['updates']}, {10, 12})
+
+    def test_bounds(self):
+        bounds = parse_bounds({'north': -2.0, 'south': -2.3, 'east': -79.8, 'west': -80.0})
+        self.assertTrue(in_bounds(bounds, -2.17, -79.92))
+        self.assertFalse(in_bounds(bounds, -0.18, -78.46))
+        self.assertTrue(in_bounds(None, -0.18, -78.46))
+        with self.assertRaises(ValueError):
+            parse_bounds({'north': -2.0})
+
+
+class LocationConsumerTest(SimpleTestCase):
+
+    def test_viewport_filters_batches(self):
+        async def scenario():
+            communicator = WebsocketCommunicator(LocationConsumer.as_asgi(), '/ws/locations/')
+            communicator.scope['user'] = FakeUser()
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+
+            await communicator.send_json_to({
+                'type': 'subscribe',
+                'bounds': {'north': -2.0, 'south': -2.3, 'east': -79.8, 'west': -80.0},
+            })
+            self.assertEqual((await communicator.receive_json_from())['type'], 'subscribed')
+
+            from channels.layers import get_channel_layer
+            await get_channel_layer().group_send(organization_group(1), {
+                'type': 'location_batch',
+                'updates': [
+                    {'driver_id': 10, 'lat': -2.17, 'lng': -79.92, 'ts': 0},
+                    {'driver_id': 11, 'lat': -0.18, 'lng': -78.46, 'ts': 0},
+                ],
+            })
+            message = await communicator.receive_json_from()
+            self.assertEqual([d['driver_id'] for d in message['drivers']], [10])
+            await communicator.disconnect()
+
+        async_to_sync(scenario)()
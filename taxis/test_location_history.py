@@ -0,0 +1,109 @@
+"""
+Tests del historial de ubicaciones
+"""
+from datetime import timedelta
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from .models import AppUser, LocationTrack
+from .location_history import (
+    TrackRecorder, encode_points, decode_points, encode_polyline, compact_day, get_driver_track
+)
+from .location_pipeline import DriverRef
+
+
+class TrackEncodingTest(TestCase):
+
+    def test_roundtrip(self):
+        base = timezone.now().replace(microsecond=0)
+        points = [
+            (base, -2.17094, -79.92241),
+            (base + timedelta(seconds=3), -2.17101, -79.92230),
+            (base + timedelta(seconds=7), -2.16950, -79.92500),
+        ]
+
+        data = encode_points(points, base)
+        decoded = decode_points(data, base)
+
+        self.assertEqual(len(decoded), 3)
+        for (t1, lat1, lng1), (t2, lat2, lng2) in zip(points, decoded):
+            self.assertEqual(t1, t2)
+            self.assertAlmostEqual(lat1, lat2, places=5)
+            self.assertAlmostEqual(lng1, lng2, places=5)
+        # Deltas pequeños: pocos bytes por punto
+        self.assertLess(len(data), 8 * len(points) + 12)
+
+    def test_polyline_matches_google_reference(self):
+        points = [(None, 38.5, -120.2), (None, 40.7, -120.95), (None, 43.252, -126.453)]
+        self.assertEqual(encode_polyline(points), '_p~iF~ps|U_ulLnnqC_mqNvxq`@')
+
+
+class TrackRecorderTest(TestCase):
+
+    def setUp(self):
+        self.driver = AppUser.objects.create_user(
+            username='carlos', password='testpass123', role='driver',
+            first_name='Carlos', last_name='Test'
+        )
+        self.ref = DriverRef(self.driver.id, 1, None, 'carlos')
+        self.recorder = TrackRecorder(segment_seconds=300)
+
+    def test_segment_is_written_when_old_enough(self):
+        start = timezone.now() - timedelta(minutes=10)
+        for i in range(5):
+            self.recorder.add_point(self.ref, -2.17 + i * 0.001, -79.92, start + timedelta(seconds=3 * i))
+        # Duplicado en el mismo segundo: se descarta
+        self.recorder.add_point(self.ref, -2.0, -79.0, start + timedelta(seconds=12))
+
+        self.assertEqual(self.recorder.flush(), 1)
+
+        track = LocationTrack.objects.get(driver=self.driver)
+        self.assertEqual(track.point_count, 5)
+        self.assertEqual(self.recorder.pending_points(self.driver.id), [])
+
+    def test_recent_points_stay_buffered(self):
+        self.recorder.add_point(self.ref, -2.17, -79.92, timezone.now())
+        self.assertEqual(self.recorder.flush(), 0)
+        self.assertEqual(self.recorder.flush(force=True), 1)
+
+    def test_compact_day_merges_segments(self):
+        base = (timezone.now() - timedelta(days=1)).replace(hour=10, minute=0, second=0, microsecond=0)
+        for segment in range(3):
+            for i in range(4):
+                moment = base + timedelta(minutes=segment * 10, seconds=i * 3)
+                self.recorder.add_point(self.ref, -2.17 + i * 0.001, -79.92, moment)
+            self.recorder.flush(force=True)
+        day = timezone.localdate(base)
+        self.assertEqual(LocationTrack.objects.filter(driver=self.driver, day=day).count(), 3)
+
+        self.assertEqual(compact_day(day), 2)
+
+        track = LocationTrack.objects.get(driver=self.driver, day=day)
+        self.assertEqual(track.point_count, 12)
+        points = get_driver_track(self.driver.id, base, base + timedelta(minutes=15))
+        self.assertEqual(len(points), 8)
+
+
+class DriverTrackAPITest(TestCase):
+
+    def setUp(self):
+        self.driver = AppUser.objects.create_user(
+            username='carlos', password='testpass123', role='driver',
+            first_name='Carlos', last_name='Test'
+        )
+        self.other = AppUser.objects.create_user(
+            username='otro', password='testpass123', role='driver',
+            first_name='Otro', last_name='Test'
+        )
+
+    def test_driver_can_read_own_track_only(self):
+        token = Token.objects.create(user=self.driver)
+        url = f'/api/drivers/{self.driver.id}/track/'
+
+        response = self.client.get(url, HTTP_AUTHORIZATION=f'Token {token.key}', secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['point_count'], 0)
+
+        response = self.client.get(f'/api/drivers/{self.other.id}/track/',
+                                   HTTP_AUTHORIZATION=f'Token {token.key}', secure=True)
+        self.assertEqual(response.status_code, 403)
@@ -0,0 +1,78 @@
+"""
+Tests de la ingesta de ubicaciones con escritura diferida
+"""
+import json
+from datetime import timedelta
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from .models import AppUser, Taxi
+from .geo_index import driver_index
+from .location_pipeline import LocationIngestor
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class LocationIngestorTest(TestCase):
+
+    def setUp(self):
+        driver_index.clear()
+        self.ingestor = LocationIngestor(flush_interval=0)  # Sin hilo: volcado manual
+        self.driver = AppUser.objects.create_user(
+            username='carlos', password='testpass123', role='driver',
+            first_name='Carlos', last_name='Test'
+        )
+        self.taxi = Taxi.objects.create(user=self.driver, plate_number='GYE123')
+
+    def tearDown(self):
+        driver_index.clear()
+
+    def test_resolve_by_id_and_username_is_cached(self):
+        ref = self.ingestor.resolve_driver(self.driver.id)
+        self.assertEqual(ref.taxi_id, self.taxi.id)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.ingestor.resolve_driver('carlos'), ref)
+            self.assertEqual(self.ingestor.resolve_driver(str(self.driver.id)), ref)
+
+    def test_resolve_unknown_driver(self):
+        self.assertIsNone(self.ingestor.resolve_driver('nadie'))
+
+    def test_pings_are_deduplicated_and_flushed_in_bulk(self):
+        ref = self.ingestor.resolve_driver(self.driver.id)
+        now = timezone.now()
+
+        with self.assertNumQueries(0):
+            self.ingestor.record(ref, -2.10, -79.90, timestamp=now - timedelta(seconds=4))
+            self.ingestor.record(ref, -2.17, -79.92, timestamp=now)
+            # Un ping atrasado no pisa al más reciente
+            self.ingestor.record(ref, -2.00, -79.80, timestamp=now - timedelta(seconds=2))
+
+        self.assertEqual(self.ingestor.flush(), 1)
+
+        self.taxi.refresh_from_db()
+        self.driver.refresh_from_db()
+        self.assertEqual((self.taxi.latitude, self.taxi.longitude), (-2.17, -79.92))
+        self.assertEqual((self.driver.last_latitude, self.driver.last_longitude), (-2.17, -79.92))
+        self.assertEqual(self.ingestor.flush(), 0)
+
+    def test_record_updates_geo_index_immediately(self):
+        ref = self.ingestor.resolve_driver(self.driver.id)
+        self.ingestor.record(ref, -2.17, -79.92)
+
+        self.assertEqual(driver_index.position(self.taxi.id), (-2.17, -79.92))
+
+    def test_invalid_coordinates_are_rejected(self):
+        ref = self.ingestor.resolve_driver(self.driver.id)
+        self.assertFalse(self.ingestor.record(ref, 'abc', -79.92))
+        self.assertFalse(self.ingestor.record(ref, 120, -79.92))
+        self.assertEqual(self.ingestor.flush(), 0)
+
+    def test_dropped_pings_are_reported_to_the_client(self):
+        self.client.force_login(self.driver)
+        for url, body in (
+            ('/api/actualizar_ubicacion/', {'latitude': None, 'longitude': -79.92}),
+            ('/actualizar_ubicacion_taxi/', {'lat': 95, 'lng': -79.92}),
+            ('/update-location/', {'latitude': 'abc', 'longitude': -79.92}),
+            ('/api/update-location/', {'latitude': -2.17}),
+        ):
+            response = self.client.post(url, json.dumps(body), content_type='application/json')
+            self.assertEqual(response.status_code, 400, url)
@@ -0,0 +1,99 @@
+"""
+Tests del cliente compartido de Google Maps
+"""
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from .maps_client import MAX_WAYPOINTS, MapsClient, TTLCache
+
+
+def leg(meters, seconds):
+    return {
+        'distance': {'value': meters, 'text': f'{meters / 1000:.1f} km'},
+        'duration': {'value': seconds, 'text': f'{seconds // 60} min'},
+    }
+
+
+class FakeResponse:
+    def __init__(self, params):
+        self.stops = 1 + len(params['waypoints'].split('|')) if 'waypoints' in params else 1
+
+    def json(self):
+        # Distancia ficticia: 1000 m por tramo según su posición en la ruta
+        return {
+            'status': 'OK',
+            'routes': [{'legs': [leg(1000 * (i + 1), 60 * (i + 1)) for i in range(self.stops)]}],
+        }
+
+
+class MapsClientTest(SimpleTestCase):
+
+    def setUp(self):
+        self.session = mock.Mock()
+        self.session.get.side_effect = lambda url, params, timeout: FakeResponse(params)
+        self.client = MapsClient(api_key='test', session=self.session)
+
+    def test_all_legs_in_one_request(self):
+        waypoints = [(-2.17, -79.92), (-2.18, -79.93), (-2.19, -79.94), (-2.20, -79.95)]
+
+        legs = self.client.legs(waypoints)
+
+        # Una consulta con paradas intermedias: solo los tramos consecutivos, no la matriz N × N
+        self.assertEqual(self.session.get.call_count, 1)
+        params = self.session.get.call_args.kwargs['params']
+        self.assertEqual((params['origin'], params['destination']), ('-2.17,-79.92', '-2.2,-79.95'))
+        self.assertEqual(params['waypoints'], '-2.18,-79.93|-2.19,-79.94')
+        self.assertEqual([leg.distance_m for leg in legs], [1000, 2000, 3000])
+
+    def test_cached_legs_skip_the_network(self):
+        waypoints = [(-2.17, -79.92), (-2.18, -79.93), (-2.19, -79.94)]
+        self.client.legs(waypoints)
+
+        # Coordenadas casi iguales (redondeo) y un destino nuevo: solo se pide el tramo nuevo
+        self.client.legs([(-2.170001, -79.920001), (-2.18, -79.93), (-2.19, -79.94), (-2.25, -79.99)])
+
+        self.assertEqual(self.session.get.call_count, 2)
+        params = self.session.get.call_args.kwargs['params']
+        self.assertEqual((params['origin'], params['destination']), ('-2.19,-79.94', '-2.25,-79.99'))
+        self.assertNotIn('waypoints', params)
+        self.assertEqual(self.client.stats['cache_hits'], 2)
+
+    def test_missing_legs_are_split_into_chains(self):
+        # Tramo del medio en caché: los dos tramos faltantes no son consecutivos
+        self.client.legs([(-2.18, -79.93), (-2.19, -79.94)])
+        self.session.get.reset_mock()
+
+        legs = self.client.legs([(-2.17, -79.92), (-2.18, -79.93), (-2.19, -79.94), (-2.20, -79.95)])
+
+        self.assertEqual(self.session.get.call_count, 2)
+        self.assertTrue(all(leg is not None for leg in legs))
+
+        # Rutas largas: como máximo MAX_WAYPOINTS paradas intermedias por consulta
+        self.session.get.reset_mock()
+        route = [(-3.0 - i / 100, -80.0) for i in range(MAX_WAYPOINTS + 4)]
+        self.assertTrue(all(self.client.legs(route)))
+        self.assertEqual(self.session.get.call_count, 2)
+
+    def test_route_distance_counts_failed_legs(self):
+        self.session.get.side_effect = lambda url, params, timeout: mock.Mock(
+            json=lambda: {'status': 'OVER_QUERY_LIMIT'}
+        )
+        meters, failed = self.client.route_distance_m([(-2.17, -79.92), (-2.18, -79.93)])
+        self.assertEqual((meters, failed), (0, 1))
+
+
+class TTLCacheTest(SimpleTestCase):
+
+    def test_lru_eviction_and_expiry(self):
+        cache = TTLCache(max_entries=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+
+        expired = TTLCache(ttl=-1)
+        expired.set('a', 1)
+        self.assertIsNone(expired.get('a'))
@@ -0,0 +1,99 @@
+"""
+Tests del envío unificado de notificaciones
+"""
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import TestCase
+
+from .audio_push_notifications import send_central_audio_notification
+from .models import AppUser, FCMToken, WebPushSubscription
+from .notification_fanout import (
+    FCM, TELEGRAM, WEBPUSH, WEBSOCKET, WHATSAPP, Audience, NotificationFanout,
+)
+from .task_queue import task_queue
+from .webpush_dispatcher import PushOutcome
+
+
+def fake_send_many(subscriptions, payload, ttl=None):
+    return [
+        PushOutcome(sub_id, info['endpoint'], 410 if 'gone' in info['endpoint'] else 201,
+                    'gone' not in info['endpoint'], 'gone' in info['endpoint'], None)
+        for sub_id, info in subscriptions
+    ]
+
+
+@mock.patch('firebase_admin._apps', {'[DEFAULT]': object()})
+class NotificationFanoutTest(TestCase):
+
+    def setUp(self):
+        self.fanout = NotificationFanout()
+        # App nativa y PWA: solo debe recibir por FCM
+        self.app_driver = AppUser.objects.create_user(
+            username='conductor_app', password='testpass123', role='driver', phone_number='0991111111'
+        )
+        FCMToken.objects.create(user=self.app_driver, token='token-app')
+        FCMToken.objects.create(user=self.app_driver, token='token-viejo', is_active=False)
+        WebPushSubscription.objects.create(user=self.app_driver, subscription_info={'endpoint': 'https://push.test/app'})
+        # Solo PWA, suscrita dos veces desde el mismo navegador
+        self.pwa_driver = AppUser.objects.create_user(
+            username='conductor_pwa', password='testpass123', role='driver',
+            phone_number='0991111111', telegram_chat_id='555'
+        )
+        for _ in range(2):
+            WebPushSubscription.objects.create(user=self.pwa_driver, subscription_info={'endpoint': 'https://push.test/pwa'})
+        WebPushSubscription.objects.create(user=self.pwa_driver, subscription_info={'endpoint': 'https://push.test/gone'})
+        AppUser.objects.create_user(username='cliente', password='testpass123', role='customer')
+
+    def test_endpoints_resolved_in_one_query_and_deduped(self):
+        with self.assertNumQueries(1):
+            recipients = self.fanout.resolve(Audience(roles=['driver']))
+        plan, deduped = self.fanout.plan(recipients, (WEBSOCKET, FCM, WEBPUSH))
+
+        self.assertEqual(plan[FCM], [(FCMToken.objects.get(token='token-app').id, 'token-app')])
+        self.assertEqual(sorted(info['endpoint'] for _, info in plan[WEBPUSH]),
+                         ['https://push.test/gone', 'https://push.test/pwa'])
+        self.assertEqual(sorted(plan[WEBSOCKET]), sorted([self.app_driver.id, self.pwa_driver.id]))
+        # La PWA del conductor con app y la suscripción repetida
+        self.assertEqual(deduped, 2)
+
+    @mock.patch('taxis.fcm_notifications.messaging.send_each_for_multicast')
+    def test_deliver_runs_channels_and_cleans_up(self, send_multicast):
+        send_multicast.return_value = SimpleNamespace(
+            responses=[SimpleNamespace(success=True, exception=None)], success_count=1, failure_count=0
+        )
+        with mock.patch('taxis.webpush_dispatcher.webpush_dispatcher.send_many', side_effect=fake_send_many), \
+                mock.patch.object(self.fanout, '_send_websocket', return_value={'sent': 2, 'failed': 0}):
+            report = self.fanout.deliver(Audience(roles=['driver']), 'nueva_carrera', {'title': 'Hola', 'body': 'Carrera'})
+
+        self.assertEqual(report['channels'][FCM]['sent'], 1)
+        self.assertEqual(report['channels'][WEBPUSH], {'sent': 1, 'failed': 1, 'expired': 1})
+        self.assertEqual(send_multicast.call_args.args[0].data, {'type': 'nueva_carrera'})
+        self.assertFalse(WebPushSubscription.objects.filter(subscription_info__endpoint='https://push.test/gone').exists())
+        self.assertEqual(self.fanout.stats['notifications'], 1)
+        self.assertEqual(self.fanout.stats['channels'][WEBPUSH], {'sent': 1, 'failed': 1})
+
+    def test_messaging_channels_are_queued_once_per_destination(self):
+        with mock.patch.object(task_queue, 'enqueue') as enqueue:
+            report = self.fanout.deliver(
+                Audience.users([self.app_driver, self.pwa_driver]), 'aviso', {'text': 'Hola'},
+                channels=(WHATSAPP, TELEGRAM), dedupe=False,
+            )
+
+        calls = [(c.args[0], c.kwargs) for c in enqueue.call_args_list]
+        self.assertEqual(calls, [
+            ('send_whatsapp', {'numero': '0991111111', 'mensaje': 'Hola'}),
+            ('send_telegram', {'chat_id': '555', 'mensaje': 'Hola'}),
+        ])
+        self.assertEqual(report['deduped'], 1)
+
+    def test_central_audio_only_queues_the_fanout(self):
+        with mock.patch.object(task_queue, 'enqueue') as enqueue:
+            with self.captureOnCommitCallbacks(execute=True):
+                with self.assertNumQueries(0):
+                    self.assertTrue(send_central_audio_notification(self.app_driver))
+
+        enqueue.assert_called_once()
+        self.assertEqual(enqueue.call_args.args[0], 'notify')
+        self.assertEqual(enqueue.call_args.kwargs['audience']['roles'], ['driver'])
+        self.assertEqual(enqueue.call_args.kwargs['audience']['exclude_user_ids'], [self.app_driver.id])
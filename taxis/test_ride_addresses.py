@@ -0,0 +1,76 @@
+"""
+Tests de las direcciones geocodificadas guardadas en las carreras
+"""
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from .geocoding import GeoResult
+from .models import AppUser, Ride, RideDestination
+from .ride_addresses import resolve_ride_addresses
+from .serializers import RideDetailSerializer
+from .task_queue import task_queue
+
+
+def fake_reverse(lat, lng, timeout=None):
+    return GeoResult(f'Calle {lat},{lng}', lat, lng)
+
+
+class RideAddressesTest(TestCase):
+
+    def setUp(self):
+        self.customer = AppUser.objects.create_user(username='cliente', password='testpass123', role='customer')
+
+    def _create_ride(self):
+        ride = Ride.objects.create(
+            customer=self.customer, origin='Mall del Sol',
+            origin_latitude=-2.15, origin_longitude=-79.89,
+        )
+        RideDestination.objects.create(
+            ride=ride, destination='Aeropuerto', destination_latitude=-2.16, destination_longitude=-79.88,
+        )
+        return ride
+
+    def test_new_rides_are_queued_after_commit(self):
+        with mock.patch.object(task_queue, 'enqueue') as enqueue:
+            with self.captureOnCommitCallbacks(execute=True):
+                ride = self._create_ride()
+                enqueue.assert_not_called()
+
+        enqueue.assert_called_with('resolve_ride_addresses', ride_id=ride.id)
+
+    @mock.patch('taxis.ride_addresses.geocoder.reverse', side_effect=fake_reverse)
+    def test_resolve_stores_origin_and_destinations(self, reverse):
+        ride = self._create_ride()
+
+        self.assertEqual(resolve_ride_addresses(ride.id), 2)
+        ride.refresh_from_db()
+        self.assertEqual(ride.origin_address, 'Calle -2.15,-79.89')
+        self.assertEqual(ride.destinations.get().address, 'Calle -2.16,-79.88')
+
+        # Ya resueltas: no vuelve a geocodificar
+        self.assertEqual(resolve_ride_addresses(ride.id), 0)
+        self.assertEqual(reverse.call_count, 2)
+
+    @mock.patch('taxis.ride_addresses.geocoder.reverse', side_effect=fake_reverse)
+    def test_serializer_makes_no_external_calls(self, reverse):
+        ride = self._create_ride()
+        with mock.patch('taxis.geocoding.Geocoder._resolve') as resolve:
+            self.assertEqual(RideDetailSerializer(ride).data['origin_address'], 'Mall del Sol')
+            resolve_ride_addresses(ride.id)
+            ride.refresh_from_db()
+            data = RideDetailSerializer(ride).data
+        resolve.assert_not_called()
+        self.assertEqual(data['origin_address'], 'Calle -2.15,-79.89')
+        self.assertEqual(data['destinations'][0]['address'], 'Calle -2.16,-79.88')
+
+    @mock.patch('taxis.ride_addresses.geocoder.reverse', side_effect=fake_reverse)
+    def test_backfill_command(self, reverse):
+        self._create_ride()
+        self._create_ride()
+        out = StringIO()
+        call_command('backfill_ride_addresses', stdout=out)
+        self.assertIn('4 dirección(es)', out.getvalue())
+        self.assertFalse(Ride.objects.filter(origin_address='').exists())
@@ -0,0 +1,145 @@
+"""
+Tests de los acumulados por conductor y por organización
+"""
+from decimal import Decimal
+
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
+
+from .models import AppUser, DriverDailyStats, Organization, OrganizationPeriodStats, Ride
+from .ride_stats import driver_summary, period_totals, rebuild_driver_stats, reconcile_organization_stats
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class DriverStatsTest(TestCase):
+
+    def setUp(self):
+        self.org = Organization.objects.create(
+            name='Coop Test', slug='coop-test', phone='0999999999',
+            email='coop@test.com', city='Guayaquil'
+        )
+        self.customer = AppUser.objects.create_user(username='cliente', password='testpass123', role='customer')
+        self.driver = AppUser.objects.create_user(
+            username='conductor', password='testpass123', role='driver', organization=self.org
+        )
+
+    def ride(self, status='requested', price='5.50', commission=None):
+        return Ride.objects.create(
+            customer=self.customer, driver=self.driver, organization=self.org,
+            origin='Centro', price=Decimal(price), status=status,
+            commission_amount=Decimal(commission) if commission else None,
+        )
+
+    def snapshot(self):
+        return list(DriverDailyStats.objects.order_by('date').values(
+            'driver', 'organization', 'date', 'completed_rides', 'canceled_rides', 'earnings'))
+
+    def test_transitions_update_the_rollup(self):
+        ride = self.ride()
+        self.ride(status='accepted')
+        self.assertFalse(DriverDailyStats.objects.exists())
+
+        ride.status = 'completed'
+        ride.save()
+        self.ride(status='completed', price='4.50')
+        self.ride(status='canceled')
+
+        summary = driver_summary(self.driver, organization=self.org)
+        self.assertEqual(summary['completed_rides'], 2)
+        self.assertEqual(summary['canceled_rides'], 1)
+        self.assertEqual(summary['today_earnings'], Decimal('10.00'))
+        self.assertEqual(summary['active_rides'], 1)
+        self.assertEqual(summary['total_rides'], 4)
+
+        # Corregir el precio y luego cancelar mueven los acumulados
+        ride = Ride.objects.get(pk=ride.pk)
+        ride.price = Decimal('7.00')
+        ride.save()
+        self.assertEqual(driver_summary(self.driver)['total_earnings'], Decimal('11.50'))
+
+        ride.status = 'canceled'
+        ride.save(update_fields=['status'])
+        summary = driver_summary(self.driver)
+        self.assertEqual((summary['completed_rides'], summary['canceled_rides']), (1, 2))
+        self.assertEqual(summary['total_earnings'], Decimal('4.50'))
+
+        ride.delete()
+        self.assertEqual(driver_summary(self.driver)['canceled_rides'], 1)
+
+    def test_rebuild_matches_incremental_rollup(self):
+        self.ride(status='completed')
+        self.ride(status='completed', price='3.25')
+        self.ride(status='canceled')
+        before = self.snapshot()
+
+        self.assertEqual(rebuild_driver_stats(), 1)
+        self.assertEqual(self.snapshot(), before)
+
+    def test_stats_endpoint_reads_the_rollup(self):
+        self.ride(status='completed')
+        token = Token.objects.create(user=self.driver)
+
+        response = self.client.get('/api/driver/stats/', HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['completed_rides'], 1)
+        self.assertEqual(Decimal(response.json()['total_earnings']), Decimal('5.50'))
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class OrganizationStatsTest(TestCase):
+
+    setUp = DriverStatsTest.setUp
+    ride = DriverStatsTest.ride
+
+    def test_counters_follow_ride_completion(self):
+        ride = self.ride(status='accepted', commission='0.50')
+        self.ride(status='completed', price='4.00', commission='0.40')
+        self.ride(status='canceled')
+
+        ride.status = 'completed'
+        ride.save()
+
+        self.org.refresh_from_db()
+        self.assertEqual(
+            (self.org.total_rides, self.org.total_revenue, self.org.total_commission),
+            (2, Decimal('9.50'), Decimal('0.90')),
+        )
+        month = OrganizationPeriodStats.objects.get(organization=self.org, period='month')
+        self.assertEqual((month.completed_rides, month.canceled_rides), (2, 1))
+        self.assertEqual(period_totals('day', month.period_start)['total_commission'], Decimal('0.90'))
+
+        # Guardar la organización con valores viejos no pisa los contadores
+        stale = Organization.objects.get(pk=self.org.pk)
+        self.ride(status='completed', price='1.00')
+        stale.name = 'Coop Renombrada'
+        stale.save()
+        self.org.refresh_from_db()
+        self.assertEqual((self.org.name, self.org.total_rides), ('Coop Renombrada', 3))
+
+    def test_reconcile_fixes_drift(self):
+        self.ride(status='completed', commission='0.55')
+        self.ride(status='completed', price='2.00')
+        self.assertEqual(reconcile_organization_stats(), [])
+
+        # Cambios que no pasan por Ride.save()
+        Ride.objects.filter(price=Decimal('2.00')).update(status='canceled')
+        Organization.objects.filter(pk=self.org.pk).update(total_commission=Decimal('9.99'))
+
+        drift = reconcile_organization_stats(fix=False)
+        self.assertEqual(len(drift), 3)  # organización, día y mes
+
+        reconcile_organization_stats()
+        self.assertEqual(reconcile_organization_stats(), [])
+        self.org.refresh_from_db()
+        self.assertEqual((self.org.total_rides, self.org.total_commission), (1, Decimal('0.55')))
+
+    def test_financial_report_reads_the_period_rows(self):
+        self.ride(status='completed', commission='0.50')
+        admin = AppUser.objects.create_superuser(username='root', password='testpass123', email='r@test.com')
+        self.client.force_login(admin)
+
+        response = self.client.get('/manage/reports/financial/?period=week')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_rides'], 1)
+        self.assertEqual(response.context['total_commission'], Decimal('0.50'))
+        self.assertEqual(response.context['by_organization'][0].revenue, Decimal('5.50'))
@@ -0,0 +1,147 @@
+"""
+Tests de los grupos de conversación del walkie-talkie
+"""
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.test import TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from .audio_clips import clip_recorder
+from .consumers import AudioConsumer
+from .models import AppUser, Organization, TalkGroup
+from .talk_groups import add_members, can_join, user_talk_groups
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class TalkGroupTest(TransactionTestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(clip_recorder, 'enabled', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.org = Organization.objects.create(
+            name='Coop Test', slug='coop-test', phone='0999999999',
+            email='coop@test.com', city='Guayaquil'
+        )
+        self.other_org = Organization.objects.create(
+            name='Coop Otra', slug='coop-otra', phone='0988888888',
+            email='otra@test.com', city='Quito'
+        )
+        self.central = AppUser.objects.create_user(
+            username='central', password='testpass123', role='admin', organization=self.org
+        )
+        self.ana = AppUser.objects.create_user(
+            username='ana', password='testpass123', role='driver', organization=self.org
+        )
+        self.luis = AppUser.objects.create_user(
+            username='luis', password='testpass123', role='driver', organization=self.org
+        )
+        self.outsider = AppUser.objects.create_user(
+            username='pedro', password='testpass123', role='driver', organization=self.other_org
+        )
+        self.zone = TalkGroup.objects.create(organization=self.org, name='Zona Norte', kind='zone')
+        add_members(self.zone, [self.ana.id, self.outsider.id])
+
+    def test_membership_rules(self):
+        self.assertTrue(can_join(self.ana, self.zone))
+        self.assertFalse(can_join(self.luis, self.zone))
+        self.assertTrue(can_join(self.central, self.zone))
+        # Los usuarios de otra cooperativa no se agregan
+        self.assertFalse(can_join(self.outsider, self.zone))
+
+        general = TalkGroup.objects.create(organization=self.org, name='General', kind='organization')
+        self.assertTrue(can_join(self.luis, general))
+        self.assertEqual(set(user_talk_groups(self.luis)), {general})
+
+    def test_api_create_group_and_manage_members(self):
+        client = APIClient()
+        client.force_authenticate(self.central)
+
+        response = client.post('/api/talk-groups/', {
+            'name': 'Turno noche', 'kind': 'shift', 'member_ids': [self.luis.id]
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        group_id = response.data['id']
+
+        members = client.get(f'/api/talk-groups/{group_id}/members/').data['members']
+        self.assertEqual([m['username'] for m in members], ['luis'])
+
+        response = client.delete(f'/api/talk-groups/{group_id}/members/', {'user_ids': [self.luis.id]}, format='json')
+        self.assertEqual(response.data['removed'], 1)
+
+        client.force_authenticate(self.ana)
+        response = client.post('/api/talk-groups/', {'name': 'Mío'}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def _communicator(self, user, talk_group_id=None, query=''):
+        path = f'/ws/audio/grupos/{talk_group_id}/' if talk_group_id else f'/ws/audio/conductores/{query}'
+        communicator = WebsocketCommunicator(AudioConsumer.as_asgi(), path)
+        communicator.scope['user'] = user
+        communicator.scope['url_route'] = {'kwargs': {'talk_group_id': talk_group_id} if talk_group_id else {}}
+        return communicator
+
+    def test_audio_reaches_only_group_members(self):
+        async def scenario():
+            central = self._communicator(self.central, self.zone.id)
+            ana = self._communicator(self.ana, self.zone.id)
+            luis_general = self._communicator(self.luis)
+            for communicator in (central, ana, luis_general):
+                connected, _ = await communicator.connect()
+                self.assertTrue(connected)
+
+            intruder = self._communicator(self.luis, self.zone.id)
+            connected, _ = await intruder.connect()
+            self.assertFalse(connected)
+
+            await central.send_json_to({'audio': 'QUJD'})
+            self.assertEqual((await ana.receive_json_from())['audio'], 'QUJD')
+            self.assertTrue(await luis_general.receive_nothing())
+
+            # Quitar a Ana del grupo cierra su socket
+            from .talk_groups import remove_members
+            await database_sync_to_async(remove_members)(self.zone, [self.ana.id])
+            self.assertEqual((await ana.receive_output())['type'], 'websocket.close')
+
+            for communicator in (central, luis_general):
+                await communicator.disconnect()
+
+        async_to_sync(scenario)()
+
+    def test_superuser_picks_the_organization_channel(self):
+        superuser = AppUser.objects.create_superuser(username='admin', password='testpass123', email='a@test.com')
+
+        async def scenario():
+            # Sin cooperativa no hay canal general: error explícito y cierre
+            lost = self._communicator(superuser)
+            connected, _ = await lost.connect()
+            self.assertTrue(connected)
+            self.assertEqual((await lost.receive_json_from())['type'], 'error')
+            self.assertEqual((await lost.receive_output())['code'], 4400)
+
+            invalid = self._communicator(superuser, query='?organization=999999')
+            await invalid.connect()
+            self.assertEqual((await invalid.receive_json_from())['type'], 'error')
+            await invalid.disconnect()
+
+            admin = self._communicator(superuser, query=f'?organization={self.org.id}')
+            luis = self._communicator(self.luis)
+            outsider = self._communicator(self.outsider)
+            for communicator in (admin, luis, outsider):
+                connected, _ = await communicator.connect()
+                self.assertTrue(connected)
+
+            await admin.send_json_to({'audio': 'QUJD'})
+            self.assertEqual((await luis.receive_json_from())['audio'], 'QUJD')
+            self.assertTrue(await outsider.receive_nothing())
+
+            await luis.send_json_to({'audio': 'REVG'})
+            self.assertEqual((await admin.receive_json_from())['audio'], 'REVG')
+
+            for communicator in (admin, luis, outsider):
+                await communicator.disconnect()
+
+        async_to_sync(scenario)()
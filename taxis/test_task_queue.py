@@ -0,0 +1,111 @@
+"""
+Tests de la cola de tareas en segundo plano
+"""
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from .models import AppUser, Organization, Ride, Taxi
+from .task_queue import LocalJobBackend, TaskQueue, task, task_queue
+
+calls = []
+
+
+@task('test_flaky', max_retries=2)
+def flaky(fail_times):
+    calls.append(fail_times)
+    if len(calls) <= fail_times:
+        raise RuntimeError('falla temporal')
+
+
+class TaskQueueTest(TestCase):
+
+    def setUp(self):
+        calls.clear()
+        self.queue = TaskQueue(backend=LocalJobBackend(), inline_worker=False)
+        patcher = mock.patch('taxis.task_queue.backoff_delay', return_value=0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def drain(self):
+        while True:
+            job = self.queue.backend.pop(0)
+            if job is None:
+                return
+            self.queue.run_job(job)
+
+    def test_failed_jobs_are_retried(self):
+        self.queue.enqueue('test_flaky', fail_times=2)
+        self.drain()
+
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(self.queue.stats, {'enqueued': 1, 'succeeded': 1, 'retried': 2, 'dead': 0})
+
+    def test_jobs_are_buried_after_max_retries(self):
+        self.queue.enqueue('test_flaky', fail_times=10)
+        self.drain()
+
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(len(self.queue.backend.dead), 1)
+        self.assertIn('falla temporal', self.queue.backend.dead[0]['error'])
+
+    def test_delayed_jobs_wait_their_turn(self):
+        self.queue.backend.push({'id': '1', 'name': 'test_flaky', 'payload': {'fail_times': 0}, 'attempt': 0}, delay=60)
+        self.assertIsNone(self.queue.backend.pop(0))
+        self.assertEqual(self.queue.backend.size(), 1)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class RideCreatedTest(TestCase):
+
+    def setUp(self):
+        self.org = Organization.objects.create(
+            name='Coop Test', slug='coop-test', phone='0999999999',
+            email='coop@test.com', city='Guayaquil'
+        )
+        self.customer = AppUser.objects.create_user(
+            username='cliente', password='testpass123', role='customer',
+            organization=self.org, phone_number='0991111111'
+        )
+        self.driver = AppUser.objects.create_user(
+            username='conductor', password='testpass123', role='driver',
+            organization=self.org, phone_number='0992222222'
+        )
+        self.taxi = Taxi.objects.create(
+            user=self.driver, plate_number='GYE-1234', latitude=-2.15, longitude=-79.89
+        )
+
+    @mock.patch('taxis.views.enviar_telegram')
+    def test_request_ride_returns_before_notifying(self, enviar_telegram):
+        self.client.force_login(self.customer)
+        with mock.patch.object(task_queue, 'enqueue') as enqueue:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post('/request-ride/', {
+                    'origin': 'Mall del Sol',
+                    'origin_latitude': '-2.15',
+                    'origin_longitude': '-79.89',
+                    'destinations[]': ['Aeropuerto'],
+                    'destination_coords[]': ['-2.16,-79.88'],
+                    'price': '5.00',
+                })
+
+        self.assertEqual(response.status_code, 302)
+        ride = Ride.objects.get()
+        enqueue.assert_any_call('ride_created', ride_id=ride.id)
+        enviar_telegram.assert_not_called()
+
+    @mock.patch('taxis.ride_addresses.geocoder.reverse', return_value=None)
+    def test_ride_created_fans_out_one_job_per_channel(self, reverse):
+        from .tasks import ride_created
+
+        ride = Ride.objects.create(
+            customer=self.customer, organization=self.org, origin='Mall del Sol',
+            origin_latitude=-2.15, origin_longitude=-79.89, price=5,
+        )
+        with mock.patch.object(task_queue, 'enqueue') as enqueue, \
+                mock.patch('taxis.views.obtener_taxista_mas_cercano', return_value=self.taxi):
+            ride_created(ride.id)
+
+        names = [c.args[0] for c in enqueue.call_args_list]
+        self.assertEqual(names, ['send_telegram', 'send_whatsapp', 'send_driver_push'])
+        self.assertEqual(enqueue.call_args_list[1].kwargs['numero'], '0992222222')
@@ -0,0 +1,76 @@
+"""
+Tests del envío concurrente de Web Push
+"""
+import base64
+import os
+from types import SimpleNamespace
+from unittest import mock
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from django.test import TestCase
+
+from .models import AppUser, WebPushSubscription
+from .push_notifications import send_push_to_users
+from .webpush_dispatcher import VapidSigner, WebPushDispatcher
+
+
+def b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def subscription_info(endpoint):
+    key = ec.generate_private_key(ec.SECP256R1()).public_key().public_bytes(
+        serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint
+    )
+    return {'endpoint': endpoint, 'keys': {'p256dh': b64(key), 'auth': b64(os.urandom(16))}}
+
+
+class FakeSession:
+    def __init__(self):
+        self.posts = []
+
+    def post(self, url, data=None, headers=None, timeout=None):
+        self.posts.append((url, headers))
+        return SimpleNamespace(status_code=410 if 'gone' in url else 201, text='')
+
+
+class WebPushDispatcherTest(TestCase):
+
+    def setUp(self):
+        private_value = ec.generate_private_key(ec.SECP256R1()).private_numbers().private_value
+        self.signer = VapidSigner(private_key=b64(private_value.to_bytes(32, 'big')), admin_email='test@example.com')
+        self.session = FakeSession()
+        self.dispatcher = WebPushDispatcher(signer=self.signer, session=self.session, max_workers=4)
+        patcher = mock.patch('taxis.push_notifications.webpush_dispatcher', self.dispatcher)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.users = [
+            AppUser.objects.create_user(username=f'conductor{i}', password='testpass123', role='driver')
+            for i in range(3)
+        ]
+        for i, user in enumerate(self.users):
+            WebPushSubscription.objects.create(
+                user=user, subscription_info=subscription_info(f'https://fcm.googleapis.com/fcm/send/{i}')
+            )
+        WebPushSubscription.objects.create(
+            user=self.users[0], subscription_info=subscription_info('https://updates.push.services.mozilla.com/gone')
+        )
+
+    def test_batch_report_and_expired_cleanup(self):
+        report = send_push_to_users(AppUser.objects.filter(role='driver'), 'Hola', 'Mensaje')
+
+        self.assertEqual((report['sent'], report['failed'], report['expired']), (3, 1, 1))
+        self.assertEqual(report['endpoints']['https://fcm.googleapis.com/fcm/send/0'], 201)
+        self.assertEqual(WebPushSubscription.objects.count(), 3)
+
+    def test_vapid_headers_are_signed_once_per_push_service(self):
+        send_push_to_users(AppUser.objects.filter(role='driver'), 'Hola', 'Mensaje')
+        send_push_to_users(AppUser.objects.filter(role='driver'), 'Otra', 'Vez')
+
+        # Dos servicios de push (FCM y Mozilla): dos firmas para 7 envíos
+        self.assertEqual(self.signer.stats['signed'], 2)
+        self.assertEqual(len(self.session.posts), 7)
+        fcm_headers = {h['Authorization'] for url, h in self.session.posts if 'fcm' in url}
+        self.assertEqual(len(fcm_headers), 1)
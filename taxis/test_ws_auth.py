@@ -0,0 +1,83 @@
+"""
+Tests de la caché de identidad en los handshakes WebSocket
+"""
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.test import TransactionTestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .authentication import token_cache
+from .middleware import HandshakeAuthCache, TokenAuthMiddleware
+from .models import AppUser
+
+
+async def inner_app(scope, receive, send):
+    return scope['user']
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class HandshakeAuthCacheTest(TransactionTestCase):
+
+    def setUp(self):
+        token_cache.clear()
+        self.addCleanup(token_cache.clear)
+        self.cache = HandshakeAuthCache()
+        patcher = mock.patch('taxis.middleware.ws_auth_cache', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.middleware = TokenAuthMiddleware(inner_app)
+        self.driver = AppUser.objects.create_user(username='conductor', password='testpass123', role='driver')
+
+    def handshake(self, **scope):
+        scope.setdefault('type', 'websocket')
+        return async_to_sync(self.middleware)(scope, None, None)
+
+    def session_scope(self):
+        session_key = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        return {
+            'cookies': {settings.SESSION_COOKIE_NAME: session_key},
+            'session': SessionStore(session_key),
+        }
+
+    def test_token_reconnects_skip_the_database(self):
+        token = Token.objects.create(user=self.driver)
+        self.assertEqual(self.handshake(query_string=f'token={token.key}'.encode()), self.driver)
+
+        with self.assertNumQueries(0):
+            user = self.handshake(headers=[(b'authorization', f'Token {token.key}'.encode())])
+        self.assertEqual(user, self.driver)
+        self.assertEqual((self.cache.stats['token_hits'], self.cache.stats['token_misses']), (1, 1))
+
+    def test_session_reconnects_skip_the_database(self):
+        self.client.force_login(self.driver)
+        self.assertEqual(self.handshake(**self.session_scope()), self.driver)
+
+        with self.assertNumQueries(0):
+            user = self.handshake(**self.session_scope())
+        self.assertEqual(user, self.driver)
+        self.assertEqual(self.cache.hit_rate(), 0.5)
+
+    def test_logout_invalidates_the_session(self):
+        self.client.force_login(self.driver)
+        scope = self.session_scope()
+        self.handshake(**scope)
+
+        self.client.logout()
+
+        scope['session'] = SessionStore(scope['cookies'][settings.SESSION_COOKIE_NAME])
+        self.assertFalse(self.handshake(**scope).is_authenticated)
+
+    def test_hit_rate_is_reported_in_the_admin_metrics(self):
+        self.client.force_login(self.driver)
+        self.handshake(**self.session_scope())
+        self.handshake(**self.session_scope())
+
+        client = APIClient()
+        client.force_authenticate(AppUser.objects.create_superuser(username='admin', password='testpass123', email='a@test.com'))
+        ws_auth = client.get('/api/notifications/metrics/').json()['ws_auth']
+        self.assertEqual((ws_auth['session_hits'], ws_auth['session_misses']), (1, 1))
+        self.assertEqual(ws_auth['hit_rate'], 0.5)
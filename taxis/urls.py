@@ -164,10 +164,12 @@ urlpatterns = [
     
     # Reportes
     path('manage/reports/financial/', admin_views.FinancialReportsView.as_view(), name='admin_reports_financial'),
+    path('manage/reports/analytics/', admin_views.AnalyticsReportView.as_view(), name='admin_reports_analytics'),
+    path('manage/exports/rides/', admin_views.RideExportView.as_view(), name='admin_export_rides'),
     
-    # Facturas (DESHABILITADO - Invoice no existe)
-    # path('admin/invoices/', admin_views.InvoiceListView.as_view(), name='admin_invoices'),
-    # path('admin/invoices/create/', admin_views.InvoiceCreateView.as_view(), name='admin_invoice_create'),
-    # path('admin/invoices/<int:pk>/mark-paid/', admin_views.InvoiceMarkPaidView.as_view(), name='admin_invoice_mark_paid'),
+    # Facturas
+    path('manage/invoices/', admin_views.InvoiceListView.as_view(), name='admin_invoices'),
+    path('manage/invoices/create/', admin_views.InvoiceCreateView.as_view(), name='admin_invoice_create'),
+    path('manage/invoices/<int:pk>/mark-paid/', admin_views.InvoiceMarkPaidView.as_view(), name='admin_invoice_mark_paid'),
 ]
 
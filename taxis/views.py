@@ -1,8 +1,7 @@
 import requests
 from django.conf import settings
-from geopy.distance import geodesic
 from django.shortcuts import render, redirect, reverse
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, HttpResponseNotModified
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
 import json
@@ -18,6 +17,13 @@ from .forms import CustomerRegistrationForm,CustomerProfileForm, DriverProfileFo
 #from django.contrib.auth.forms import DriverRegistrationForm, CustomerRegistrationForm
 from django.contrib.auth.decorators import login_required
 from .decorators import organization_admin_required
+from .fleet_snapshot import fleet_snapshot
+from .geo_index import buscar_taxi_cercano
+from .location_pipeline import location_ingestor
+from .maps_client import maps_client
+from .geocoding import geocoder
+from .task_queue import task_queue
+from .chat_history import InvalidCursor, history_page, parse_limit
 from django.utils import timezone
 from django.utils.timezone import now, timedelta
 from django.shortcuts import get_object_or_404
@@ -286,10 +292,11 @@ def update_location(request):
             longitude = data.get('longitude')
 
             if request.user.is_authenticated:
-                taxi = request.user.taxi
-                taxi.latitude = latitude
-                taxi.longitude = longitude
-                taxi.save()
+                driver = location_ingestor.resolve_driver(request.user.id, create_taxi=False)
+                if driver is None:
+                    raise Taxi.DoesNotExist("El usuario no tiene un taxi asignado")
+                if not location_ingestor.record(driver, latitude, longitude):
+                    return JsonResponse({"status": "error", "message": "Coordenadas inválidas"}, status=400)
 
                 # Enviar la ubicación a los clientes conectados vía WebSocket
                 channel_layer = get_channel_layer()
@@ -328,49 +335,15 @@ def driver_dashboard(request):
     else:
         rides_queryset = Ride.objects.none()
     
-    # Obtener estadísticas del conductor
-    total_rides = rides_queryset.filter(driver=request.user).count()
-    completed_rides = rides_queryset.filter(driver=request.user, status='completed').count()
-    canceled_rides = rides_queryset.filter(driver=request.user, status='canceled').count()
-    active_rides_count = rides_queryset.filter(
-        driver=request.user, 
-        status__in=['accepted', 'in_progress']
-    ).count()
-    
-    # Calcular ganancias (basado en precio de carreras completadas)
-    from django.db.models import Sum
-    today = now().date()
-    
-    # Ganancias del día
-    today_earnings = rides_queryset.filter(
-        driver=request.user, 
-        status='completed',
-        created_at__date=today,
-        price__isnull=False
-    ).aggregate(total=Sum('price'))['total'] or 0
-    
-    # Ganancias del mes
-    month_earnings = rides_queryset.filter(
-        driver=request.user, 
-        status='completed',
-        created_at__year=today.year,
-        created_at__month=today.month,
-        price__isnull=False
-    ).aggregate(total=Sum('price'))['total'] or 0
-    
-    # Ganancias totales
-    total_earnings = rides_queryset.filter(
-        driver=request.user, 
-        status='completed',
-        price__isnull=False
-    ).aggregate(total=Sum('price'))['total'] or 0
-    
-    # Carreras de hoy
-    today_rides_count = rides_queryset.filter(
-        driver=request.user, 
-        status='completed',
-        created_at__date=today
-    ).count()
+    # Estadísticas y ganancias del conductor desde los acumulados diarios (taxis.ride_stats)
+    from .ride_stats import driver_summary
+    if request.user.organization:
+        stats = driver_summary(request.user, organization=request.user.organization)
+    else:
+        stats = dict.fromkeys((
+            'total_rides', 'completed_rides', 'canceled_rides', 'active_rides',
+            'today_rides', 'today_earnings', 'month_earnings', 'total_earnings',
+        ), 0)
     
     # ✅ Obtener carreras disponibles (sin conductor asignado, de su organización)
     available_rides_list = rides_queryset.filter(
@@ -396,14 +369,14 @@ def driver_dashboard(request):
     
     context = {
         'taxi': taxi,
-        'total_rides': total_rides,
-        'completed_rides': completed_rides,
-        'canceled_rides': canceled_rides,
-        'active_rides': active_rides_count,
-        'today_rides': today_rides_count,
-        'today_earnings': today_earnings,
-        'month_earnings': month_earnings,
-        'total_earnings': total_earnings,
+        'total_rides': stats['total_rides'],
+        'completed_rides': stats['completed_rides'],
+        'canceled_rides': stats['canceled_rides'],
+        'active_rides': stats['active_rides'],
+        'today_rides': stats['today_rides'],
+        'today_earnings': stats['today_earnings'],
+        'month_earnings': stats['month_earnings'],
+        'total_earnings': stats['total_earnings'],
         'rating': rating,
         'available_rides': available_rides_list,
         'active_rides_list': active_rides_list,
@@ -483,19 +456,14 @@ def admin_dashboard(request):
     completed_rides = rides_qs.filter(status='completed').count()
     canceled_rides = rides_qs.filter(status='canceled').count()
     
-    # Ingresos
-    total_revenue = rides_qs.filter(status='completed', price__isnull=False).aggregate(
-        total=Sum('price')
-    )['total'] or 0
+    # Ingresos (contadores de la organización, ver taxis.ride_stats)
+    from .ride_stats import period_totals
+    total_revenue = organization.total_revenue
     
     # Carreras de hoy
-    today = timezone.now().date()
+    today = timezone.localdate()
     today_rides = rides_qs.filter(created_at__date=today).count()
-    today_revenue = rides_qs.filter(
-        status='completed', 
-        price__isnull=False,
-        created_at__date=today
-    ).aggregate(total=Sum('price'))['total'] or 0
+    today_revenue = period_totals('day', today, organization)['total_revenue']
     
     # Conductores activos (con ubicación)
     active_drivers = taxis_qs.exclude(
@@ -598,29 +566,23 @@ def superadmin_dashboard(request):
     total_admins = AppUser.objects.filter(role='admin').count()
     
     total_rides = Ride.objects.count()
-    completed_rides = Ride.objects.filter(status='completed').count()
     in_progress_rides = Ride.objects.filter(status='in_progress').count()
     
-    # Ingresos totales
-    total_revenue = Ride.objects.filter(
-        status='completed',
-        price__isnull=False
-    ).aggregate(total=Sum('price'))['total'] or 0
-    
-    # Comisiones totales
-    total_commissions = Ride.objects.filter(
-        status='completed',
-        commission_amount__isnull=False
-    ).aggregate(total=Sum('commission_amount'))['total'] or 0
+    # Completadas, ingresos y comisiones: contadores de cada organización (taxis.ride_stats)
+    org_totals = Organization.objects.aggregate(
+        completed=Sum('total_rides'),
+        revenue=Sum('total_revenue'),
+        commissions=Sum('total_commission'),
+    )
+    completed_rides = org_totals['completed'] or 0
+    total_revenue = org_totals['revenue'] or 0
+    total_commissions = org_totals['commissions'] or 0
     
     # Estadísticas de hoy
-    today = timezone.now().date()
+    from .ride_stats import period_totals
+    today = timezone.localdate()
     today_rides = Ride.objects.filter(created_at__date=today).count()
-    today_revenue = Ride.objects.filter(
-        status='completed',
-        price__isnull=False,
-        created_at__date=today
-    ).aggregate(total=Sum('price'))['total'] or 0
+    today_revenue = period_totals('day', today)['total_revenue']
     
     # Estadísticas por organización (top 10)
     org_stats = []
@@ -628,24 +590,14 @@ def superadmin_dashboard(request):
         org_drivers = AppUser.objects.filter(role='driver', organization=org).count()
         org_customers = AppUser.objects.filter(role='customer', organization=org).count()
         org_rides = Ride.objects.filter(organization=org).count()
-        org_revenue = Ride.objects.filter(
-            organization=org,
-            status='completed',
-            price__isnull=False
-        ).aggregate(total=Sum('price'))['total'] or 0
-        org_commissions = Ride.objects.filter(
-            organization=org,
-            status='completed',
-            commission_amount__isnull=False
-        ).aggregate(total=Sum('commission_amount'))['total'] or 0
         
         org_stats.append({
             'organization': org,
             'drivers': org_drivers,
             'customers': org_customers,
             'rides': org_rides,
-            'revenue': org_revenue,
-            'commissions': org_commissions,
+            'revenue': org.total_revenue,
+            'commissions': org.total_commission,
         })
     
     # Organizaciones recientes
@@ -952,38 +904,19 @@ def enviar_telegram(chat_id, mensaje, botones=None, parse_mode='HTML'):
 
 
 # 📍 Convertir dirección en coordenadas
-def direccion_a_coordenadas(direccion, api_key):
-    try:
-        url = f"https://maps.googleapis.com/maps/api/geocode/json?address={requests.utils.quote(direccion)}&key={api_key}&language=es"
-        response = requests.get(url, timeout=5)
-        if response.status_code == 200:
-            datos = response.json()
-            if datos.get('results'):
-                loc = datos['results'][0]['geometry']['location']
-                return loc['lat'], loc['lng']
-    except Exception as e:
-        print(f"❌ Error en direccion_a_coordenadas: {e}")
+def direccion_a_coordenadas(direccion, api_key=None):
+    # api_key se conserva por compatibilidad; el servicio usa settings.GOOGLE_API_KEY
+    resultado = geocoder.geocode(direccion)
+    if resultado:
+        return resultado.latitude, resultado.longitude
     return None, None
 
 
 
 # 🧭 Obtener dirección legible desde coordenadas usando Google Maps
-def obtener_direccion_google(lat, lng, api_key):
-    try:
-        url = f"https://maps.googleapis.com/maps/api/geocode/json?latlng={lat},{lng}&key={api_key}&language=es"
-        response = requests.get(url, timeout=5)
-        if response.status_code == 200:
-            datos = response.json()
-            for resultado in datos.get("results", []):
-                tipos = resultado.get("types", [])
-                # Evitar plus_code y tomar tipo de calle o ruta
-                if "plus_code" not in tipos and any(t in tipos for t in ("street_address", "route", "premise", "sublocality")):
-                    return resultado.get("formatted_address")
-            if datos.get("results"):
-                return datos["results"][0].get("formatted_address")
-    except Exception as e:
-        print(f"❌ Error obteniendo dirección: {e}")
-    return "Dirección desconocida"
+def obtener_direccion_google(lat, lng, api_key=None):
+    # Cacheado por coordenadas redondeadas (ver taxis.geocoding)
+    return geocoder.address_for(lat, lng)
 
 
 
@@ -996,15 +929,10 @@ def get_map_url(lat1, lng1, lat2, lng2):
 # 📏 Obtener distancia y duración estimada entre dos puntos
 def get_distance_duration(lat1, lng1, lat2, lng2):
     try:
-        url = (
-            f"https://maps.googleapis.com/maps/api/distancematrix/json?units=metric"
-            f"&origins={lat1},{lng1}&destinations={lat2},{lng2}&key={settings.GOOGLE_API_KEY}"
-        )
-        response = requests.get(url, timeout=5).json()
-        if response.get('status') == 'OK':
-            element = response['rows'][0]['elements'][0]
-            if element.get('status') == 'OK':
-                return element['distance']['text'], element['duration']['text']
+        # Cliente compartido: conexión reutilizada y tramo en caché
+        leg = maps_client.leg(lat1, lng1, lat2, lng2)
+        if leg is not None:
+            return leg.distance_text, leg.duration_text
     except Exception as e:
         print(f"❌ Error en get_distance_duration: {e}")
     return None, None
@@ -1017,7 +945,6 @@ def obtener_taxista_mas_cercano(lat, lng, organization=None):
     Si se pasa 'organization', solo busca conductores de esa cooperativa.
     Acepta conductores con Telegram O WhatsApp.
     """
-    origen = (lat, lng)
     taxistas = Taxi.objects.select_related('user').filter(
         user__role='driver',
         latitude__isnull=False,
@@ -1032,17 +959,14 @@ def obtener_taxista_mas_cercano(lat, lng, organization=None):
     if organization is not None:
         taxistas = taxistas.filter(user__organization=organization)
     
-    if not taxistas.exists():
+    # El índice geoespacial propone candidatos por distancia; la BD solo valida filtros
+    taxista_cercano, distancia = buscar_taxi_cercano(lat, lng, queryset=taxistas, organization=organization)
+
+    if taxista_cercano is None:
         logger.warning(f"⚠️ No se encontraron taxistas disponibles cerca de ({lat}, {lng})"
                        + (f" en org {organization}" if organization else ""))
         return None
     
-    taxista_cercano = min(
-        taxistas,
-        key=lambda t: geodesic(origen, (t.latitude, t.longitude)).km
-    )
-    
-    distancia = geodesic(origen, (taxista_cercano.latitude, taxista_cercano.longitude)).km
     logger.info(f"✅ Taxista más cercano: {taxista_cercano.user.get_full_name()} a {distancia:.2f} km")
     
     return taxista_cercano
@@ -1343,15 +1267,10 @@ def request_ride(request):
                         'direccion_legible': 'Aún no se ha seleccionado un origen'
                     })
 
-                # ✅ Si el origen está vacío o es inválido, obtener dirección desde coordenadas
+                # ✅ Si el origen está vacío o es inválido, usar coordenadas; la dirección
+                # legible se resuelve en segundo plano (Ride.origin_address)
                 if not origin or origin.strip() == '' or 'undefined' in origin.lower():
-                    try:
-                        origin = obtener_direccion_google(origin_lat, origin_lng, settings.GOOGLE_API_KEY)
-                        if not origin:
-                            origin = f"Lat: {origin_lat}, Lng: {origin_lng}"
-                    except Exception as e:
-                        logger.warning(f"No se pudo obtener dirección de origen: {e}")
-                        origin = f"Lat: {origin_lat}, Lng: {origin_lng}"
+                    origin = f"Lat: {origin_lat}, Lng: {origin_lng}"
 
                 # ✅ MULTI-TENANT: Asignar organización del cliente
                 ride = Ride.objects.create(
@@ -1384,88 +1303,8 @@ def request_ride(request):
                         order=i
                     )
 
-                # Obtener dirección legible para origen
-                direccion_legible = obtener_direccion_google(origin_lat, origin_lng, settings.GOOGLE_API_KEY)
-
-                # Formatear lista de destinos legibles
-                lista_destinos = "\n".join([f"➡️ Destino {i+1}: {d}" for i, d in enumerate(destinations)])
-
-                # Mensaje para el grupo de conductores
-                mensaje_grupo = (
-                    f"🚕 <b>Nueva carrera solicitada</b>\n"
-                    f"📍 Origen: {direccion_legible}\n"
-                    f"{lista_destinos}\n"
-                    f"👤 Cliente: {request.user.get_full_name()}\n"
-                    f"💰 Precio estimado: ${price:.2f}"
-                )
-
-                # Botones para el mensaje: Aceptar y Ver en Google Maps
-                botones = [[
-                    {"text": "✅ Aceptar carrera", "callback_data": f"aceptar_{ride.id}"},
-                    {"text": "🗺 Ver en Google Maps", "url": f"https://maps.google.com/?q={origin_lat},{origin_lng}"}
-                ]]
-
-                # Enviar mensaje al grupo de conductores por Telegram
-                enviar_telegram(TELEGRAM_CHAT_ID_GRUPO_TAXISTAS, mensaje_grupo, botones)
-
-                # ✅ FIX #2: Notificar al taxista más cercano de la misma organización
-                taxista_cercano = obtener_taxista_mas_cercano(
-                    origin_lat, origin_lng,
-                    organization=request.user.organization
-                )
-                if taxista_cercano:
-                    mensaje_taxista_whatsapp = (
-                        f"🚕 *Nueva carrera cerca de ti!*\n\n"
-                        f"📍 *Origen:* {direccion_legible}\n"
-                        f"{lista_destinos}\n"
-                        f"👤 *Cliente:* {request.user.get_full_name()}\n"
-                        f"📱 *Teléfono:* {request.user.phone_number}\n"
-                        f"💰 *Precio:* ${price:.2f}\n\n"
-                        f"🆔 *Carrera #*{ride.id}\n\n"
-                        f"Para aceptar, responde:\n"
-                        f"*ACEPTAR {ride.id}*"
-                    )
-
-                    # Enviar por Telegram si tiene chat_id
-                    if taxista_cercano.user.telegram_chat_id:
-                        try:
-                            mensaje_telegram = (
-                                f"📣 Hola {taxista_cercano.user.get_full_name()}, hay una carrera cerca de ti:\n"
-                                f"🛫 Desde: {direccion_legible}\n"
-                                f"👤 Cliente: {request.user.get_full_name()}"
-                            )
-                            enviar_telegram(taxista_cercano.user.telegram_chat_id, mensaje_telegram)
-                        except Exception as e:
-                            logger.warning(f"⚠️ No se pudo enviar Telegram: {e}")
-
-                    # Enviar por WhatsApp si tiene número
-                    if taxista_cercano.user.phone_number:
-                        try:
-                            from .whatsapp_agent_ai import whatsapp_agent_ai
-                            whatsapp_agent_ai.enviar_mensaje(
-                                taxista_cercano.user.phone_number,
-                                mensaje_taxista_whatsapp
-                            )
-                            logger.info(f"✅ Notificación WhatsApp enviada a {taxista_cercano.user.get_full_name()}")
-                        except Exception as e:
-                            logger.warning(f"⚠️ No se pudo enviar WhatsApp: {e}")
-
-                    # Enviar notificación PWA push
-                    try:
-                        enviar_notificacion_pwa_conductor(
-                            conductor=taxista_cercano.user,
-                            titulo='🚕 Nueva carrera cerca de ti!',
-                            mensaje=f'Origen: {direccion_legible}\nPrecio: ${price:.2f}',
-                            datos={
-                                'ride_id': ride.id,
-                                'origin': direccion_legible,
-                                'price': float(price),
-                                'url': '/available-rides/'
-                            }
-                        )
-                        logger.info(f"✅ Notificación PWA enviada a {taxista_cercano.user.get_full_name()}")
-                    except Exception as e:
-                        logger.warning(f"⚠️ No se pudo enviar notificación PWA: {e}")
+                # Telegram, WhatsApp, push y geocodificación salen desde la cola de tareas
+                task_queue.enqueue_on_commit('ride_created', ride_id=ride.id)
 
                 messages.success(request, '¡Carrera solicitada con éxito!')
                 return redirect(reverse('ride_detail', args=[ride.id]))
@@ -1524,86 +1363,8 @@ def crear_carrera_desde_whatsapp(user, origin, origin_lat, origin_lng, destinati
         # ✅ Broadcast WebSocket: Nueva carrera disponible
         broadcast_ride_update(ride)
         
-        # Obtener dirección legible para origen
-        direccion_legible = obtener_direccion_google(origin_lat, origin_lng, settings.GOOGLE_API_KEY)
-        
-        # Mensaje para el grupo de conductores
-        mensaje_grupo = (
-            f"🚕 <b>Nueva carrera solicitada (WhatsApp)</b>\n"
-            f"📍 Origen: {direccion_legible}\n"
-            f"➡️ Destino: {destination}\n"
-            f"👤 Cliente: {user.get_full_name()}\n"
-            f"📱 Teléfono: {user.phone_number}\n"
-            f"💰 Precio estimado: ${price:.2f}"
-        )
-        
-        # Botones para el mensaje
-        botones = [[
-            {"text": "✅ Aceptar carrera", "callback_data": f"aceptar_{ride.id}"},
-            {"text": "🗺 Ver en Google Maps", "url": f"https://maps.google.com/?q={origin_lat},{origin_lng}"}
-        ]]
-        
-        # Enviar mensaje al grupo de conductores (si está configurado)
-        try:
-            # Usar la función enviar_telegram definida en este mismo archivo
-            enviar_telegram(TELEGRAM_CHAT_ID_GRUPO_TAXISTAS, mensaje_grupo, botones)
-        except Exception as e:
-            logger.warning(f"⚠️ No se pudo enviar a Telegram: {e}")
-        
-        # Notificar al taxista más cercano
-        # ✅ FIX #2: Filtrar por organización del usuario (multi-tenant)
-        taxista_cercano = obtener_taxista_mas_cercano(origin_lat, origin_lng, organization=user.organization)
-        if taxista_cercano:
-            mensaje_taxista = (
-                f"🚕 *Nueva carrera cerca de ti!*\n\n"
-                f"📍 *Origen:* {direccion_legible}\n"
-                f"🎯 *Destino:* {destination}\n"
-                f"👤 *Cliente:* {user.get_full_name()}\n"
-                f"📱 *Teléfono:* {user.phone_number}\n"
-                f"💰 *Precio:* ${price:.2f}\n\n"
-                f"🆔 *Carrera #*{ride.id}\n\n"
-                f"Para aceptar, responde:\n"
-                f"*ACEPTAR {ride.id}*"
-            )
-            
-            # Enviar por Telegram si tiene chat_id
-            if taxista_cercano.user.telegram_chat_id:
-                try:
-                    # Usar función local
-                    enviar_telegram(taxista_cercano.user.telegram_chat_id, mensaje_taxista)
-                    logger.info(f"✅ Notificación Telegram enviada a {taxista_cercano.user.get_full_name()}")
-                except Exception as e:
-                    logger.warning(f"⚠️ No se pudo enviar a Telegram: {e}")
-            
-            # Enviar por WhatsApp si tiene número
-            if taxista_cercano.user.phone_number:
-                try:
-                    from .whatsapp_agent_ai import whatsapp_agent_ai
-                    whatsapp_agent_ai.enviar_mensaje(
-                        taxista_cercano.user.phone_number,
-                        mensaje_taxista
-                    )
-                    logger.info(f"✅ Notificación WhatsApp enviada a {taxista_cercano.user.get_full_name()}")
-                except Exception as e:
-                    logger.warning(f"⚠️ No se pudo enviar WhatsApp: {e}")
-            
-            # Enviar notificación PWA push
-            try:
-                enviar_notificacion_pwa_conductor(
-                    conductor=taxista_cercano.user,
-                    titulo='🚕 Nueva carrera cerca de ti!',
-                    mensaje=f'Origen: {direccion_legible}\nDestino: {destination}\nPrecio: ${price:.2f}',
-                    datos={
-                        'ride_id': ride.id,
-                        'origin': direccion_legible,
-                        'destination': destination,
-                        'price': float(price),
-                        'url': '/available-rides/'
-                    }
-                )
-                logger.info(f"✅ Notificación PWA enviada a {taxista_cercano.user.get_full_name()}")
-            except Exception as e:
-                logger.warning(f"⚠️ No se pudo enviar notificación PWA: {e}")
+        # Notificaciones en segundo plano (ver taxis.tasks.ride_created)
+        task_queue.enqueue_on_commit('ride_created', ride_id=ride.id, source='whatsapp')
         
         logger.info(f"✅ Carrera creada desde WhatsApp: {ride.id}")
         return ride
@@ -1824,8 +1585,8 @@ def ride_detail(request, ride_id):
             messages.error(request, 'No tiene permiso para ver esta carrera.')
             return redirect('available_rides')
 
-        # Obtener la dirección de origen
-        origin_address = ride.get_origin_address()
+        # Dirección de origen guardada (se resuelve en segundo plano al crear la carrera)
+        origin_address = ride.display_origin
 
         # Obtener TODOS los destinos ordenados
         destinations = ride.destinations.all().order_by('order')
@@ -2398,33 +2159,34 @@ def get_latest_driver_app(request):
 
 def taxis_ubicacion(request):
     try:
-        taxis = Taxi.objects.exclude(latitude__isnull=True, longitude__isnull=True)
+        # ✅ MULTI-TENANT: Superadmin ve todo, el resto solo su organización
+        if not request.user.is_authenticated:
+            return JsonResponse([], safe=False)
+        if request.user.is_superuser:
+            organization_id = None
+        elif request.user.organization_id:
+            organization_id = request.user.organization_id
+        else:
+            return JsonResponse([], safe=False)
+
+        # Servido desde el snapshot en memoria (sin consultas por taxi)
+        snapshot = fleet_snapshot.changes(organization_id=organization_id)
 
         data = []
-        for taxi in taxis:
-            try:
-                # Obtener teléfono de manera segura
-                telefono = 'N/A'
-                if hasattr(taxi.user, 'phone_number'):
-                    telefono = taxi.user.phone_number or 'N/A'
-                elif hasattr(taxi.user, 'phone'):
-                    telefono = taxi.user.phone or 'N/A'
-                
-                taxi_data = {
-                    "id": taxi.id,
-                    "username": taxi.user.username,  # 🔑 Agregar username para actualizaciones de ubicación
-                    "nombre_conductor": taxi.user.get_full_name() or taxi.user.username,
-                    "latitude": float(taxi.latitude) if taxi.latitude else 0.0,
-                    "longitude": float(taxi.longitude) if taxi.longitude else 0.0,
-                    "placa": taxi.plate_number or 'N/A',
-                    "vehiculo": taxi.vehicle_description or 'N/A',
-                    "disponible": getattr(taxi, 'is_available', True),
-                    "telefono": telefono
-                }
-                data.append(taxi_data)
-            except Exception as e:
-                print(f"Error procesando taxi {taxi.id}: {e}")
+        for taxi in snapshot['taxis']:
+            if taxi['lat'] is None and taxi['lng'] is None:
                 continue
+            data.append({
+                "id": taxi['taxi_id'],
+                "username": taxi['username'],  # 🔑 Agregar username para actualizaciones de ubicación
+                "nombre_conductor": taxi['nombre'] or taxi['username'],
+                "latitude": float(taxi['lat']) if taxi['lat'] else 0.0,
+                "longitude": float(taxi['lng']) if taxi['lng'] else 0.0,
+                "placa": taxi['placa'] or 'N/A',
+                "vehiculo": taxi['descripcion'] or 'N/A',
+                "disponible": True,
+                "telefono": taxi['telefono'],
+            })
 
         return JsonResponse(data, safe=False)
         
@@ -2444,12 +2206,14 @@ def actualizar_ubicacion(request):
             return JsonResponse({"error": "Acceso no autorizado"}, status=403)
 
         try:
-            taxi = Taxi.objects.get(user=user)
-            taxi.latitude = data.get("latitude")
-            taxi.longitude = data.get("longitude")
-            taxi.save()
-
-            return JsonResponse({"message": "Ubicación actualizada", "latitude": taxi.latitude, "longitude": taxi.longitude})
+            driver = location_ingestor.resolve_driver(user.id, create_taxi=False)
+            if driver is None:
+                raise Taxi.DoesNotExist
+            if not location_ingestor.record(driver, data.get("latitude"), data.get("longitude")):
+                # Sin coordenadas o fuera de rango: el ping se descarta
+                return JsonResponse({"error": "Coordenadas inválidas", "latitude": data.get("latitude"), "longitude": data.get("longitude")}, status=400)
+
+            return JsonResponse({"message": "Ubicación actualizada", "latitude": data.get("latitude"), "longitude": data.get("longitude")})
         except Taxi.DoesNotExist:
             return JsonResponse({"error": "El taxista no tiene un taxi asignado"}, status=400)
     return JsonResponse({"error": "Método no permitido"}, status=405)
@@ -2684,39 +2448,47 @@ def comunicacion_conductores(request):
 
 
 def ubicaciones_taxis(request):
+    """
+    Ubicaciones de la flota para el mapa de la central.
+
+    Sin parámetros retorna la flota completa. Con `?since=<cursor>` (el
+    `cursor` de la respuesta anterior) retorna solo los taxis que cambiaron y
+    los IDs dados de baja en `removed`. Si el cursor ya no es válido la
+    respuesta trae `full: true` y el cliente debe reemplazar todo el mapa.
+    """
     # ✅ MULTI-TENANT: Filtrar taxis por organización
-    if request.user.is_authenticated:
-        if request.user.is_superuser:
-            # Super admin ve TODOS los taxis
-            taxis = Taxi.objects.select_related('user').all()
-        elif request.user.role == 'admin' and request.user.organization:
-            # Admin ve solo taxis de SU organización
-            taxis = Taxi.objects.select_related('user').filter(user__organization=request.user.organization)
-        else:
-            # Otros usuarios no ven nada
-            taxis = Taxi.objects.none()
+    if request.user.is_authenticated and request.user.is_superuser:
+        # Super admin ve TODOS los taxis
+        organization_id = None
+    elif request.user.is_authenticated and request.user.role == 'admin' and request.user.organization_id:
+        # Admin ve solo taxis de SU organización
+        organization_id = request.user.organization_id
     else:
-        # Usuario no autenticado no ve nada
-        taxis = Taxi.objects.none()
-    
-    data = []
-    
-    for taxi in taxis:
-        if taxi.user.role == 'driver':
-            data.append({
-                'id': taxi.user.id,
-                'nombre': taxi.user.get_full_name(),
-                'lat': taxi.latitude,
-                'lng': taxi.longitude,
-                # En Railway normalmente no se sirve /media/ (no hay storage persistente).
-                # Usar una imagen estática por defecto para evitar 404.
-                'foto': taxi.user.profile_picture.url if taxi.user.profile_picture else '/static/imagenes/logo1.png',
-                'placa': taxi.plate_number,
-                'descripcion': taxi.vehicle_description,
-                'numero_unidad': taxi.user.driver_number or 'S/N',  # Número de unidad del conductor
-            })
-            
-    return JsonResponse({'taxis': data})
+        # Otros usuarios (o no autenticados) no ven nada
+        return JsonResponse({'taxis': []})
+
+    # El ETag identifica la versión de la flota: sin cambios, 304 sin cuerpo
+    scope = organization_id or 'all'
+    etag = f'"fleet-{scope}-{fleet_snapshot.cursor()}"'
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    snapshot = fleet_snapshot.changes(organization_id=organization_id, since=request.GET.get('since'))
+    taxis = [
+        {key: value for key, value in taxi.items() if key not in ('taxi_id', 'username', 'telefono')}
+        for taxi in snapshot['taxis']
+    ]
+    response = JsonResponse({
+        'taxis': taxis,
+        'cursor': snapshot['cursor'],
+        'full': snapshot['full'],
+        'removed': snapshot['removed'],
+    })
+    cursor = snapshot['cursor']
+    response['ETag'] = f'"fleet-{scope}-{cursor}"'
+    return response
 
 @csrf_exempt
 @login_required
@@ -2729,10 +2501,11 @@ def actualizar_ubicacion_taxi(request):
             data = json.loads(request.body)
             print("Datos recibidos:", data)
 
-            taxi = Taxi.objects.get(user=request.user)
-            taxi.latitude = data.get('lat')
-            taxi.longitude = data.get('lng')
-            taxi.save()
+            driver = location_ingestor.resolve_driver(request.user.id, create_taxi=False)
+            if driver is None:
+                raise Taxi.DoesNotExist
+            if not location_ingestor.record(driver, data.get('lat'), data.get('lng')):
+                return JsonResponse({'status': 'error', 'message': 'Coordenadas inválidas'}, status=400)
             return JsonResponse({'status': 'ok'})
         except Taxi.DoesNotExist:
             print("❌ Taxi no encontrado")
@@ -2842,41 +2615,19 @@ def chat_central(request):
     
     admin_user = AppUser.objects.filter(is_superuser=True).first()
 
-    # Pre-cargar historial de chat para cada conductor
-    from .models import ChatMessage
-    from django.db.models import Q, Max
+    # Último mensaje y no leídos de cada conductor desde las conversaciones
+    # (una consulta); el historial lo pide el chat al abrirlo (/api/chat_history/)
+    from .chat_threads import inbox
     
+    threads = inbox(request.user)
     drivers_with_history = []
     for driver in drivers:
-        # Obtener historial de chat entre el admin/superadmin y este conductor
-        chat_history = []
-        last_message = None
-        
-        # Primero obtener el último mensaje para cada par de usuarios
-        last_messages = ChatMessage.objects.filter(
-            Q(sender=request.user, recipient=driver) | 
-            Q(sender=driver, recipient=request.user)
-        ).values('sender', 'recipient').annotate(
-            max_timestamp=Max('timestamp')
-        )
-        
-        # Obtener los mensajes completos para los timestamps máximos
-        if last_messages.exists():
-            last_message = ChatMessage.objects.filter(
-                Q(sender=request.user, recipient=driver) | 
-                Q(sender=driver, recipient=request.user)
-            ).order_by('-timestamp').first()
-        
-        # Obtener los últimos 50 mensajes para el historial
-        chat_history = ChatMessage.objects.filter(
-            Q(sender=request.user, recipient=driver) | 
-            Q(sender=driver, recipient=request.user)
-        ).select_related('sender', 'recipient').order_by('timestamp')[:50]
-        
+        thread = threads.get(driver.id)
         drivers_with_history.append({
             'driver': driver,
-            'chat_history': chat_history,
-            'last_message': last_message
+            'chat_history': [],
+            'last_message': thread.last_message if thread else None,
+            'unread': thread.unread_for(request.user.id) if thread else 0,
         })
 
     import time
@@ -2898,20 +2649,21 @@ def chat_central(request):
     return render(request, 'central_comunicacion.html', context)
 
 def get_chat_history(request, user_id):
-    """API para obtener historial de chat con un usuario específico"""
-    from .models import ChatMessage, AppUser
-    from django.db.models import Q
-    from rest_framework.authtoken.models import Token
+    """
+    API para obtener historial de chat con un usuario específico
+    
+    GET ?limit=50 | ?before=<cursor> | ?after=<cursor> (ver taxis.chat_history)
+    """
+    from rest_framework.exceptions import AuthenticationFailed
+    from .authentication import CachedTokenAuthentication
     
     # Autenticación por token (para app móvil)
-    auth_header = request.headers.get('Authorization', '')
-    if auth_header.startswith('Token '):
-        token_key = auth_header.split(' ')[1]
-        try:
-            token = Token.objects.get(key=token_key)
-            request.user = token.user
-        except Token.DoesNotExist:
-            return JsonResponse({'error': 'Token inválido'}, status=401)
+    try:
+        credentials = CachedTokenAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return JsonResponse({'error': 'Token inválido'}, status=401)
+    if credentials:
+        request.user = credentials[0]
     elif not request.user.is_authenticated:
         return JsonResponse({'error': 'No autenticado'}, status=401)
     
@@ -2922,37 +2674,51 @@ def get_chat_history(request, user_id):
     # El historial siempre será entre request.user y other_user
     
     other_user = get_object_or_404(AppUser, id=user_id)
-    print(f"[CHAT_HISTORY] Usuario encontrado: {other_user.get_full_name() or other_user.username} (ID: {other_user.id})")
-    
-    messages = ChatMessage.objects.filter(
-        Q(sender=request.user, recipient=other_user) | 
-        Q(sender=other_user, recipient=request.user)
-    ).order_by('timestamp')
     
-    print(f"[CHAT_HISTORY] Mensajes encontrados: {messages.count()}")
-    
-    data = [{
-        'sender_id': msg.sender.id,
-        'sender_name': msg.sender.get_full_name() or msg.sender.username,
-        'message': msg.message,
-        'timestamp': msg.timestamp.strftime('%H:%M'),
-        'is_sent': msg.sender.id == request.user.id,
-        # Campos de media
-        'message_type': msg.message_type,
-        'media_url': msg.media_url,
-        'thumbnail_url': msg.thumbnail_url,
-        'metadata': msg.metadata or {},
-    } for msg in messages]
+    # Paginado por cursor: ?before=<cursor> (anteriores) o ?after=<cursor> (solo lo nuevo)
+    try:
+        page = history_page(
+            request.user, other_user,
+            before=request.GET.get('before'), after=request.GET.get('after'),
+            limit=parse_limit(request.GET.get('limit')),
+        )
+    except InvalidCursor as e:
+        return JsonResponse({'error': str(e)}, status=400)
     
-    print(f"[CHAT_HISTORY] ✅ Retornando {len(data)} mensajes")
-    return JsonResponse({'messages': data})
+    print(f"[CHAT_HISTORY] ✅ Retornando {len(page['messages'])} mensajes con {other_user.username} (ID: {other_user.id})")
+    return JsonResponse(_chat_history_response(page, [request.user, other_user], request.user.id, '%H:%M'))
+
+
+def _chat_history_response(page, participants, viewer_id, timestamp_format):
+    """Respuesta JSON de una página del historial (los nombres salen de los dos participantes, sin consultas)"""
+    names = {user.id: user.get_full_name() or user.username for user in participants}
+    return {
+        'messages': [{
+            'id': msg.id,
+            'sender_id': msg.sender_id,
+            'sender_name': names.get(msg.sender_id, ''),
+            'message': msg.message,
+            'timestamp': msg.timestamp.strftime(timestamp_format),
+            'is_sent': msg.sender_id == viewer_id,
+            # Campos de media
+            'message_type': msg.message_type,
+            'media_url': msg.media_url,
+            'thumbnail_url': msg.thumbnail_url,
+            'metadata': msg.metadata or {},
+        } for msg in page['messages']],
+        'has_more': page['has_more'],
+        'before': page['before'],
+        'after': page['after'],
+    }
 
 
 @csrf_exempt
 def get_driver_chat_history(request, driver_id):
-    """API para que los conductores obtengan su historial de chat con el admin"""
-    from .models import ChatMessage, AppUser
-    from django.db.models import Q
+    """
+    API para que los conductores obtengan su historial de chat con el admin
+    
+    GET ?limit=50 | ?before=<cursor> | ?after=<cursor> (ver taxis.chat_history)
+    """
     
     try:
         # Intentar obtener el conductor por ID numérico o username
@@ -2972,29 +2738,19 @@ def get_driver_chat_history(request, driver_id):
         if not admin:
             return JsonResponse({'error': 'Admin no encontrado'}, status=404)
         
-        # Obtener mensajes entre el conductor y el admin
-        messages = ChatMessage.objects.filter(
-            Q(sender=driver, recipient=admin) | 
-            Q(sender=admin, recipient=driver)
-        ).order_by('timestamp')
-        
-        print(f"📜 Cargando historial de chat: {driver.username} (ID: {driver.id}) <-> Admin (ID: {admin.id})")
-        print(f"   Total mensajes encontrados: {messages.count()}")
+        # Mensajes entre el conductor y el admin, paginados por cursor
+        try:
+            page = history_page(
+                driver, admin,
+                before=request.GET.get('before'), after=request.GET.get('after'),
+                limit=parse_limit(request.GET.get('limit')),
+            )
+        except InvalidCursor as e:
+            return JsonResponse({'error': str(e)}, status=400)
         
-        data = [{
-            'sender_id': msg.sender.id,
-            'sender_name': msg.sender.get_full_name() or msg.sender.username,
-            'message': msg.message,
-            'timestamp': msg.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
-            'is_sent': msg.sender.id == driver.id,
-            # Campos de media
-            'message_type': msg.message_type,
-            'media_url': msg.media_url,
-            'thumbnail_url': msg.thumbnail_url,
-            'metadata': msg.metadata or {},
-        } for msg in messages]
+        print(f"📜 Historial de chat: {driver.username} (ID: {driver.id}) <-> Admin (ID: {admin.id}): {len(page['messages'])} mensajes")
         
-        return JsonResponse({'messages': data})
+        return JsonResponse(_chat_history_response(page, [driver, admin], driver.id, '%Y-%m-%d %H:%M:%S'))
         
     except Exception as e:
         print(f"❌ Error en get_driver_chat_history: {e}")
@@ -3250,17 +3006,21 @@ def enviar_notificacion_pwa_conductor(conductor, titulo, mensaje, datos=None):
         datos: Datos adicionales (dict)
     """
     try:
-        # 1. Enviar notificación push real con Web Push API
-        from .push_notifications import send_push_notification
+        # 1. Push al dispositivo del conductor (app nativa por FCM, si no PWA)
+        from .notification_fanout import FCM, WEBPUSH, Audience, notification_fanout
         
         try:
-            send_push_notification(
-                user=conductor,
-                title=titulo,
-                body=mensaje,
-                data=datos,
-                icon='/static/imagenes/icon-192x192.png',
-                badge='/static/imagenes/icon-96x96.png'
+            notification_fanout.deliver(
+                Audience.users([conductor]),
+                'nueva_carrera',
+                {
+                    'title': titulo,
+                    'body': mensaje,
+                    'data': datos,
+                    'icon': '/static/imagenes/icon-192x192.png',
+                    'badge': '/static/imagenes/icon-96x96.png',
+                },
+                channels=(FCM, WEBPUSH),
             )
             logger.info(f"✅ Push notification enviada a {conductor.username}")
         except Exception as e:
@@ -0,0 +1,178 @@
+"""
+Envío concurrente de Web Push (PWA)
+
+`send_push_notification` enviaba a cada suscripción en serie con
+`pywebpush.webpush`: por cada envío volvía a cargar la llave VAPID, firmaba un
+JWT nuevo y abría una conexión HTTP nueva. Ahora:
+
+- La llave VAPID se carga una vez y el encabezado firmado se reutiliza por
+  servicio de push (origen del endpoint: FCM, Mozilla, Apple...) hasta poco
+  antes de que venza el JWT.
+- Una `requests.Session` compartida mantiene las conexiones abiertas (un pool
+  por servicio de push).
+- Las suscripciones se envían en paralelo con un pool de hilos acotado y el
+  resultado se reporta por endpoint en un solo lote.
+"""
+import json
+import logging
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from django.conf import settings
+from py_vapid import Vapid
+from pywebpush import WebPushException, WebPusher
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Envíos simultáneos
+WEBPUSH_MAX_WORKERS = getattr(settings, 'WEBPUSH_MAX_WORKERS', 8)
+
+# Vigencia del JWT VAPID (los servicios de push aceptan hasta 24 h)
+VAPID_TOKEN_TTL_SECONDS = 12 * 60 * 60
+
+# Se firma uno nuevo cuando al actual le queda menos que esto
+VAPID_RENEW_MARGIN_SECONDS = 60 * 60
+
+REQUEST_TIMEOUT = 10
+
+# Tiempo que el servicio de push guarda el mensaje si el dispositivo está apagado
+DEFAULT_TTL = 24 * 60 * 60
+
+PushOutcome = namedtuple('PushOutcome', ['subscription_id', 'endpoint', 'status_code', 'ok', 'expired', 'error'])
+
+
+def push_origin(endpoint):
+    """Origen (scheme://host) del servicio de push: es la audiencia del JWT VAPID"""
+    parsed = urlparse(endpoint)
+    return f'{parsed.scheme}://{parsed.netloc}'
+
+
+class VapidSigner:
+    """Encabezados VAPID firmados, cacheados por audiencia hasta su vencimiento"""
+
+    def __init__(self, private_key=None, admin_email=None):
+        self._private_key = private_key
+        self._admin_email = admin_email
+        self._vapid = None
+        self._cache = {}   # aud -> (headers, exp)
+        self._lock = threading.Lock()
+        self.stats = {'signed': 0, 'reused': 0}
+
+    @property
+    def vapid(self):
+        if self._vapid is None:
+            private_key = self._private_key or settings.WEBPUSH_SETTINGS['VAPID_PRIVATE_KEY']
+            self._vapid = Vapid.from_string(private_key=private_key)
+        return self._vapid
+
+    def headers(self, audience):
+        now = time.time()
+        with self._lock:
+            cached = self._cache.get(audience)
+            if cached and cached[1] - now > VAPID_RENEW_MARGIN_SECONDS:
+                self.stats['reused'] += 1
+                return dict(cached[0])
+
+            admin_email = self._admin_email or settings.WEBPUSH_SETTINGS['VAPID_ADMIN_EMAIL']
+            exp = int(now) + VAPID_TOKEN_TTL_SECONDS
+            signed = self.vapid.sign({'sub': f'mailto:{admin_email}', 'aud': audience, 'exp': exp})
+            self._cache[audience] = (signed, exp)
+            self.stats['signed'] += 1
+            return dict(signed)
+
+
+class WebPushDispatcher:
+    """Envía un mismo payload a muchas suscripciones en paralelo"""
+
+    def __init__(self, signer=None, session=None, max_workers=WEBPUSH_MAX_WORKERS):
+        self.signer = signer or VapidSigner()
+        self.max_workers = max_workers
+        self._session = session
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=self.max_workers)
+                    session.mount('https://', adapter)
+                    self._session = session
+        return self._session
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='webpush')
+        return self._executor
+
+    def send_one(self, subscription_id, subscription_info, data, ttl=DEFAULT_TTL):
+        """Envía a una suscripción; nunca lanza excepción (el error va en el PushOutcome)"""
+        endpoint = subscription_info.get('endpoint', '') if isinstance(subscription_info, dict) else ''
+        if not endpoint:
+            return PushOutcome(subscription_id, endpoint, None, False, True, 'Suscripción sin endpoint')
+        try:
+            headers = self.signer.headers(push_origin(endpoint))
+        except Exception as e:
+            # Problema de configuración VAPID: no es culpa de la suscripción
+            return PushOutcome(subscription_id, endpoint, None, False, False, f'Error firmando VAPID: {e}')
+        try:
+            response = WebPusher(subscription_info, requests_session=self.session).send(
+                data, headers=headers, ttl=ttl, timeout=REQUEST_TIMEOUT,
+            )
+        except (WebPushException, ValueError, TypeError, KeyError) as e:
+            # Llaves p256dh/auth corruptas: la suscripción no sirve
+            return PushOutcome(subscription_id, endpoint, None, False, True, f'Suscripción inválida: {e}')
+        except Exception as e:
+            return PushOutcome(subscription_id, endpoint, None, False, False, str(e))
+
+        status_code = response.status_code
+        if status_code <= 202:
+            return PushOutcome(subscription_id, endpoint, status_code, True, False, None)
+        # 404/410: el navegador canceló la suscripción
+        expired = status_code in (404, 410)
+        return PushOutcome(subscription_id, endpoint, status_code, False, expired, response.text[:200])
+
+    def send_many(self, subscriptions, payload, ttl=DEFAULT_TTL):
+        """
+        Envía `payload` a todas las suscripciones
+
+        Args:
+            subscriptions: Lista de (id, subscription_info)
+            payload: dict (se serializa una sola vez)
+
+        Returns:
+            list[PushOutcome] en el mismo orden
+        """
+        if not subscriptions:
+            return []
+        data = json.dumps(payload)
+        if len(subscriptions) == 1:
+            subscription_id, info = subscriptions[0]
+            return [self.send_one(subscription_id, info, data, ttl)]
+        return list(self.executor.map(
+            lambda item: self.send_one(item[0], item[1], data, ttl), subscriptions
+        ))
+
+
+# Instancia global
+webpush_dispatcher = WebPushDispatcher()
+
+
+def summarize(outcomes):
+    """Resumen de un lote: {'sent', 'failed', 'expired', 'endpoints': {...}}"""
+    return {
+        'sent': sum(1 for o in outcomes if o.ok),
+        'failed': sum(1 for o in outcomes if not o.ok),
+        'expired': sum(1 for o in outcomes if o.expired),
+        'endpoints': {o.endpoint: o.status_code if o.ok else (o.error or o.status_code) for o in outcomes},
+    }
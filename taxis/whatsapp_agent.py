@@ -7,8 +7,9 @@ import json
 from django.conf import settings
 from django.utils import timezone
 from .models import Ride, AppUser, Taxi, RideDestination
-from geopy.geocoders import Nominatim
 from geopy.distance import geodesic
+from .geo_index import buscar_taxi_cercano
+from .geocoding import geocoder
 import logging
 
 logger = logging.getLogger(__name__)
@@ -34,7 +35,7 @@ class WhatsAppAgent:
     """Agente de IA para gestionar carreras por WhatsApp"""
     
     def __init__(self):
-        self.geolocator = Nominatim(user_agent="taxi_app_whatsapp")
+        self.geolocator = geocoder
     
     def enviar_mensaje(self, numero_telefono, mensaje, botones=None):
         """
@@ -400,18 +401,7 @@ Comandos disponibles:
                 user__role='driver'
             )
             
-            origen = (lat, lng)
-            taxista_cercano = None
-            distancia_minima = float('inf')
-            
-            for taxi in taxis_disponibles:
-                taxi_pos = (taxi.latitude, taxi.longitude)
-                distancia = geodesic(origen, taxi_pos).kilometers
-                
-                if distancia < distancia_minima:
-                    distancia_minima = distancia
-                    taxista_cercano = taxi
-            
+            taxista_cercano, _ = buscar_taxi_cercano(lat, lng, queryset=taxis_disponibles)
             return taxista_cercano
             
         except Exception as e:
@@ -10,8 +10,9 @@ from .models import (
     Ride, AppUser, Taxi, RideDestination,
     WhatsAppConversation, WhatsAppMessage, WhatsAppStats
 )
-from geopy.geocoders import Nominatim
 from geopy.distance import geodesic
+from .geo_index import buscar_taxi_cercano
+from .geocoding import geocoder
 import logging
 from datetime import date
 # Importar asistente de IA (Claude si está disponible, sino simple)
@@ -32,7 +33,7 @@ class WhatsAppAgentAI:
     """Agente de IA mejorado con Claude para conversaciones naturales"""
     
     def __init__(self):
-        self.geolocator = Nominatim(user_agent="taxi_app_whatsapp")
+        self.geolocator = geocoder
     
     def _guardar_mensaje(self, conversation, direction, content, message_type='text', metadata=None):
         """Guarda un mensaje en la base de datos"""
@@ -292,7 +293,7 @@ class WhatsAppAgentAI:
             
             # Geocodificación inversa para obtener dirección
             try:
-                location = self.geolocator.reverse(f"{lat}, {lng}", timeout=10)
+                location = self.geolocator.reverse(lat, lng, timeout=10)
                 direccion = location.address if location else f"Ubicación: {lat}, {lng}"
             except:
                 direccion = f"Ubicación GPS: {lat}, {lng}"
@@ -613,33 +614,6 @@ Puedes seguir el estado escribiendo *ESTADO*"""
         except Exception as e:
             logger.error(f"Error al enviar ubicación a central: {str(e)}")
     
-    def _buscar_taxista_cercano(self, lat, lng):
-        """Busca el taxista más cercano disponible"""
-        try:
-            taxis_disponibles = Taxi.objects.filter(
-                latitude__isnull=False,
-                longitude__isnull=False,
-                user__role='driver'
-            )
-            
-            origen = (lat, lng)
-            taxista_cercano = None
-            distancia_minima = float('inf')
-            
-            for taxi in taxis_disponibles:
-                taxi_pos = (taxi.latitude, taxi.longitude)
-                distancia = geodesic(origen, taxi_pos).kilometers
-                
-                if distancia < distancia_minima:
-                    distancia_minima = distancia
-                    taxista_cercano = taxi
-            
-            return taxista_cercano
-            
-        except Exception as e:
-            logger.error(f"Error al buscar taxista: {str(e)}")
-            return None
-    
     def _calcular_tarifa(self, distancia_km):
         """Calcula la tarifa estimada"""
         tarifa_base = 5000  # COP
@@ -713,52 +687,26 @@ Puedes seguir el estado escribiendo *ESTADO*"""
     
     def _buscar_taxista_cercano(self, lat, lng):
         """Busca el taxista disponible más cercano a las coordenadas dadas"""
-        from math import radians, sin, cos, sqrt, atan2
-        
-        # Obtener todos los taxis que no tienen carreras activas
-        taxis_con_carreras = Ride.objects.filter(
-            status__in=['requested', 'accepted', 'in_progress']
-        ).values_list('driver_id', flat=True)
-        
-        taxis_disponibles = Taxi.objects.filter(
-            user__role='driver'
-        ).exclude(
-            user_id__in=taxis_con_carreras
-        ).select_related('user')
-        
-        if not taxis_disponibles.exists():
-            return None
-        
-        # Función para calcular distancia usando fórmula de Haversine
-        def calcular_distancia(lat1, lon1, lat2, lon2):
-            R = 6371  # Radio de la Tierra en km
-            
-            lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-            dlat = lat2 - lat1
-            dlon = lon2 - lon1
-            
-            a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-            c = 2 * atan2(sqrt(a), sqrt(1-a))
+        try:
+            # Excluir conductores que ya tienen carreras activas
+            taxis_con_carreras = Ride.objects.filter(
+                status__in=['requested', 'accepted', 'in_progress'],
+                driver__isnull=False
+            ).values_list('driver_id', flat=True)
             
-            return R * c
-        
-        # Buscar el taxi más cercano
-        taxista_cercano = None
-        distancia_minima = float('inf')
-        
-        for taxi in taxis_disponibles:
-            # Por ahora usamos coordenadas fijas o las últimas conocidas
-            # En producción, esto vendría de un sistema de tracking en tiempo real
-            taxi_lat = -2.1709  # Coordenadas de ejemplo (Guayaquil)
-            taxi_lng = -79.9224
+            taxis_disponibles = Taxi.objects.filter(
+                user__role='driver'
+            ).exclude(
+                user_id__in=taxis_con_carreras
+            ).select_related('user')
             
-            distancia = calcular_distancia(lat, lng, taxi_lat, taxi_lng)
+            # Posiciones reales desde el índice geoespacial
+            taxista_cercano, _ = buscar_taxi_cercano(lat, lng, queryset=taxis_disponibles)
+            return taxista_cercano
             
-            if distancia < distancia_minima:
-                distancia_minima = distancia
-                taxista_cercano = taxi
-        
-        return taxista_cercano
+        except Exception as e:
+            logger.error(f"Error al buscar taxista: {str(e)}")
+            return None
     
     def _notificar_conductor_nueva_carrera(self, numero_conductor, ride):
         """Notifica al conductor sobre una nueva carrera disponible para aceptar"""